@@ -0,0 +1 @@
+# Benchmarks for Prompt Optimizer MCP
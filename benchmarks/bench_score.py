@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Exact versus approximate scoring benchmark.
+
+Scores the 'precise' filler-free variant and a truncated copy of prompts of
+growing size, exactly and approximately, and prints both scores, the
+reported error bound and the speedup. Run from the repository root:
+
+    python benchmarks/bench_score.py --sizes 10000 100000 1000000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.bench_wire import make_prompt
+from tools.approximate import estimate_score
+from tools.optimize import optimize_prompt, score_prompt
+
+
+def best_time(fn, rounds: int) -> float:
+    """Best wall time of ``fn()`` in seconds over ``rounds`` runs."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(sizes, rounds: int) -> None:
+    print(f"{'words':>9}{'pair':>10}{'exact':>8}{'approx':>8}{'error':>8}{'exact ms':>11}{'approx ms':>11}{'speedup':>9}")
+    for words in sizes:
+        raw = make_prompt(words)
+        pairs = [("precise", optimize_prompt(raw, "precise")[0]), ("truncated", raw[:len(raw) * 3 // 4])]
+        for name, improved in pairs:
+            exact = score_prompt(raw, improved)
+            estimate = estimate_score(raw, improved)
+            exact_seconds = best_time(lambda: score_prompt(raw, improved), rounds)
+            approximate_seconds = best_time(lambda: estimate_score(raw, improved), rounds)
+            print(f"{words:>9}{name:>10}{exact:>8.3f}{estimate.score:>8.3f}{estimate.error:>8.3f}"
+                  f"{exact_seconds * 1000:>11.1f}{approximate_seconds * 1000:>11.1f}"
+                  f"{exact_seconds / approximate_seconds:>8.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    run(args.sizes, args.rounds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Variant-selection benchmark for optimize_prompt.
+
+Times building every variant against building each variant alone, for every
+style, so the savings of ``variants=[...]`` are visible per variant. Run from
+the repository root:
+
+    python benchmarks/bench_variants.py --prompt-words 50 --repeat 2000
+"""
+
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.bench_wire import make_prompt
+from tools.optimize import VARIANT_COUNT, optimize_prompt
+
+STYLES = ('creative', 'precise', 'fast')
+
+
+def time_call(prompt: str, style: str, variants, repeat: int) -> float:
+    """Best per-call time in microseconds over 5 rounds."""
+    timer = timeit.Timer(lambda: optimize_prompt(prompt, style, variants))
+    return min(timer.repeat(5, repeat)) / repeat * 1e6
+
+
+def run(prompt_words: int, repeat: int) -> None:
+    prompt = make_prompt(prompt_words)
+    selections = [("all", None)] + [(f"[{i}]", [i]) for i in range(VARIANT_COUNT)]
+
+    print(f"{'style':<10}" + "".join(f"{name + ' us':>12}" for name, _ in selections))
+    for style in STYLES:
+        times = [time_call(prompt, style, variants, repeat) for _, variants in selections]
+        print(f"{style:<10}" + "".join(f"{t:>12.1f}" for t in times))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prompt-words", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.prompt_words, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Wire-format benchmark for the HTTP server.
+
+Sends the same /optimize request in every supported body format and content
+coding and reports response bytes and CPU time per request (client and server
+share the process, so CPU includes both sides of the exchange). Run from the
+repository root:
+
+    python benchmarks/bench_wire.py --requests 200 --prompt-words 2000
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi.testclient import TestClient
+
+import http_server
+from tools import wire
+
+
+def formats():
+    """Yield (name, request headers, body encoder, response decoder) for each format."""
+    body_formats = [("json", "application/json", lambda obj: json.dumps(obj).encode(), json.loads)]
+    if wire.MSGPACK_AVAILABLE:
+        body_formats.append(("msgpack", wire.MSGPACK_TYPE, wire.packb, wire.unpackb))
+
+    for body_name, media_type, encode, decode in body_formats:
+        for encoding in ["identity"] + wire.available_encodings():
+            headers = {"content-type": media_type, "accept": media_type, "accept-encoding": encoding}
+            yield f"{body_name}+{encoding}", headers, encode, decode
+
+
+VOCABULARY = (
+    "please write a very detailed explanation about machine learning models data training "
+    "could you describe the system design and analyze its performance really quickly simply "
+    "summarize report customer feedback kind of sort of just actually features latency"
+).split()
+
+
+def make_prompt(words: int, seed: int = 7) -> str:
+    """Build a reproducible prompt with sentence breaks and filler words."""
+    rng = random.Random(seed)
+    tokens = [rng.choice(VOCABULARY) + ("." if rng.random() < 0.08 else "") for _ in range(words)]
+    return " ".join(tokens)
+
+
+def run(requests: int, prompt_words: int) -> None:
+    logging.getLogger("http_server").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    client = TestClient(http_server.app)
+    prompt = make_prompt(prompt_words)
+    payload = {"raw_prompt": prompt, "style": "precise"}
+
+    print(f"{'format':<20}{'bytes':>10}{'CPU us/req':>14}")
+    for name, headers, encode, decode in formats():
+        sizes = 0
+        cpu_start = time.process_time()
+        for i in range(requests):
+            # Vary the prompt so single-flight coalescing does not hide the encoding cost
+            response = client.post("/optimize", content=encode(dict(payload, raw_prompt=f"{i} {prompt}")), headers=headers)
+            sizes += int(response.headers["content-length"])
+            decode(response.content if response.headers.get("content-encoding") != "zstd"
+                   else wire.decompress(response.content, "zstd"))
+        cpu = (time.process_time() - cpu_start) / requests
+        print(f"{name:<20}{sizes // requests:>10}{cpu * 1e6:>14.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--prompt-words", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.requests, args.prompt_words)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+"""
+Priority-lane load test: interactive latency while a batch flood runs.
+
+Starts http_server.py and runs a light closed-loop interactive workload (IDE
+calls on short prompts) three times: alone, next to a flood of long-prompt
+requests sent as ``X-Request-Class: batch``, and next to the same flood sent
+without a request class, as every client did before lanes existed. The
+interactive p50/p99 of the three phases show whether lanes keep interactive
+latency flat. The flood runs in its own process so its client work does not
+delay the interactive clients' event loop. Run from the repository root:
+
+    python benchmarks/lanes.py --duration 10 --batch-concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.loadtest import HttpTarget, Recorder, Workload, percentile
+
+PHASES = ("alone", "batch_flood", "unclassified_flood")
+
+
+async def _client(target: HttpTarget, workload: Workload, recorder: Recorder, deadline: float,
+                  headers: Optional[Dict[str, str]]) -> None:
+    while time.perf_counter() < deadline:
+        operation, arguments = workload.next_call()
+        start = time.perf_counter()
+        try:
+            outcome = await target.call(operation, arguments, headers)
+        except Exception as e:
+            outcome = type(e).__name__
+        recorder.record(time.perf_counter() - start, outcome)
+
+
+def _summary(recorder: Recorder, elapsed: float) -> Dict[str, Any]:
+    latencies = sorted(recorder.latencies)
+    return {
+        "requests": len(latencies),
+        "outcomes": recorder.outcomes,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            name: round(value * 1000, 3) if value is not None else None
+            for name, value in [("p50", percentile(latencies, 50)), ("p99", percentile(latencies, 99)),
+                                ("max", latencies[-1] if latencies else None)]
+        },
+    }
+
+
+FLOOD_LEAD_SECONDS = 1.0
+
+
+async def queue_wait(target: HttpTarget) -> Dict[str, List[float]]:
+    """Return {lane: [sum, count]} of the server's scheduler queue-wait histogram."""
+    text = (await target.client.get("/metrics")).text
+    totals: Dict[str, List[float]] = {}
+    for line in text.splitlines():
+        for suffix, index in (("_sum", 0), ("_count", 1)):
+            prefix = f"scheduler_queue_wait_seconds{suffix}{{"
+            if line.startswith(prefix):
+                labels, value = line[len(prefix):].rsplit("} ", 1)
+                lane = dict(item.split("=") for item in labels.split(","))["lane"].strip('"')
+                totals.setdefault(lane, [0.0, 0.0])[index] += float(value)
+    return totals
+
+
+async def _flood(url: str, args: argparse.Namespace, headers: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    import httpx
+
+    target = HttpTarget()
+    target.client = httpx.AsyncClient(base_url=url, timeout=120.0, limits=httpx.Limits(
+        max_connections=args.batch_concurrency, max_keepalive_connections=args.batch_concurrency))
+    workload = Workload(seed=args.seed + 1, median_words=args.batch_words, sigma=0.5, max_words=20000)
+    recorder = Recorder()
+    started = time.perf_counter()
+    # Start early and keep going until the interactive measurement is over
+    deadline = started + args.duration + 2 * FLOOD_LEAD_SECONDS
+    try:
+        await asyncio.gather(*(_client(target, workload, recorder, deadline, headers)
+                               for _ in range(args.batch_concurrency)))
+    finally:
+        await target.client.aclose()
+    return _summary(recorder, time.perf_counter() - started)
+
+
+def _flood_process(url: str, args: argparse.Namespace, headers: Optional[Dict[str, str]], results) -> None:
+    results.put(asyncio.run(_flood(url, args, headers)))
+
+
+async def run_phase(target: HttpTarget, args: argparse.Namespace, phase: str) -> Dict[str, Any]:
+    interactive = Workload(seed=args.seed, median_words=args.interactive_words, sigma=0.5)
+    recorder = Recorder()
+
+    flood = None
+    if phase != "alone":
+        headers = {"X-Request-Class": "batch"} if phase == "batch_flood" else None
+        results = multiprocessing.Queue()
+        flood = multiprocessing.Process(target=_flood_process, args=(target.url, args, headers, results))
+        flood.start()
+        # Let the flood build up before measuring
+        await asyncio.sleep(FLOOD_LEAD_SECONDS)
+
+    waits_before = await queue_wait(target)
+    started = time.perf_counter()
+    await asyncio.gather(*(_client(target, interactive, recorder, started + args.duration, None)
+                           for _ in range(args.interactive_concurrency)))
+    result = {"interactive": _summary(recorder, time.perf_counter() - started)}
+    waits_after = await queue_wait(target)
+    result["server_queue_wait_ms"] = {
+        lane: round((total - waits_before.get(lane, [0, 0])[0]) / count * 1000, 3)
+        for lane, (total, count) in ((lane, (value[0], value[1] - waits_before.get(lane, [0, 0])[1]))
+                                     for lane, value in waits_after.items())
+        if count > 0
+    }
+    if flood is not None:
+        result["batch"] = await asyncio.to_thread(results.get)
+        flood.join()
+    return result
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    env = dict(item.split("=", 1) for item in args.server_env)
+    target = HttpTarget(env=env)
+    await target.start(args.interactive_concurrency + args.batch_concurrency)
+    try:
+        warmup = Workload(seed=0)
+        for _ in range(20):
+            await target.call(*warmup.next_call())
+        report = {"config": {key: value for key, value in vars(args).items() if key != "output"}}
+        for phase in args.phases:
+            report[phase] = await run_phase(target, args, phase)
+        return report
+    finally:
+        await target.stop()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    parser.add_argument("--interactive-concurrency", type=int, default=2)
+    parser.add_argument("--interactive-words", type=int, default=30, help="median interactive prompt length")
+    parser.add_argument("--batch-concurrency", type=int, default=32)
+    parser.add_argument("--batch-words", type=int, default=1500, help="median batch prompt length")
+    parser.add_argument("--phases", nargs="+", choices=PHASES, default=list(PHASES))
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="environment variable for the server process (repeatable)")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    text = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
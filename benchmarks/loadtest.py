@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+End-to-end load generator for the Prompt Optimizer servers.
+
+Starts the server locally -- http_server.py under uvicorn, or server.py over MCP
+stdio -- drives open-loop (fixed arrival rate) or closed-loop (fixed number of
+concurrent clients) load with a log-normal prompt-length distribution, and
+reports throughput, latency percentiles and the server's CPU time and RSS.
+Results are written as JSON so runs can be compared. Run from the repository root:
+
+    python benchmarks/loadtest.py --transport http --mode closed --concurrency 16 --duration 30
+    python benchmarks/loadtest.py --transport stdio --mode open --rate 200 --output run.json
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, REPO_ROOT)
+
+STYLES = ("creative", "precise", "fast")
+
+VOCABULARY = (
+    "please write a very detailed explanation about machine learning models data training "
+    "could you describe the system design and analyze its performance really quickly simply "
+    "summarize report customer feedback kind of sort of just actually features latency "
+    "create demonstrate comprehensive implement utilize additionally furthermore story cat"
+).split()
+
+
+# ---------------------------------------------------------------------------
+# Workload
+# ---------------------------------------------------------------------------
+
+class Workload:
+    """Reproducible stream of optimize and score calls with log-normal prompt lengths."""
+
+    def __init__(self, seed: int = 7, median_words: int = 40, sigma: float = 1.0,
+                 max_words: int = 5000, score_fraction: float = 0.3):
+        self.rng = random.Random(seed)
+        self.mu = math.log(median_words)
+        self.sigma = sigma
+        self.max_words = max_words
+        self.score_fraction = score_fraction
+
+    def prompt(self) -> str:
+        words = int(min(self.max_words, max(1, self.rng.lognormvariate(self.mu, self.sigma))))
+        tokens = [self.rng.choice(VOCABULARY) for _ in range(words)]
+        # Roughly one sentence break every 12 words
+        for i in range(11, words, 12):
+            tokens[i] += "."
+        return " ".join(tokens)
+
+    def next_call(self) -> Tuple[str, Dict[str, str]]:
+        """Return (operation, arguments) for the next request."""
+        prompt = self.prompt()
+        if self.rng.random() < self.score_fraction:
+            improved = " ".join(word for word in prompt.split() if self.rng.random() > 0.2) or prompt
+            return "score", {"raw_prompt": prompt, "improved_prompt": improved}
+        return "optimize", {"raw_prompt": prompt, "style": self.rng.choice(STYLES)}
+
+
+# ---------------------------------------------------------------------------
+# Server process statistics
+# ---------------------------------------------------------------------------
+
+def process_stats(pid: int) -> Tuple[float, int]:
+    """Return (CPU seconds, RSS bytes) of a process, via psutil when available, else /proc."""
+    try:
+        import psutil
+        proc = psutil.Process(pid)
+        times = proc.cpu_times()
+        return times.user + times.system, proc.memory_info().rss
+    except ImportError:
+        pass
+
+    with open(f"/proc/{pid}/stat", "r") as fh:
+        fields = fh.read().rsplit(")", 1)[1].split()
+    ticks = os.sysconf("SC_CLK_TCK")
+    cpu = (int(fields[11]) + int(fields[12])) / ticks
+    rss = int(fields[21]) * os.sysconf("SC_PAGE_SIZE")
+    return cpu, rss
+
+
+def child_pids(parent: int) -> List[int]:
+    """Return the PIDs of the direct children of ``parent`` (Linux /proc fallback)."""
+    try:
+        import psutil
+        return [child.pid for child in psutil.Process(parent).children()]
+    except ImportError:
+        pass
+
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as fh:
+                ppid = int(fh.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == parent:
+            children.append(int(entry))
+    return children
+
+
+# ---------------------------------------------------------------------------
+# Transports
+# ---------------------------------------------------------------------------
+
+class HttpTarget:
+    """http_server.py under uvicorn in a subprocess."""
+
+    name = "http"
+
+    def __init__(self, port: Optional[int] = None, env: Optional[Dict[str, str]] = None):
+        self.port = port or self._free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.env = env or {}
+        self.process = None
+        self.client = None
+        self.pid = None
+
+    @staticmethod
+    def _free_port() -> int:
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    async def start(self, connections: int) -> None:
+        import httpx
+
+        env = dict(os.environ, **self.env)
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "http_server:app", "--host", "127.0.0.1",
+             "--port", str(self.port), "--log-level", "warning"],
+            cwd=REPO_ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self.pid = self.process.pid
+        self.client = httpx.AsyncClient(
+            base_url=self.url, timeout=60.0,
+            limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections)
+        )
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if (await self.client.get("/ready")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("HTTP server failed to start")
+            await asyncio.sleep(0.1)
+
+    async def call(self, operation: str, arguments: Dict[str, str],
+                   headers: Optional[Dict[str, str]] = None) -> str:
+        response = await self.client.post(f"/{operation}", json=arguments, headers=headers)
+        return str(response.status_code)
+
+    async def stop(self) -> None:
+        if self.client is not None:
+            await self.client.aclose()
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class StdioTarget:
+    """server.py over MCP stdio, spawned by the MCP client."""
+
+    name = "stdio"
+
+    TOOLS = {"optimize": "optimize_prompt_tool", "score": "score_prompt_tool"}
+
+    def __init__(self, env: Optional[Dict[str, str]] = None):
+        self.env = env or {}
+        self.pid = None
+        self._stack = None
+        self.session = None
+
+    async def start(self, connections: int) -> None:
+        from contextlib import AsyncExitStack
+        from mcp import ClientSession, StdioServerParameters
+        from mcp.client.stdio import stdio_client
+
+        before = set(child_pids(os.getpid()))
+        params = StdioServerParameters(
+            command=sys.executable, args=["server.py"], cwd=REPO_ROOT, env=dict(os.environ, **self.env)
+        )
+        self._stack = AsyncExitStack()
+        errlog = self._stack.enter_context(open(os.devnull, "w"))
+        read_stream, write_stream = await self._stack.enter_async_context(stdio_client(params, errlog=errlog))
+        self.session = await self._stack.enter_async_context(ClientSession(read_stream, write_stream))
+        await self.session.initialize()
+        spawned = [pid for pid in child_pids(os.getpid()) if pid not in before]
+        self.pid = spawned[0] if spawned else None
+
+    async def call(self, operation: str, arguments: Dict[str, str]) -> str:
+        result = await self.session.call_tool(self.TOOLS[operation], arguments)
+        return "error" if result.isError else "ok"
+
+    async def stop(self) -> None:
+        if self._stack is not None:
+            await self._stack.aclose()
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+def percentile(sorted_values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list (q in [0, 100])."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """Collects per-request latency and outcome, and samples server resource use."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.outcomes: Dict[str, int] = {}
+        self.rss_peak = 0
+
+    def record(self, latency: float, outcome: str) -> None:
+        self.latencies.append(latency)
+        self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    async def sample_rss(self, pid: Optional[int], interval: float = 0.2) -> None:
+        while pid is not None:
+            try:
+                self.rss_peak = max(self.rss_peak, process_stats(pid)[1])
+            except (OSError, ValueError):
+                return
+            await asyncio.sleep(interval)
+
+
+async def _timed_call(target, workload: Workload, recorder: Recorder) -> None:
+    operation, arguments = workload.next_call()
+    start = time.perf_counter()
+    try:
+        outcome = await target.call(operation, arguments)
+    except Exception as e:
+        outcome = type(e).__name__
+    recorder.record(time.perf_counter() - start, outcome)
+
+
+async def closed_loop(target, workload: Workload, recorder: Recorder, concurrency: int, duration: float) -> None:
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            await _timed_call(target, workload, recorder)
+
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+
+
+async def open_loop(target, workload: Workload, recorder: Recorder, rate: float, duration: float,
+                    max_outstanding: int) -> None:
+    rng = random.Random(workload.rng.random())
+    tasks = set()
+    start = time.perf_counter()
+    next_arrival = start
+    while next_arrival < start + duration:
+        delay = next_arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(tasks) < max_outstanding:
+            task = asyncio.ensure_future(_timed_call(target, workload, recorder))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        else:
+            recorder.record(0.0, "dropped_by_generator")
+        # Poisson arrivals
+        next_arrival += rng.expovariate(rate)
+    if tasks:
+        await asyncio.gather(*tasks)
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    env = dict(item.split("=", 1) for item in args.server_env)
+    target = HttpTarget(env=env) if args.transport == "http" else StdioTarget(env=env)
+    workload = Workload(seed=args.seed, median_words=args.median_words, sigma=args.sigma,
+                        max_words=args.max_words, score_fraction=args.score_fraction)
+    recorder = Recorder()
+    connections = args.concurrency if args.mode == "closed" else args.max_outstanding
+
+    await target.start(connections)
+    try:
+        # Warm up so import and first-call costs do not skew the measurement
+        for _ in range(args.warmup):
+            await target.call(*workload.next_call())
+
+        cpu_before = process_stats(target.pid)[0] if target.pid else None
+        sampler = asyncio.ensure_future(recorder.sample_rss(target.pid))
+        started = time.perf_counter()
+        if args.mode == "closed":
+            await closed_loop(target, workload, recorder, args.concurrency, args.duration)
+        else:
+            await open_loop(target, workload, recorder, args.rate, args.duration, args.max_outstanding)
+        elapsed = time.perf_counter() - started
+        cpu_after = process_stats(target.pid)[0] if target.pid else None
+        sampler.cancel()
+    finally:
+        await target.stop()
+
+    completed = [lat for lat in recorder.latencies if lat > 0]
+    completed.sort()
+    ok = recorder.outcomes.get("200", 0) + recorder.outcomes.get("ok", 0)
+    cpu_seconds = cpu_after - cpu_before if cpu_before is not None else None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(), "cpus": os.cpu_count()},
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "elapsed_seconds": round(elapsed, 3),
+        "requests": len(recorder.latencies),
+        "outcomes": recorder.outcomes,
+        "throughput_rps": round(len(completed) / elapsed, 2),
+        "success_rps": round(ok / elapsed, 2),
+        "latency_ms": {
+            name: round(value * 1000, 3) if value is not None else None
+            for name, value in [
+                ("p50", percentile(completed, 50)),
+                ("p90", percentile(completed, 90)),
+                ("p99", percentile(completed, 99)),
+                ("p999", percentile(completed, 99.9)),
+                ("max", completed[-1] if completed else None),
+                ("mean", sum(completed) / len(completed) if completed else None),
+            ]
+        },
+        "server": {
+            "pid": target.pid,
+            "cpu_seconds": round(cpu_seconds, 3) if cpu_seconds is not None else None,
+            "cpu_utilization": round(cpu_seconds / elapsed, 3) if cpu_seconds is not None else None,
+            "rss_peak_bytes": recorder.rss_peak or None,
+        },
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", choices=["http", "stdio"], default="http")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--concurrency", type=int, default=8, help="clients in closed-loop mode")
+    parser.add_argument("--rate", type=float, default=100.0, help="arrivals per second in open-loop mode")
+    parser.add_argument("--max-outstanding", type=int, default=1000, help="open-loop cap on requests in flight")
+    parser.add_argument("--duration", type=float, default=10.0, help="measurement time in seconds")
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent before measuring")
+    parser.add_argument("--median-words", type=int, default=40)
+    parser.add_argument("--sigma", type=float, default=1.0, help="log-normal shape of prompt lengths")
+    parser.add_argument("--max-words", type=int, default=5000)
+    parser.add_argument("--score-fraction", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="environment variable for the server process (repeatable)")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Micro-batching benchmark: many concurrent clients sending one short prompt each.
+
+Runs the same closed-loop workload of short optimize and score calls with
+micro-batching off (``MICROBATCH_MAX_SIZE=1``) and on, at each concurrency
+level, and reports throughput and p50/p99 latency of both. With
+``--transport scheduler`` the calls go straight to a scheduler in this
+process, which isolates the per-job hand-off cost that batching saves; with
+``--transport http`` they go through http_server.py under uvicorn. Run from
+the repository root:
+
+    python benchmarks/microbatch.py --duration 5 --concurrency 1 8 64
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks.loadtest import HttpTarget, Recorder, Workload, closed_loop, percentile
+from tools.microbatch import MicroBatcher
+from tools.optimize import optimize_prompt, score_prompt
+from tools.scheduler import FairScheduler
+
+
+class SchedulerTarget:
+    """Calls run on an in-process scheduler behind a MicroBatcher."""
+
+    name = "scheduler"
+
+    def __init__(self, workers: int, max_batch: int, max_wait: float):
+        self.scheduler = FairScheduler("bench_microbatch", workers=workers)
+        self.batcher = MicroBatcher(self.scheduler, max_batch=max_batch, max_wait=max_wait)
+
+    async def call(self, operation: str, arguments: Dict[str, str]) -> str:
+        if operation == "score":
+            await self.batcher.submit(score_prompt, arguments["raw_prompt"], arguments["improved_prompt"])
+        else:
+            await self.batcher.submit(optimize_prompt, arguments["raw_prompt"], arguments["style"])
+        return "ok"
+
+    async def stop(self) -> None:
+        self.scheduler.shutdown()
+
+
+async def run_level(args: argparse.Namespace, max_batch: int, concurrency: int) -> Dict[str, Any]:
+    if args.transport == "http":
+        target = HttpTarget(env={"MICROBATCH_MAX_SIZE": str(max_batch),
+                                 "MICROBATCH_WINDOW_MS": str(args.window_ms),
+                                 "WORKER_THREADS": str(args.workers)})
+        await target.start(concurrency)
+    else:
+        target = SchedulerTarget(args.workers, max_batch, args.window_ms / 1000)
+    try:
+        await closed_loop(target, Workload(seed=0, median_words=args.median_words, sigma=0.5),
+                          Recorder(), concurrency, args.warmup)
+        recorder = Recorder()
+        started = time.perf_counter()
+        await closed_loop(target, Workload(seed=args.seed, median_words=args.median_words, sigma=0.5),
+                          recorder, concurrency, args.duration)
+        elapsed = time.perf_counter() - started
+    finally:
+        await target.stop()
+
+    latencies = sorted(recorder.latencies)
+    return {
+        "requests": len(latencies),
+        "outcomes": recorder.outcomes,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": {
+            name: round(value * 1000, 3) if value is not None else None
+            for name, value in [("p50", percentile(latencies, 50)), ("p99", percentile(latencies, 99))]
+        },
+    }
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    report: Dict[str, Any] = {"config": {key: value for key, value in vars(args).items() if key != "output"}}
+    modes = {"off": 1, "on": args.max_batch}
+    for concurrency in args.concurrency:
+        level = report[f"concurrency_{concurrency}"] = {}
+        for mode, max_batch in modes.items():
+            level[mode] = await run_level(args, max_batch, concurrency)
+        level["throughput_gain"] = round(level["on"]["throughput_rps"] / max(level["off"]["throughput_rps"], 1e-9), 3)
+    return report
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--transport", choices=("scheduler", "http"), default="scheduler")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds per measurement")
+    parser.add_argument("--warmup", type=float, default=0.5, help="seconds of unmeasured load before each")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--workers", type=int, default=4, help="scheduler worker threads")
+    parser.add_argument("--max-batch", type=int, default=16, help="batch size with batching on")
+    parser.add_argument("--window-ms", type=float, default=2.0, help="longest wait for a busy worker")
+    parser.add_argument("--median-words", type=int, default=20, help="median prompt length")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    text = json.dumps(asyncio.run(run(args)), indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,45 +6,629 @@ This provides HTTP transport for the MCP server when deployed.
 """
 
 import os
+import asyncio
+import hmac
+import json
+import math
+import random
+import tempfile
+import time
 import logging
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
-from typing import List, Literal
+from contextlib import asynccontextmanager, suppress
+from contextvars import ContextVar
+from fastapi import Depends, FastAPI, Header, HTTPException, Path, Query, Request, WebSocket
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from starlette.datastructures import Headers
+from starlette.requests import ClientDisconnect, HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import Annotated, Any, AsyncIterator, Awaitable, Callable, Dict, List, Literal, Optional, Union
 import uvicorn
 
-from tools.optimize import optimize_prompt, score_prompt
+from tools.admission import AdmissionController
+from tools.analytics import DEFAULT_QUANTILES, CorpusAnalysis
+from tools.approximate import APPROXIMATE_MIN_CHARS, score_with_error
+from tools.deadline import CANCELLED, DEADLINE, CancelToken, OperationCancelledError, cancel_scope, run_with_deadline
+from tools.engines import ENGINES, Engine, ShadowVerifier, engine_scope, get_engine
+from tools.httpcache import RULES_VERSION, ContentStore, content_hash, etag_matches, make_etag, representation_etag
+from tools.jobs import OPERATIONS, OPTIMIZE, SCORE, JobRunner, JobStore, Outcome, read_corpus
+from tools.limits import LimitPolicy, RequestTooLargeError, SizeLimits, parse_api_keys, parse_tenant_limits
+from tools.metrics import REGISTRY
+from tools.microbatch import MicroBatcher
+from tools.optimize import record_stages
+from tools.profiler import MAX_SECONDS, ProfilerBusyError, format_collapsed, sample_stacks
+from tools.similarity import load_or_create
+from tools.scheduler import BATCH, FairScheduler, SchedulerRejectedError, parse_weights
+from tools.singleflight import SingleFlight, content_key
+from tools.styles import BUILTIN_STYLES, DEFAULT_TENANT, CompiledStyle, StyleRegistry
+from tools.warmup import CORPUS, Warmup, warm_rules, warm_scorer
+from tools import wire
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Similarity index of previously optimized prompts, persisted across restarts
+SIMILARITY_INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH")
+similarity_index = load_or_create(SIMILARITY_INDEX_PATH)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown hooks."""
+    logger.info(f"Similarity index loaded with {len(similarity_index)} prompts")
+    warming = asyncio.ensure_future(run_in_threadpool(warmup.run))
+    running_jobs = asyncio.ensure_future(job_runner.run())
+    yield
+    running_jobs.cancel()
+    with suppress(asyncio.CancelledError):
+        await running_jobs
+    await warming
+    scheduler.shutdown()
+    if SIMILARITY_INDEX_PATH:
+        similarity_index.save(SIMILARITY_INDEX_PATH)
+        logger.info(f"Saved similarity index to {SIMILARITY_INDEX_PATH}")
+
+# Tenant-registered custom styles; compiled pipelines are kept in a per-tenant LRU
+style_registry = StyleRegistry(
+    cache_size=int(os.getenv("STYLE_CACHE_SIZE", 32)),
+    max_styles=int(os.getenv("MAX_STYLES_PER_TENANT", 100)),
+    max_tenants=int(os.getenv("MAX_STYLE_TENANTS", 1000))
+)
+
+def tenant_id(x_tenant_id: str = Header(default=DEFAULT_TENANT, min_length=1, max_length=64)) -> str:
+    """Dependency that returns the calling tenant from the X-Tenant-ID header."""
+    return x_tenant_id
+
+# Responses at least this large are compressed when the client accepts zstd or gzip
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))
+
+async def _decode_msgpack_request(request: Request) -> Request:
+    """Rebuild a msgpack request as the equivalent JSON request for FastAPI to validate."""
+    if not wire.MSGPACK_AVAILABLE:
+        raise HTTPException(status_code=415, detail="application/msgpack is not supported by this server")
+    try:
+        decoded = wire.unpackb(await request.body())
+        body = json.dumps(decoded, allow_nan=False).encode()
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    replayed = False
+
+    async def receive() -> Message:
+        # Hand the JSON body to the route once, then pass through to the client connection
+        nonlocal replayed
+        if replayed:
+            return await request.receive()
+        replayed = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    scope = dict(request.scope)
+    scope["headers"] = [(k, v) for k, v in request.scope["headers"] if k not in (b"content-type", b"content-length")]
+    scope["headers"] += [(b"content-type", wire.JSON_TYPE.encode()), (b"content-length", str(len(body)).encode())]
+    return Request(scope, receive)
+
+def _encode_response(request: Request, response: Response) -> Response:
+    """Re-encode a JSON response as msgpack and compress it, as negotiated with the client."""
+    body = getattr(response, "body", None)
+    if body is None:
+        return response
+
+    response.headers["Vary"] = ", ".join(filter(None, [response.headers.get("vary"), "Accept, Accept-Encoding"]))
+    if response.status_code == 304:
+        return response
+    transforms = []
+    content_type = response.headers.get("content-type", "")
+    if content_type.startswith(wire.JSON_TYPE) and wire.MSGPACK_AVAILABLE and wire.wants_msgpack(request.headers.get("accept")):
+        body = wire.packb(json.loads(body))
+        response.headers["content-type"] = wire.MSGPACK_TYPE
+        transforms.append("msgpack")
+
+    encoding = wire.choose_encoding(request.headers.get("accept-encoding")) if len(body) >= COMPRESSION_MIN_BYTES else None
+    if encoding:
+        body = wire.compress(body, encoding)
+        response.headers["content-encoding"] = encoding
+        transforms.append(encoding)
+    if transforms and "etag" in response.headers:
+        response.headers["etag"] = representation_etag(response.headers["etag"], *transforms)
+
+    response.body = body
+    response.headers["content-length"] = str(len(body))
+    return response
+
+class NegotiatedRoute(APIRoute):
+    """Route that accepts and returns msgpack as well as JSON and compresses large responses."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def negotiated_handler(request: Request) -> Response:
+            if wire.is_msgpack(request.headers.get("content-type")):
+                request = await _decode_msgpack_request(request)
+            response = await handler(request)
+            return _encode_response(request, response)
+
+        return negotiated_handler
+
 # Create FastAPI app
 app = FastAPI(
     title="Prompt Optimizer MCP Server",
     description="A Model Context Protocol server for optimizing and scoring LLM prompts",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
+)
+app.router.route_class = NegotiatedRoute
+
+# Admin endpoints are disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+def require_admin(request: Request) -> None:
+    """Dependency that allows only callers presenting the admin token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+# Priority lanes: compute runs on a small worker pool that serves the lanes by
+# weighted fair queuing, so bulk traffic cannot crowd out interactive calls
+scheduler = FairScheduler(
+    "http",
+    workers=int(os.getenv("WORKER_THREADS", 4)),
+    weights=parse_weights(os.getenv("LANE_WEIGHTS")),
+    max_queue=int(os.getenv("LANE_MAX_QUEUE", 1000)),
+    tenant_limit=int(os.getenv("TENANT_MAX_IN_FLIGHT", 0))
+)
+
+# Concurrent single calls of one lane and tenant run as one worker job while every worker
+# is busy, for up to MICROBATCH_WINDOW_MS; MICROBATCH_MAX_SIZE=1 turns batching off
+batcher = MicroBatcher(
+    scheduler,
+    max_batch=int(os.getenv("MICROBATCH_MAX_SIZE", 16)),
+    max_wait=float(os.getenv("MICROBATCH_WINDOW_MS", 2)) / 1000
+)
+
+# Readiness: /ready answers 503 until the warmup steps, run in the background at startup, have finished
+warmup = Warmup()
+warmup.add("workers", scheduler.start)
+warmup.add("rules", warm_rules)
+warmup.add("scorer", warm_scorer)
+warmup.add("similarity_index", lambda: similarity_index.query(CORPUS[0]))
+
+# Requests with these API keys always go to the batch lane, whatever they ask for
+BATCH_API_KEYS = {key.strip() for key in os.getenv("BATCH_API_KEYS", "").split(",") if key.strip()}
+
+def request_lane(request: HTTPConnection) -> str:
+    """Dependency that picks the lane from the API key or the X-Request-Class header."""
+    if BATCH in scheduler.weights and request.headers.get("x-api-key") in BATCH_API_KEYS:
+        return BATCH
+    lane = request.headers.get("x-request-class", "").lower()
+    return lane if lane in scheduler.weights else scheduler.default_lane
+
+# Engine that runs optimize and score unless a request picks another with X-Engine
+DEFAULT_ENGINE = get_engine(os.getenv("ENGINE", "reference"))
+# Shadow mode: this fraction of the calls served by a non-reference engine is run again on
+# the reference engine in the background and the outputs compared byte for byte
+shadow = ShadowVerifier(
+    sample_rate=float(os.getenv("ENGINE_SHADOW_RATE", 0.01)),
+    max_pending=int(os.getenv("ENGINE_SHADOW_MAX_PENDING", 64))
+)
+
+def request_engine(request: HTTPConnection) -> Engine:
+    """Dependency that picks the engine from the X-Engine header, or the process default."""
+    name = request.headers.get("x-engine")
+    if not name:
+        return DEFAULT_ENGINE
+    try:
+        return get_engine(name)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def work_cost(*texts: str) -> float:
+    """Scheduler cost of a request: one unit plus one per 1000 characters of input."""
+    return 1 + sum(len(text) for text in texts) / 1000
+
+def overloaded(error: SchedulerRejectedError) -> HTTPException:
+    """429 response for work the scheduler refused to queue."""
+    logger.warning(f"Rejecting request: {error}")
+    return HTTPException(status_code=429, detail=str(error), headers={"Retry-After": "1"})
+
+# Every request gets a deadline: REQUEST_TIMEOUT_SECONDS, or less if the client sends X-Request-Timeout-Ms
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT_SECONDS", 30))
+
+def request_timeout(x_request_timeout_ms: Optional[float] = Header(default=None, gt=0)) -> float:
+    """Dependency that returns the request's time budget in seconds, capped at the server default."""
+    if x_request_timeout_ms is None:
+        return REQUEST_TIMEOUT
+    return min(x_request_timeout_ms / 1000, REQUEST_TIMEOUT)
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # The body has been read by now, so the next message is the disconnect; a zero-timeout
+    # is_disconnected() poll never sees it through the middleware's receive wrapper
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+async def run_job(request: Request, timeout: float, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Await ``fn()`` under a deadline of ``timeout`` seconds.
+
+    The work is cancelled when the deadline passes or the client disconnects:
+    queued jobs are dropped and running ones stop at their next checkpoint.
+
+    Raises:
+        OperationCancelledError: If the deadline passed or the client went away
+    """
+    token = CancelToken(timeout)
+    with cancel_scope(token):
+        # The task copies the current context, so the token follows the work onto the workers
+        work = asyncio.ensure_future(fn())
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait((work, watcher), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not work.done():
+            work.cancel()
+    if work in done:
+        return work.result()
+    if watcher in done:
+        raise OperationCancelledError("client disconnected", CANCELLED)
+    raise OperationCancelledError("deadline exceeded", DEADLINE)
+
+def cancelled(error: OperationCancelledError) -> HTTPException:
+    """504 for work that ran out of time; 499 (client closed request) for work the client gave up on."""
+    logger.warning(f"Request stopped early: {error}")
+    return HTTPException(status_code=504 if error.reason == DEADLINE else 499, detail=str(error))
+
+# Combined prompt length from which /score estimates instead of computing exactly
+APPROXIMATE_SCORE_MIN_CHARS = int(os.getenv("APPROXIMATE_SCORE_MIN_CHARS", APPROXIMATE_MIN_CHARS))
+
+# Identical concurrent requests share one computation
+optimize_flight = SingleFlight("http_optimize")
+score_flight = SingleFlight("http_score")
+
+# Input size limits, enforced before a body is parsed: MAX_BODY_BYTES per request body,
+# MAX_CORPUS_BYTES per corpus uploaded to /jobs or /analyze and MAX_PROMPT_CHARS per prompt;
+# 0 turns a limit off. TENANT_SIZE_LIMITS raises them per tenant, e.g. "acme.body=67108864,acme.prompt=0",
+# for callers presenting one of the tenant's TENANT_API_KEYS in X-API-Key, e.g. "k3y=acme"; X-Tenant-ID
+# alone is not authenticated and gets the defaults. A caller can omit its key, so overrides may only loosen
+DEFAULT_SIZE_LIMITS = SizeLimits(
+    max_body_bytes=int(os.getenv("MAX_BODY_BYTES", 16 * 1024 * 1024)),
+    max_prompt_chars=int(os.getenv("MAX_PROMPT_CHARS", 4_000_000)),
+    max_corpus_bytes=int(os.getenv("MAX_CORPUS_BYTES", 1024 ** 3))
+)
+size_limits = LimitPolicy(DEFAULT_SIZE_LIMITS,
+                          parse_tenant_limits(os.getenv("TENANT_SIZE_LIMITS"), DEFAULT_SIZE_LIMITS),
+                          parse_api_keys(os.getenv("TENANT_API_KEYS")))
+# Limits of the current request, set by BodySizeLimit from its API key
+_request_limits: ContextVar[Optional[SizeLimits]] = ContextVar('_request_limits', default=None)
+CORPUS_PATHS = {"/jobs", "/analyze"}
+too_large_requests = REGISTRY.counter("requests_too_large_total", "Requests refused for their size, by limit")
+
+def too_large(error: RequestTooLargeError) -> HTTPException:
+    """413 response for input over a size limit."""
+    logger.warning(f"Rejecting request: {error}")
+    too_large_requests.inc(limit=error.kind)
+    return HTTPException(status_code=413, detail=str(error))
+
+def request_limits() -> SizeLimits:
+    """Limits of the current request: its authenticated tenant's, or the defaults."""
+    limits = _request_limits.get()
+    return limits if limits is not None else size_limits.default
+
+def limit_prompts(**prompts: str) -> None:
+    """
+    Hold each prompt to the prompt limit of the current request.
+
+    Raises:
+        HTTPException: 413 if a prompt is too long
+    """
+    limits = request_limits()
+    try:
+        for field, text in prompts.items():
+            limits.check_prompt(text, field)
+    except RequestTooLargeError as e:
+        raise too_large(e)
+
+class BodySizeLimit:
+    """
+    ASGI middleware that holds request bodies to the caller's size limit as they stream in.
+
+    A body declared larger than the limit by Content-Length is refused before
+    any of it is read. Otherwise the bytes are counted as the endpoint reads
+    them, and reading fails with 413 once they pass the limit, so no more than
+    the limit is ever buffered for a request.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        limits = size_limits.for_api_key(headers.get("x-api-key"))
+        reset = _request_limits.set(limits)
+        try:
+            if scope["type"] == "http":
+                await self.limited(scope, receive, send, headers, limits)
+            else:
+                # WebSocket messages are held to the prompt limit as they are dispatched
+                await self.app(scope, receive, send)
+        finally:
+            _request_limits.reset(reset)
+
+    async def limited(self, scope: Scope, receive: Receive, send: Send, headers: Headers,
+                      limits: SizeLimits) -> None:
+        corpus = scope["path"] in CORPUS_PATHS
+        declared = headers.get("content-length", "")
+        try:
+            limits.check_body(int(declared) if declared.isdigit() else 0, corpus)
+        except RequestTooLargeError as e:
+            error = too_large(e)
+            response = JSONResponse(status_code=413, content={"detail": error.detail}, headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Dict[str, Any]:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                try:
+                    limits.check_body(received, corpus)
+                except RequestTooLargeError as e:
+                    # FastAPI lets an HTTPException raised while reading the body through as the response
+                    raise too_large(e)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+# Added before the other middleware, so it is the innermost: raised from their receive wrappers,
+# the 413 would reach FastAPI inside an exception group and become a 400
+app.add_middleware(BodySizeLimit)
+
+# Admission control: shed load with 429 instead of queueing work we cannot finish in time
+ADMISSION_EXEMPT_PATHS = {"/", "/health", "/ready", "/metrics", "/debug/profile"}
+admission = AdmissionController(
+    max_in_flight=int(os.getenv("MAX_IN_FLIGHT", 64)),
+    rate=float(os.getenv("RATE_LIMIT_RPS", 0)),
+    burst=float(os.getenv("RATE_LIMIT_BURST")) if os.getenv("RATE_LIMIT_BURST") else None
+)
+# The batch lane has its own budget so a flood of bulk requests cannot use up the interactive one
+batch_admission = AdmissionController(
+    max_in_flight=int(os.getenv("MAX_IN_FLIGHT", 64)),
+    rate=float(os.getenv("RATE_LIMIT_RPS", 0)),
+    burst=float(os.getenv("RATE_LIMIT_BURST")) if os.getenv("RATE_LIMIT_BURST") else None
 )
 
+@app.middleware("http")
+async def admission_control(request: Request, call_next):
+    """Reject requests immediately when the server is over capacity."""
+    if request.url.path in ADMISSION_EXEMPT_PATHS:
+        return await call_next(request)
+
+    controller = batch_admission if request_lane(request) == BATCH else admission
+    retry_after = controller.try_acquire()
+    if retry_after is not None:
+        logger.warning(f"Rejecting {request.url.path}: server over capacity")
+        return JSONResponse(
+            status_code=429,
+            content={"detail": "Server over capacity, retry later"},
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+        )
+    try:
+        return await call_next(request)
+    finally:
+        controller.release()
+
+# Per-stage timing: returned as Server-Timing when a request sends "X-Server-Timing: 1",
+# and recorded in histograms for those requests plus a sampled fraction of the rest
+STAGE_TIMING_SAMPLE_RATE = float(os.getenv("STAGE_TIMING_SAMPLE_RATE", 0))
+stage_seconds = REGISTRY.histogram("stage_duration_seconds", "Time spent in each optimize/score stage")
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    """Collect stage timings for opted-in or sampled requests."""
+    opted_in = request.headers.get("x-server-timing", "").lower() in ("1", "true", "yes")
+    if not opted_in and not (STAGE_TIMING_SAMPLE_RATE and random.random() < STAGE_TIMING_SAMPLE_RATE):
+        return await call_next(request)
+
+    start = time.perf_counter()
+    with record_stages() as timings:
+        response = await call_next(request)
+    total = time.perf_counter() - start
+
+    for stage, seconds in timings:
+        stage_seconds.observe(seconds, stage=stage)
+    if opted_in:
+        entries = [f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in timings]
+        entries.append(f"total;dur={total * 1000:.3f}")
+        response.headers["Server-Timing"] = ", ".join(entries)
+    return response
+
+# Items one /optimize/batch or /score/batch request may hold
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 256))
+
 # Pydantic models for request/response
 class OptimizeRequest(BaseModel):
     raw_prompt: str
-    style: Literal['creative', 'precise', 'fast']
+    # 'creative', 'precise', 'fast' or a style registered by the tenant
+    style: str = Field(min_length=1, max_length=64)
+    # "delta" returns each variant as an edit script against raw_prompt instead of a full string
+    response_format: Literal['full', 'delta'] = 'full'
+    # Indices of the variants to build, in response order; all three by default
+    variants: Optional[List[Annotated[int, Field(ge=0, le=2)]]] = None
 
 class OptimizeResponse(BaseModel):
-    variants: List[str]
+    variants: Optional[List[str]] = None
+    edits: Optional[List[List[List[Union[str, int]]]]] = None
 
 class ScoreRequest(BaseModel):
     raw_prompt: str
     improved_prompt: str
+    # Force exact (False) or approximate (True) scoring; by default inputs of
+    # APPROXIMATE_SCORE_MIN_CHARS or more are scored approximately
+    approximate: Optional[bool] = None
 
 class ScoreResponse(BaseModel):
     score: float
+    # Error bound of an approximate score (about 95% confidence); 0.0 for exact scores
+    error: float = 0.0
+    approximate: bool = False
+
+class OptimizeBatchRequest(BaseModel):
+    requests: List[OptimizeRequest] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class ScoreBatchRequest(BaseModel):
+    requests: List[ScoreRequest] = Field(min_length=1, max_length=BATCH_MAX_ITEMS)
+
+class BatchResult(BaseModel):
+    # Status /optimize or /score would have answered this item with
+    status: int
+    result: Optional[Dict[str, Any]] = None
+    detail: Optional[Any] = None
+
+class BatchResponse(BaseModel):
+    # One result per request, in request order
+    results: List[BatchResult]
+
+class PromptRequest(BaseModel):
+    text: str
+
+class PromptResponse(BaseModel):
+    # SHA-256 of the UTF-8 text, for raw_prompt_hash and improved_prompt_hash
+    hash: str
+
+class SimilarRequest(BaseModel):
+    raw_prompt: str
+    k: int = Field(default=5, ge=1, le=100)
+    min_similarity: float = Field(default=0.0, ge=0.0, le=1.0)
+
+class SimilarMatch(BaseModel):
+    prompt: str
+    similarity: float
+    payload: Optional[Any] = None
+
+class SimilarResponse(BaseModel):
+    matches: List[SimilarMatch]
+
+class SimilarIndexRequest(BaseModel):
+    raw_prompt: str
+    payload: Optional[Any] = None
+
+class SimilarIndexResponse(BaseModel):
+    size: int
+
+class JobResponse(BaseModel):
+    id: str
+    # queued, running, done or failed
+    status: str
+    operation: str
+    options: Dict[str, Any]
+    total: int
+    # Items processed so far, and how many of those failed
+    done: int
+    failed: int
+    created: float
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    # Items per second since the job last started or resumed after a restart
+    throughput: Optional[float] = None
+    eta_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+class JobResult(BaseModel):
+    # Position of the item in the corpus
+    index: int
+    result: Optional[Any] = None
+    error: Optional[str] = None
+
+class JobResultsResponse(BaseModel):
+    results: List[JobResult]
+    # Cursor of the next page; None once every result has been returned
+    next_cursor: Optional[str] = None
+
+class Distribution(BaseModel):
+    count: int
+    mean: Optional[float] = None
+    stddev: Optional[float] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    # Approximate value at each requested rank, keyed by the rank as given
+    quantiles: Dict[str, Optional[float]]
+
+class FillerCount(BaseModel):
+    raw: int
+    improved: int
+
+class AnalyzeExample(BaseModel):
+    # Position of the pair in the corpus, counting only non-blank lines
+    index: int
+    score: float
+    # Cut to the first 200 characters
+    raw_prompt: str
+    improved_prompt: str
+
+class AnalyzeResponse(BaseModel):
+    count: int
+    score: Distribution
+    # length, keywords and clarity; pairs with an empty prompt have no components
+    components: Dict[str, Distribution]
+    # Improved word count over raw word count
+    length_ratio: Distribution
+    fillers: Dict[str, FillerCount]
+    best: List[AnalyzeExample]
+    worst: List[AnalyzeExample]
+
+class StyleRequest(BaseModel):
+    # One list of rewrite operations per variant; see tools/styles.py
+    variants: List[List[Dict[str, Any]]]
+
+class StyleResponse(BaseModel):
+    name: str
+    version: int
+    variants: List[List[Dict[str, Any]]]
+
+class StyleListResponse(BaseModel):
+    builtin: List[str]
+    custom: List[str]
+
+class ShadowMismatch(BaseModel):
+    engine: str
+    operation: str
+    input: str
+    output: str
+    reference_output: str
+    first_difference: int
+    time: float
+
+class EnginesResponse(BaseModel):
+    engines: List[str]
+    default: str
+    shadow_sample_rate: float
+    recent_mismatches: List[ShadowMismatch]
 
 class HealthResponse(BaseModel):
     status: str
     message: str
 
+class ComponentStatus(BaseModel):
+    ready: bool
+    seconds: Optional[float] = None
+    error: Optional[str] = None
+
+class ReadinessResponse(BaseModel):
+    ready: bool
+    # Total warmup time; None while warmup is running
+    warmup_seconds: Optional[float] = None
+    components: Dict[str, ComponentStatus]
+
 @app.get("/", response_model=HealthResponse)
 async def root():
     """Root endpoint."""
@@ -61,30 +645,796 @@ async def health_check():
         message="Prompt Optimizer MCP Server is running"
     )
 
-@app.post("/optimize", response_model=OptimizeResponse)
-async def optimize_prompt_endpoint(request: OptimizeRequest):
+@app.get("/ready", response_model=ReadinessResponse, responses={503: {"model": ReadinessResponse}})
+async def readiness_check(response: Response):
+    """Readiness probe: 200 once warmup has finished, 503 before or if a component failed."""
+    status = warmup.status()
+    if not status["ready"]:
+        response.status_code = 503
+    return status
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics endpoint."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+async def compute_optimize(request: OptimizeRequest, style: CompiledStyle, tenant: str, lane: str,
+                           engine: Engine) -> OptimizeResponse:
+    """Optimize through the single-flight group and the scheduler; shared by /optimize and /ws."""
+    limit_prompts(raw_prompt=request.raw_prompt)
+    delta = request.response_format == 'delta'
+    with engine_scope(engine, shadow):
+        variants = await optimize_flight.do(
+            content_key(request.raw_prompt, style.key, request.response_format, request.variants, engine.name),
+            lambda: batcher.submit(style.optimize_edits if delta else style.optimize,
+                                   request.raw_prompt, request.variants,
+                                   lane=lane, tenant=tenant, cost=work_cost(request.raw_prompt))
+        )
+    logger.info(f"Successfully generated {len(variants)} variants")
+    return OptimizeResponse(edits=variants) if delta else OptimizeResponse(variants=variants)
+
+async def compute_score(request: ScoreRequest, tenant: str, lane: str, engine: Engine) -> ScoreResponse:
+    """Score through the single-flight group and the scheduler; shared by /score and /ws."""
+    limit_prompts(raw_prompt=request.raw_prompt, improved_prompt=request.improved_prompt)
+    with engine_scope(engine, shadow):
+        estimate = await score_flight.do(
+            content_key(request.raw_prompt, request.improved_prompt, request.approximate, engine.name),
+            lambda: batcher.submit(score_with_error, request.raw_prompt, request.improved_prompt,
+                                   request.approximate, APPROXIMATE_SCORE_MIN_CHARS,
+                                   lane=lane, tenant=tenant,
+                                   cost=work_cost(request.raw_prompt, request.improved_prompt))
+        )
+    logger.info(f"Score: {estimate.score}")
+    return ScoreResponse(score=estimate.score, error=estimate.error, approximate=estimate.approximate)
+
+def resolve_style(name: str, tenant: str) -> CompiledStyle:
+    """
+    Look up a built-in style or one the tenant registered.
+
+    Raises:
+        HTTPException: 422 if the tenant has no style of that name
+    """
+    try:
+        return style_registry.resolve(name, tenant)
+    except KeyError:
+        raise HTTPException(status_code=422, detail=f"Unknown style: {name}")
+
+@app.post("/optimize", response_model=OptimizeResponse, response_model_exclude_none=True)
+async def optimize_prompt_endpoint(request: OptimizeRequest, http_request: Request,
+                                   tenant: str = Depends(tenant_id), lane: str = Depends(request_lane),
+                                   timeout: float = Depends(request_timeout),
+                                   engine: Engine = Depends(request_engine)):
     """Optimize a prompt using the specified style."""
+    style = resolve_style(request.style, tenant)
     try:
         logger.info(f"Optimizing prompt with style: {request.style}")
-        variants = optimize_prompt(request.raw_prompt, request.style)
-        logger.info(f"Successfully generated {len(variants)} variants")
-        return OptimizeResponse(variants=variants)
+        return await run_job(http_request, timeout, lambda: compute_optimize(request, style, tenant, lane, engine))
+    except SchedulerRejectedError as e:
+        raise overloaded(e)
+    except OperationCancelledError as e:
+        raise cancelled(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error optimizing prompt: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/score", response_model=ScoreResponse)
-async def score_prompt_endpoint(request: ScoreRequest):
+async def score_prompt_endpoint(request: ScoreRequest, http_request: Request,
+                                tenant: str = Depends(tenant_id), lane: str = Depends(request_lane),
+                                timeout: float = Depends(request_timeout),
+                                engine: Engine = Depends(request_engine)):
     """Score an improved prompt relative to the original."""
     try:
         logger.info("Scoring prompt improvement")
-        score = score_prompt(request.raw_prompt, request.improved_prompt)
-        logger.info(f"Score: {score}")
-        return ScoreResponse(score=score)
+        return await run_job(http_request, timeout, lambda: compute_score(request, tenant, lane, engine))
+    except SchedulerRejectedError as e:
+        raise overloaded(e)
+    except OperationCancelledError as e:
+        raise cancelled(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error scoring prompt: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def batch_item(compute: Callable[[], Awaitable[BaseModel]]) -> BatchResult:
+    """Run one item of a batch; its failure becomes the status the single-item endpoint would return."""
+    try:
+        result = await compute()
+    except OperationCancelledError:
+        raise
+    except HTTPException as e:
+        return BatchResult(status=e.status_code, detail=e.detail)
+    except SchedulerRejectedError as e:
+        return BatchResult(status=429, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in batch item: {e}")
+        return BatchResult(status=500, detail=str(e))
+    return BatchResult(status=200, result=result.model_dump(exclude_none=True))
+
+@app.post("/optimize/batch", response_model=BatchResponse, response_model_exclude_none=True)
+async def optimize_batch_endpoint(request: OptimizeBatchRequest, http_request: Request,
+                                  tenant: str = Depends(tenant_id), lane: str = Depends(request_lane),
+                                  timeout: float = Depends(request_timeout),
+                                  engine: Engine = Depends(request_engine)):
+    """Optimize several prompts at once; each item succeeds or fails on its own."""
+    async def optimize_all() -> BatchResponse:
+        return BatchResponse(results=await asyncio.gather(*(
+            batch_item(lambda item=item: compute_optimize(item, resolve_style(item.style, tenant),
+                                                          tenant, lane, engine))
+            for item in request.requests
+        )))
+
+    try:
+        logger.info(f"Optimizing a batch of {len(request.requests)} prompts")
+        return await run_job(http_request, timeout, optimize_all)
+    except OperationCancelledError as e:
+        raise cancelled(e)
+
+@app.post("/score/batch", response_model=BatchResponse, response_model_exclude_none=True)
+async def score_batch_endpoint(request: ScoreBatchRequest, http_request: Request,
+                               tenant: str = Depends(tenant_id), lane: str = Depends(request_lane),
+                               timeout: float = Depends(request_timeout),
+                               engine: Engine = Depends(request_engine)):
+    """Score several prompt pairs at once; each item succeeds or fails on its own."""
+    async def score_all() -> BatchResponse:
+        return BatchResponse(results=await asyncio.gather(*(
+            batch_item(lambda item=item: compute_score(item, tenant, lane, engine)) for item in request.requests
+        )))
+
+    try:
+        logger.info(f"Scoring a batch of {len(request.requests)} prompt pairs")
+        return await run_job(http_request, timeout, score_all)
+    except OperationCancelledError as e:
+        raise cancelled(e)
+
+# Cacheable GET variants of /optimize and /score. Results are deterministic, so they carry
+# strong ETags over the inputs and the rule version and can be cached by CDNs and proxies
+CACHE_MAX_AGE_SECONDS = int(os.getenv("CACHE_MAX_AGE_SECONDS", 86400))
+# Longer prompts are stored with POST /prompts and passed by hash
+GET_INLINE_MAX_CHARS = int(os.getenv("GET_INLINE_MAX_CHARS", 2048))
+content_store = ContentStore(int(os.getenv("PROMPT_STORE_MAX_BYTES", 64 * 1024 * 1024)))
+cache_responses = REGISTRY.counter("http_cache_responses_total", "Cacheable GET responses by endpoint and result")
+
+def stored_text(text: Optional[str], text_hash: Optional[str], field: str) -> str:
+    """
+    The prompt given inline or by the hash it was stored under with POST /prompts.
+
+    Raises:
+        HTTPException: 422 unless exactly one form is given, 404 for an unknown hash
+    """
+    if (text is None) == (text_hash is None):
+        raise HTTPException(status_code=422, detail=f"Pass exactly one of {field} or {field}_hash")
+    if text is not None:
+        return text
+    stored = content_store.get(text_hash)
+    if stored is None:
+        raise HTTPException(status_code=404, detail=f"Unknown {field}_hash; POST the text to /prompts first")
+    return stored
+
+def validated(model: type, **values: Any) -> BaseModel:
+    """Build a request model from query parameters, failing with 422 like a request body would."""
+    try:
+        return model.model_validate(values)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors(include_url=False))
+
+def cache_headers(etag: str, shared: bool = True) -> Dict[str, str]:
+    """Validators and lifetime of a cacheable response; results of tenant styles are never shared."""
+    if shared:
+        return {"ETag": etag, "Cache-Control": f"public, max-age={CACHE_MAX_AGE_SECONDS}"}
+    # A custom style can change at any time: keep it out of shared caches and always revalidate
+    return {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "X-Tenant-ID"}
+
+def not_modified(request: Request, endpoint: str, etag: str, shared: bool = True) -> Optional[Response]:
+    """304 response when If-None-Match already holds ``etag``, so nothing is computed."""
+    matched = etag_matches(request.headers.get("if-none-match"), etag)
+    if matched is None:
+        cache_responses.inc(endpoint=endpoint, result="miss")
+        return None
+    cache_responses.inc(endpoint=endpoint, result="not_modified")
+    return Response(status_code=304, headers=cache_headers(matched, shared))
+
+@app.post("/prompts", response_model=PromptResponse)
+async def store_prompt(request: PromptRequest, tenant: str = Depends(tenant_id)):
+    """Store a prompt for GET /optimize and GET /score to reference by hash."""
+    limit_prompts(text=request.text)
+    try:
+        return PromptResponse(hash=content_store.put(request.text))
+    except ValueError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+@app.get("/prompts/{text_hash}", response_model=PromptRequest)
+async def get_prompt(text_hash: str = Path(pattern="^[0-9a-f]{64}$")):
+    """A prompt stored with POST /prompts, so a router can copy it to another shard."""
+    return PromptRequest(text=stored_text(None, text_hash, "text"))
+
+@app.get("/optimize", response_model=OptimizeResponse, response_model_exclude_none=True)
+async def optimize_prompt_get(http_request: Request, response: Response,
+                              style: str,
+                              raw_prompt: Optional[str] = Query(default=None, max_length=GET_INLINE_MAX_CHARS),
+                              raw_prompt_hash: Optional[str] = Query(default=None, pattern="^[0-9a-f]{64}$"),
+                              response_format: Literal['full', 'delta'] = 'full',
+                              variants: Optional[List[int]] = Query(default=None),
+                              tenant: str = Depends(tenant_id), lane: str = Depends(request_lane),
+                              timeout: float = Depends(request_timeout),
+                              engine: Engine = Depends(request_engine)):
+    """Cacheable /optimize: the prompt is passed inline or by hash."""
+    text = stored_text(raw_prompt, raw_prompt_hash, "raw_prompt")
+    request = validated(OptimizeRequest, raw_prompt=text, style=style,
+                        response_format=response_format, variants=variants)
+    compiled = resolve_style(request.style, tenant)
+    shared = request.style in BUILTIN_STYLES
+    etag = make_etag("optimize", RULES_VERSION, compiled.digest, content_hash(text),
+                     request.response_format, request.variants)
+    cached = not_modified(http_request, "optimize", etag, shared)
+    if cached is not None:
+        return cached
+    try:
+        result = await run_job(http_request, timeout,
+                               lambda: compute_optimize(request, compiled, tenant, lane, engine))
+    except SchedulerRejectedError as e:
+        raise overloaded(e)
+    except OperationCancelledError as e:
+        raise cancelled(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error optimizing prompt: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    response.headers.update(cache_headers(etag, shared))
+    return result
+
+@app.get("/score", response_model=ScoreResponse)
+async def score_prompt_get(http_request: Request, response: Response,
+                           raw_prompt: Optional[str] = Query(default=None, max_length=GET_INLINE_MAX_CHARS),
+                           raw_prompt_hash: Optional[str] = Query(default=None, pattern="^[0-9a-f]{64}$"),
+                           improved_prompt: Optional[str] = Query(default=None, max_length=GET_INLINE_MAX_CHARS),
+                           improved_prompt_hash: Optional[str] = Query(default=None, pattern="^[0-9a-f]{64}$"),
+                           approximate: Optional[bool] = None,
+                           tenant: str = Depends(tenant_id), lane: str = Depends(request_lane),
+                           timeout: float = Depends(request_timeout),
+                           engine: Engine = Depends(request_engine)):
+    """Cacheable /score: each prompt is passed inline or by hash."""
+    raw = stored_text(raw_prompt, raw_prompt_hash, "raw_prompt")
+    improved = stored_text(improved_prompt, improved_prompt_hash, "improved_prompt")
+    request = validated(ScoreRequest, raw_prompt=raw, improved_prompt=improved, approximate=approximate)
+    # The default mode depends on the approximate threshold, so it is part of the tag
+    etag = make_etag("score", RULES_VERSION, content_hash(raw), content_hash(improved),
+                     request.approximate, APPROXIMATE_SCORE_MIN_CHARS)
+    cached = not_modified(http_request, "score", etag)
+    if cached is not None:
+        return cached
+    try:
+        result = await run_job(http_request, timeout, lambda: compute_score(request, tenant, lane, engine))
+    except SchedulerRejectedError as e:
+        raise overloaded(e)
+    except OperationCancelledError as e:
+        raise cancelled(e)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error scoring prompt: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    response.headers.update(cache_headers(etag))
+    return result
+
+@app.post("/similar", response_model=SimilarResponse)
+async def similar_prompts_endpoint(request: SimilarRequest, http_request: Request,
+                                   tenant: str = Depends(tenant_id), lane: str = Depends(request_lane),
+                                   timeout: float = Depends(request_timeout)):
+    """Find previously optimized prompts that nearly match the given prompt."""
+    limit_prompts(raw_prompt=request.raw_prompt)
+    try:
+        matches = await run_job(http_request, timeout, lambda: scheduler.submit(
+            similarity_index.query, request.raw_prompt, request.k, request.min_similarity,
+            lane=lane, tenant=tenant, cost=work_cost(request.raw_prompt)
+        ))
+        logger.info(f"Found {len(matches)} similar prompts")
+        return SimilarResponse(matches=matches)
+    except SchedulerRejectedError as e:
+        raise overloaded(e)
+    except OperationCancelledError as e:
+        raise cancelled(e)
+    except Exception as e:
+        logger.error(f"Error querying similar prompts: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/similar/index", response_model=SimilarIndexResponse)
+async def index_prompt_endpoint(request: SimilarIndexRequest, tenant: str = Depends(tenant_id)):
+    """Store a prompt and its curated rewrite in the similarity index."""
+    limit_prompts(raw_prompt=request.raw_prompt)
+    try:
+        similarity_index.insert(request.raw_prompt, request.payload)
+        return SimilarIndexResponse(size=len(similarity_index))
+    except Exception as e:
+        logger.error(f"Error indexing prompt: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Background jobs over corpora too large for one request. Jobs live in SQLite, so with
+# JOBS_DB_PATH set they survive restarts and resume where they stopped
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", ":memory:")
+# Corpora can be read from files under this directory; referencing local paths is disabled unless set
+JOBS_CORPUS_DIR = os.getenv("JOBS_CORPUS_DIR")
+# Uploaded corpora beyond this size are spooled to a temporary file instead of held in memory
+JOB_UPLOAD_SPOOL_BYTES = int(os.getenv("JOB_UPLOAD_SPOOL_BYTES", 1024 * 1024))
+job_store = JobStore(JOBS_DB_PATH)
+
+def run_job_items(job: Dict[str, Any], style: Optional[CompiledStyle], items: List[Dict[str, str]]) -> List[Outcome]:
+    """Optimize or score a chunk of corpus items on a worker; an item that fails does not fail the others."""
+    options = job["options"]
+    outcomes = []
+    for item in items:
+        try:
+            if job["operation"] == OPTIMIZE:
+                result = {"variants": style.optimize(item["raw_prompt"], options["variants"])}
+            else:
+                result = score_with_error(item["raw_prompt"], item["improved_prompt"], options["approximate"],
+                                          APPROXIMATE_SCORE_MIN_CHARS)._asdict()
+            outcomes.append((result, None))
+        except OperationCancelledError:
+            raise
+        except Exception as e:
+            outcomes.append((None, str(e)))
+    return outcomes
+
+async def process_job_chunk(job: Dict[str, Any], items: List[Dict[str, str]]) -> List[Outcome]:
+    """Run a chunk of a job in the batch lane, charged to the tenant that created the job."""
+    style = None
+    if job["operation"] == OPTIMIZE:
+        try:
+            style = style_registry.resolve(job["options"]["style"], job["tenant"])
+        except KeyError:
+            # Custom styles are not persisted: one deleted, or lost in a restart, fails the job
+            raise ValueError(f"Unknown style: {job['options']['style']}")
+    lane = BATCH if BATCH in scheduler.weights else scheduler.default_lane
+    with engine_scope(DEFAULT_ENGINE, shadow):
+        return await scheduler.submit(run_job_items, job, style, items, lane=lane, tenant=job["tenant"],
+                                      cost=work_cost(*(text for item in items for text in item.values())))
+
+job_runner = JobRunner(
+    job_store,
+    process_job_chunk,
+    chunk_size=int(os.getenv("JOB_CHUNK_SIZE", 64)),
+    parallel=int(os.getenv("JOB_PARALLEL_CHUNKS", 2)),
+    retention=float(os.getenv("JOB_RETENTION_SECONDS", 7 * 86400))
+)
+
+def corpus_path(path: str) -> str:
+    """
+    Resolve a corpus file under JOBS_CORPUS_DIR.
+
+    Raises:
+        HTTPException: 403 if local corpora are disabled or the path leaves the directory, 404 if there is no such file
+    """
+    if not JOBS_CORPUS_DIR:
+        raise HTTPException(status_code=403, detail="Corpus paths are disabled; upload the corpus instead")
+    root = os.path.realpath(JOBS_CORPUS_DIR)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise HTTPException(status_code=403, detail="Corpus path is outside the corpus directory")
+    if not os.path.isfile(resolved):
+        raise HTTPException(status_code=404, detail=f"No corpus at {path}")
+    return resolved
+
+async def spool_body(request: Request, limits: SizeLimits) -> tempfile.SpooledTemporaryFile:
+    """
+    Copy the request body to a temporary file as it arrives, so a large upload is never held in memory.
+
+    Raises:
+        HTTPException: 413 if a line is larger than a request body may be, as it would be read whole later
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=JOB_UPLOAD_SPOOL_BYTES)
+    line = 0
+    try:
+        async for chunk in request.stream():
+            first = chunk.find(b"\n")
+            if first < 0:
+                line += len(chunk)
+            else:
+                limits.check_line(line + first)
+                line = len(chunk) - chunk.rfind(b"\n") - 1
+            limits.check_line(line)
+            spool.write(chunk)
+    except RequestTooLargeError as e:
+        spool.close()
+        raise too_large(e)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+@app.post("/jobs", response_model=JobResponse, status_code=202)
+async def create_job(http_request: Request, response: Response,
+                     operation: Literal['optimize', 'score'],
+                     style: str = Query(default='precise', min_length=1, max_length=64),
+                     variants: Optional[List[Annotated[int, Field(ge=0, le=2)]]] = Query(default=None),
+                     approximate: Optional[bool] = None,
+                     path: Optional[str] = None,
+                     tenant: str = Depends(tenant_id)):
+    """Queue a JSON Lines corpus, uploaded as the body or read from ``path``, for processing in the background."""
+    if operation == OPTIMIZE:
+        resolve_style(style, tenant)
+        options = {"style": style, "variants": variants}
+    else:
+        options = {"approximate": approximate}
+    limits = request_limits()
+    source = open(corpus_path(path), "rb") if path is not None else await spool_body(http_request, limits)
+    try:
+        job_id = await run_in_threadpool(job_store.create, tenant, operation, options,
+                                         read_corpus(source, operation, limits=limits))
+    except RequestTooLargeError as e:
+        raise too_large(e)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid corpus: {e}")
+    finally:
+        source.close()
+    job_runner.wake()
+    job = await run_in_threadpool(job_store.get, job_id)
+    logger.info(f"Queued {operation} job {job_id} with {job['total']} items for tenant {tenant}")
+    response.headers["Location"] = f"/jobs/{job_id}"
+    return job
+
+async def tenant_job(job_id: str, tenant: str) -> Dict[str, Any]:
+    """
+    The tenant's job.
+
+    Raises:
+        HTTPException: 404 if the job does not exist, has expired or belongs to another tenant
+    """
+    job = await run_in_threadpool(job_store.get, job_id, tenant)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, tenant: str = Depends(tenant_id)):
+    """Status, progress and throughput of a job."""
+    return await tenant_job(job_id, tenant)
+
+@app.get("/jobs/{job_id}/results", response_model=JobResultsResponse, response_model_exclude_none=True)
+async def get_job_results(job_id: str, cursor: Optional[str] = Query(default=None, pattern=r"^\d+$"),
+                          limit: int = Query(default=100, ge=1, le=1000), tenant: str = Depends(tenant_id)):
+    """Page through a job's results in corpus order; results appear as soon as they are computed."""
+    await tenant_job(job_id, tenant)
+    start = int(cursor) if cursor is not None else 0
+    page, more = await run_in_threadpool(job_store.results, job_id, start, limit)
+    next_start = page[-1]["index"] + 1 if page else start
+    return JobResultsResponse(results=page, next_cursor=str(next_start) if more else None)
+
+# Corpus analytics: a whole corpus scored in one request, answered with its aggregates only
+# Longest an /analyze request may run; X-Request-Timeout-Ms can only shorten it
+ANALYZE_TIMEOUT = float(os.getenv("ANALYZE_TIMEOUT_SECONDS", 600))
+# Corpus bytes parsed and scored per scheduler job; the next piece is read while one is scored
+ANALYZE_CHUNK_BYTES = int(os.getenv("ANALYZE_CHUNK_BYTES", 256 * 1024))
+
+async def body_line_chunks(request: Request, limits: SizeLimits) -> AsyncIterator[List[bytes]]:
+    """
+    Split the request body into lines as it arrives, about ANALYZE_CHUNK_BYTES of them at a time.
+
+    Raises:
+        RequestTooLargeError: If a line is larger than a request body may be
+    """
+    lines: List[bytes] = []
+    size = 0
+    partial = bytearray()
+    async for data in request.stream():
+        partial += data
+        if b"\n" not in data:
+            limits.check_line(len(partial))
+            continue
+        *complete, rest = partial.split(b"\n")
+        partial = rest
+        for line in complete:
+            limits.check_line(len(line))
+            size += len(line)
+        lines.extend(complete)
+        if size >= ANALYZE_CHUNK_BYTES:
+            yield lines
+            lines, size = [], 0
+    if partial:
+        lines.append(bytes(partial))
+    if lines:
+        yield lines
+
+async def file_line_chunks(path: str) -> AsyncIterator[List[bytes]]:
+    """Read a corpus file in pieces of about ANALYZE_CHUNK_BYTES of whole lines."""
+    with open(path, "rb") as fh:
+        while True:
+            lines = await run_in_threadpool(fh.readlines, ANALYZE_CHUNK_BYTES)
+            if not lines:
+                return
+            yield lines
+
+def analyze_lines(analysis: CorpusAnalysis, lines: List[bytes], start: int, limits: SizeLimits) -> int:
+    """Parse a piece of a corpus, whose first line is line ``start``, and fold it into ``analysis``."""
+    return analysis.add_all(read_corpus(lines, SCORE, start, limits))
+
+@app.post("/analyze", response_model=AnalyzeResponse)
+async def analyze_corpus(http_request: Request, path: Optional[str] = None,
+                         quantiles: Optional[List[Annotated[float, Field(ge=0, le=1)]]] = Query(default=None),
+                         examples: int = Query(default=5, ge=0, le=100),
+                         x_request_timeout_ms: Optional[float] = Header(default=None, gt=0),
+                         tenant: str = Depends(tenant_id)):
+    """
+    Score a JSON Lines corpus of raw/improved pairs, uploaded as the body or read from ``path``.
+
+    The corpus is scored as it streams in, one piece at a time in the batch
+    lane, and only its aggregates are kept and returned: distributions of the
+    score, its components and the length ratio, filler counts, and the best
+    and worst pairs.
+    """
+    source = corpus_path(path) if path is not None else None
+    timeout = ANALYZE_TIMEOUT if x_request_timeout_ms is None else min(x_request_timeout_ms / 1000, ANALYZE_TIMEOUT)
+    lane = BATCH if BATCH in scheduler.weights else scheduler.default_lane
+    limits = request_limits()
+    analysis = CorpusAnalysis(examples=examples)
+
+    async def analyze() -> None:
+        chunks = file_line_chunks(source) if source is not None else body_line_chunks(http_request, limits)
+        scoring: Optional[asyncio.Future] = None
+        start = 1
+        try:
+            async for lines in chunks:
+                # At most one piece is scored while the next is read, so memory stays bounded
+                if scoring is not None:
+                    await scoring
+                scoring = asyncio.ensure_future(scheduler.submit(analyze_lines, analysis, lines, start, limits, lane=lane,
+                                                                 tenant=tenant, cost=work_cost(*lines)))
+                start += len(lines)
+            if scoring is not None:
+                await scoring
+        finally:
+            if scoring is not None and not scoring.done():
+                scoring.cancel()
+            await chunks.aclose()
+
+    try:
+        await run_with_deadline(timeout, analyze)
+    except RequestTooLargeError as e:
+        raise too_large(e)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Invalid corpus: {e}")
+    except SchedulerRejectedError as e:
+        raise overloaded(e)
+    except ClientDisconnect:
+        raise cancelled(OperationCancelledError("client disconnected", CANCELLED))
+    except OperationCancelledError as e:
+        raise cancelled(e)
+    logger.info(f"Analyzed {analysis.count} pairs for tenant {tenant}")
+    return analysis.summary(quantiles or DEFAULT_QUANTILES)
+
+# WebSocket transport: optimize and score messages multiplexed over one connection
+WS_MAX_IN_FLIGHT = int(os.getenv("WS_MAX_IN_FLIGHT", 8))
+# A message with a channel waits this long before it starts, so a burst of edits runs only the last one
+WS_DEBOUNCE_SECONDS = float(os.getenv("WS_DEBOUNCE_MS", 50)) / 1000
+ws_connections = REGISTRY.gauge("websocket_connections", "Open /ws connections")
+ws_messages = REGISTRY.counter("websocket_messages_total", "Messages handled on /ws by type and outcome")
+
+MessageId = Union[str, int]
+
+class WebSocketMessage(BaseModel):
+    """Envelope of a /ws message; the other fields are the optimize or score request."""
+    model_config = ConfigDict(extra='allow')
+
+    id: MessageId
+    type: Literal['optimize', 'score', 'cancel']
+    # A newer message on the same channel supersedes the one still running there
+    channel: Optional[str] = Field(default=None, min_length=1, max_length=128)
+    timeout_ms: Optional[float] = Field(default=None, gt=0)
+
+class WebSocketSession:
+    """
+    One /ws connection: runs its messages concurrently and replies to each by ID.
+
+    Replies are ``{"id", "type": "result", "result"}``, ``{"id", "type": "error",
+    "status", "detail"}`` with the status the HTTP endpoint would return, or
+    ``{"id", "type": "cancelled", "reason"}`` after a cancel message or a newer
+    message on the same channel.
+    """
+
+    def __init__(self, websocket: WebSocket, tenant: str, lane: str, engine: Engine):
+        self.websocket = websocket
+        self.tenant = tenant
+        self.lane = lane
+        self.engine = engine
+        self.controller = batch_admission if lane == BATCH else admission
+        # Messages counted against WS_MAX_IN_FLIGHT and not yet answered, by ID
+        self.in_flight: Dict[MessageId, asyncio.Task] = {}
+        # Latest message ID of each channel
+        self.channels: Dict[str, MessageId] = {}
+        # Every task still running, superseded and answered ones included, with its message type
+        self.tasks: Dict[asyncio.Task, str] = {}
+        self.send_lock = asyncio.Lock()
+
+    async def run(self) -> None:
+        """Read messages until the client disconnects, then cancel whatever is still running."""
+        try:
+            while True:
+                message = await self.websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                # Reading never waits for the work, so cancel and superseding messages get through
+                await self.dispatch(message.get("text") or message.get("bytes") or "")
+        finally:
+            for task in self.tasks:
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def send(self, reply: Dict[str, Any]) -> None:
+        # One writer at a time. A client that stops reading stalls its tasks here with their
+        # slots held, so new messages are refused instead of buffering replies without bound
+        async with self.send_lock:
+            await self.websocket.send_json(reply)
+
+    @staticmethod
+    def error_reply(message_id: Optional[MessageId], kind: str, status: int, detail: Any) -> Dict[str, Any]:
+        ws_messages.inc(type=kind, outcome="error")
+        return {"id": message_id, "type": "error", "status": status, "detail": detail}
+
+    async def reply_error(self, message_id: Optional[MessageId], kind: str, status: int, detail: Any) -> None:
+        await self.send(self.error_reply(message_id, kind, status, detail))
+
+    async def cancel(self, message_id: MessageId, reason: str) -> None:
+        """
+        Cancel a message that is not answered yet and reply that it was cancelled.
+
+        The reply is sent here rather than by the task, which may be cancelled before it ever runs.
+        """
+        task = self.in_flight.pop(message_id, None)
+        if task is None:
+            return
+        task.cancel()
+        ws_messages.inc(type=self.tasks[task], outcome=reason)
+        await self.send({"id": message_id, "type": "cancelled", "reason": reason})
+
+    def settle(self, message: WebSocketMessage, task: asyncio.Task) -> None:
+        """Forget a message as in flight; a cancel message or a newer message on its channel no longer applies."""
+        if self.in_flight.get(message.id) is task:
+            del self.in_flight[message.id]
+        if message.channel is not None and self.channels.get(message.channel) == message.id:
+            del self.channels[message.channel]
+
+    def finished(self, message: WebSocketMessage, task: asyncio.Task) -> None:
+        # Done callback, so the admission slot is returned even by a task cancelled before it ran
+        self.controller.release()
+        self.tasks.pop(task, None)
+        self.settle(message, task)
+
+    async def dispatch(self, data: Union[str, bytes]) -> None:
+        payload = None
+        try:
+            payload = json.loads(data)
+            message = WebSocketMessage.model_validate(payload)
+        except ValidationError as e:
+            message_id = payload.get("id") if isinstance(payload, dict) else None
+            await self.reply_error(message_id, "invalid", 422, json.loads(e.json(include_url=False)))
+            return
+        except ValueError as e:
+            await self.reply_error(None, "invalid", 400, f"Invalid JSON: {e}")
+            return
+
+        if message.type == 'cancel':
+            await self.cancel(message.id, "cancelled")
+            return
+        if message.id in self.in_flight:
+            await self.reply_error(message.id, message.type, 409, "A message with this id is in flight")
+            return
+        try:
+            model = OptimizeRequest if message.type == 'optimize' else ScoreRequest
+            request = model.model_validate(message.model_extra)
+        except ValidationError as e:
+            await self.reply_error(message.id, message.type, 422, json.loads(e.json(include_url=False)))
+            return
+
+        if message.channel is not None and message.channel in self.channels:
+            await self.cancel(self.channels.pop(message.channel), "superseded")
+        if len(self.in_flight) >= WS_MAX_IN_FLIGHT:
+            await self.reply_error(message.id, message.type, 429,
+                                   f"At most {WS_MAX_IN_FLIGHT} messages may be in flight per connection")
+            return
+        if self.controller.try_acquire() is not None:
+            await self.reply_error(message.id, message.type, 429, "Server over capacity, retry later")
+            return
+
+        timeout = min(message.timeout_ms / 1000, REQUEST_TIMEOUT) if message.timeout_ms else REQUEST_TIMEOUT
+        task = asyncio.ensure_future(self.handle(message, request, timeout))
+        task.add_done_callback(lambda done: self.finished(message, done))
+        self.tasks[task] = message.type
+        self.in_flight[message.id] = task
+        if message.channel is not None:
+            self.channels[message.channel] = message.id
+
+    async def handle(self, message: WebSocketMessage, request: BaseModel, timeout: float) -> None:
+        # Cancelled by cancel() or a closing connection, the task just stops: cancel() replies for it
+        try:
+            if message.channel is not None and WS_DEBOUNCE_SECONDS:
+                # Superseded during this pause, the message never reaches the scheduler
+                await asyncio.sleep(WS_DEBOUNCE_SECONDS)
+            if message.type == 'optimize':
+                style = resolve_style(request.style, self.tenant)
+                result = await run_with_deadline(
+                    timeout, lambda: compute_optimize(request, style, self.tenant, self.lane, self.engine))
+            else:
+                result = await run_with_deadline(
+                    timeout, lambda: compute_score(request, self.tenant, self.lane, self.engine))
+            ws_messages.inc(type=message.type, outcome="result")
+            reply = {"id": message.id, "type": "result", "result": result.model_dump(exclude_none=True)}
+        except HTTPException as e:
+            reply = self.error_reply(message.id, message.type, e.status_code, e.detail)
+        except SchedulerRejectedError as e:
+            error = overloaded(e)
+            reply = self.error_reply(message.id, message.type, error.status_code, error.detail)
+        except OperationCancelledError as e:
+            error = cancelled(e)
+            reply = self.error_reply(message.id, message.type, error.status_code, error.detail)
+        except Exception as e:
+            logger.error(f"Error handling {message.type} message: {e}")
+            reply = self.error_reply(message.id, message.type, 500, str(e))
+        # Answered from here on, so a later cancel finds nothing to cancel and sends no second reply
+        self.settle(message, asyncio.current_task())
+        await self.send(reply)
+
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, tenant: str = Depends(tenant_id),
+                             lane: str = Depends(request_lane), engine: Engine = Depends(request_engine)):
+    """Optimize and score over one connection, with messages correlated by ID."""
+    await websocket.accept()
+    ws_connections.inc()
+    try:
+        await WebSocketSession(websocket, tenant, lane, engine).run()
+    finally:
+        ws_connections.dec()
+
+@app.get("/engines", response_model=EnginesResponse)
+async def list_engines():
+    """List the engines, the default one, and recent shadow-mode mismatches (as digests only)."""
+    return EnginesResponse(engines=list(ENGINES), default=DEFAULT_ENGINE.name,
+                           shadow_sample_rate=shadow.sample_rate, recent_mismatches=shadow.mismatches())
+
+@app.get("/styles", response_model=StyleListResponse)
+async def list_styles(tenant: str = Depends(tenant_id)):
+    """List the built-in styles and the tenant's custom styles."""
+    return StyleListResponse(builtin=list(BUILTIN_STYLES), custom=style_registry.names(tenant))
+
+@app.put("/styles/{name}", response_model=StyleResponse)
+async def register_style(name: str, request: StyleRequest, tenant: str = Depends(tenant_id)):
+    """Create or replace a custom style for the tenant."""
+    try:
+        version = style_registry.register(name, request.model_dump(), tenant)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    logger.info(f"Registered style {name} (version {version}) for tenant {tenant}")
+    return StyleResponse(name=name, version=version, variants=request.variants)
+
+@app.get("/styles/{name}", response_model=StyleResponse)
+async def get_style(name: str, tenant: str = Depends(tenant_id)):
+    """Return a custom style definition."""
+    try:
+        version, spec = style_registry.spec(name, tenant)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown style: {name}")
+    return StyleResponse(name=name, version=version, variants=spec["variants"])
+
+@app.delete("/styles/{name}", status_code=204)
+async def delete_style(name: str, tenant: str = Depends(tenant_id)):
+    """Delete a custom style."""
+    if not style_registry.remove(name, tenant):
+        raise HTTPException(status_code=404, detail=f"Unknown style: {name}")
+    return Response(status_code=204)
+
+@app.get("/debug/profile", response_class=PlainTextResponse, dependencies=[Depends(require_admin)])
+async def debug_profile(seconds: float = Query(default=10.0, gt=0, le=MAX_SECONDS)):
+    """Sample all thread stacks for the given time and return them as collapsed stacks."""
+    try:
+        logger.info(f"Profiling for {seconds:g}s")
+        counts = await run_in_threadpool(sample_stacks, seconds)
+    except ProfilerBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return PlainTextResponse(format_collapsed(counts))
+
 @app.get("/tools")
 async def list_tools():
     """List available tools."""
@@ -95,7 +1445,7 @@ async def list_tools():
                 "description": "Generate 3 optimized variants of a raw LLM prompt",
                 "parameters": {
                     "raw_prompt": "string",
-                    "style": "creative|precise|fast"
+                    "style": "creative|precise|fast|<registered style>"
                 }
             },
             {
@@ -103,7 +1453,8 @@ async def list_tools():
                 "description": "Evaluate the effectiveness of an improved prompt",
                 "parameters": {
                     "raw_prompt": "string",
-                    "improved_prompt": "string"
+                    "improved_prompt": "string",
+                    "approximate": "boolean (optional)"
                 }
             }
         ]
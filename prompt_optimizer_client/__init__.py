@@ -0,0 +1,21 @@
+"""
+Python client for the Prompt Optimizer HTTP server.
+
+Provides synchronous and asyncio clients that reuse keep-alive connections,
+retry with backoff when the server sheds load, and send many prompts with a
+bounded number of requests in flight.
+"""
+
+from prompt_optimizer_client.client import (
+    AsyncPromptOptimizerClient,
+    PromptOptimizerClient,
+    PromptOptimizerError,
+)
+from prompt_optimizer_client.delta import apply_edits
+
+__all__ = [
+    "AsyncPromptOptimizerClient",
+    "PromptOptimizerClient",
+    "PromptOptimizerError",
+    "apply_edits",
+]
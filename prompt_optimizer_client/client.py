@@ -0,0 +1,353 @@
+"""
+Synchronous and asyncio clients for the Prompt Optimizer HTTP server.
+"""
+
+import asyncio
+import collections
+import json
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import httpx
+
+from prompt_optimizer_client.delta import apply_edits
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+MSGPACK_TYPE = "application/msgpack"
+JSON_TYPE = "application/json"
+
+# Statuses the server uses when shedding load; safe to retry because every endpoint is deterministic
+RETRY_STATUSES = (429, 503)
+
+
+class PromptOptimizerError(Exception):
+    """Raised when the server returns an error or cannot be reached after all retries."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, detail: Any = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _as_args(item: Any) -> Tuple:
+    return item if isinstance(item, tuple) else (item,)
+
+
+def _optimize_payload(raw_prompt: str, style: str, variants: Optional[List[int]] = None,
+                      **extra: Any) -> Dict[str, Any]:
+    payload = {"raw_prompt": raw_prompt, "style": style, **extra}
+    if variants is not None:
+        payload["variants"] = list(variants)
+    return payload
+
+
+class _ClientBase:
+    """Request encoding, response decoding and retry policy shared by both clients."""
+
+    def __init__(self, base_url: str = "http://localhost:8000", *, timeout: float = 30.0,
+                 max_connections: int = 10, concurrency: Optional[int] = None,
+                 max_retries: int = 3, backoff: float = 0.1, max_backoff: float = 5.0,
+                 use_msgpack: bool = False, headers: Optional[Dict[str, str]] = None):
+        """
+        Args:
+            base_url: Root URL of the HTTP server
+            timeout: Per-request timeout in seconds, also sent to the server as the request's deadline
+            max_connections: Size of the keep-alive connection pool
+            concurrency: Default number of requests in flight for ``map`` (defaults to ``max_connections``)
+            max_retries: Retries after a 429/503 response or a connection error
+            backoff: Base delay for exponential backoff in seconds
+            max_backoff: Upper bound for a single retry delay in seconds
+            use_msgpack: Send and receive msgpack bodies instead of JSON (requires msgpack)
+            headers: Extra headers sent with every request
+
+        Raises:
+            ValueError: If an argument is out of range
+            RuntimeError: If ``use_msgpack`` is set but msgpack is not installed
+        """
+        if max_connections < 1:
+            raise ValueError("max_connections must be at least 1")
+        if concurrency is not None and concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if max_retries < 0:
+            raise ValueError("max_retries must be non-negative")
+        if use_msgpack and msgpack is None:
+            raise RuntimeError("use_msgpack requires the msgpack package")
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.concurrency = concurrency or max_connections
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.use_msgpack = use_msgpack
+        self.headers = dict(headers or {})
+        if timeout is not None:
+            # The server stops work on requests this client has already given up on
+            self.headers.setdefault("X-Request-Timeout-Ms", str(max(1, int(timeout * 1000))))
+        if use_msgpack:
+            self.headers["Accept"] = MSGPACK_TYPE
+
+    def _limits(self) -> httpx.Limits:
+        return httpx.Limits(max_connections=self.max_connections,
+                            max_keepalive_connections=self.max_connections)
+
+    def _encode(self, payload: Dict[str, Any]) -> Tuple[bytes, Dict[str, str]]:
+        if self.use_msgpack:
+            return msgpack.packb(payload, use_bin_type=True), {"Content-Type": MSGPACK_TYPE}
+        return json.dumps(payload).encode("utf-8"), {"Content-Type": JSON_TYPE}
+
+    @staticmethod
+    def _decode(response: httpx.Response) -> Any:
+        content_type = response.headers.get("content-type", "")
+        if content_type.startswith(MSGPACK_TYPE):
+            return msgpack.unpackb(response.content, raw=False)
+        if content_type.startswith(JSON_TYPE):
+            return response.json()
+        return response.text
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        """Delay before retry number ``attempt`` (0-based), honouring Retry-After when given."""
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            if retry_after:
+                try:
+                    return min(self.max_backoff, float(retry_after))
+                except ValueError:
+                    pass
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def _result(self, response: httpx.Response) -> Any:
+        if response.is_success:
+            return self._decode(response)
+        try:
+            detail = self._decode(response)
+        except Exception:
+            detail = response.text
+        if isinstance(detail, dict) and "detail" in detail:
+            detail = detail["detail"]
+        raise PromptOptimizerError(
+            f"{response.request.method} {response.request.url.path} failed with {response.status_code}: {detail}",
+            status_code=response.status_code,
+            detail=detail
+        )
+
+
+class PromptOptimizerClient(_ClientBase):
+    """
+    Synchronous client over a keep-alive connection pool.
+
+    The client is thread-safe; ``map`` uses a bounded thread pool to keep
+    several requests in flight over the shared connections.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:8000", **kwargs):
+        super().__init__(base_url, **kwargs)
+        self._http = httpx.Client(base_url=self.base_url, timeout=self.timeout,
+                                  limits=self._limits(), headers=self.headers)
+
+    def close(self) -> None:
+        """Close every pooled connection."""
+        self._http.close()
+
+    def __enter__(self) -> "PromptOptimizerClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _send(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+              headers: Optional[Dict[str, str]] = None) -> Any:
+        content, request_headers = self._encode(payload) if payload is not None else (None, {})
+        request_headers.update(headers or {})
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = self._http.request(method, path, content=content, headers=request_headers)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise PromptOptimizerError(f"{method} {path} failed: {e}") from e
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return self._result(response)
+            time.sleep(self._retry_delay(attempt, response))
+
+    def health(self) -> Dict[str, Any]:
+        """Return the server health status."""
+        return self._send("GET", "/health")
+
+    def optimize(self, raw_prompt: str, style: str, delta: bool = False,
+                 variants: Optional[List[int]] = None) -> List[str]:
+        """
+        Return optimized variants of ``raw_prompt`` in ``style``.
+
+        ``variants`` selects variant indices (0-2) so the server builds only
+        those. With ``delta=True`` the server sends compact edit scripts that
+        are applied locally, which saves bandwidth for large prompts.
+        """
+        if delta:
+            return [apply_edits(raw_prompt, edits) for edits in self.optimize_edits(raw_prompt, style, variants)]
+        return self._send("POST", "/optimize", _optimize_payload(raw_prompt, style, variants))["variants"]
+
+    def optimize_edits(self, raw_prompt: str, style: str, variants: Optional[List[int]] = None) -> List[List[list]]:
+        """Return the variants as edit scripts against ``raw_prompt``; see :func:`apply_edits`."""
+        payload = _optimize_payload(raw_prompt, style, variants, response_format="delta")
+        return self._send("POST", "/optimize", payload)["edits"]
+
+    def score(self, raw_prompt: str, improved_prompt: str) -> float:
+        """Return the effectiveness score of ``improved_prompt`` relative to ``raw_prompt``."""
+        return self._send("POST", "/score", {"raw_prompt": raw_prompt, "improved_prompt": improved_prompt})["score"]
+
+    def similar(self, raw_prompt: str, k: int = 5, min_similarity: float = 0.0) -> List[Dict[str, Any]]:
+        """Return previously indexed prompts similar to ``raw_prompt``."""
+        payload = {"raw_prompt": raw_prompt, "k": k, "min_similarity": min_similarity}
+        return self._send("POST", "/similar", payload)["matches"]
+
+    def map(self, fn: Callable[..., Any], items: Iterable[Any], concurrency: Optional[int] = None) -> Iterator[Any]:
+        """
+        Apply a client method to many items with a bounded number in flight.
+
+        Items are consumed lazily and results are yielded in input order. A
+        tuple item is passed as positional arguments, anything else as the
+        single argument.
+
+        Args:
+            fn: Client method (or any callable) to apply, e.g. ``client.score``
+            items: Arguments for each call
+            concurrency: Maximum calls in flight (defaults to the client's ``concurrency``)
+
+        Returns:
+            Iterator[Any]: Results in the order of ``items``
+
+        Raises:
+            PromptOptimizerError: If any call fails
+        """
+        limit = concurrency or self.concurrency
+        with ThreadPoolExecutor(max_workers=limit) as pool:
+            pending = collections.deque()
+            for item in items:
+                pending.append(pool.submit(fn, *_as_args(item)))
+                if len(pending) >= limit:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def optimize_many(self, prompts: Iterable[str], style: str,
+                      concurrency: Optional[int] = None) -> Iterator[List[str]]:
+        """Optimize many prompts in one style; see :meth:`map`."""
+        return self.map(self.optimize, ((prompt, style) for prompt in prompts), concurrency)
+
+    def score_many(self, pairs: Iterable[Tuple[str, str]], concurrency: Optional[int] = None) -> Iterator[float]:
+        """Score many (raw_prompt, improved_prompt) pairs; see :meth:`map`."""
+        return self.map(self.score, pairs, concurrency)
+
+
+class AsyncPromptOptimizerClient(_ClientBase):
+    """Asyncio client over a keep-alive connection pool."""
+
+    def __init__(self, base_url: str = "http://localhost:8000", **kwargs):
+        super().__init__(base_url, **kwargs)
+        self._http = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout,
+                                       limits=self._limits(), headers=self.headers)
+
+    async def close(self) -> None:
+        """Close every pooled connection."""
+        await self._http.aclose()
+
+    async def __aenter__(self) -> "AsyncPromptOptimizerClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def _send(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                    headers: Optional[Dict[str, str]] = None) -> Any:
+        content, request_headers = self._encode(payload) if payload is not None else (None, {})
+        request_headers.update(headers or {})
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = await self._http.request(method, path, content=content, headers=request_headers)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise PromptOptimizerError(f"{method} {path} failed: {e}") from e
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return self._result(response)
+            await asyncio.sleep(self._retry_delay(attempt, response))
+
+    async def health(self) -> Dict[str, Any]:
+        """Return the server health status."""
+        return await self._send("GET", "/health")
+
+    async def optimize(self, raw_prompt: str, style: str, delta: bool = False,
+                       variants: Optional[List[int]] = None) -> List[str]:
+        """Return optimized variants of ``raw_prompt`` in ``style``; see :meth:`PromptOptimizerClient.optimize`."""
+        if delta:
+            return [apply_edits(raw_prompt, edits) for edits in await self.optimize_edits(raw_prompt, style, variants)]
+        return (await self._send("POST", "/optimize", _optimize_payload(raw_prompt, style, variants)))["variants"]
+
+    async def optimize_edits(self, raw_prompt: str, style: str,
+                             variants: Optional[List[int]] = None) -> List[List[list]]:
+        """Return the variants as edit scripts against ``raw_prompt``; see :func:`apply_edits`."""
+        payload = _optimize_payload(raw_prompt, style, variants, response_format="delta")
+        return (await self._send("POST", "/optimize", payload))["edits"]
+
+    async def score(self, raw_prompt: str, improved_prompt: str) -> float:
+        """Return the effectiveness score of ``improved_prompt`` relative to ``raw_prompt``."""
+        payload = {"raw_prompt": raw_prompt, "improved_prompt": improved_prompt}
+        return (await self._send("POST", "/score", payload))["score"]
+
+    async def similar(self, raw_prompt: str, k: int = 5, min_similarity: float = 0.0) -> List[Dict[str, Any]]:
+        """Return previously indexed prompts similar to ``raw_prompt``."""
+        payload = {"raw_prompt": raw_prompt, "k": k, "min_similarity": min_similarity}
+        return (await self._send("POST", "/similar", payload))["matches"]
+
+    async def map(self, fn: Callable[..., Any], items: Iterable[Any],
+                  concurrency: Optional[int] = None) -> AsyncIterator[Any]:
+        """
+        Apply a coroutine method to many items with a bounded number in flight.
+
+        Behaves like :meth:`PromptOptimizerClient.map` but yields results
+        asynchronously; unfinished calls are cancelled if iteration stops early.
+
+        Args:
+            fn: Coroutine method to apply, e.g. ``client.score``
+            items: Arguments for each call
+            concurrency: Maximum calls in flight (defaults to the client's ``concurrency``)
+
+        Returns:
+            AsyncIterator[Any]: Results in the order of ``items``
+
+        Raises:
+            PromptOptimizerError: If any call fails
+        """
+        limit = concurrency or self.concurrency
+        pending = collections.deque()
+        try:
+            for item in items:
+                pending.append(asyncio.ensure_future(fn(*_as_args(item))))
+                if len(pending) >= limit:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def optimize_many(self, prompts: Iterable[str], style: str,
+                      concurrency: Optional[int] = None) -> AsyncIterator[List[str]]:
+        """Optimize many prompts in one style; see :meth:`map`."""
+        return self.map(self.optimize, ((prompt, style) for prompt in prompts), concurrency)
+
+    def score_many(self, pairs: Iterable[Tuple[str, str]],
+                   concurrency: Optional[int] = None) -> AsyncIterator[float]:
+        """Score many (raw_prompt, improved_prompt) pairs; see :meth:`map`."""
+        return self.map(self.score, pairs, concurrency)
@@ -0,0 +1,43 @@
+"""
+Helpers for delta-encoded optimize responses.
+
+With ``response_format="delta"`` the server returns each variant as an edit
+script against the raw prompt instead of a full string. A script is read left
+to right over the raw prompt: ``["c", n]`` copies the next n characters,
+``["d", n]`` skips them and ``["i", text]`` inserts text.
+"""
+
+from typing import List, Sequence
+
+
+def apply_edits(raw_prompt: str, edits: Sequence[Sequence]) -> str:
+    """
+    Rebuild a variant from the raw prompt and its edit script.
+
+    Args:
+        raw_prompt: The exact prompt that was sent to the server
+        edits: Edit script for one variant
+
+    Returns:
+        str: The variant text
+
+    Raises:
+        ValueError: If the script is malformed or does not fit the prompt
+    """
+    parts: List[str] = []
+    cursor = 0
+    for kind, arg in edits:
+        if kind == "c":
+            if cursor + arg > len(raw_prompt):
+                raise ValueError("copy past the end of the prompt")
+            parts.append(raw_prompt[cursor:cursor + arg])
+            cursor += arg
+        elif kind == "d":
+            cursor += arg
+        elif kind == "i":
+            parts.append(arg)
+        else:
+            raise ValueError(f"unknown edit operation: {kind!r}")
+    if cursor != len(raw_prompt):
+        raise ValueError("edit script does not cover the whole prompt")
+    return "".join(parts)
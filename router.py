@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""
+Consistent-hash router for several Prompt Optimizer HTTP servers.
+
+Requests are routed by the content hash of their prompt, so each backend
+serves a stable partition of the prompts and keeps its caches warm for
+them; batches are split by shard and reassembled in order. Custom styles
+are sent to every backend, and other tenant state (jobs, the similarity
+index) stays on the backend owning the tenant.
+"""
+
+import os
+import asyncio
+import hmac
+import json
+import logging
+from contextlib import asynccontextmanager, suppress
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import httpx
+import uvicorn
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from pydantic import BaseModel
+
+from tools.httpcache import content_hash
+from tools.metrics import REGISTRY
+from tools.routing import BackendPool
+from tools.styles import DEFAULT_TENANT
+from tools import wire
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Comma-separated backend base URLs, e.g. "http://10.0.0.1:8000,http://10.0.0.2:8000"
+ROUTER_BACKENDS = [url for url in os.getenv("ROUTER_BACKENDS", "").split(",") if url.strip()]
+# Points per backend on the hash ring; more spread the keys more evenly
+ROUTER_REPLICAS = int(os.getenv("ROUTER_REPLICAS", 128))
+ROUTER_HEALTH_INTERVAL = float(os.getenv("ROUTER_HEALTH_INTERVAL_SECONDS", 2))
+ROUTER_TIMEOUT = float(os.getenv("ROUTER_TIMEOUT_SECONDS", 60))
+# Backend management is disabled unless ADMIN_TOKEN is set
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+pool = BackendPool(ROUTER_BACKENDS, replicas=ROUTER_REPLICAS)
+routed = REGISTRY.counter("router_requests_total", "Requests forwarded by backend and endpoint")
+failovers = REGISTRY.counter("router_failovers_total", "Requests retried on the next backend after a connection failure")
+
+# Last definition of every custom style by (tenant, name), replayed to backends that join or come back
+style_specs: Dict[Tuple[str, str], bytes] = {}
+
+# Headers that describe one connection rather than the message, plus those the proxy sets itself
+_HOP_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization", "te", "trailer",
+                "transfer-encoding", "upgrade", "host", "content-length", "date", "server"}
+
+client: Optional[httpx.AsyncClient] = None
+
+async def check_backends() -> None:
+    """Probe every backend and bring the ones that came back up to date with the custom styles."""
+    for url in await pool.check(client):
+        await replay_styles(url)
+
+async def health_loop() -> None:
+    while True:
+        await asyncio.sleep(ROUTER_HEALTH_INTERVAL)
+        try:
+            await check_backends()
+        except Exception as e:
+            logger.error(f"Health check failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the backend connection pool and check backend health in the background."""
+    global client
+    client = httpx.AsyncClient(timeout=ROUTER_TIMEOUT)
+    await check_backends()
+    logger.info(f"Routing to {len(pool.ring)} backends: {pool.status()}")
+    checking = asyncio.ensure_future(health_loop())
+    yield
+    checking.cancel()
+    with suppress(asyncio.CancelledError):
+        await checking
+    await client.aclose()
+
+app = FastAPI(
+    title="Prompt Optimizer Router",
+    description="Routes Prompt Optimizer requests to backend shards by prompt content",
+    version="1.0.0",
+    lifespan=lifespan
+)
+
+def require_admin(request: Request) -> None:
+    """Dependency that allows only callers presenting the admin token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+def tenant_key(request: Request) -> str:
+    return "tenant:" + request.headers.get("x-tenant-id", DEFAULT_TENANT)
+
+def decode_body(request: Request, body: bytes) -> Any:
+    """The JSON or msgpack body, or None if it cannot be decoded; the backend reports the error."""
+    try:
+        if wire.is_msgpack(request.headers.get("content-type")):
+            return wire.unpackb(body) if wire.MSGPACK_AVAILABLE else None
+        return json.loads(body)
+    except ValueError:
+        return None
+
+def prompt_key(request: Request, body: bytes) -> str:
+    """
+    Shard key of a request: the content hash of its prompt.
+
+    Prompts stored with POST /prompts and referenced by hash in GET requests
+    hash to the same key, so they land on the backend that stored them. A
+    GET /score is routed by its raw prompt; its improved prompt may live on
+    another backend, which :func:`copy_prompt` handles.
+    """
+    if request.method == "GET":
+        text_hash = request.query_params.get("raw_prompt_hash")
+        text = request.query_params.get("raw_prompt")
+    else:
+        payload = decode_body(request, body)
+        field = "text" if request.url.path == "/prompts" else "raw_prompt"
+        text_hash, text = None, payload.get(field) if isinstance(payload, dict) else None
+    if text_hash:
+        return text_hash
+    if isinstance(text, str):
+        return content_hash(text)
+    return tenant_key(request)
+
+def forwarded_headers(request: Request, **overrides: str) -> Dict[str, str]:
+    headers = {name: value for name, value in request.headers.items() if name not in _HOP_HEADERS}
+    # Without this the client library would ask for compression the caller never accepted
+    headers.setdefault("accept-encoding", "identity")
+    headers.update(overrides)
+    return headers
+
+class Upstream(NamedTuple):
+    """A backend response with its body exactly as the backend encoded it (compressed, msgpack)."""
+    status_code: int
+    headers: httpx.Headers
+    body: bytes
+
+async def send(url: str, request: Request, path: str, body: bytes, headers: Dict[str, str]) -> Upstream:
+    """Forward one request to ``url``."""
+    response = await client.send(
+        client.build_request(request.method, url + path, params=request.query_params.multi_items(),
+                             content=body, headers=headers),
+        stream=True
+    )
+    try:
+        raw = b"".join([chunk async for chunk in response.aiter_raw()])
+    finally:
+        await response.aclose()
+    return Upstream(response.status_code, response.headers, raw)
+
+async def forward(request: Request, key: str, body: bytes, endpoint: str) -> Tuple[str, Upstream]:
+    """
+    Send a request to the owner of ``key``, failing over along the ring while backends refuse connections.
+
+    Raises:
+        HTTPException: 503 if no backend is up, 502 if the backend failed mid-request
+    """
+    headers = forwarded_headers(request)
+    for url in pool.route(key):
+        try:
+            response = await send(url, request, request.url.path, body, headers)
+        except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+            pool.mark(url, False, f"{type(e).__name__}: {e}")
+            failovers.inc(endpoint=endpoint)
+            continue
+        except httpx.HTTPError as e:
+            logger.error(f"Backend {url} failed: {e}")
+            raise HTTPException(status_code=502, detail=f"Backend failed: {type(e).__name__}")
+        routed.inc(backend=url, endpoint=endpoint)
+        return url, response
+    raise HTTPException(status_code=503, detail="No healthy backend", headers={"Retry-After": "1"})
+
+def relay(url: str, upstream: Upstream) -> Response:
+    """The backend's response as the router's, naming the backend in X-Backend."""
+    headers = {name: value for name, value in upstream.headers.items() if name not in _HOP_HEADERS}
+    headers["X-Backend"] = url
+    return Response(content=upstream.body, status_code=upstream.status_code, headers=headers)
+
+class BackendRequest(BaseModel):
+    url: str
+
+@app.get("/health")
+async def health_check():
+    """The router itself is up."""
+    return {"status": "healthy", "message": "Prompt Optimizer router is running"}
+
+@app.get("/ready")
+async def readiness_check(response: Response):
+    """200 while at least one backend is healthy."""
+    backends = pool.status()
+    if not any(backend["healthy"] for backend in backends):
+        response.status_code = 503
+    return {"ready": response.status_code != 503, "backends": backends}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics endpoint."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/router/backends")
+async def list_backends():
+    """Backends with their health."""
+    return {"backends": pool.status()}
+
+@app.post("/router/backends", dependencies=[Depends(require_admin)])
+async def add_backend(request: BackendRequest):
+    """Add a backend; it takes over its share of the keys once it passes a health check."""
+    if not request.url.startswith(("http://", "https://")):
+        raise HTTPException(status_code=422, detail="Backend URL must start with http:// or https://")
+    if not pool.add(request.url):
+        raise HTTPException(status_code=409, detail="Backend already added")
+    await check_backends()
+    return {"backends": pool.status()}
+
+@app.delete("/router/backends", dependencies=[Depends(require_admin)])
+async def remove_backend(url: str):
+    """Remove a backend; its keys move to the next backends on the ring."""
+    if not pool.remove(url):
+        raise HTTPException(status_code=404, detail="Unknown backend")
+    return {"backends": pool.status()}
+
+@app.api_route("/optimize", methods=["GET", "POST"])
+@app.api_route("/score", methods=["GET", "POST"])
+@app.post("/prompts")
+async def route_by_prompt(request: Request):
+    """Forward to the backend owning the prompt."""
+    body = await request.body()
+    key = prompt_key(request, body)
+    url, response = await forward(request, key, body, request.url.path)
+    improved_hash = request.query_params.get("improved_prompt_hash")
+    if request.method == "GET" and response.status_code == 404 and improved_hash:
+        # The improved prompt was stored on the shard owning its own hash
+        if await copy_prompt(request, improved_hash, url):
+            url, response = await forward(request, key, body, request.url.path)
+    return relay(url, response)
+
+@app.get("/prompts/{text_hash}")
+async def route_stored_prompt(text_hash: str, request: Request):
+    """Fetch a stored prompt from the backend owning its hash."""
+    url, response = await forward(request, text_hash, b"", "/prompts")
+    return relay(url, response)
+
+async def copy_prompt(request: Request, text_hash: str, url: str) -> bool:
+    """
+    Copy a prompt stored with POST /prompts from the backend owning its hash to ``url``.
+
+    Returns:
+        bool: True if the prompt was copied; False if its owner is ``url`` itself or does not hold it
+    """
+    owners = pool.route(text_hash)
+    if not owners or owners[0] == url:
+        return False
+    headers = {"x-tenant-id": request.headers.get("x-tenant-id", DEFAULT_TENANT), "accept": wire.JSON_TYPE,
+               "accept-encoding": "identity"}
+    try:
+        stored = await client.get(f"{owners[0]}/prompts/{text_hash}", headers=headers)
+        if stored.status_code != 200:
+            return False
+        copied = await client.post(f"{url}/prompts", json=stored.json(), headers=headers)
+    except httpx.HTTPError as e:
+        logger.warning(f"Could not copy prompt {text_hash} to {url}: {e}")
+        return False
+    routed.inc(backend=owners[0], endpoint="/prompts/copy")
+    return copied.status_code == 200
+
+async def split_batch(request: Request, body: bytes) -> Response:
+    """
+    Send each item of a batch to the backend owning its prompt and merge the results in request order.
+
+    Items of a backend that refuses connections are routed again without it.
+    A batch that is empty or not a list of objects is passed whole to one backend to report the error.
+    """
+    payload = decode_body(request, body)
+    items = payload.get("requests") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+        url, response = await forward(request, tenant_key(request), body, request.url.path)
+        return relay(url, response)
+
+    keys = [content_hash(item["raw_prompt"]) if isinstance(item.get("raw_prompt"), str) else tenant_key(request)
+            for item in items]
+    headers = forwarded_headers(request, **{"content-type": wire.JSON_TYPE, "accept": wire.JSON_TYPE,
+                                            "accept-encoding": "identity"})
+    results: List[Any] = [None] * len(items)
+    pending = list(range(len(items)))
+    while pending:
+        shards: Dict[str, List[int]] = {}
+        for index in pending:
+            owners = pool.route(keys[index])
+            if not owners:
+                raise HTTPException(status_code=503, detail="No healthy backend", headers={"Retry-After": "1"})
+            shards.setdefault(owners[0], []).append(index)
+
+        async def run_shard(url: str, indices: List[int]) -> Optional[Upstream]:
+            shard_body = json.dumps({"requests": [items[index] for index in indices]}).encode()
+            try:
+                response = await send(url, request, request.url.path, shard_body, headers)
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                pool.mark(url, False, f"{type(e).__name__}: {e}")
+                failovers.inc(endpoint=request.url.path)
+                return None
+            routed.inc(backend=url, endpoint=request.url.path)
+            return response
+
+        try:
+            responses = await asyncio.gather(*(run_shard(url, indices) for url, indices in shards.items()))
+        except httpx.HTTPError as e:
+            logger.error(f"Backend failed during batch: {e}")
+            raise HTTPException(status_code=502, detail=f"Backend failed: {type(e).__name__}")
+        pending = []
+        for (url, indices), response in zip(shards.items(), responses):
+            if response is None:
+                pending.extend(indices)
+            elif response.status_code != 200:
+                # The whole batch fails as it would on one server (validation, overload, deadline)
+                return relay(url, response)
+            else:
+                for index, result in zip(indices, json.loads(response.body)["results"]):
+                    results[index] = result
+        pending.sort()
+    return JSONResponse({"results": results})
+
+@app.post("/optimize/batch")
+@app.post("/score/batch")
+async def route_batch(request: Request):
+    """Split a batch across the shards owning its prompts."""
+    return await split_batch(request, await request.body())
+
+async def broadcast(request: Request, body: bytes) -> Response:
+    """Send a request to every healthy backend; the reply is that of the tenant's own backend."""
+    owners = pool.route(tenant_key(request))
+    if not owners:
+        raise HTTPException(status_code=503, detail="No healthy backend", headers={"Retry-After": "1"})
+    headers = forwarded_headers(request)
+    responses = await asyncio.gather(*(send(url, request, request.url.path, body, headers) for url in owners),
+                                     return_exceptions=True)
+    for url, response in zip(owners, responses):
+        if isinstance(response, Exception):
+            pool.mark(url, False, f"{type(response).__name__}: {response}")
+        else:
+            routed.inc(backend=url, endpoint="/styles")
+    if isinstance(responses[0], Exception):
+        raise HTTPException(status_code=502, detail=f"Backend failed: {type(responses[0]).__name__}")
+    return relay(owners[0], responses[0])
+
+@app.api_route("/styles/{name}", methods=["PUT", "DELETE"])
+async def route_style_change(name: str, request: Request):
+    """Register or delete a custom style on every backend, so any shard can use it."""
+    body = await request.body()
+    response = await broadcast(request, body)
+    key = (request.headers.get("x-tenant-id", DEFAULT_TENANT), name)
+    if request.method == "PUT" and response.status_code == 200:
+        style_specs[key] = body
+    elif request.method == "DELETE" and response.status_code in (204, 404):
+        style_specs.pop(key, None)
+    return response
+
+async def replay_styles(url: str) -> None:
+    """Register every known custom style on a backend that joined or came back up."""
+    for (tenant, name), spec in list(style_specs.items()):
+        try:
+            await client.put(f"{url}/styles/{name}", content=spec,
+                             headers={"content-type": wire.JSON_TYPE, "x-tenant-id": tenant})
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not replay style {name} to {url}: {e}")
+            return
+    if style_specs:
+        logger.info(f"Replayed {len(style_specs)} styles to {url}")
+
+@app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+async def route_by_tenant(path: str, request: Request):
+    """Everything else (jobs, styles, similarity) goes to the backend owning the tenant, where its state lives."""
+    body = await request.body()
+    url, response = await forward(request, tenant_key(request), body, "other")
+    return relay(url, response)
+
+if __name__ == "__main__":
+    port = int(os.getenv("PORT", 8000))
+    host = os.getenv("HOST", "0.0.0.0")
+
+    logger.info(f"Starting router on {host}:{port}")
+    uvicorn.run(app, host=host, port=port)
@@ -8,13 +8,25 @@ A Model Context Protocol server that provides tools for optimizing and scoring L
 import asyncio
 import json
 import logging
+import os
 import sys
-from typing import List, Literal, Any, Dict
-from mcp import ServerSession, StdioServerParameters
+import time
+from contextlib import asynccontextmanager
+from typing import List, Literal, Any, AsyncIterator, Callable, Dict, Optional
+from mcp import ServerSession, StdioServerParameters, types
 from mcp.server import NotificationOptions, Server
 from mcp.server.models import InitializationOptions
 from mcp.server.stdio import stdio_server
-from tools.optimize import optimize_prompt, score_prompt
+from tools.approximate import APPROXIMATE_MIN_CHARS, score_with_error
+from tools.deadline import run_with_deadline
+from tools.engines import ENGINES, Engine, ShadowVerifier, engine_scope, get_engine
+from tools.limits import LimitPolicy, SizeLimits, check_arguments, parse_tenant_limits
+from tools.microbatch import MicroBatcher
+from tools.profiler import install_signal_handler
+from tools.progress import progress_scope
+from tools.scheduler import FairScheduler
+from tools.singleflight import SingleFlight, content_key
+from tools.styles import BUILTIN_STYLES, DEFAULT_TENANT, StyleRegistry
 
 # Configure logging
 logging.basicConfig(
@@ -26,14 +38,169 @@ logger = logging.getLogger(__name__)
 # Create MCP server
 server = Server("prompt-optimizer")
 
+# Identical concurrent tool calls share one computation
+optimize_flight = SingleFlight("mcp_optimize")
+score_flight = SingleFlight("mcp_score")
+
+# Custom styles registered through register_style_tool; a stdio server serves one tenant
+style_registry = StyleRegistry(cache_size=int(os.getenv("STYLE_CACHE_SIZE", 32)))
+
+# Tool computations run on worker threads, so cancelled calls can be dropped from the queue
+scheduler = FairScheduler("mcp", workers=int(os.getenv("WORKER_THREADS", 4)))
+# Concurrent calls run as one worker job while every worker is busy; MICROBATCH_MAX_SIZE=1 turns this off
+batcher = MicroBatcher(
+    scheduler,
+    max_batch=int(os.getenv("MICROBATCH_MAX_SIZE", 16)),
+    max_wait=float(os.getenv("MICROBATCH_WINDOW_MS", 2)) / 1000
+)
+
+# Engine that runs the tools unless a call picks another with its engine argument
+DEFAULT_ENGINE = get_engine(os.getenv("ENGINE", "reference"))
+# Shadow mode: this fraction of the calls served by a non-reference engine is run again on
+# the reference engine in the background and the outputs compared byte for byte
+shadow = ShadowVerifier(
+    sample_rate=float(os.getenv("ENGINE_SHADOW_RATE", 0.01)),
+    max_pending=int(os.getenv("ENGINE_SHADOW_MAX_PENDING", 64))
+)
+
+ENGINE_SCHEMA = {
+    "type": "string",
+    "enum": list(ENGINES),
+    "description": "Optional implementation to run on; all engines give identical output, 'reference' is the original"
+}
+
+def call_engine(arguments: Dict[str, Any]) -> Engine:
+    """Engine of a tool call, from its engine argument or the server default."""
+    name = arguments.get("engine")
+    return DEFAULT_ENGINE if name is None else get_engine(name)
+
+# Size limits of tool arguments, as for HTTP requests: MAX_PROMPT_CHARS for each string and
+# MAX_BODY_BYTES for all of them together; TENANT_SIZE_LIMITS entries for the default tenant apply
+DEFAULT_SIZE_LIMITS = SizeLimits(
+    max_body_bytes=int(os.getenv("MAX_BODY_BYTES", 16 * 1024 * 1024)),
+    max_prompt_chars=int(os.getenv("MAX_PROMPT_CHARS", 4_000_000)),
+    max_corpus_bytes=int(os.getenv("MAX_CORPUS_BYTES", 1024 ** 3))
+)
+size_limits = LimitPolicy(DEFAULT_SIZE_LIMITS, parse_tenant_limits(os.getenv("TENANT_SIZE_LIMITS"), DEFAULT_SIZE_LIMITS))
+
+# Combined prompt length from which score_prompt_tool estimates instead of computing exactly
+APPROXIMATE_SCORE_MIN_CHARS = int(os.getenv("APPROXIMATE_SCORE_MIN_CHARS", APPROXIMATE_MIN_CHARS))
+
+# Default and maximum time budget of a tool call; a call may ask for less with timeout_ms
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT_SECONDS", 30))
+
+TIMEOUT_SCHEMA = {
+    "type": "number",
+    "exclusiveMinimum": 0,
+    "description": "Optional time budget in milliseconds; work still running when it expires is stopped"
+}
+
+def call_timeout(arguments: Dict[str, Any]) -> float:
+    """Time budget of a tool call in seconds, from its timeout_ms argument capped at the server default."""
+    timeout_ms = arguments.get("timeout_ms")
+    if timeout_ms is None:
+        return REQUEST_TIMEOUT
+    if isinstance(timeout_ms, bool) or not isinstance(timeout_ms, (int, float)) or timeout_ms <= 0:
+        raise ValueError("timeout_ms must be a positive number")
+    return min(timeout_ms / 1000, REQUEST_TIMEOUT)
+
+# Partial results longer than this are split over several progress notifications
+PROGRESS_CHUNK_CHARS = int(os.getenv("PROGRESS_CHUNK_CHARS", 16384))
+
+class ProgressNotifier:
+    """
+    Sends the MCP progress notifications of one tool call, in order, from any thread.
+
+    Each notification says how many items are done out of the total and the
+    elapsed time, followed by the partial result of the item that just
+    finished. Results longer than PROGRESS_CHUNK_CHARS are split over several
+    notifications with fractional progress, so progress still increases with
+    every notification.
+    """
+
+    def __init__(self, session: ServerSession, progress_token: Any, request_id: Optional[str],
+                 describe: Callable[[int, Any], str]):
+        self.session = session
+        self.progress_token = progress_token
+        self.request_id = request_id
+        self.describe = describe
+        self.started = time.monotonic()
+        self._loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._sender = asyncio.ensure_future(self._send_all())
+
+    def report(self, done: int, total: int, partial: Any) -> None:
+        """Progress callback; runs on the worker thread, so the event loop only has to send."""
+        elapsed = time.monotonic() - self.started
+        message = self.describe(done, partial) if partial is not None else ""
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (done, total, elapsed, message))
+
+    async def _send_all(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            done, total, elapsed, message = item
+            chunks = [message[i:i + PROGRESS_CHUNK_CHARS] for i in range(0, len(message), PROGRESS_CHUNK_CHARS)] or [""]
+            for number, chunk in enumerate(chunks, 1):
+                text = f"{done}/{total} done in {elapsed:.2f}s"
+                if len(chunks) > 1:
+                    text += f" (part {number}/{len(chunks)})"
+                if chunk:
+                    text += f"\n{chunk}"
+                await self.session.send_progress_notification(
+                    self.progress_token, done - 1 + number / len(chunks) if done else 0, total, text,
+                    related_request_id=self.request_id)
+
+    async def close(self) -> None:
+        """Send every notification reported so far."""
+        self._queue.put_nowait(None)
+        try:
+            await self._sender
+        except Exception as e:
+            logger.warning(f"Could not send progress notifications: {e}")
+
+    def abort(self) -> None:
+        """Drop pending notifications; the call failed or was cancelled."""
+        self._sender.cancel()
+
+@asynccontextmanager
+async def tool_progress(total: int, describe: Callable[[int, Any], str]) -> AsyncIterator[None]:
+    """
+    Report the progress of work started in this block if the caller sent a progress token.
+
+    Args:
+        total: Items the work will report
+        describe: Formats (items done, partial result) as the notification text
+    """
+    try:
+        context = server.request_context
+    except LookupError:
+        # Called outside an MCP request, e.g. directly from Python
+        context = None
+    token = context.meta.progressToken if context is not None and context.meta is not None else None
+    if token is None:
+        yield
+        return
+
+    notifier = ProgressNotifier(context.session, token, str(context.request_id), describe)
+    notifier.report(0, total, None)
+    with progress_scope(notifier.report):
+        try:
+            yield
+        except BaseException:
+            notifier.abort()
+            raise
+    await notifier.close()
+
 @server.list_tools()
-async def handle_list_tools() -> List[Dict[str, Any]]:
+async def handle_list_tools() -> List[types.Tool]:
     """List available tools."""
     return [
-        {
-            "name": "optimize_prompt_tool",
-            "description": "Generate 3 optimized variants of the raw LLM prompt in the specified style.",
-            "inputSchema": {
+        types.Tool(
+            name="optimize_prompt_tool",
+            description="Generate 3 optimized variants of the raw LLM prompt in the specified style.",
+            inputSchema={
                 "type": "object",
                 "properties": {
                     "raw_prompt": {
@@ -42,17 +209,55 @@ async def handle_list_tools() -> List[Dict[str, Any]]:
                     },
                     "style": {
                         "type": "string",
-                        "enum": ["creative", "precise", "fast"],
-                        "description": "The optimization style - 'creative' for imaginative variants, 'precise' for concise and focused variants, 'fast' for quick and direct variants"
-                    }
+                        "description": "The optimization style - 'creative' for imaginative variants, 'precise' for concise and focused variants, 'fast' for quick and direct variants, or the name of a style added with register_style_tool"
+                    },
+                    "variants": {
+                        "type": "array",
+                        "items": {"type": "integer", "minimum": 0, "maximum": 2},
+                        "description": "Optional indices (0-2) of the variants to generate; all three by default"
+                    },
+                    "timeout_ms": TIMEOUT_SCHEMA,
+                    "engine": ENGINE_SCHEMA
                 },
                 "required": ["raw_prompt", "style"]
             }
-        },
-        {
-            "name": "score_prompt_tool",
-            "description": "Evaluate the effectiveness of an improved prompt relative to the original.",
-            "inputSchema": {
+        ),
+        types.Tool(
+            name="register_style_tool",
+            description="Create or replace a custom optimization style from a list of rewrite operations per variant.",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "name": {
+                        "type": "string",
+                        "description": "Style name (letters, digits, '_' or '-'); built-in names are reserved"
+                    },
+                    "variants": {
+                        "type": "array",
+                        "minItems": 3,
+                        "maxItems": 3,
+                        "items": {
+                            "type": "array",
+                            "items": {
+                                "type": "object",
+                                "properties": {
+                                    "op": {"type": "string", "enum": ["replace", "remove", "prefix", "suffix", "bullets"]},
+                                    "words": {"description": "Word-to-replacement object for 'replace', word list for 'remove'"},
+                                    "text": {"type": "string", "description": "Text for 'prefix' and 'suffix'"}
+                                },
+                                "required": ["op"]
+                            }
+                        },
+                        "description": "Three lists of rewrite operations, one per variant"
+                    }
+                },
+                "required": ["name", "variants"]
+            }
+        ),
+        types.Tool(
+            name="score_prompt_tool",
+            description="Evaluate the effectiveness of an improved prompt relative to the original.",
+            inputSchema={
                 "type": "object",
                 "properties": {
                     "raw_prompt": {
@@ -62,45 +267,94 @@ async def handle_list_tools() -> List[Dict[str, Any]]:
                     "improved_prompt": {
                         "type": "string",
                         "description": "The optimized version to evaluate"
-                    }
+                    },
+                    "approximate": {
+                        "type": "boolean",
+                        "description": "Estimate the score (to about ±0.02) instead of computing it exactly; by default only very long inputs are estimated"
+                    },
+                    "timeout_ms": TIMEOUT_SCHEMA,
+                    "engine": ENGINE_SCHEMA
                 },
                 "required": ["raw_prompt", "improved_prompt"]
             }
-        }
+        )
     ]
 
 @server.call_tool()
-async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[Dict[str, Any]]:
+async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> List[types.TextContent]:
     """Handle tool calls."""
     try:
+        # Checked before anything else, so an oversized call does no work
+        check_arguments(arguments or {}, size_limits.for_tenant(DEFAULT_TENANT))
         if name == "optimize_prompt_tool":
             raw_prompt = arguments["raw_prompt"]
             style = arguments["style"]
+            variants = arguments.get("variants")
+            timeout = call_timeout(arguments)
+            engine = call_engine(arguments)
+            
+            try:
+                compiled = style_registry.resolve(style)
+            except KeyError:
+                raise ValueError(f"Unknown style: {style}; use one of {', '.join(BUILTIN_STYLES)} or a registered style")
             
             logger.info(f"Optimizing prompt with style: {style}")
-            result = optimize_prompt(raw_prompt, style)
+            indices = list(variants) if isinstance(variants, list) else [0, 1, 2]
+            # Each variant is sent as a progress notification as soon as it is built
+            with engine_scope(engine, shadow):
+                async with tool_progress(len(indices), lambda done, text: f"Variant {indices[done - 1] + 1}: {text}"):
+                    result = await run_with_deadline(timeout, lambda: optimize_flight.do(
+                        content_key(raw_prompt, compiled.key, variants, engine.name),
+                        lambda: batcher.submit(compiled.optimize, raw_prompt, variants)
+                    ))
             logger.info(f"Successfully generated {len(result)} variants")
             
             return [
-                {
-                    "type": "text",
-                    "text": f"Generated {len(result)} optimized variants:\n\n" + "\n\n".join(f"Variant {i+1}: {variant}" for i, variant in enumerate(result))
-                }
+                types.TextContent(
+                    type="text",
+                    text=f"Generated {len(result)} optimized variants:\n\n" + "\n\n".join(f"Variant {i + 1}: {variant}" for i, variant in zip(indices, result))
+                )
+            ]
+            
+        elif name == "register_style_tool":
+            style_name = arguments["name"]
+            version = style_registry.register(style_name, {"variants": arguments["variants"]})
+            logger.info(f"Registered style {style_name} (version {version})")
+            
+            return [
+                types.TextContent(
+                    type="text",
+                    text=f"Registered style '{style_name}' (version {version})"
+                )
             ]
             
         elif name == "score_prompt_tool":
             raw_prompt = arguments["raw_prompt"]
             improved_prompt = arguments["improved_prompt"]
+            approximate = arguments.get("approximate")
+            timeout = call_timeout(arguments)
+            engine = call_engine(arguments)
             
             logger.info("Scoring prompt improvement")
-            result = score_prompt(raw_prompt, improved_prompt)
-            logger.info(f"Score: {result}")
+            # Each component score is sent as a progress notification as soon as it is known
+            with engine_scope(engine, shadow):
+                async with tool_progress(3, lambda done, component: f"{component[0]} score: {component[1]:.3f}"):
+                    result = await run_with_deadline(timeout, lambda: score_flight.do(
+                        content_key(raw_prompt, improved_prompt, approximate, engine.name),
+                        lambda: batcher.submit(score_with_error, raw_prompt, improved_prompt,
+                                               approximate, APPROXIMATE_SCORE_MIN_CHARS)
+                    ))
+            logger.info(f"Score: {result.score}")
             
+            if result.approximate:
+                text = f"Effectiveness score: {result.score:.3f} ± {result.error:.3f} (approximate, 0.0 to 1.0 scale)"
+            else:
+                text = f"Effectiveness score: {result.score:.3f} (0.0 to 1.0 scale)"
             return [
-                {
-                    "type": "text",
-                    "text": f"Effectiveness score: {result:.3f} (0.0 to 1.0 scale)"
-                }
+                types.TextContent(
+                    type="text",
+                    text=text
+                )
             ]
         else:
             raise ValueError(f"Unknown tool: {name}")
@@ -113,6 +367,12 @@ async def main():
     """Main function to run the MCP server."""
     try:
         logger.info("Starting Prompt Optimizer MCP Server...")
+
+        # `kill -USR1 <pid>` writes a collapsed-stack profile to PROFILE_DIR
+        install_signal_handler(
+            seconds=float(os.getenv("PROFILE_SECONDS", 10)),
+            directory=os.getenv("PROFILE_DIR")
+        )
         
         # Run the server with stdio transport
         async with stdio_server() as (read_stream, write_stream):
@@ -55,6 +55,10 @@ setup(
             "bandit>=1.7.0",
             "safety>=2.0.0",
         ],
+        "wire": [
+            "msgpack>=1.0.0",
+            "zstandard>=0.22.0",
+        ],
         "test": [
             "pytest>=7.0.0",
             "pytest-cov>=4.0.0",
@@ -2,8 +2,9 @@
 """
 Startup script for Prompt Optimizer MCP Server
 
-This script determines whether to run in STDIO mode (for local development)
-or HTTP mode (for deployment) based on environment variables.
+This script determines whether to run in STDIO mode (for local development),
+HTTP mode (for deployment) or router mode (in front of several HTTP servers)
+based on environment variables.
 """
 
 import os
@@ -16,8 +17,9 @@ logger = logging.getLogger(__name__)
 
 def main():
     """Main startup function."""
+    mode = os.getenv("DEPLOYMENT_MODE", "").lower()
     # Check if we should run in HTTP mode (for deployment)
-    if os.getenv("DEPLOYMENT_MODE", "").lower() == "http":
+    if mode == "http":
         logger.info("Starting in HTTP deployment mode")
         from http_server import app
         import uvicorn
@@ -27,6 +29,17 @@ def main():
         
         logger.info(f"Starting HTTP server on {host}:{port}")
         uvicorn.run(app, host=host, port=port)
+    elif mode == "router":
+        # Consistent-hash router in front of the HTTP servers listed in ROUTER_BACKENDS
+        logger.info("Starting in router mode")
+        from router import app
+        import uvicorn
+
+        port = int(os.getenv("PORT", 8000))
+        host = os.getenv("HOST", "0.0.0.0")
+
+        logger.info(f"Starting router on {host}:{port}")
+        uvicorn.run(app, host=host, port=port)
     else:
         # Default to STDIO mode (for local development and MCP clients)
         logger.info("Starting in STDIO mode")
@@ -0,0 +1,173 @@
+"""
+Unit tests and an overload simulation for admission control.
+"""
+
+import asyncio
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+import sys
+import os
+import threading
+import time
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi.testclient import TestClient
+
+import http_server
+from tools.admission import AdmissionController, TokenBucket
+
+
+class FakeClock:
+    """Manually advanced monotonic clock."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket(unittest.TestCase):
+    """Test cases for the TokenBucket class."""
+
+    def test_burst_then_refill(self):
+        """Test that the bucket allows a burst and then refills at the rate."""
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, burst=2, clock=clock)
+        self.assertEqual(bucket.try_take(), 0.0)
+        self.assertEqual(bucket.try_take(), 0.0)
+        self.assertAlmostEqual(bucket.try_take(), 0.5)
+
+        clock.now = 0.5
+        self.assertEqual(bucket.try_take(), 0.0)
+
+    def test_invalid_rate(self):
+        """Test handling of invalid rates."""
+        with self.assertRaises(ValueError):
+            TokenBucket(rate=0)
+
+
+class TestAdmissionController(unittest.TestCase):
+    """Test cases for the AdmissionController class."""
+
+    def test_in_flight_limit(self):
+        """Test that requests beyond the concurrency cap are rejected until one is released."""
+        controller = AdmissionController(max_in_flight=2)
+        self.assertIsNone(controller.try_acquire())
+        self.assertIsNone(controller.try_acquire())
+        self.assertIsNotNone(controller.try_acquire())
+        self.assertEqual(controller.rejected, 1)
+
+        controller.release()
+        self.assertIsNone(controller.try_acquire())
+
+    def test_rate_limit(self):
+        """Test that the token bucket rejects with a retry delay."""
+        clock = FakeClock()
+        controller = AdmissionController(max_in_flight=0, rate=1, burst=1, clock=clock)
+        self.assertIsNone(controller.try_acquire())
+        self.assertAlmostEqual(controller.try_acquire(), 1.0)
+
+        clock.now = 1.0
+        self.assertIsNone(controller.try_acquire())
+
+
+class TestOverload(unittest.TestCase):
+    """Open-loop load at 3x capacity must keep latency bounded."""
+
+    SERVICE_TIME = 0.005
+    WORKERS = 4
+    DURATION = 0.5
+
+    def _run(self, controller):
+        async def scenario():
+            workers = asyncio.Semaphore(self.WORKERS)
+            latencies = []
+
+            async def handle():
+                start = time.perf_counter()
+                if controller is not None and controller.try_acquire() is not None:
+                    latencies.append(time.perf_counter() - start)
+                    return
+                try:
+                    async with workers:
+                        await asyncio.sleep(self.SERVICE_TIME)
+                finally:
+                    if controller is not None:
+                        controller.release()
+                latencies.append(time.perf_counter() - start)
+
+            capacity = self.WORKERS / self.SERVICE_TIME
+            interval = 1.0 / (3 * capacity)
+            tasks = []
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.DURATION
+            next_arrival = loop.time()
+            while next_arrival < deadline:
+                # Issue every arrival that is due, so the offered load stays open-loop
+                while loop.time() >= next_arrival and next_arrival < deadline:
+                    tasks.append(asyncio.ensure_future(handle()))
+                    next_arrival += interval
+                await asyncio.sleep(0)
+            await asyncio.gather(*tasks)
+            latencies.sort()
+            return latencies[int(len(latencies) * 0.99) - 1]
+
+        return asyncio.run(scenario())
+
+    def test_p99_bounded_at_3x_overload(self):
+        """Test that admission control keeps p99 near the service time while unbounded queueing does not."""
+        p99_unbounded = self._run(None)
+        p99_admitted = self._run(AdmissionController(max_in_flight=2 * self.WORKERS))
+
+        self.assertLess(p99_admitted, 10 * self.SERVICE_TIME)
+        self.assertLess(p99_admitted, p99_unbounded / 3)
+
+
+
+class TestAdmissionMiddleware(unittest.TestCase):
+    """The admission middleware of the HTTP server under a burst of concurrent requests."""
+
+    def test_excess_requests_are_shed(self):
+        """Test that requests over the in-flight cap get 429 with Retry-After, and the batch lane has its own cap."""
+        arrived = threading.Semaphore(0)
+
+        async def slow_score(request, tenant, lane, engine):
+            arrived.release()
+            await asyncio.sleep(0.5)
+            return http_server.ScoreResponse(score=1.0)
+
+        interactive = AdmissionController(max_in_flight=3)
+        batch = AdmissionController(max_in_flight=2)
+        with patch("http_server.admission", interactive), patch("http_server.batch_admission", batch), \
+                patch("http_server.compute_score", slow_score), TestClient(http_server.app) as client:
+
+            def score(lane):
+                return client.post("/score", json={"raw_prompt": "a", "improved_prompt": "b"},
+                                   headers={"X-Request-Class": lane})
+
+            with ThreadPoolExecutor(max_workers=20) as pool:
+                held = [pool.submit(score, "interactive") for _ in range(3)]
+                for _ in held:
+                    self.assertTrue(arrived.acquire(timeout=5))
+                # Every admitted slot is busy: the rest of the burst is shed at once
+                started = time.perf_counter()
+                shed = [future.result() for future in [pool.submit(score, "interactive") for _ in range(12)]]
+                shed_seconds = time.perf_counter() - started
+                batched = [future.result() for future in [pool.submit(score, "batch") for _ in range(4)]]
+                admitted = [future.result() for future in held]
+
+        self.assertEqual([response.status_code for response in admitted], [200] * 3)
+        self.assertEqual({response.status_code for response in shed}, {429})
+        self.assertTrue(all(response.headers["retry-after"] == "1" for response in shed))
+        self.assertLess(shed_seconds, 0.5)
+        self.assertEqual(sorted(response.status_code for response in batched), [200, 200, 429, 429])
+        self.assertEqual((interactive.rejected, batch.rejected), (12, 2))
+        self.assertEqual((interactive.in_flight, batch.in_flight), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
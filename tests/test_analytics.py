@@ -0,0 +1,123 @@
+"""
+Unit tests for one-pass corpus analytics.
+"""
+
+import os
+import random
+import re
+import sys
+import unittest
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tools.analytics import FILLER_PHRASES, CorpusAnalysis, QuantileSketch, score_breakdown
+from tools.deadline import CancelToken, OperationCancelledError, cancel_scope
+from tools.optimize import _FILLER_PATTERNS, score_prompt
+
+WORDS = ["explain", "the", "data", "model", "write", "a", "summary", "very", "quite", "please", "kind of",
+         "could you", "Just", "SORT OF", "it's", "naïve", "!", "done."]
+
+
+def _pairs(count, seed=5):
+    rng = random.Random(seed)
+    pairs = [("", ""), ("  ", "x"), ("x", " \n"), ("!!!", "...")]
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randrange(1, 40))]
+        pairs.append((" ".join(words), " ".join(word for word in words if rng.random() > 0.4)))
+    return pairs
+
+
+class TestScoreBreakdown(unittest.TestCase):
+    """Test cases for score_breakdown."""
+
+    def test_matches_score_prompt(self):
+        """Test that the breakdown scores exactly as score_prompt and counts fillers per phrase."""
+        for raw, improved in _pairs(1000):
+            breakdown = score_breakdown(raw, improved)
+            self.assertEqual(repr(breakdown.score), repr(score_prompt(raw, improved)), (raw, improved))
+            expected = [len(re.findall(pattern, raw.strip(), re.IGNORECASE)) for pattern in _FILLER_PATTERNS]
+            self.assertEqual(breakdown.raw_fillers, expected)
+
+    def test_empty_prompts_have_no_components(self):
+        """Test that pairs decided without computing components leave them unset."""
+        breakdown = score_breakdown("Explain this", "")
+        self.assertEqual((breakdown.score, breakdown.length, breakdown.length_ratio), (0.0, None, 0.0))
+        self.assertIsNone(score_breakdown("", "x").length_ratio)
+        self.assertEqual(FILLER_PHRASES[6], "kind of")
+
+
+class TestQuantileSketch(unittest.TestCase):
+    """Test cases for the QuantileSketch class."""
+
+    def test_exact_until_full(self):
+        """Test that a sketch holding every value answers exactly."""
+        sketch = QuantileSketch(k=200)
+        for value in range(100):
+            sketch.add(value)
+        self.assertEqual(sketch.quantiles([0.0, 0.5, 1.0]), [0, 49, 99])
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+
+    def test_bounded_and_accurate(self):
+        """Test that memory stays bounded and ranks stay close over a long stream."""
+        rng = random.Random(1)
+        values = [rng.random() for _ in range(200000)]
+        sketch = QuantileSketch(k=200, seed=2)
+        for value in values:
+            sketch.add(value)
+        self.assertEqual(sketch.count, 200000)
+        self.assertLess(len(sketch), 3 * 200)
+        ordered = sorted(values)
+        for q in (0.01, 0.25, 0.5, 0.9, 0.99):
+            rank = ordered.index(sketch.quantile(q)) / len(values)
+            self.assertLess(abs(rank - q), 0.02, q)
+
+    def test_invalid_settings(self):
+        """Test that a k below 2 is refused."""
+        with self.assertRaises(ValueError):
+            QuantileSketch(k=1)
+
+
+class TestCorpusAnalysis(unittest.TestCase):
+    """Test cases for the CorpusAnalysis class."""
+
+    def test_summary(self):
+        """Test that the report's moments, filler totals and examples match the per-pair results."""
+        pairs = _pairs(500)
+        analysis = CorpusAnalysis(examples=3, example_chars=10)
+        self.assertEqual(analysis.add_all({"raw_prompt": raw, "improved_prompt": improved}
+                                          for raw, improved in pairs), len(pairs))
+        report = analysis.summary([0.5])
+        scores = [score_prompt(raw, improved) for raw, improved in pairs]
+        self.assertEqual(report["count"], len(pairs))
+        self.assertAlmostEqual(report["score"]["mean"], sum(scores) / len(scores))
+        self.assertEqual((report["score"]["min"], report["score"]["max"]), (min(scores), max(scores)))
+        self.assertEqual(list(report["score"]["quantiles"]), ["0.5"])
+        # Pairs with an empty prompt have a score but no components
+        self.assertEqual(report["components"]["clarity"]["count"],
+                         sum(1 for raw, improved in pairs if raw.strip() and improved.strip()))
+        self.assertEqual(report["fillers"]["please"]["raw"],
+                         sum(len(re.findall(r'\bplease\s+', raw.strip(), re.IGNORECASE)) for raw, _ in pairs))
+
+        ranked = sorted(range(len(pairs)), key=lambda i: (-scores[i], i))
+        self.assertEqual([example["index"] for example in report["best"]], ranked[:3])
+        ranked = sorted(range(len(pairs)), key=lambda i: (scores[i], i))
+        self.assertEqual([example["index"] for example in report["worst"]], ranked[:3])
+        self.assertTrue(all(len(example["raw_prompt"]) <= 10 for example in report["worst"]))
+
+    def test_empty_corpus(self):
+        """Test that an empty corpus gives an empty report."""
+        report = CorpusAnalysis(examples=0).summary()
+        self.assertEqual((report["count"], report["score"]["mean"], report["best"]), (0, None, []))
+        self.assertEqual(report["length_ratio"]["quantiles"]["0.5"], None)
+
+    def test_cancellation(self):
+        """Test that folding a piece stops once its deadline has passed."""
+        analysis = CorpusAnalysis()
+        with cancel_scope(CancelToken(0)), self.assertRaises(OperationCancelledError):
+            analysis.add_all([{"raw_prompt": "a", "improved_prompt": "b"}])
+        self.assertEqual(analysis.count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+"""
+Unit tests for approximate scoring, checked against the exact scorer.
+"""
+
+import random
+import re
+import time
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tools.approximate import _FILLERS, estimate_score, jaccard_estimate, score_with_error, signature
+from tools.optimize import _FILLER_PATTERNS, optimize_prompt, score_prompt
+
+FILLERS = ["very", "quite", "really", "actually", "just", "simply", "please",
+           "kind of", "sort of", "could you", "would you"]
+COMMON = ["the", "a", "system", "data", "model", "explain", "write", "describe"]
+
+
+def make_prompt(rng, words, filler_rate, vocabulary):
+    """Long synthetic prompt with Zipf-like rare words, common words and fillers."""
+    out = []
+    for _ in range(words):
+        if rng.random() < filler_rate:
+            out.append(rng.choice(FILLERS))
+        if rng.random() < 0.5:
+            out.append(f"w{int(rng.paretovariate(1.1)) % vocabulary}")
+        else:
+            out.append(rng.choice(COMMON))
+        if rng.random() < 0.06:
+            out[-1] += "."
+    return " ".join(out)
+
+
+class TestApproximateScore(unittest.TestCase):
+    """Test cases for estimate_score against score_prompt."""
+
+    @classmethod
+    def setUpClass(cls):
+        rng = random.Random(11)
+        cls.pairs = []
+        for case in range(8):
+            raw = make_prompt(rng, 60_000, [0.005, 0.03, 0.1, 0.01][case % 4], [2_000, 100_000][case % 2])
+            improved = [
+                lambda: optimize_prompt(raw, "precise")[0],
+                lambda: optimize_prompt(raw, "fast")[1],
+                lambda: raw[:int(len(raw) * rng.uniform(0.4, 0.95))],
+                lambda: make_prompt(rng, 50_000, 0.01, 100_000),
+            ][case % 4]()
+            cls.pairs.append((raw, improved))
+
+    def test_accuracy(self):
+        """Test that estimates are within 0.02 of the exact score and mostly within their error bound."""
+        within_bound = 0
+        for raw, improved in self.pairs:
+            exact = score_prompt(raw, improved)
+            estimate = estimate_score(raw, improved)
+            self.assertTrue(estimate.approximate)
+            self.assertLessEqual(abs(estimate.score - exact), 0.02 + 1e-9)
+            self.assertLessEqual(estimate.error, 0.02)
+            within_bound += abs(estimate.score - exact) <= estimate.error + 0.001
+        # The bound is two standard errors, so about one estimate in twenty may fall outside it
+        self.assertGreaterEqual(within_bound, len(self.pairs) - 1)
+
+    def test_speedup(self):
+        """Test that the estimate is much faster than the exact score on a large input."""
+        raw = make_prompt(random.Random(5), 250_000, 0.02, 50_000)
+        improved = optimize_prompt(raw, "precise")[0]
+
+        start = time.perf_counter()
+        score_prompt(raw, improved)
+        exact_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        estimate_score(raw, improved)
+        approximate_seconds = time.perf_counter() - start
+        self.assertGreater(exact_seconds / approximate_seconds, 2.0)
+
+    def test_small_inputs_are_exact(self):
+        """Test that inputs the windows and signatures cover completely give the exact score."""
+        for raw, improved in [("Please could you write a very short story", "Write a short story"),
+                              ("Really explain this. Just do it.", "Explain this."),
+                              ("  ", "anything"), ("text", "")]:
+            estimate = estimate_score(raw, improved)
+            self.assertEqual(estimate.score, score_prompt(raw, improved))
+            self.assertEqual(estimate.error, 0.0)
+
+    def test_deterministic(self):
+        """Test that the same input always gives the same estimate."""
+        raw, improved = self.pairs[0]
+        self.assertEqual(estimate_score(raw, improved), estimate_score(raw, improved))
+
+    def test_fused_filler_count(self):
+        """Test that the fused filler regex counts the same matches as the separate patterns."""
+        raw, _ = self.pairs[2]
+        separate = sum(len(re.findall(pattern, raw, re.IGNORECASE)) for pattern in _FILLER_PATTERNS)
+        self.assertEqual(len(_FILLERS.findall(raw)), separate)
+
+    def test_jaccard_estimate(self):
+        """Test MinHash Jaccard estimates against exact set similarity."""
+        first = {f"t{i}" for i in range(20_000)}
+        second = {f"t{i}" for i in range(10_000, 40_000)}
+        estimate, error = jaccard_estimate(signature(" ".join(first)), signature(" ".join(second)))
+        self.assertAlmostEqual(estimate, 10_000 / 40_000, delta=3 * error)
+        self.assertEqual(jaccard_estimate(signature("a b c"), signature("b c d")), (0.5, 0.0))
+
+
+class TestScoreWithError(unittest.TestCase):
+    """Test cases for the automatic mode switch."""
+
+    def test_threshold(self):
+        """Test that scoring turns approximate at the configured input size."""
+        raw, improved = "Please write a very short story", "Write a short story"
+        self.assertEqual(score_with_error(raw, improved), (score_prompt(raw, improved), 0.0, False))
+        self.assertTrue(score_with_error(raw, improved, min_chars=10).approximate)
+        self.assertFalse(score_with_error(raw, improved, approximate=False, min_chars=10).approximate)
+        self.assertTrue(score_with_error(raw, improved, approximate=True).approximate)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""
+Tests for the Python client SDK against a locally started HTTP server.
+"""
+
+import asyncio
+import socket
+import threading
+import time
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the client and server
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import uvicorn
+
+import http_server
+from prompt_optimizer_client import AsyncPromptOptimizerClient, PromptOptimizerClient, PromptOptimizerError
+from prompt_optimizer_client.client import msgpack
+from tools.admission import AdmissionController
+from tools.optimize import optimize_prompt, score_prompt
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LocalServer:
+    """Run http_server.app under uvicorn in a background thread."""
+
+    def __init__(self):
+        self.port = _free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        config = uvicorn.Config(http_server.app, host="127.0.0.1", port=self.port, log_level="warning")
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        deadline = time.time() + 10
+        while not self.server.started:
+            if time.time() > deadline:
+                raise RuntimeError("server did not start")
+            time.sleep(0.01)
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+class ClientTestCase(unittest.TestCase):
+    """Starts one server for all tests in the class."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = LocalServer()
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+
+class TestSyncClient(ClientTestCase):
+    """Test cases for PromptOptimizerClient."""
+
+    def test_endpoints(self):
+        """Test optimize, score and health calls."""
+        with PromptOptimizerClient(self.server.url) as client:
+            self.assertEqual(client.health()["status"], "healthy")
+            self.assertEqual(client.optimize("Write a story about a cat", "creative"),
+                             optimize_prompt("Write a story about a cat", "creative"))
+            self.assertEqual(client.score("Write about AI", "Write about AI"), score_prompt("Write about AI", "Write about AI"))
+
+    def test_map_preserves_order(self):
+        """Test that map returns results in input order with bounded concurrency."""
+        prompts = [f"Please write {i} very detailed stories" for i in range(20)]
+        with PromptOptimizerClient(self.server.url, max_connections=4) as client:
+            results = list(client.optimize_many(prompts, "precise", concurrency=3))
+        self.assertEqual(results, [optimize_prompt(prompt, "precise") for prompt in prompts])
+
+    def test_validation_error(self):
+        """Test that server errors raise PromptOptimizerError without retrying."""
+        with PromptOptimizerClient(self.server.url) as client:
+            with self.assertRaises(PromptOptimizerError) as ctx:
+                client.optimize("test", "bogus")
+        self.assertEqual(ctx.exception.status_code, 422)
+
+    def test_retries_on_429(self):
+        """Test that the client retries when the server sheds load."""
+        original = http_server.admission
+        http_server.admission = AdmissionController(max_in_flight=0, rate=20, burst=1)
+        try:
+            with PromptOptimizerClient(self.server.url, max_retries=5, max_backoff=0.1) as client:
+                scores = list(client.score_many([("a b", "a b")] * 4, concurrency=1))
+            self.assertEqual(scores, [score_prompt("a b", "a b")] * 4)
+            self.assertGreater(http_server.admission.rejected, 0)
+        finally:
+            http_server.admission = original
+
+    def test_retries_exhausted(self):
+        """Test that a persistent 429 surfaces as an error."""
+        original = http_server.admission
+        http_server.admission = AdmissionController(max_in_flight=0, rate=0.001, burst=1)
+        try:
+            with PromptOptimizerClient(self.server.url, max_retries=1, max_backoff=0.01) as client:
+                client.score("a", "a")
+                with self.assertRaises(PromptOptimizerError) as ctx:
+                    client.score("a", "a")
+            self.assertEqual(ctx.exception.status_code, 429)
+        finally:
+            http_server.admission = original
+
+    def test_connection_error(self):
+        """Test that an unreachable server raises PromptOptimizerError."""
+        with PromptOptimizerClient(f"http://127.0.0.1:{_free_port()}", max_retries=1, backoff=0.01) as client:
+            with self.assertRaises(PromptOptimizerError):
+                client.health()
+
+    @unittest.skipIf(msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        """Test the msgpack wire format."""
+        with PromptOptimizerClient(self.server.url, use_msgpack=True) as client:
+            self.assertEqual(client.optimize("Write about AI", "fast"), optimize_prompt("Write about AI", "fast"))
+
+    def test_delta(self):
+        """Test that delta responses are applied to the same variants."""
+        prompt = "  Please write a detailed story. It should be good.  "
+        with PromptOptimizerClient(self.server.url) as client:
+            self.assertEqual(client.optimize(prompt, "precise", delta=True), optimize_prompt(prompt, "precise"))
+            self.assertEqual(len(client.optimize_edits(prompt, "precise")), 3)
+            self.assertEqual(client.optimize(prompt, "precise", delta=True, variants=[1]),
+                             optimize_prompt(prompt, "precise", variants=[1]))
+
+
+class TestAsyncClient(ClientTestCase):
+    """Test cases for AsyncPromptOptimizerClient."""
+
+    def test_endpoints_and_map(self):
+        """Test single calls and the async map helper."""
+        pairs = [(f"Please write about topic {i}", f"Write about topic {i}") for i in range(10)]
+
+        async def scenario():
+            async with AsyncPromptOptimizerClient(self.server.url, max_connections=4) as client:
+                variants = await client.optimize("Write a story about a cat", "fast")
+                scores = [score async for score in client.score_many(pairs, concurrency=4)]
+            return variants, scores
+
+        variants, scores = asyncio.run(scenario())
+        self.assertEqual(variants, optimize_prompt("Write a story about a cat", "fast"))
+        self.assertEqual(scores, [score_prompt(raw, improved) for raw, improved in pairs])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+"""
+Algorithmic-complexity and regex-backtracking regression tests.
+
+Untrusted prompts go through many regexes and per-word rewrite loops. Each
+public text function is timed on adversarial inputs of growing size; the
+growth exponent fitted on a log-log scale must stay near-linear and the time
+per MB of input within a budget. Set COMPLEXITY_MAX_CHARS to test larger
+inputs and COMPLEXITY_SECONDS_PER_MB to adjust the budget for slow machines.
+"""
+
+import math
+import os
+import sys
+import time
+import unittest
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from prompt_optimizer_client.delta import apply_edits
+from tools.approximate import INITIAL_WINDOWS, WINDOW_CHARS, estimate_score
+from tools.optimize import optimize_prompt, optimize_prompt_edits, score_prompt
+from tools.similarity import MinHashIndex
+from tools.styles import compile_style
+
+MAX_CHARS = int(os.getenv("COMPLEXITY_MAX_CHARS", 1 << 17))
+SIZES = [MAX_CHARS >> 3, MAX_CHARS >> 2, MAX_CHARS >> 1, MAX_CHARS]
+# Fitted exponent of time against input size; quadratic behaviour fits about 2.0
+MAX_EXPONENT = 1.35
+SECONDS_PER_MB = float(os.getenv("COMPLEXITY_SECONDS_PER_MB", 5.0))
+# Shortest total time of one measurement; fast calls are repeated to reach it
+MIN_MEASURE_SECONDS = 0.01
+
+
+def _repeat(unit: str, size: int) -> str:
+    return (unit * (size // len(unit) + 1))[:size]
+
+
+# Adversarial input families: size -> prompt
+INPUTS = {
+    "punctuation run": lambda n: _repeat("!?.", n),
+    "dots and spaces": lambda n: _repeat(". ", n),
+    "whitespace run": lambda n: "a" + " " * (n - 2) + "b",
+    "mixed whitespace": lambda n: _repeat("\n \t\r", n),
+    "single token": lambda n: "x" * n,
+    "single word per char": lambda n: _repeat("a ", n),
+    "repeated filler": lambda n: _repeat("kind of ", n),
+    "filler then whitespace": lambda n: "kind of" + " " * (n - 8) + "x",
+    "polite openings": lambda n: _repeat("please could you would you ", n),
+    "every rule word": lambda n: _repeat("Basically, I really want a very detailed, actually quite simple approach. ", n),
+    "short sentences": lambda n: _repeat("Do it. ", n),
+    "dense unicode": lambda n: _repeat("é漢字😀́ß Ωж ", n),
+    "combining marks": lambda n: "a" + "́" * (n - 1),
+}
+
+_CUSTOM_STYLE = compile_style("adversarial", {"variants": [
+    [{"op": "remove", "words": ["kind of", "kind", "very", "really"]},
+     {"op": "replace", "words": {"utilize": "use", "approach": "way"}}],
+    [{"op": "bullets"}, {"op": "remove", "words": ["please"]}],
+    [{"op": "prefix", "text": "Brief: "}, {"op": "replace", "words": {"a": "one"}}],
+]})
+
+
+def _measure(fn, text: str) -> float:
+    """Seconds per call: the best of two runs, each repeated up to MIN_MEASURE_SECONDS."""
+    best = math.inf
+    for _ in range(2):
+        calls = 0
+        start = time.perf_counter()
+        while True:
+            fn(text)
+            calls += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= MIN_MEASURE_SECONDS:
+                break
+        best = min(best, elapsed / calls)
+        if elapsed > 1.0:
+            # Long enough to be stable; the remaining runs would only cost time
+            break
+    return best
+
+
+def _exponent(sizes, seconds) -> float:
+    """Least-squares slope of log(seconds) against log(size)."""
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(s, 1e-9)) for s in seconds]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    return (sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+            / sum((x - mean_x) ** 2 for x in xs))
+
+
+class TestComplexity(unittest.TestCase):
+    """Growth and per-MB budget of public functions on adversarial inputs."""
+
+    def assertNearLinear(self, fn, sizes=SIZES):
+        for name, make in INPUTS.items():
+            with self.subTest(input=name):
+                texts = [make(size) for size in sizes]
+                seconds = []
+                for size, text in zip(sizes, texts):
+                    # Checked size by size, so a superlinear function fails before the large inputs
+                    seconds.append(_measure(fn, text))
+                    per_mb = seconds[-1] / (size / (1 << 20))
+                    self.assertLessEqual(per_mb, SECONDS_PER_MB, f"{per_mb:.2f}s per MB on {name} at {size} chars")
+                exponent = _exponent(sizes, seconds)
+                if exponent > MAX_EXPONENT:
+                    # Re-measure once so a noisy neighbour does not fail the suite
+                    seconds = [min(old, _measure(fn, text)) for old, text in zip(seconds, texts)]
+                    exponent = _exponent(sizes, seconds)
+                timings = ", ".join(f"{size}: {s * 1000:.1f}ms" for size, s in zip(sizes, seconds))
+                self.assertLessEqual(exponent, MAX_EXPONENT, f"time grows as n^{exponent:.2f} on {name} ({timings})")
+
+    def test_optimize_creative(self):
+        self.assertNearLinear(lambda text: optimize_prompt(text, 'creative'))
+
+    def test_optimize_precise(self):
+        self.assertNearLinear(lambda text: optimize_prompt(text, 'precise'))
+
+    def test_optimize_fast(self):
+        self.assertNearLinear(lambda text: optimize_prompt(text, 'fast'))
+
+    def test_optimize_edits_and_apply(self):
+        def round_trip(text):
+            for edits in optimize_prompt_edits(text, 'precise'):
+                apply_edits(text, edits)
+
+        self.assertNearLinear(round_trip)
+
+    def test_custom_style(self):
+        self.assertNearLinear(_CUSTOM_STYLE.optimize)
+
+    def test_score(self):
+        self.assertNearLinear(lambda text: score_prompt(text, text[:len(text) // 2] + "?"))
+
+    def test_approximate_score(self):
+        # Smaller inputs are scanned exactly; a fit across the switch to sampling is not a growth rate
+        sizes = [max(size, 2 * INITIAL_WINDOWS * WINDOW_CHARS) for size in SIZES]
+        sizes = [sizes[0] << i for i in range(len(SIZES))]
+        self.assertNearLinear(lambda text: estimate_score(text, text[:len(text) // 2] + "?"), sizes)
+
+    def test_similarity_signature(self):
+        self.assertNearLinear(MinHashIndex().signature)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+"""
+Unit tests for deadlines and cooperative cancellation.
+"""
+
+import asyncio
+import threading
+import time
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import server
+from tools.deadline import (
+    CANCELLED,
+    DEADLINE,
+    CancelToken,
+    OperationCancelledError,
+    cancel_scope,
+    checkpoint,
+    run_with_deadline,
+)
+from tools.metrics import REGISTRY
+from tools.optimize import optimize_prompt, score_prompt
+from tools.scheduler import INTERACTIVE, FairScheduler
+from tools.singleflight import SingleFlight
+
+
+def cancelled_jobs(pool, state, reason):
+    return REGISTRY.counter("scheduler_cancelled_total", "").value(
+        pool=pool, lane=INTERACTIVE, state=state, reason=reason)
+
+
+class TestCancelToken(unittest.TestCase):
+    """Test cases for CancelToken and checkpoints."""
+
+    def test_deadline(self):
+        """Test that a token expires at its deadline and reports why."""
+        token = CancelToken(0.01)
+        token.check()
+        self.assertGreater(token.remaining(), 0)
+        time.sleep(0.02)
+        self.assertEqual(token.remaining(), 0)
+        with self.assertRaises(OperationCancelledError) as raised:
+            token.check()
+        self.assertEqual(raised.exception.reason, DEADLINE)
+
+        # An expired deadline wins over a later cancellation
+        token.cancel()
+        self.assertEqual(token.reason, DEADLINE)
+
+    def test_cancel(self):
+        """Test that cancelling a token without a deadline stops checkpoints."""
+        token = CancelToken()
+        self.assertIsNone(token.remaining())
+        token.cancel()
+        with cancel_scope(token), self.assertRaises(OperationCancelledError) as raised:
+            checkpoint()
+        self.assertEqual(raised.exception.reason, CANCELLED)
+
+    def test_checkpoint_outside_scope(self):
+        """Test that checkpoints are no-ops when no token is set."""
+        checkpoint()
+        self.assertEqual(len(optimize_prompt("Write a story. Make it short.", "precise")), 3)
+
+    def test_optimize_and_score_stop(self):
+        """Test that optimize and score stop under an expired token."""
+        token = CancelToken()
+        token.cancel()
+        with cancel_scope(token):
+            for style in ("creative", "precise", "fast"):
+                with self.assertRaises(OperationCancelledError):
+                    optimize_prompt("Please write a very short story.", style)
+            with self.assertRaises(OperationCancelledError):
+                score_prompt("Please write a story.", "Write a story.")
+
+
+class TestSchedulerCancellation(unittest.TestCase):
+    """Test that the scheduler drops and stops cancelled work."""
+
+    def setUp(self):
+        self.scheduler = FairScheduler("test_cancel", workers=1)
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+
+    def test_running_job_stops_at_checkpoint(self):
+        """Test that cancelling a waiter stops its running job at the next checkpoint."""
+        started = threading.Event()
+        iterations = []
+
+        def work():
+            started.set()
+            for _ in range(500):
+                checkpoint()
+                iterations.append(1)
+                time.sleep(0.002)
+
+        async def scenario():
+            job = asyncio.ensure_future(self.scheduler.submit(work))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait)
+            job.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await job
+            # The worker is released once the job reaches a checkpoint
+            return await self.scheduler.submit(len, "abc")
+
+        before = cancelled_jobs("test_cancel", "running", CANCELLED)
+        self.assertEqual(asyncio.run(scenario()), 3)
+        self.assertLess(len(iterations), 500)
+        self.assertEqual(cancelled_jobs("test_cancel", "running", CANCELLED) - before, 1)
+
+    def test_expired_job_never_runs(self):
+        """Test that a job whose deadline passes while queued fails without running."""
+        gate = threading.Event()
+        ran = []
+
+        async def scenario():
+            blocker = asyncio.ensure_future(self.scheduler.submit(gate.wait))
+            with cancel_scope(CancelToken(0.01)):
+                job = asyncio.ensure_future(self.scheduler.submit(ran.append, 1))
+            await asyncio.sleep(0.05)
+            gate.set()
+            await blocker
+            with self.assertRaises(OperationCancelledError) as raised:
+                await job
+            return raised.exception.reason
+
+        before = cancelled_jobs("test_cancel", "queued", DEADLINE)
+        self.assertEqual(asyncio.run(scenario()), DEADLINE)
+        self.assertEqual(ran, [])
+        self.assertEqual(cancelled_jobs("test_cancel", "queued", DEADLINE) - before, 1)
+
+
+class TestSingleFlightCancellation(unittest.TestCase):
+    """Test that shared computations stop only when every caller is gone."""
+
+    def test_last_waiter_cancels(self):
+        """Test that the computation survives one cancelled caller but not all of them."""
+        flight = SingleFlight("test_cancel")
+
+        async def scenario():
+            started = asyncio.Event()
+            cancelled = asyncio.Event()
+
+            async def compute():
+                started.set()
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+
+            callers = [asyncio.ensure_future(flight.do("k", compute)) for _ in range(2)]
+            await started.wait()
+            callers[0].cancel()
+            await asyncio.sleep(0.01)
+            first = cancelled.is_set()
+            callers[1].cancel()
+            await asyncio.sleep(0.01)
+            return first, cancelled.is_set()
+
+        self.assertEqual(asyncio.run(scenario()), (False, True))
+
+    def test_callers_keep_their_own_deadlines(self):
+        """Test that a caller with a short deadline does not cut the shared computation short for the others."""
+        flight = SingleFlight("test_deadlines")
+        scheduler = FairScheduler("test_deadlines", workers=1)
+        self.addCleanup(scheduler.shutdown)
+
+        def work():
+            for _ in range(20):
+                checkpoint()
+                time.sleep(0.01)
+            return "done"
+
+        async def scenario():
+            compute = lambda: scheduler.submit(work)
+            short = asyncio.ensure_future(run_with_deadline(0.05, lambda: flight.do("k", compute)))
+            await asyncio.sleep(0)
+            long = asyncio.ensure_future(run_with_deadline(5, lambda: flight.do("k", compute)))
+            return await asyncio.gather(short, long, return_exceptions=True)
+
+        short, long = asyncio.run(scenario())
+        self.assertIsInstance(short, OperationCancelledError)
+        self.assertEqual(long, "done")
+        self.assertEqual(len(flight), 0)
+
+
+class TestMCPDeadline(unittest.TestCase):
+    """Test the timeout_ms argument of the MCP tools."""
+
+    def test_timeout_ms(self):
+        """Test that an expired timeout_ms fails the call and bad values are rejected."""
+        arguments = {"raw_prompt": "Please could you write a story. " * 20000, "improved_prompt": "Write a story.",
+                     "timeout_ms": 0.001}
+        with self.assertRaises(OperationCancelledError):
+            asyncio.run(server.handle_call_tool("score_prompt_tool", arguments))
+        with self.assertRaises(ValueError):
+            asyncio.run(server.handle_call_tool("score_prompt_tool", dict(arguments, timeout_ms=-1)))
+
+        result = asyncio.run(server.handle_call_tool(
+            "optimize_prompt_tool", {"raw_prompt": "Write a story", "style": "fast", "timeout_ms": 5000}))
+        self.assertIn("Variant 3", result[0].text)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+Unit tests for switchable engines and shadow-mode verification.
+"""
+
+import os
+import random
+import sys
+import threading
+import unittest
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tools.approximate import score_with_error
+from tools.engines import (
+    FUSED,
+    OPTIMIZE,
+    REFERENCE,
+    SCORE,
+    Engine,
+    ShadowVerifier,
+    current_engine,
+    engine_scope,
+    fused_score_prompt,
+    get_engine,
+    run,
+)
+from tools.metrics import REGISTRY
+from tools.optimize import optimize_prompt, optimize_prompt_edits, score_prompt
+from tools.progress import progress_scope
+from tools.styles import StyleRegistry
+
+FILLERS = ["very", "quite", "really", "actually", "just", "simply", "kind of", "sort of", "please",
+           "could you", "would you", "Please", "JUST", "Kind  of"]
+WORDS = ["explain", "the", "data", "model", "write", "a", "summary", "of", "code", "review", "it's", "naïve",
+         "test-case", "e.g.", "x1", "UTF-8", "résumé", "!", "?", "done."]
+
+
+def _pairs(count, seed=11):
+    rng = random.Random(seed)
+    pairs = [("", ""), ("  ", "x"), ("x", " \n"), ("kind of  sort of\tvery", "please   could you"), ("!!!", "...")]
+    for _ in range(count):
+        words = [rng.choice(WORDS + FILLERS) for _ in range(rng.randrange(1, 60))]
+        raw = " ".join(words)
+        improved = " ".join(word for word in words if rng.random() > 0.3)
+        pairs.append((raw, improved))
+    return pairs
+
+
+def _shadowed(engine, operation, outcome):
+    return REGISTRY.counter("engine_shadow_total", "").value(engine=engine, operation=operation, outcome=outcome)
+
+
+class TestEngines(unittest.TestCase):
+    """Test cases for engine selection and the fused engine."""
+
+    def test_fused_matches_reference(self):
+        """Test that the fused scorer gives exactly the reference score."""
+        for raw, improved in _pairs(2000):
+            self.assertEqual(repr(fused_score_prompt(raw, improved)), repr(score_prompt(raw, improved)),
+                             (raw, improved))
+        with self.assertRaises(TypeError):
+            fused_score_prompt("a", None)
+
+    def test_lookup(self):
+        """Test that engines are found by name and unknown names are refused."""
+        self.assertIs(get_engine("reference"), REFERENCE)
+        self.assertIs(get_engine("fused"), FUSED)
+        with self.assertRaisesRegex(ValueError, "Unknown engine: turbo"):
+            get_engine("turbo")
+
+    def test_scope_selects_engine(self):
+        """Test that run() and the built-in entry points use the engine of the current scope."""
+        calls = []
+        marker = Engine("marker", lambda *args: calls.append(("optimize", args)) or ["m"],
+                        lambda *args: calls.append(("edits", args)) or [[]],
+                        lambda *args: calls.append(("score", args)) or 0.5)
+        self.assertIs(current_engine(), REFERENCE)
+        with engine_scope(marker):
+            self.assertIs(current_engine(), marker)
+            self.assertEqual(run(SCORE, "a", "b"), 0.5)
+            builtin = StyleRegistry().resolve("fast")
+            self.assertEqual(builtin.optimize("Write a poem", [1]), ["m"])
+            self.assertEqual(builtin.optimize_edits("Write a poem"), [[]])
+            self.assertEqual(score_with_error("a b", "a", False).score, 0.5)
+            # Approximate scoring has no engine variants
+            self.assertNotEqual(score_with_error("a b", "a", True).score, 0.5)
+        self.assertIs(current_engine(), REFERENCE)
+        self.assertEqual(calls, [("score", ("a", "b")), ("optimize", ("Write a poem", "fast", [1])),
+                                 ("edits", ("Write a poem", "fast", None)), ("score", ("a b", "a"))])
+        self.assertEqual(StyleRegistry().resolve("fast").optimize("Write a poem"),
+                         optimize_prompt("Write a poem", "fast"))
+
+
+class TestShadowVerifier(unittest.TestCase):
+    """Test cases for the ShadowVerifier class."""
+
+    def test_match_and_latency(self):
+        """Test that agreeing outputs count as matches and the latency ratio is recorded."""
+        shadow = ShadowVerifier(sample_rate=1.0)
+        ratios = REGISTRY.histogram("engine_shadow_latency_ratio", "")
+        before = (_shadowed("fused", SCORE, "match"), ratios.count(engine="fused", operation=SCORE))
+        with engine_scope(FUSED, shadow):
+            for raw, improved in _pairs(20):
+                run(SCORE, raw, improved)
+        shadow.drain()
+        self.assertEqual(_shadowed("fused", SCORE, "match") - before[0], 25)
+        self.assertEqual(ratios.count(engine="fused", operation=SCORE) - before[1], 25)
+        self.assertEqual(shadow.mismatches(), [])
+
+    def test_mismatch_is_reported(self):
+        """Test that an engine whose output differs is counted and kept with digests only."""
+        broken = Engine("broken", lambda raw, style, variants=None: [raw.upper()] * 3,
+                        optimize_prompt_edits, score_prompt)
+        shadow = ShadowVerifier(sample_rate=1.0)
+        before = _shadowed("broken", OPTIMIZE, "mismatch")
+        with engine_scope(broken, shadow):
+            run(OPTIMIZE, "Write a secret poem", "fast", None)
+            # Operations that run the reference code are not compared
+            run(SCORE, "a", "b")
+        shadow.drain()
+        self.assertEqual(_shadowed("broken", OPTIMIZE, "mismatch") - before, 1)
+        self.assertEqual(_shadowed("broken", SCORE, "match"), 0)
+        [mismatch] = shadow.mismatches()
+        self.assertEqual((mismatch["engine"], mismatch["operation"]), ("broken", OPTIMIZE))
+        self.assertEqual(mismatch["first_difference"], 3)
+        self.assertNotIn("secret", repr(mismatch).lower())
+
+    def test_sampling_and_backpressure(self):
+        """Test that only the sampled fraction is compared and a full queue drops comparisons."""
+        self.assertFalse(ShadowVerifier(sample_rate=0.0).offer(FUSED, SCORE, ("a", "b"), 1.0, 0.1))
+        self.assertFalse(ShadowVerifier(sample_rate=1.0).offer(REFERENCE, SCORE, ("a", "b"), 1.0, 0.1))
+        sampled = ShadowVerifier(sample_rate=0.25, max_pending=1000, seed=3)
+        offered = sum(sampled.offer(FUSED, SCORE, ("a", "b"), 0.5, 0.1) for _ in range(400))
+        self.assertLess(abs(offered - 100), 30)
+        sampled.drain()
+
+        gate = threading.Event()
+        started = threading.Event()
+
+        def blocked_score(raw, improved):
+            started.set()
+            gate.wait()
+            return score_prompt(raw, improved)
+
+        slow = Engine("slow_reference", optimize_prompt, optimize_prompt_edits, blocked_score)
+        shadow = ShadowVerifier(sample_rate=1.0, max_pending=1, reference=slow)
+        before = _shadowed("fused", SCORE, "dropped")
+        self.assertTrue(shadow.offer(FUSED, SCORE, ("a", "b"), 1.0, 0.1))
+        started.wait(5)
+        self.assertTrue(shadow.offer(FUSED, SCORE, ("a", "b"), 1.0, 0.1))
+        self.assertFalse(shadow.offer(FUSED, SCORE, ("a", "b"), 1.0, 0.1))
+        self.assertEqual(_shadowed("fused", SCORE, "dropped") - before, 1)
+        gate.set()
+        shadow.drain()
+
+    def test_reference_runs_outside_caller_context(self):
+        """Test that the shadow reference run sends no progress to the caller."""
+        reports = []
+        shadow = ShadowVerifier(sample_rate=1.0)
+        with progress_scope(lambda done, total, partial: reports.append(partial)), engine_scope(FUSED, shadow):
+            run(SCORE, "Please explain this", "Explain this")
+            shadow.drain()
+        self.assertEqual([component for component, _ in reports], ["length", "keywords", "clarity"])
+
+    def test_invalid_settings(self):
+        """Test that a sample rate outside 0-1 is refused."""
+        with self.assertRaises(ValueError):
+            ShadowVerifier(sample_rate=1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,1039 @@
+"""
+Tests for the HTTP server endpoints.
+"""
+
+import asyncio
+import itertools
+import json
+import socket
+import tempfile
+import threading
+import tracemalloc
+import time
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the parent directory to the path so we can import the server
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import uvicorn
+from fastapi.testclient import TestClient
+from websockets.sync.client import connect
+
+import http_server
+from prompt_optimizer_client.delta import apply_edits
+from tools import wire
+from tools.admission import AdmissionController
+from tools.approximate import score_with_error
+from tools.deadline import checkpoint
+from tools.engines import ShadowVerifier
+from tools.limits import LimitPolicy, SizeLimits, parse_api_keys, parse_tenant_limits
+from tools.metrics import REGISTRY
+from tools.microbatch import MicroBatcher
+from tools.scheduler import FairScheduler
+
+
+class TestSimilarEndpoints(unittest.TestCase):
+    """Test cases for the /similar endpoints."""
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+
+    def test_index_and_query(self):
+        """Test that an indexed prompt is returned by /similar."""
+        response = self.client.post("/similar/index", json={
+            "raw_prompt": "Describe the water cycle for children",
+            "payload": {"variants": ["Paint a vivid picture of the water cycle"]}
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertGreaterEqual(response.json()["size"], 1)
+
+        response = self.client.post("/similar", json={"raw_prompt": "Describe the water cycle for kids", "k": 1})
+        self.assertEqual(response.status_code, 200)
+        matches = response.json()["matches"]
+        self.assertEqual(matches[0]["prompt"], "Describe the water cycle for children")
+        self.assertEqual(matches[0]["payload"]["variants"], ["Paint a vivid picture of the water cycle"])
+
+    def test_invalid_k(self):
+        """Test that out-of-range k is rejected."""
+        response = self.client.post("/similar", json={"raw_prompt": "test", "k": 0})
+        self.assertEqual(response.status_code, 422)
+
+
+class TestStyleEndpoints(unittest.TestCase):
+    """Test cases for tenant-registered custom styles."""
+
+    SPEC = {"variants": [
+        [{"op": "replace", "words": {"use": "utilize"}}],
+        [{"op": "bullets"}],
+        [{"op": "suffix", "text": " Cite the statute."}],
+    ]}
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+        self.tenant = {"X-Tenant-ID": "acme"}
+
+    def tearDown(self):
+        self.client.delete("/styles/legal", headers=self.tenant)
+
+    def test_register_and_optimize(self):
+        """Test that a registered style is usable by its tenant only."""
+        response = self.client.put("/styles/legal", json=self.SPEC, headers=self.tenant)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("legal", self.client.get("/styles", headers=self.tenant).json()["custom"])
+
+        payload = {"raw_prompt": "Use the contract. Explain it", "style": "legal"}
+        response = self.client.post("/optimize", json=payload, headers=self.tenant)
+        self.assertEqual(response.json()["variants"], [
+            "utilize the contract. Explain it",
+            "• Use the contract\n• Explain it",
+            "Use the contract. Explain it Cite the statute.",
+        ])
+        self.assertEqual(self.client.post("/optimize", json=payload).status_code, 422)
+
+    def test_update_and_delete(self):
+        """Test that updates take effect immediately and deleted styles disappear."""
+        self.client.put("/styles/legal", json=self.SPEC, headers=self.tenant)
+        updated = {"variants": [[], [], [{"op": "prefix", "text": "Legal: "}]]}
+        version = self.client.put("/styles/legal", json=updated, headers=self.tenant).json()["version"]
+        self.assertEqual(self.client.get("/styles/legal", headers=self.tenant).json()["version"], version)
+
+        payload = {"raw_prompt": "Use the contract", "style": "legal", "variants": [2]}
+        self.assertEqual(self.client.post("/optimize", json=payload, headers=self.tenant).json()["variants"],
+                         ["Legal: Use the contract"])
+
+        self.assertEqual(self.client.delete("/styles/legal", headers=self.tenant).status_code, 204)
+        self.assertEqual(self.client.get("/styles/legal", headers=self.tenant).status_code, 404)
+
+    def test_invalid_style(self):
+        """Test that malformed specs and built-in names are rejected."""
+        response = self.client.put("/styles/legal", json={"variants": [[{"op": "shout"}], [], []]}, headers=self.tenant)
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(self.client.put("/styles/fast", json=self.SPEC).status_code, 422)
+
+
+class TestAdmissionControl(unittest.TestCase):
+    """Test cases for load shedding in the HTTP server."""
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+        self.original = http_server.admission
+        http_server.admission = AdmissionController(max_in_flight=0, rate=0.001, burst=1)
+
+    def tearDown(self):
+        http_server.admission = self.original
+
+    def test_over_capacity_returns_429(self):
+        """Test that requests over the rate limit get 429 with Retry-After."""
+        data = {"raw_prompt": "Write about AI", "style": "fast"}
+        self.assertEqual(self.client.post("/optimize", json=data).status_code, 200)
+
+        response = self.client.post("/optimize", json=data)
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers["Retry-After"]), 1)
+
+    def test_health_is_exempt(self):
+        """Test that health checks bypass admission control."""
+        self.client.post("/score", json={"raw_prompt": "a", "improved_prompt": "a"})
+        for _ in range(3):
+            self.assertEqual(self.client.get("/health").status_code, 200)
+
+
+class TestPriorityLanes(unittest.TestCase):
+    """Test cases for lane selection and per-tenant caps."""
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+        self.original_keys = http_server.BATCH_API_KEYS
+        http_server.BATCH_API_KEYS = {"bulk-key"}
+
+    def tearDown(self):
+        http_server.BATCH_API_KEYS = self.original_keys
+
+    def completed(self, lane):
+        return REGISTRY.counter("scheduler_completed_total", "").value(pool="http", lane=lane)
+
+    def test_lane_selection(self):
+        """Test that the request class header and batch API keys pick the lane."""
+        data = {"raw_prompt": "a b c", "improved_prompt": "a b"}
+        cases = [({}, "interactive"), ({"X-Request-Class": "batch"}, "batch"),
+                 ({"X-Request-Class": "interactive", "X-API-Key": "bulk-key"}, "batch")]
+        for headers, lane in cases:
+            before = self.completed(lane)
+            self.assertEqual(self.client.post("/score", json=data, headers=headers).status_code, 200)
+            self.assertEqual(self.completed(lane), before + 1)
+
+    def test_tenant_cap_returns_429(self):
+        """Test that a tenant over its in-flight cap is rejected with 429."""
+        original = http_server.scheduler
+        http_server.scheduler = FairScheduler("test_http_tenant", workers=1, tenant_limit=1)
+        batcher = patch("http_server.batcher", MicroBatcher(http_server.scheduler))
+        batcher.start()
+        try:
+            # Simulate one request of the tenant already in flight
+            with patch.dict(http_server.scheduler._tenants, {"acme": 1}):
+                response = self.client.post("/optimize", json={"raw_prompt": "Write", "style": "fast"},
+                                            headers={"X-Tenant-ID": "acme"})
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response.headers["Retry-After"], "1")
+            response = self.client.post("/optimize", json={"raw_prompt": "Write", "style": "fast"},
+                                        headers={"X-Tenant-ID": "acme"})
+            self.assertEqual(response.status_code, 200)
+        finally:
+            batcher.stop()
+            http_server.scheduler.shutdown()
+            http_server.scheduler = original
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    """Test cases for the /metrics endpoint."""
+
+    def test_metrics_exposed(self):
+        """Test that single-flight counters appear after a request."""
+        client = TestClient(http_server.app)
+        client.post("/optimize", json={"raw_prompt": "Write about AI", "style": "creative"})
+
+        response = client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('singleflight_calls_total{group="http_optimize"}', response.text)
+        self.assertIn("singleflight_coalesce_ratio", response.text)
+
+
+class TestContentNegotiation(unittest.TestCase):
+    """Test cases for msgpack bodies and response compression."""
+
+    LONG_PROMPT = "Please write a very detailed explanation about machine learning. " * 50
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+
+    def test_json_default(self):
+        """Test that plain JSON requests still get JSON responses."""
+        response = self.client.post("/optimize", json={"raw_prompt": "Write about AI", "style": "fast"},
+                                    headers={"accept-encoding": "identity"})
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertNotIn("content-encoding", response.headers)
+        self.assertEqual(len(response.json()["variants"]), 3)
+
+    def test_gzip_large_response(self):
+        """Test that large responses are gzip-compressed when accepted."""
+        response = self.client.post("/optimize", json={"raw_prompt": self.LONG_PROMPT, "style": "precise"},
+                                    headers={"accept-encoding": "gzip"})
+        self.assertEqual(response.headers["content-encoding"], "gzip")
+        self.assertEqual(len(response.json()["variants"]), 3)
+
+    def test_delta_response_format(self):
+        """Test that response_format=delta returns edit scripts instead of variants."""
+        payload = {"raw_prompt": self.LONG_PROMPT, "style": "creative"}
+        full = self.client.post("/optimize", json=payload).json()
+        delta = self.client.post("/optimize", json={**payload, "response_format": "delta"}).json()
+        self.assertEqual(set(full), {"variants"})
+        self.assertEqual(set(delta), {"edits"})
+        self.assertEqual([apply_edits(self.LONG_PROMPT, script) for script in delta["edits"]], full["variants"])
+
+    def test_variant_selection(self):
+        """Test that the variants field limits which variants are built and returned."""
+        payload = {"raw_prompt": "Please write a story. About a cat!", "style": "precise"}
+        full = self.client.post("/optimize", json=payload).json()["variants"]
+        response = self.client.post("/optimize", json={**payload, "variants": [1]})
+        self.assertEqual(response.json(), {"variants": full[1:2]})
+        response = self.client.post("/optimize", json={**payload, "variants": [3]})
+        self.assertEqual(response.status_code, 422)
+
+    @unittest.skipUnless(wire.MSGPACK_AVAILABLE, "msgpack is not installed")
+    def test_msgpack_round_trip(self):
+        """Test sending and receiving msgpack bodies."""
+        body = wire.packb({"raw_prompt": "Write a story about a cat", "style": "creative"})
+        response = self.client.post("/optimize", content=body, headers={
+            "content-type": "application/msgpack",
+            "accept": "application/msgpack",
+            "accept-encoding": "identity"
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"], "application/msgpack")
+        expected = self.client.post("/optimize", json={"raw_prompt": "Write a story about a cat", "style": "creative"}).json()
+        self.assertEqual(wire.unpackb(response.content), expected)
+
+    @unittest.skipUnless(wire.MSGPACK_AVAILABLE, "msgpack is not installed")
+    def test_msgpack_validation_and_errors(self):
+        """Test that msgpack bodies are validated and malformed ones rejected."""
+        headers = {"content-type": "application/msgpack"}
+        response = self.client.post("/optimize", content=wire.packb({"raw_prompt": "x", "style": "bogus"}), headers=headers)
+        self.assertEqual(response.status_code, 422)
+        response = self.client.post("/optimize", content=b"\xc1", headers=headers)
+        self.assertEqual(response.status_code, 400)
+        # Binary values have no JSON equivalent
+        response = self.client.post("/optimize", content=wire.packb({"raw_prompt": b"x", "style": "fast"}), headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    @unittest.skipUnless(wire.MSGPACK_AVAILABLE, "msgpack is not installed")
+    def test_msgpack_on_other_routes(self):
+        """Test that a msgpack body is accepted by routes other than /optimize."""
+        body = wire.packb({"text": "Explain the msgpack wire format"})
+        response = self.client.post("/prompts", content=body, headers={"content-type": "application/msgpack"})
+        self.assertEqual(response.status_code, 200, response.text)
+        stored = self.client.get(f"/prompts/{response.json()['hash']}")
+        self.assertEqual(stored.json(), {"text": "Explain the msgpack wire format"})
+
+
+class TestProfileEndpoint(unittest.TestCase):
+    """Test cases for the admin-only /debug/profile endpoint."""
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+        self.original = http_server.ADMIN_TOKEN
+
+    def tearDown(self):
+        http_server.ADMIN_TOKEN = self.original
+
+    def test_disabled_without_token(self):
+        """Test that the endpoint is hidden when no admin token is configured."""
+        http_server.ADMIN_TOKEN = None
+        self.assertEqual(self.client.get("/debug/profile?seconds=0.1").status_code, 404)
+
+    def test_requires_admin_token(self):
+        """Test that only callers with the admin token can profile."""
+        http_server.ADMIN_TOKEN = "secret"
+        self.assertEqual(self.client.get("/debug/profile?seconds=0.1").status_code, 403)
+        self.assertEqual(self.client.get("/debug/profile?seconds=0.1", headers={"X-Admin-Token": "wrong"}).status_code, 403)
+
+        response = self.client.get("/debug/profile?seconds=0.1", headers={"X-Admin-Token": "secret"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.text)
+        self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in response.text.splitlines()))
+
+    def test_seconds_bounds(self):
+        """Test that the duration is validated."""
+        http_server.ADMIN_TOKEN = "secret"
+        response = self.client.get("/debug/profile?seconds=600", headers={"X-Admin-Token": "secret"})
+        self.assertEqual(response.status_code, 422)
+
+
+class TestServerTiming(unittest.TestCase):
+    """Test cases for the Server-Timing header."""
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+
+    def test_opt_in_header(self):
+        """Test that opted-in requests get per-stage durations."""
+        response = self.client.post("/optimize", json={"raw_prompt": "Write a story. About a cat!", "style": "creative"},
+                                    headers={"X-Server-Timing": "1"})
+        entries = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+        self.assertEqual(entries, ["validate", "build_creative", "total"])
+
+        metrics = self.client.get("/metrics").text
+        self.assertIn('stage_duration_seconds_count{stage="build_creative"}', metrics)
+
+    def test_not_sent_by_default(self):
+        """Test that requests without the opt-in header get no Server-Timing."""
+        response = self.client.post("/score", json={"raw_prompt": "a b", "improved_prompt": "a"})
+        self.assertNotIn("Server-Timing", response.headers)
+
+
+class TestApproximateScore(unittest.TestCase):
+    """Test cases for approximate scoring on /score."""
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+
+    def test_approximate_flag(self):
+        """Test that small inputs are scored exactly unless approximate scoring is requested."""
+        payload = {"raw_prompt": "Please write a very short story", "improved_prompt": "Write a short story"}
+        exact = self.client.post("/score", json=payload).json()
+        self.assertEqual(exact["approximate"], False)
+        self.assertEqual(exact["error"], 0.0)
+
+        approximate = self.client.post("/score", json={**payload, "approximate": True}).json()
+        self.assertEqual(approximate["approximate"], True)
+        self.assertEqual(approximate["score"], exact["score"])
+
+    def test_automatic_above_threshold(self):
+        """Test that long inputs switch to approximate scoring by default."""
+        raw = "Please could you really explain this very simply. " * 2000
+        with patch.object(http_server, "APPROXIMATE_SCORE_MIN_CHARS", 50_000):
+            body = self.client.post("/score", json={"raw_prompt": raw, "improved_prompt": raw[:60_000]}).json()
+        self.assertEqual(body["approximate"], True)
+        self.assertLessEqual(body["error"], 0.02)
+
+
+class TestDeadlines(unittest.TestCase):
+    """Test cases for request deadlines."""
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+
+    def test_deadline_header(self):
+        """Test that work past the X-Request-Timeout-Ms deadline is stopped and reported as 504."""
+        def slow_score(raw_prompt, improved_prompt, *options):
+            for _ in range(500):
+                checkpoint()
+                time.sleep(0.002)
+            return 0.5
+
+        counter = REGISTRY.counter("scheduler_cancelled_total", "")
+        before = counter.value(pool="http", lane="interactive", state="running", reason="deadline")
+        with patch("http_server.score_with_error", slow_score):
+            response = self.client.post("/score", json={"raw_prompt": "slow", "improved_prompt": "deadline"},
+                                        headers={"X-Request-Timeout-Ms": "50"})
+        self.assertEqual(response.status_code, 504)
+        # The worker stops at its next checkpoint shortly after the response
+        for _ in range(100):
+            if counter.value(pool="http", lane="interactive", state="running", reason="deadline") > before:
+                break
+            time.sleep(0.01)
+        self.assertEqual(counter.value(pool="http", lane="interactive", state="running", reason="deadline") - before, 1)
+
+    def test_invalid_deadline_header(self):
+        """Test that a non-positive deadline is rejected."""
+        response = self.client.post("/score", json={"raw_prompt": "a", "improved_prompt": "b"},
+                                    headers={"X-Request-Timeout-Ms": "0"})
+        self.assertEqual(response.status_code, 422)
+
+
+class TestWebSocket(unittest.TestCase):
+    """Test cases for the /ws endpoint."""
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+
+    @staticmethod
+    def slow_score(raw_prompt, improved_prompt, *options):
+        # Runs until cancelled when raw_prompt is "slow"
+        for _ in range(1000 if raw_prompt == "slow" else 0):
+            checkpoint()
+            time.sleep(0.002)
+        return score_with_error(raw_prompt, improved_prompt, *options)
+
+    def receive(self, websocket, count):
+        replies = [websocket.receive_json() for _ in range(count)]
+        return {reply["id"]: reply for reply in replies}
+
+    def test_replies_by_id(self):
+        """Test that concurrent messages are answered with their own IDs."""
+        with self.client.websocket_connect("/ws") as websocket:
+            websocket.send_json({"id": "a", "type": "optimize", "raw_prompt": "Explain websockets please",
+                                 "style": "fast"})
+            websocket.send_json({"id": 2, "type": "score", "raw_prompt": "Explain websockets please",
+                                 "improved_prompt": "Explain websockets"})
+            replies = self.receive(websocket, 2)
+        self.assertEqual(replies["a"]["type"], "result")
+        self.assertEqual(len(replies["a"]["result"]["variants"]), 3)
+        self.assertEqual(replies[2]["type"], "result")
+        self.assertIn("score", replies[2]["result"])
+
+    def test_superseded_message_is_cancelled(self):
+        """Test that a newer message on the same channel stops the running one."""
+        counter = REGISTRY.counter("scheduler_cancelled_total", "")
+        before = counter.value(pool="http", lane="interactive", state="running", reason="cancelled")
+        with patch("http_server.score_with_error", self.slow_score), \
+                self.client.websocket_connect("/ws") as websocket:
+            websocket.send_json({"id": 1, "type": "score", "channel": "editor",
+                                 "raw_prompt": "slow", "improved_prompt": "superseded"})
+            time.sleep(0.2)
+            websocket.send_json({"id": 2, "type": "score", "channel": "editor",
+                                 "raw_prompt": "fast", "improved_prompt": "latest"})
+            replies = self.receive(websocket, 2)
+        self.assertEqual(replies[1], {"id": 1, "type": "cancelled", "reason": "superseded"})
+        self.assertEqual(replies[2]["type"], "result")
+        for _ in range(100):
+            if counter.value(pool="http", lane="interactive", state="running", reason="cancelled") > before:
+                break
+            time.sleep(0.01)
+        self.assertEqual(counter.value(pool="http", lane="interactive", state="running", reason="cancelled") - before, 1)
+
+    def test_debounced_message_never_runs(self):
+        """Test that a message superseded while debouncing is not scheduled."""
+        calls = []
+        def score(raw_prompt, improved_prompt, *options):
+            calls.append(improved_prompt)
+            return score_with_error(raw_prompt, improved_prompt, *options)
+
+        with patch("http_server.score_with_error", score), self.client.websocket_connect("/ws") as websocket:
+            for number in range(3):
+                websocket.send_json({"id": number, "type": "score", "channel": "editor",
+                                     "raw_prompt": "debounce", "improved_prompt": f"edit {number}"})
+            replies = self.receive(websocket, 3)
+        self.assertEqual([replies[n]["type"] for n in range(3)], ["cancelled", "cancelled", "result"])
+        self.assertEqual(calls, ["edit 2"])
+
+    def test_in_flight_limit_and_cancel(self):
+        """Test that messages over the per-connection limit are refused and cancel frees a slot."""
+        with patch("http_server.score_with_error", self.slow_score), \
+                patch("http_server.WS_MAX_IN_FLIGHT", 1), self.client.websocket_connect("/ws") as websocket:
+            websocket.send_json({"id": 1, "type": "score", "raw_prompt": "slow", "improved_prompt": "limit"})
+            websocket.send_json({"id": 2, "type": "score", "raw_prompt": "fast", "improved_prompt": "limit"})
+            refused = websocket.receive_json()
+            websocket.send_json({"id": 1, "type": "cancel"})
+            cancelled = websocket.receive_json()
+        self.assertEqual((refused["id"], refused["type"], refused["status"]), (2, "error", 429))
+        self.assertEqual(cancelled, {"id": 1, "type": "cancelled", "reason": "cancelled"})
+
+    def test_invalid_messages(self):
+        """Test that malformed messages get an error reply and the connection stays open."""
+        with self.client.websocket_connect("/ws") as websocket:
+            websocket.send_text("not json")
+            self.assertEqual(websocket.receive_json()["status"], 400)
+            websocket.send_json({"id": "x", "type": "score", "raw_prompt": "missing improved_prompt"})
+            self.assertEqual(websocket.receive_json()["status"], 422)
+            websocket.send_json({"id": "y", "type": "optimize", "raw_prompt": "a", "style": "nope"})
+            error = websocket.receive_json()
+        self.assertEqual((error["id"], error["status"]), ("y", 422))
+
+    def test_real_socket_releases_slots(self):
+        """Test over a real socket that messages cancelled before they run still get a reply and free their slot."""
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        server = uvicorn.Server(uvicorn.Config(http_server.app, host="127.0.0.1", port=port, log_level="warning"))
+        controller = AdmissionController(max_in_flight=3)
+        with patch("http_server.admission", controller), patch("http_server.WS_DEBOUNCE_SECONDS", 0):
+            thread = threading.Thread(target=server.run)
+            thread.start()
+            try:
+                for _ in range(500):
+                    if server.started:
+                        break
+                    time.sleep(0.01)
+                replies = {}
+                with connect(f"ws://127.0.0.1:{port}/ws") as websocket:
+                    # Sent back to back, so later messages supersede earlier ones before their tasks first run
+                    for number in range(20):
+                        websocket.send(json.dumps({"id": number, "type": "score", "channel": "editor",
+                                                   "raw_prompt": "Please explain", "improved_prompt": f"edit {number}"}))
+                    while len(replies) < 20:
+                        reply = json.loads(websocket.recv(timeout=10))
+                        self.assertNotIn(reply["id"], replies)
+                        replies[reply["id"]] = reply
+                    # Superseded messages gave their slots back, so the connection can still be used
+                    websocket.send(json.dumps({"id": 20, "type": "score", "raw_prompt": "Please explain",
+                                               "improved_prompt": "Explain"}))
+                    last = json.loads(websocket.recv(timeout=10))
+                for _ in range(100):
+                    if not controller.in_flight:
+                        break
+                    time.sleep(0.01)
+            finally:
+                server.should_exit = True
+                thread.join(10)
+        self.assertEqual(sorted(replies), list(range(20)))
+        self.assertTrue({reply["type"] for reply in replies.values()} <= {"cancelled", "error", "result"})
+        self.assertEqual((last["id"], last["type"]), (20, "result"))
+        self.assertEqual(controller.in_flight, 0)
+
+
+class TestReadiness(unittest.TestCase):
+    """Test cases for the /ready endpoint."""
+
+    def test_ready_after_warmup(self):
+        """Test that /ready answers 503 before warmup and 200 with component details after it."""
+        warmup = http_server.Warmup()
+        warmup.add("workers", http_server.scheduler.start)
+        with patch("http_server.warmup", warmup):
+            client = TestClient(http_server.app)
+            response = client.get("/ready")
+            self.assertEqual(response.status_code, 503)
+            self.assertFalse(response.json()["components"]["workers"]["ready"])
+            self.assertEqual(client.get("/health").status_code, 200)
+
+            with TestClient(http_server.app) as started:
+                for _ in range(100):
+                    response = started.get("/ready")
+                    if response.status_code == 200:
+                        break
+                    time.sleep(0.01)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertTrue(body["components"]["workers"]["ready"])
+        self.assertIsNotNone(body["warmup_seconds"])
+
+
+class CachingProxy:
+    """
+    Minimal HTTP cache in front of the app for tests.
+
+    Serves fresh entries (within max-age) itself and revalidates stale or
+    no-cache entries with If-None-Match. A shared proxy does not store
+    private responses.
+    """
+
+    def __init__(self, client, shared=True):
+        self.client = client
+        self.shared = shared
+        self.now = 0.0
+        self.entries = {}
+        self.hits = self.revalidated = self.misses = 0
+
+    def get(self, url, params=None, headers=None):
+        headers = dict(headers or {})
+        key = (str(self.client.build_request("GET", url, params=params).url), tuple(sorted(headers.items())))
+        entry = self.entries.get(key)
+        if entry is not None:
+            directives = entry["cache-control"]
+            if "no-cache" not in directives and self.now - entry["stored"] < entry["max-age"]:
+                self.hits += 1
+                return entry["response"]
+            response = self.client.get(url, params=params, headers=dict(headers, **{"If-None-Match": entry["etag"]}))
+            if response.status_code == 304:
+                self.revalidated += 1
+                entry["stored"] = self.now
+                return entry["response"]
+        else:
+            response = self.client.get(url, params=params, headers=headers)
+        self.misses += 1
+        directives = [d.strip() for d in response.headers.get("cache-control", "").split(",")]
+        if response.status_code == 200 and "etag" in response.headers and not (self.shared and "private" in directives):
+            max_age = next((int(d.split("=")[1]) for d in directives if d.startswith("max-age=")), 0)
+            self.entries[key] = {"response": response, "etag": response.headers["etag"], "stored": self.now,
+                                 "max-age": max_age, "cache-control": directives}
+        return response
+
+
+class TestHttpCaching(unittest.TestCase):
+    """Test cases for the cacheable GET endpoints."""
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+        self.computed = []
+        compute_optimize = http_server.compute_optimize
+
+        async def counting_optimize(request, *args):
+            self.computed.append(request.raw_prompt)
+            return await compute_optimize(request, *args)
+
+        patcher = patch("http_server.compute_optimize", counting_optimize)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hit_rate_through_proxy(self):
+        """Test that a caching proxy serves repeats itself and revalidates with 304 once stale."""
+        proxy = CachingProxy(self.client)
+        prompts = [f"Please explain cache topic {n} in detail" for n in range(5)]
+        bodies = {}
+        for _ in range(6):
+            for prompt in prompts:
+                response = proxy.get("/optimize", params={"raw_prompt": prompt, "style": "precise"})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(bodies.setdefault(prompt, response.json()), response.json())
+        self.assertEqual((proxy.hits, proxy.misses), (25, 5))
+        self.assertEqual(sorted(self.computed), sorted(prompts))
+
+        proxy.now += http_server.CACHE_MAX_AGE_SECONDS + 1
+        for prompt in prompts:
+            self.assertEqual(proxy.get("/optimize", params={"raw_prompt": prompt, "style": "precise"}).json(),
+                             bodies[prompt])
+        self.assertEqual(proxy.revalidated, 5)
+        self.assertEqual(len(self.computed), 5)
+        self.assertEqual((proxy.hits + proxy.revalidated) / 35, 30 / 35)
+
+    def test_matches_post_and_prompt_hashes(self):
+        """Test that GET by inline text or by stored hash returns the POST result."""
+        raw, improved = "Please kind of write a very short poem. " * 100, "Write a short poem."
+        digest = self.client.post("/prompts", json={"text": raw}).json()["hash"]
+        posted = self.client.post("/optimize", json={"raw_prompt": raw, "style": "fast"}).json()
+        self.assertEqual(self.client.get("/optimize", params={"raw_prompt_hash": digest, "style": "fast"}).json(),
+                         posted)
+        scored = self.client.get("/score", params={"raw_prompt_hash": digest, "improved_prompt": improved})
+        self.assertEqual(scored.json(), self.client.post(
+            "/score", json={"raw_prompt": raw, "improved_prompt": improved}).json())
+        self.assertTrue(scored.headers["cache-control"].startswith("public, max-age="))
+
+        self.assertEqual(self.client.get("/optimize", params={"raw_prompt_hash": "0" * 64, "style": "fast"})
+                         .status_code, 404)
+        self.assertEqual(self.client.get("/optimize", params={"raw_prompt": "a", "raw_prompt_hash": digest,
+                                                              "style": "fast"}).status_code, 422)
+        self.assertEqual(self.client.get("/optimize", params={"raw_prompt": raw, "style": "fast"}).status_code, 422)
+
+    def test_etag_depends_on_rules_version(self):
+        """Test that a rule change invalidates earlier ETags."""
+        params = {"raw_prompt": "Please explain versioned caching", "style": "fast"}
+        etag = self.client.get("/optimize", params=params).headers["etag"]
+        self.assertEqual(self.client.get("/optimize", params=params, headers={"If-None-Match": etag}).status_code, 304)
+        with patch("http_server.RULES_VERSION", "next"):
+            response = self.client.get("/optimize", params=params, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["etag"], etag)
+
+    def test_encoded_representations(self):
+        """Test that compressed responses get their own strong ETag and still revalidate."""
+        digest = self.client.post("/prompts", json={"text": "Describe the ocean floor. " * 200}).json()["hash"]
+        params = {"raw_prompt_hash": digest, "style": "creative"}
+        plain = self.client.get("/optimize", params=params, headers={"Accept-Encoding": "identity"})
+        gzipped = self.client.get("/optimize", params=params, headers={"Accept-Encoding": "gzip"})
+        self.assertEqual(gzipped.headers["content-encoding"], "gzip")
+        self.assertNotEqual(plain.headers["etag"], gzipped.headers["etag"])
+        response = self.client.get("/optimize", params=params,
+                                   headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["etag"]})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], gzipped.headers["etag"])
+
+    def test_custom_styles_are_private(self):
+        """Test that tenant styles are kept out of shared caches and revalidated on every use."""
+        tenant = {"X-Tenant-ID": "cache-tenant"}
+        self.addCleanup(self.client.delete, "/styles/brief", headers=tenant)
+        self.client.put("/styles/brief", json=TestStyleEndpoints.SPEC, headers=tenant)
+        params = {"raw_prompt": "Use the cache. Explain it", "style": "brief"}
+
+        shared = CachingProxy(self.client)
+        for _ in range(3):
+            shared.get("/optimize", params=params, headers=tenant)
+        self.assertEqual((shared.hits, shared.misses), (0, 3))
+
+        private = CachingProxy(self.client, shared=False)
+        first = private.get("/optimize", params=params, headers=tenant)
+        self.assertEqual(first.headers["cache-control"], "private, no-cache")
+        self.assertIn("X-Tenant-ID", first.headers["vary"])
+        private.get("/optimize", params=params, headers=tenant)
+        self.assertEqual(private.revalidated, 1)
+
+        spec = {"variants": [[{"op": "prefix", "text": "New: "}], [{"op": "bullets"}], [{"op": "suffix", "text": "!"}]]}
+        self.client.put("/styles/brief", json=spec, headers=tenant)
+        updated = private.get("/optimize", params=params, headers=tenant)
+        self.assertEqual(updated.json()["variants"][0], "New: Use the cache. Explain it")
+        self.assertEqual(private.revalidated, 1)
+
+
+class TestBatchEndpoints(unittest.TestCase):
+    """Test cases for /optimize/batch and /score/batch."""
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+
+    def test_results_in_order(self):
+        """Test that each item gets the result or error its single-item request would get."""
+        requests = [{"raw_prompt": "Write about AI", "style": "fast"},
+                    {"raw_prompt": "x", "style": "unknown"},
+                    {"raw_prompt": "Please could you explain gravity", "style": "precise", "variants": [2]}]
+        response = self.client.post("/optimize/batch", json={"requests": requests})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([result["status"] for result in results], [200, 422, 200])
+        self.assertEqual(results[1]["detail"], "Unknown style: unknown")
+        for index in (0, 2):
+            self.assertEqual(results[index]["result"], self.client.post("/optimize", json=requests[index]).json())
+
+        pair = {"raw_prompt": "Write about AI", "improved_prompt": "Write an essay about AI"}
+        scored = self.client.post("/score/batch", json={"requests": [pair]}).json()["results"]
+        self.assertEqual(scored[0]["result"], self.client.post("/score", json=pair).json())
+
+    def test_size_limits(self):
+        """Test that empty and oversized batches are rejected."""
+        self.assertEqual(self.client.post("/score/batch", json={"requests": []}).status_code, 422)
+        pair = {"raw_prompt": "a", "improved_prompt": "b"}
+        oversized = {"requests": [pair] * (http_server.BATCH_MAX_ITEMS + 1)}
+        self.assertEqual(self.client.post("/score/batch", json=oversized).status_code, 422)
+
+
+class TestEngineSelection(unittest.TestCase):
+    """Test cases for per-request engines and shadow verification."""
+
+    def setUp(self):
+        self.client = TestClient(http_server.app)
+
+    def test_header_selects_engine(self):
+        """Test that X-Engine picks the engine, with the same output, and unknown engines are refused."""
+        pair = {"raw_prompt": "Please could you just explain gravity", "improved_prompt": "Explain gravity"}
+        seconds = REGISTRY.histogram("engine_seconds", "")
+        before = seconds.count(engine="fused", operation="score")
+        fused = self.client.post("/score", json=pair, headers={"X-Engine": "fused"})
+        self.assertEqual(fused.status_code, 200)
+        self.assertEqual(seconds.count(engine="fused", operation="score"), before + 1)
+        self.assertEqual(fused.json(), self.client.post("/score", json=pair).json())
+
+        response = self.client.post("/optimize", json={"raw_prompt": "x", "style": "fast"},
+                                    headers={"X-Engine": "turbo"})
+        self.assertEqual(response.status_code, 422)
+        self.assertIn("Unknown engine: turbo", response.json()["detail"])
+
+    def test_shadow_mode(self):
+        """Test that sampled calls are compared with the reference and reported."""
+        counter = REGISTRY.counter("engine_shadow_total", "")
+        before = counter.value(engine="fused", operation="score", outcome="match")
+        with patch("http_server.shadow", ShadowVerifier(sample_rate=1.0)) as shadow:
+            for i in range(3):
+                pair = {"raw_prompt": f"Please explain topic {i} very clearly", "improved_prompt": f"Explain {i}"}
+                self.assertEqual(self.client.post("/score", json=pair, headers={"X-Engine": "fused"}).status_code, 200)
+            shadow.drain()
+            engines = self.client.get("/engines").json()
+        self.assertEqual(counter.value(engine="fused", operation="score", outcome="match") - before, 3)
+        self.assertEqual(engines["default"], "reference")
+        self.assertIn("fused", engines["engines"])
+        self.assertEqual((engines["shadow_sample_rate"], engines["recent_mismatches"]), (1.0, []))
+
+
+class TestJobs(unittest.TestCase):
+    """Test cases for the /jobs endpoints."""
+
+    CORPUS = "".join(f'{{"raw_prompt": "Please explain topic {i}", "improved_prompt": "Explain topic {i}"}}\n'
+                     for i in range(300))
+
+    def wait_for(self, client, job_id, headers=None):
+        for _ in range(200):
+            job = client.get(f"/jobs/{job_id}", headers=headers).json()
+            if job["status"] in ("done", "failed"):
+                return job
+            time.sleep(0.02)
+        self.fail(f"job did not finish: {job}")
+
+    def test_upload_poll_and_page(self):
+        """Test that an uploaded corpus is processed in the background and paged through in order."""
+        tenant = {"X-Tenant-ID": "jobs-tenant"}
+        with TestClient(http_server.app) as client:
+            response = client.post("/jobs", params={"operation": "score"}, content=self.CORPUS,
+                                   headers={**tenant, "Content-Type": "application/x-ndjson"})
+            self.assertEqual(response.status_code, 202)
+            job_id = response.json()["id"]
+            self.assertEqual(response.headers["location"], f"/jobs/{job_id}")
+            self.assertEqual(response.json()["total"], 300)
+            self.assertEqual(client.get(f"/jobs/{job_id}").status_code, 404)
+
+            job = self.wait_for(client, job_id, tenant)
+            self.assertEqual((job["status"], job["done"], job["failed"]), ("done", 300, 0))
+            self.assertGreater(job["throughput"], 0)
+
+            indices, cursor = [], None
+            while True:
+                params = {"limit": 128} if cursor is None else {"limit": 128, "cursor": cursor}
+                page = client.get(f"/jobs/{job_id}/results", params=params, headers=tenant).json()
+                indices.extend(entry["index"] for entry in page["results"])
+                cursor = page.get("next_cursor")
+                if cursor is None:
+                    break
+            self.assertEqual(indices, list(range(300)))
+            expected = client.post("/score", json={"raw_prompt": "Please explain topic 299",
+                                                   "improved_prompt": "Explain topic 299"}).json()
+            last = client.get(f"/jobs/{job_id}/results", params={"cursor": 299}, headers=tenant).json()
+            self.assertEqual(last["results"][0]["result"]["score"], expected["score"])
+
+    def test_invalid_corpus(self):
+        """Test that malformed corpora and options are rejected before anything is queued."""
+        client = TestClient(http_server.app)
+        response = client.post("/jobs", params={"operation": "score"}, content='{"raw_prompt": "a"}\n')
+        self.assertEqual(response.status_code, 422)
+        self.assertIn("line 1", response.json()["detail"])
+        self.assertEqual(client.post("/jobs", params={"operation": "optimize", "style": "nope"},
+                                     content='"a"').status_code, 422)
+        self.assertEqual(client.post("/jobs", params={"operation": "optimize", "variants": 3},
+                                     content='"a"').status_code, 422)
+        self.assertEqual(client.get("/jobs/unknown").status_code, 404)
+
+    def test_local_corpus_path(self):
+        """Test that corpora are read from JOBS_CORPUS_DIR only, and never from outside it."""
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "corpus.jsonl"), "w", encoding="utf-8") as fh:
+                fh.write('"Could you kind of summarize this"\n"Write about AI"\n')
+            with TestClient(http_server.app) as client:
+                params = {"operation": "optimize", "style": "precise", "path": "corpus.jsonl"}
+                self.assertEqual(client.post("/jobs", params=params).status_code, 403)
+                with patch("http_server.JOBS_CORPUS_DIR", directory):
+                    response = client.post("/jobs", params=params)
+                    self.assertEqual(response.status_code, 202)
+                    self.assertEqual(client.post("/jobs", params={**params, "path": "../etc/passwd"}).status_code, 403)
+                    self.assertEqual(client.post("/jobs", params={**params, "path": "missing.jsonl"}).status_code, 404)
+                job = self.wait_for(client, response.json()["id"])
+                self.assertEqual(job["done"], 2)
+                page = client.get(f"/jobs/{job['id']}/results").json()
+                self.assertEqual(len(page["results"][0]["result"]["variants"]), 3)
+
+
+class TestAnalyze(unittest.TestCase):
+    """Test cases for the /analyze endpoint."""
+
+    PAIRS = [(f"Please could you explain topic {i} {'very ' * (i % 3)}briefly", f"Explain topic {i}")
+             for i in range(400)]
+
+    def corpus(self):
+        return "".join(json.dumps({"raw_prompt": raw, "improved_prompt": improved}) + "\n"
+                       for raw, improved in self.PAIRS)
+
+    def test_streamed_aggregates(self):
+        """Test that a corpus streamed in many pieces gives the aggregates of its /score results."""
+        body = self.corpus().encode()
+        # Uneven upload chunks that split lines, scored in pieces of a few lines
+        parts = (body[i:i + 777] for i in range(0, len(body), 777))
+        with patch("http_server.ANALYZE_CHUNK_BYTES", 1000), TestClient(http_server.app) as client:
+            response = client.post("/analyze", params={"quantiles": [0.5, 0.9], "examples": 2}, content=parts)
+            self.assertEqual(response.status_code, 200)
+            report = response.json()
+            scores = [client.post("/score", json={"raw_prompt": raw, "improved_prompt": improved}).json()["score"]
+                      for raw, improved in self.PAIRS[:5]]
+        self.assertEqual(report["count"], 400)
+        self.assertEqual(set(report["score"]["quantiles"]), {"0.5", "0.9"})
+        self.assertIn(report["score"]["min"], scores)
+        self.assertEqual(report["fillers"]["very"], {"raw": sum(i % 3 for i in range(400)), "improved": 0})
+        self.assertEqual(report["fillers"]["could you"]["raw"], 400)
+        self.assertEqual(len(report["best"]), 2)
+        self.assertNotIn("results", report)
+
+    def test_invalid_corpus(self):
+        """Test that a malformed line is reported with its line number across pieces."""
+        body = self.corpus() + '{"raw_prompt": "a"}\n'
+        with patch("http_server.ANALYZE_CHUNK_BYTES", 1000):
+            response = TestClient(http_server.app).post("/analyze", content=body)
+        self.assertEqual(response.status_code, 422)
+        self.assertIn("line 401", response.json()["detail"])
+
+    def test_local_corpus_path(self):
+        """Test that a corpus can be read from JOBS_CORPUS_DIR instead of uploaded."""
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "pairs.jsonl"), "w", encoding="utf-8") as fh:
+                fh.write(self.corpus())
+            client = TestClient(http_server.app)
+            with patch("http_server.JOBS_CORPUS_DIR", directory):
+                report = client.post("/analyze", params={"path": "pairs.jsonl"}).json()
+                self.assertEqual(client.post("/analyze", params={"path": "../pairs.jsonl"}).status_code, 403)
+        self.assertEqual(report["count"], 400)
+        self.assertEqual(len(report["worst"]), 5)
+
+
+async def stream_request(path, chunks, headers=()):
+    """
+    Send a POST with a body of ``chunks`` straight to the app, without buffering it anywhere.
+
+    Returns:
+        Tuple[int, int]: The response status and the number of body chunks the server read
+    """
+    chunks = iter(chunks)
+    pulled = 0
+    finished = asyncio.Event()
+    status = None
+
+    ended = False
+
+    async def receive():
+        nonlocal pulled, ended
+        chunk = next(chunks, None)
+        if chunk is None:
+            if not ended:
+                ended = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            # The client waits for its response, then hangs up
+            await finished.wait()
+            return {"type": "http.disconnect"}
+        pulled += 1
+        return {"type": "http.request", "body": chunk, "more_body": True}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif not message.get("more_body"):
+            finished.set()
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"operation=score",
+             "root_path": "", "client": ("127.0.0.1", 1), "server": ("testserver", 80),
+             "headers": [(b"content-type", b"application/json"), *headers]}
+    await http_server.app(scope, receive, send)
+    return status, pulled
+
+
+class TestRequestSizeLimits(unittest.TestCase):
+    """Test cases for request size limits."""
+
+    LIMITS = SizeLimits(max_body_bytes=64 * 1024, max_prompt_chars=20, max_corpus_bytes=256 * 1024)
+
+    def setUp(self):
+        policy = LimitPolicy(self.LIMITS, parse_tenant_limits("big.body=0,big.prompt=1000", self.LIMITS),
+                             parse_api_keys("big-key=big"))
+        patcher = patch("http_server.size_limits", policy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_declared_length_refused_unread(self):
+        """Test that a body declared too large is refused before any of it is read."""
+        status, pulled = asyncio.run(stream_request("/optimize", [b"{}"], [(b"content-length", b"70000")]))
+        self.assertEqual((status, pulled), (413, 0))
+        # Corpus uploads have their own, larger limit
+        with TestClient(http_server.app) as client:
+            self.assertEqual(client.post("/analyze", content=b"\n" * 70000).status_code, 200)
+            self.assertEqual(client.post("/analyze", content=b"\n" * 300000).status_code, 413)
+
+    def test_streamed_body_stops_at_limit(self):
+        """Test that an undeclared body is read only until it passes the limit."""
+        chunk = b" " * 16 * 1024
+        for path, limit in [("/optimize", self.LIMITS.max_body_bytes), ("/score/batch", self.LIMITS.max_body_bytes),
+                            ("/jobs", self.LIMITS.max_corpus_bytes), ("/analyze", self.LIMITS.max_corpus_bytes)]:
+            # Many short lines, so corpus endpoints hit the corpus limit rather than the line limit
+            body = chunk if path in ("/optimize", "/score/batch") else b"\n" * len(chunk)
+            status, pulled = asyncio.run(stream_request(path, itertools.repeat(body, 4096)))
+            self.assertEqual(status, 413, path)
+            self.assertEqual(pulled, limit // len(chunk) + 1, path)
+        # A tenant with the body limit turned off may send more, once it presents its API key
+        status, _ = asyncio.run(stream_request("/optimize", itertools.repeat(chunk, 5), [(b"x-api-key", b"big-key")]))
+        self.assertNotEqual(status, 413)
+        status, _ = asyncio.run(stream_request("/optimize", itertools.repeat(chunk, 5), [(b"x-tenant-id", b"big")]))
+        self.assertEqual(status, 413)
+
+    def test_long_corpus_line(self):
+        """Test that a corpus line may be no larger than a request body."""
+        chunk = b"x" * 16 * 1024
+        for path in ("/jobs", "/analyze"):
+            status, pulled = asyncio.run(stream_request(path, itertools.repeat(chunk, 4096)))
+            self.assertEqual((status, pulled), (413, 5), path)
+
+    def test_prompt_limit_per_tenant(self):
+        """Test that prompts over the tenant's limit get 413 on every endpoint and transport."""
+        # Overrides need the tenant's API key: naming the tenant, or no tenant, gets the defaults
+        other = {"X-Tenant-ID": "big"}
+        long_prompt = "Please explain recursion"
+        with TestClient(http_server.app) as client:
+            self.assertEqual(client.post("/optimize", json={"raw_prompt": long_prompt, "style": "precise"},
+                                         headers={"X-API-Key": "big-key"}).status_code, 200)
+            for headers in ({}, other, {"X-Tenant-ID": "big", "X-API-Key": "guessed"}):
+                response = client.post("/optimize", json={"raw_prompt": long_prompt, "style": "precise"},
+                                       headers=headers)
+                self.assertEqual(response.status_code, 413)
+                self.assertIn("raw_prompt is 24 characters; the limit is 20", response.json()["detail"])
+            self.assertEqual(client.post("/score", json={"raw_prompt": "a", "improved_prompt": long_prompt},
+                                         headers=other).status_code, 413)
+            self.assertEqual(client.get("/score", params={"raw_prompt": long_prompt, "improved_prompt": "a"},
+                                        headers=other).status_code, 413)
+            self.assertEqual(client.post("/similar", json={"raw_prompt": long_prompt}, headers=other).status_code, 413)
+            batch = client.post("/score/batch", headers=other, json={"requests": [
+                {"raw_prompt": "a", "improved_prompt": "b"}, {"raw_prompt": long_prompt, "improved_prompt": "b"}]})
+            self.assertEqual([item["status"] for item in batch.json()["results"]], [200, 413])
+            corpus = '{"raw_prompt": "a", "improved_prompt": "b"}\n' + json.dumps(
+                {"raw_prompt": long_prompt, "improved_prompt": "b"})
+            for path in ("/jobs", "/analyze"):
+                response = client.post(path, params={"operation": "score"}, content=corpus, headers=other)
+                self.assertEqual(response.status_code, 413, path)
+                self.assertIn("line 2: raw_prompt", response.json()["detail"])
+            with client.websocket_connect("/ws", headers=other) as websocket:
+                websocket.send_json({"id": "1", "type": "optimize", "raw_prompt": long_prompt, "style": "precise"})
+                reply = websocket.receive_json()
+            self.assertEqual((reply["type"], reply["status"]), ("error", 413))
+
+    def test_oversized_flood_memory(self):
+        """Test that a flood of huge streamed requests holds no more than the limit per request."""
+        chunk = b" " * 16 * 1024
+        requests, offered = 100, 4096
+
+        async def flood():
+            paths = ["/optimize", "/score", "/optimize/batch", "/analyze"]
+            # Each request offers 64 MB; the same chunk object is sent over and over, so the
+            # client side allocates nothing and any growth is the server buffering the body
+            return await asyncio.gather(*(
+                stream_request(paths[i % len(paths)], itertools.repeat(chunk if i % 4 != 3 else b"x" * len(chunk),
+                                                                       offered))
+                for i in range(requests)))
+
+        before = REGISTRY.counter("requests_too_large_total", "").value(limit="body")
+        tracemalloc.start()
+        try:
+            with patch("http_server.admission", AdmissionController(max_in_flight=requests)):
+                results = asyncio.run(flood())
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual({status for status, _ in results}, {413})
+        self.assertLessEqual(max(pulled for _, pulled in results), self.LIMITS.max_body_bytes // len(chunk) + 1)
+        self.assertEqual(REGISTRY.counter("requests_too_large_total", "").value(limit="body") - before, 75)
+        # 6.4 GB offered in all; at most the 64 KB limit per request may be buffered
+        self.assertLess(peak, requests * self.LIMITS.max_body_bytes + 16 * 1024 * 1024)
+
+
+if __name__ == '__main__':
+    unittest.main()
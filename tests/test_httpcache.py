@@ -0,0 +1,62 @@
+"""
+Unit tests for HTTP caching helpers.
+"""
+
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tools.httpcache import ContentStore, content_hash, etag_matches, make_etag, representation_etag
+
+
+class TestEtags(unittest.TestCase):
+    """Test cases for entity tags."""
+
+    def test_make_etag(self):
+        """Test that tags are strong, deterministic and sensitive to every part."""
+        etag = make_etag("optimize", "v1", "fast", content_hash("prompt"), None)
+        self.assertRegex(etag, r'^"[0-9a-f]{32}"$')
+        self.assertEqual(etag, make_etag("optimize", "v1", "fast", content_hash("prompt"), None))
+        self.assertNotEqual(etag, make_etag("optimize", "v2", "fast", content_hash("prompt"), None))
+        self.assertNotEqual(make_etag("a", "bc"), make_etag("ab", "c"))
+
+    def test_matches(self):
+        """Test If-None-Match comparison, including weak tags, lists, * and encoded representations."""
+        etag = make_etag("x")
+        gzipped = representation_etag(etag, "msgpack", "gzip")
+        self.assertEqual(gzipped, etag[:-1] + '+msgpack+gzip"')
+        self.assertEqual(etag_matches(etag, etag), etag)
+        self.assertEqual(etag_matches(f'"other", W/{etag}', etag), etag)
+        self.assertEqual(etag_matches(gzipped, etag), gzipped)
+        self.assertEqual(etag_matches("*", etag), etag)
+        self.assertIsNone(etag_matches('"other"', etag))
+        self.assertIsNone(etag_matches(None, etag))
+
+
+class TestContentStore(unittest.TestCase):
+    """Test cases for the ContentStore class."""
+
+    def test_put_get_and_evict(self):
+        """Test storage by hash with least-recently-used eviction by size."""
+        store = ContentStore(max_bytes=10)
+        first = store.put("aaaa")
+        self.assertEqual(first, content_hash("aaaa"))
+        second = store.put("bbbb")
+        store.get(first)
+        store.put("cccc")
+        self.assertEqual(store.get(first), "aaaa")
+        self.assertIsNone(store.get(second))
+        self.assertEqual(len(store), 2)
+
+    def test_too_large(self):
+        """Test that a text larger than the store is refused."""
+        store = ContentStore(max_bytes=4)
+        with self.assertRaises(ValueError):
+            store.put("ééé")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+"""
+Unit tests for the SQLite job store and the background job runner.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tools.jobs import DONE, FAILED, OPTIMIZE, QUEUED, RUNNING, SCORE, JobRunner, JobStore, read_corpus
+from tools.scheduler import SchedulerRejectedError
+
+
+def _items(count):
+    return [{"raw_prompt": f"prompt {i}"} for i in range(count)]
+
+
+async def _upper(job, items):
+    return [({"text": item["raw_prompt"].upper()}, None) for item in items]
+
+
+class TestReadCorpus(unittest.TestCase):
+    """Test cases for JSON Lines corpus parsing."""
+
+    def test_formats(self):
+        """Test objects, bare strings for optimize jobs, bytes and blank lines."""
+        lines = [b'"first"\n', '\n', '{"raw_prompt": "second", "extra": 1}\n']
+        self.assertEqual(list(read_corpus(lines, OPTIMIZE)), [{"raw_prompt": "first"}, {"raw_prompt": "second"}])
+        self.assertEqual(list(read_corpus(['{"raw_prompt": "a", "improved_prompt": "b"}'], SCORE)),
+                         [{"raw_prompt": "a", "improved_prompt": "b"}])
+
+    def test_errors(self):
+        """Test that malformed lines are reported with their line number."""
+        with self.assertRaisesRegex(ValueError, "line 2: invalid JSON"):
+            list(read_corpus(['"ok"', '{broken'], OPTIMIZE))
+        with self.assertRaisesRegex(ValueError, "line 1: expected an object"):
+            list(read_corpus(['"a bare string"'], SCORE))
+
+
+class TestJobStore(unittest.TestCase):
+    """Test cases for the JobStore class."""
+
+    def setUp(self):
+        self.store = JobStore()
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_progress_and_paging(self):
+        """Test that pages stop at the first pending item while items finish out of order."""
+        job_id = self.store.create("t1", OPTIMIZE, {"style": "fast"}, _items(6))
+        self.assertEqual(self.store.get(job_id)["status"], QUEUED)
+        self.assertIsNone(self.store.get(job_id, "other tenant"))
+
+        self.store.start(job_id)
+        pending = self.store.pending(job_id, 10)
+        self.assertEqual([seq for seq, _ in pending], list(range(6)))
+        self.store.record(job_id, [(0, ({"n": 0}, None)), (1, (None, "boom")), (4, ({"n": 4}, None))])
+
+        job = self.store.get(job_id)
+        self.assertEqual((job["status"], job["done"], job["failed"]), (RUNNING, 3, 1))
+        self.assertIsNotNone(job["throughput"])
+        self.assertIsNotNone(job["eta_seconds"])
+        page, more = self.store.results(job_id, 0, 10)
+        self.assertEqual(page, [{"index": 0, "result": {"n": 0}}, {"index": 1, "error": "boom"}])
+        self.assertTrue(more)
+
+        self.store.record(job_id, [(seq, ({"n": seq}, None)) for seq in (2, 3, 5)])
+        self.store.finish(job_id)
+        page, more = self.store.results(job_id, 2, 2)
+        self.assertEqual([entry["index"] for entry in page], [2, 3])
+        self.assertTrue(more)
+        page, more = self.store.results(job_id, 4, 2)
+        self.assertEqual([entry["index"] for entry in page], [4, 5])
+        self.assertFalse(more)
+        self.assertEqual(self.store.get(job_id)["status"], DONE)
+
+    def test_failed_upload_keeps_nothing(self):
+        """Test that a corpus that fails to parse leaves no job behind."""
+        with self.assertRaises(ValueError):
+            self.store.create("t1", OPTIMIZE, {}, read_corpus(['"ok"'] * 1500 + ['{broken'], OPTIMIZE))
+        self.assertIsNone(self.store.next_job())
+
+    def test_retention(self):
+        """Test that only jobs finished longer ago than the retention period are deleted."""
+        old = self.store.create("t1", OPTIMIZE, {}, _items(2))
+        self.store.finish(old)
+        running = self.store.create("t1", OPTIMIZE, {}, _items(2))
+        self.assertEqual(self.store.purge(3600), 0)
+        time.sleep(0.01)
+        self.assertEqual(self.store.purge(0), 1)
+        self.assertIsNone(self.store.get(old))
+        self.assertIsNotNone(self.store.get(running))
+
+
+class TestJobRunner(unittest.TestCase):
+    """Test cases for the JobRunner class."""
+
+    def test_runs_to_completion(self):
+        """Test that every item is processed in chunks and the job is marked done."""
+        store = JobStore()
+        job_id = store.create("t1", OPTIMIZE, {}, _items(10))
+        chunks = []
+
+        async def process(job, items):
+            chunks.append(len(items))
+            return await _upper(job, items)
+
+        runner = JobRunner(store, process, chunk_size=3, parallel=2)
+        asyncio.run(runner.run_job(store.next_job()))
+        self.assertEqual(chunks, [3, 3, 3, 1])
+        job = store.get(job_id)
+        self.assertEqual((job["status"], job["done"]), (DONE, 10))
+        page, _ = store.results(job_id, 9, 1)
+        self.assertEqual(page, [{"index": 9, "result": {"text": "PROMPT 9"}}])
+
+    def test_resume_after_restart(self):
+        """Test that a job interrupted mid-run resumes with only its unfinished items."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "jobs.db")
+            store = JobStore(path)
+            job_id = store.create("t1", OPTIMIZE, {}, _items(8))
+
+            async def crash_after_first_round(job, items):
+                if store.get(job["id"])["done"]:
+                    raise asyncio.CancelledError()
+                return await _upper(job, items)
+
+            runner = JobRunner(store, crash_after_first_round, chunk_size=2, parallel=2)
+            with self.assertRaises(asyncio.CancelledError):
+                asyncio.run(runner.run_job(store.next_job()))
+            store.close()
+
+            store = JobStore(path)
+            job = store.next_job()
+            self.assertEqual((job["id"], job["status"], job["done"]), (job_id, RUNNING, 4))
+            processed = []
+
+            async def process(job, items):
+                processed.extend(item["raw_prompt"] for item in items)
+                return await _upper(job, items)
+
+            asyncio.run(JobRunner(store, process, chunk_size=2, parallel=2).run_job(job))
+            self.assertEqual(processed, [f"prompt {i}" for i in range(4, 8)])
+            page, more = store.results(job_id, 0, 100)
+            self.assertEqual([entry["result"]["text"] for entry in page], [f"PROMPT {i}" for i in range(8)])
+            self.assertFalse(more)
+            store.close()
+
+    def test_rejected_chunks_are_retried(self):
+        """Test that chunks refused by the scheduler stay pending and are retried."""
+        store = JobStore()
+        job_id = store.create("t1", OPTIMIZE, {}, _items(4))
+        attempts = []
+
+        async def process(job, items):
+            attempts.append(len(items))
+            if len(attempts) == 1:
+                raise SchedulerRejectedError("batch queue is full", "queue")
+            return await _upper(job, items)
+
+        runner = JobRunner(store, process, chunk_size=2, parallel=2, retry_interval=0.01)
+        asyncio.run(runner.run_job(store.next_job()))
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(store.get(job_id)["done"], 4)
+
+    def test_job_error_fails_job(self):
+        """Test that an error outside the items fails the job and records it."""
+        store = JobStore()
+        job_id = store.create("t1", OPTIMIZE, {}, _items(2))
+
+        async def process(job, items):
+            raise ValueError("Unknown style: gone")
+
+        asyncio.run(JobRunner(store, process).run_job(store.next_job()))
+        job = store.get(job_id)
+        self.assertEqual((job["status"], job["error"]), (FAILED, "Unknown style: gone"))
+        self.assertIsNone(store.next_job())
+
+
+if __name__ == '__main__':
+    unittest.main()
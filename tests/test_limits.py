@@ -0,0 +1,106 @@
+"""
+Unit tests for input size limits and their use by the MCP server.
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import server
+from tools.limits import (
+    LimitPolicy,
+    RequestTooLargeError,
+    SizeLimits,
+    check_arguments,
+    parse_api_keys,
+    parse_tenant_limits,
+)
+
+DEFAULT = SizeLimits(max_body_bytes=1000, max_prompt_chars=100, max_corpus_bytes=10000)
+
+
+class TestSizeLimits(unittest.TestCase):
+    """Test cases for SizeLimits and the tenant policy."""
+
+    def test_checks(self):
+        """Test that each check refuses only sizes over its limit, and 0 turns a limit off."""
+        DEFAULT.check_body(1000)
+        DEFAULT.check_body(5000, corpus=True)
+        DEFAULT.check_prompt("x" * 100)
+        with self.assertRaises(RequestTooLargeError) as caught:
+            DEFAULT.check_body(1001)
+        self.assertEqual((caught.exception.kind, caught.exception.limit), ("body", 1000))
+        with self.assertRaisesRegex(RequestTooLargeError, "raw_prompt is 101 characters"):
+            DEFAULT.check_prompt("x" * 101, "raw_prompt")
+        with self.assertRaises(RequestTooLargeError):
+            DEFAULT.check_line(1001)
+        SizeLimits(0, 0, 0).check_body(10 ** 12)
+        SizeLimits(0, 0, 0).check_prompt("x" * 1000)
+
+    def test_tenant_overrides(self):
+        """Test that tenants override single limits and keep the defaults for the rest."""
+        policy = LimitPolicy(DEFAULT, parse_tenant_limits("paid.prompt=1000, paid.body=2000,acme.corp.body=0", DEFAULT))
+        self.assertEqual(policy.for_tenant("paid"), SizeLimits(2000, 1000, 10000))
+        # Tenant IDs may contain dots; the limit name follows the last one
+        self.assertEqual(policy.for_tenant("acme.corp"), SizeLimits(0, 100, 10000))
+        self.assertIs(policy.for_tenant("other"), DEFAULT)
+        self.assertEqual(parse_tenant_limits(None, DEFAULT), {})
+        for spec in ("free=10", "free.size=10", "free.body=-1", ".body=1"):
+            with self.assertRaises(ValueError, msg=spec):
+                parse_tenant_limits(spec, DEFAULT)
+
+    def test_overrides_only_loosen(self):
+        """Test that a tenant cannot be given a tighter limit, which dropping the tenant header would escape."""
+        for spec in ("free.prompt=10", "free.body=999"):
+            with self.assertRaisesRegex(ValueError, "tighter than the default"):
+                parse_tenant_limits(spec, DEFAULT)
+        # A limit that is off by default cannot be turned on for one tenant either
+        with self.assertRaises(ValueError):
+            parse_tenant_limits("free.prompt=10", SizeLimits(1000, 0, 10000))
+        self.assertEqual(parse_tenant_limits("free.prompt=100", DEFAULT)["free"], DEFAULT)
+
+    def test_api_keys(self):
+        """Test that overrides apply only to a caller presenting one of the tenant's API keys."""
+        policy = LimitPolicy(DEFAULT, parse_tenant_limits("paid.prompt=1000", DEFAULT),
+                             parse_api_keys("k1=paid, k2=free"))
+        self.assertEqual(policy.for_api_key("k1").max_prompt_chars, 1000)
+        for key in (None, "", "k2", "paid", "unknown"):
+            self.assertIs(policy.for_api_key(key), DEFAULT, key)
+        for spec in ("k1", "=paid", "k1="):
+            with self.assertRaises(ValueError, msg=spec):
+                parse_api_keys(spec)
+
+    def test_check_arguments(self):
+        """Test that every nested string is held to the prompt limit and all of them to the body limit."""
+        check_arguments({"raw_prompt": "x" * 100, "variants": [1, 2], "style": "precise"}, DEFAULT)
+        with self.assertRaisesRegex(RequestTooLargeError, r"variants\[1\]\.text is 101"):
+            check_arguments({"variants": [{"text": "a"}, {"text": "x" * 101}]}, DEFAULT)
+        with self.assertRaises(RequestTooLargeError) as caught:
+            check_arguments({"items": ["é" * 60] * 10}, DEFAULT)
+        self.assertEqual(caught.exception.kind, "body")
+
+
+class TestToolArgumentLimits(unittest.TestCase):
+    """Test cases for size limits on MCP tool calls."""
+
+    def test_oversized_call_does_no_work(self):
+        """Test that a tool call over a limit fails before anything is queued."""
+        policy = LimitPolicy(DEFAULT._replace(max_prompt_chars=20))
+        submitted = []
+        with patch("server.size_limits", policy), patch.object(server.batcher, "submit", side_effect=submitted.append):
+            with self.assertRaisesRegex(RequestTooLargeError, "raw_prompt is 21 characters"):
+                asyncio.run(server.handle_call_tool("score_prompt_tool",
+                                                    {"raw_prompt": "x" * 21, "improved_prompt": "x"}))
+        self.assertEqual(submitted, [])
+        result = asyncio.run(server.handle_call_tool("score_prompt_tool",
+                                                     {"raw_prompt": "x" * 21, "improved_prompt": "x"}))
+        self.assertIn("Effectiveness score", result[0].text)
+
+
+if __name__ == '__main__':
+    unittest.main()
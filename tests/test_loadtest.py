@@ -0,0 +1,68 @@
+"""
+Tests for the load-testing harness.
+"""
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+# Add the parent directory to the path so we can import the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from benchmarks import loadtest
+
+
+class TestWorkload(unittest.TestCase):
+    """Test cases for the workload generator and statistics helpers."""
+
+    def test_reproducible(self):
+        """Test that the same seed produces the same calls."""
+        first = [loadtest.Workload(seed=3).next_call() for _ in range(5)]
+        second = [loadtest.Workload(seed=3).next_call() for _ in range(5)]
+        self.assertEqual(first, second)
+
+    def test_prompt_lengths_bounded(self):
+        """Test that prompt lengths stay within the configured maximum."""
+        workload = loadtest.Workload(median_words=50, sigma=2.0, max_words=200)
+        lengths = [len(workload.prompt().split()) for _ in range(200)]
+        self.assertTrue(all(1 <= length <= 200 for length in lengths))
+
+    def test_percentile(self):
+        """Test nearest-rank percentiles."""
+        values = list(range(1, 101))
+        self.assertEqual(loadtest.percentile(values, 50), 50)
+        self.assertEqual(loadtest.percentile(values, 99), 99)
+        self.assertEqual(loadtest.percentile(values, 99.9), 100)
+        self.assertIsNone(loadtest.percentile([], 50))
+
+
+class TestHarness(unittest.TestCase):
+    """Short end-to-end runs against locally started servers."""
+
+    def _run(self, *argv):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "report.json")
+            loadtest.main(list(argv) + ["--duration", "0.5", "--warmup", "2", "--output", path])
+            with open(path, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+
+    def test_http_closed_loop(self):
+        """Test a closed-loop run over HTTP."""
+        report = self._run("--transport", "http", "--mode", "closed", "--concurrency", "2")
+        self.assertGreater(report["requests"], 0)
+        self.assertEqual(set(report["outcomes"]), {"200"})
+        self.assertLessEqual(report["latency_ms"]["p50"], report["latency_ms"]["p999"])
+        self.assertGreater(report["server"]["rss_peak_bytes"], 0)
+
+    def test_stdio_open_loop(self):
+        """Test an open-loop run over MCP stdio."""
+        report = self._run("--transport", "stdio", "--mode", "open", "--rate", "50")
+        self.assertGreater(report["requests"], 0)
+        self.assertEqual(set(report["outcomes"]), {"ok"})
+        self.assertIsNotNone(report["server"]["cpu_seconds"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+"""
+Unit tests for adaptive micro-batching in front of the scheduler.
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import unittest
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tools.deadline import CancelToken, OperationCancelledError, cancel_scope, run_with_deadline
+from tools.metrics import REGISTRY
+from tools.microbatch import MicroBatcher
+from tools.progress import progress_scope, report_progress
+from tools.scheduler import BATCH, FairScheduler, SchedulerRejectedError
+
+
+def _batches(name):
+    """Number of scheduler jobs the batcher of pool ``name`` has sent."""
+    return REGISTRY.histogram("microbatch_size", "").count(pool=name)
+
+
+class TestMicroBatcher(unittest.TestCase):
+    """Test cases for the MicroBatcher class."""
+
+    def setUp(self):
+        self.scheduler = FairScheduler(f"test_mb_{self._testMethodName}", workers=1)
+        self.batcher = MicroBatcher(self.scheduler, max_batch=8, max_wait=0.05)
+        self.addCleanup(self.scheduler.shutdown)
+
+    def run_behind_blocker(self, calls):
+        """Occupy the worker, start ``calls`` (coroutine factories), release it and return their outcomes."""
+        gate = threading.Event()
+
+        async def scenario():
+            blocker = asyncio.ensure_future(self.batcher.submit(gate.wait))
+            await asyncio.sleep(0.01)
+            tasks = [asyncio.ensure_future(call()) for call in calls]
+            await asyncio.sleep(0.01)
+            gate.set()
+            await blocker
+            return await asyncio.gather(*tasks, return_exceptions=True)
+
+        return asyncio.run(scenario())
+
+    def test_idle_call_is_not_delayed(self):
+        """Test that a call is sent at once while a worker is free."""
+        async def scenario():
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            result = await self.batcher.submit(len, "abc")
+            return result, loop.time() - start
+
+        result, elapsed = asyncio.run(scenario())
+        self.assertEqual(result, 3)
+        self.assertLess(elapsed, self.batcher.max_wait)
+        self.assertEqual(_batches(self.scheduler.name), 1)
+
+    def test_concurrent_calls_share_a_job(self):
+        """Test that calls queued behind a busy worker run as one job and each gets its own result."""
+        outcomes = self.run_behind_blocker([lambda i=i: self.batcher.submit(str.upper, f"p{i}") for i in range(5)])
+        self.assertEqual(outcomes, [f"P{i}" for i in range(5)])
+        # The blocker alone, then the five waiting calls together
+        self.assertEqual(_batches(self.scheduler.name), 2)
+
+    def test_full_batch_is_sent_without_waiting(self):
+        """Test that a batch is sent as soon as it holds max_batch calls."""
+        self.batcher.max_wait = 60
+        outcomes = self.run_behind_blocker([lambda i=i: self.batcher.submit(abs, -i) for i in range(8)])
+        self.assertEqual(outcomes, list(range(8)))
+        self.assertEqual(_batches(self.scheduler.name), 2)
+
+    def test_lanes_and_tenants_are_not_mixed(self):
+        """Test that calls of different lanes or tenants go into separate batches."""
+        outcomes = self.run_behind_blocker([
+            lambda: self.batcher.submit(len, "a", tenant="t1"),
+            lambda: self.batcher.submit(len, "bb", tenant="t2"),
+            lambda: self.batcher.submit(len, "ccc", tenant="t1", lane=BATCH),
+            lambda: self.batcher.submit(len, "dddd", tenant="t1"),
+        ])
+        self.assertEqual(outcomes, [1, 2, 3, 4])
+        self.assertEqual(_batches(self.scheduler.name), 4)
+
+    def test_failure_is_isolated(self):
+        """Test that one failing call does not fail the others in its batch."""
+        outcomes = self.run_behind_blocker([
+            lambda: self.batcher.submit(int, "1"),
+            lambda: self.batcher.submit(int, "not a number"),
+            lambda: self.batcher.submit(int, "3"),
+        ])
+        self.assertEqual(outcomes[0], 1)
+        self.assertIsInstance(outcomes[1], ValueError)
+        self.assertEqual(outcomes[2], 3)
+
+    def test_deadline_is_per_call(self):
+        """Test that a call whose deadline passed is dropped while its batch mates run."""
+        ran = []
+
+        async def expired():
+            with cancel_scope(CancelToken(0)):
+                return await self.batcher.submit(ran.append, "expired")
+
+        async def cancelled():
+            # The caller gives up while the call is still waiting for the worker
+            return await run_with_deadline(0.005, lambda: self.batcher.submit(ran.append, "cancelled"))
+
+        outcomes = self.run_behind_blocker([
+            expired, cancelled,
+            lambda: self.batcher.submit(ran.append, "kept"),
+        ])
+        self.assertIsInstance(outcomes[0], OperationCancelledError)
+        self.assertIsInstance(outcomes[1], OperationCancelledError)
+        self.assertIsNone(outcomes[2])
+        self.assertEqual(ran, ["kept"])
+
+    def test_cancelled_call_leaves_nothing_pending(self):
+        """Test that cancelling the only waiting call clears its key and timer before the next flush."""
+        self.batcher.max_wait = 60
+        gate = threading.Event()
+
+        async def scenario():
+            blocker = asyncio.ensure_future(self.batcher.submit(gate.wait))
+            await asyncio.sleep(0.01)
+            waiting = asyncio.ensure_future(self.batcher.submit(len, "dropped"))
+            await asyncio.sleep(0.01)
+            self.assertIn(("interactive", "default"), self.batcher._timers)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            self.assertEqual((self.batcher._pending, self.batcher._timers), ({}, {}))
+            gate.set()
+            await blocker
+            return await self.batcher.submit(len, "next")
+
+        self.assertEqual(asyncio.run(scenario()), 4)
+        # The blocker and the next call each went straight to the scheduler; no batch was sent
+        self.assertEqual(_batches(self.scheduler.name), 2)
+
+    def test_rejection_reaches_every_call(self):
+        """Test that a batch refused by the scheduler fails each of its calls with the rejection."""
+        scheduler = FairScheduler("test_mb_rejected", workers=1, max_queue=1)
+        self.addCleanup(scheduler.shutdown)
+        self.batcher = MicroBatcher(scheduler, max_batch=4, max_wait=0.001)
+        # The direct job fills the queue behind the blocker, so the batch finds no room
+        outcomes = self.run_behind_blocker([
+            lambda: scheduler.submit(len, "queued"),
+            *(lambda: self.batcher.submit(len, "x") for _ in range(3)),
+        ])
+        self.assertEqual(outcomes[0], 6)
+        for outcome in outcomes[1:]:
+            self.assertIsInstance(outcome, SchedulerRejectedError)
+
+    def test_progress_follows_each_caller(self):
+        """Test that progress reported inside a batch reaches the caller the call belongs to."""
+        reports = {"a": [], "b": []}
+
+        def work(label):
+            report_progress(1, 1, lambda: label)
+            return label
+
+        def listen(label):
+            async def call():
+                with progress_scope(lambda done, total, partial: reports[label].append(partial)):
+                    return await self.batcher.submit(work, label)
+            return call
+
+        outcomes = self.run_behind_blocker([listen("a"), listen("b")])
+        self.assertEqual(outcomes, ["a", "b"])
+        self.assertEqual(reports, {"a": ["a"], "b": ["b"]})
+
+    def test_disabled_passes_through(self):
+        """Test that max_batch=1 submits every call straight to the scheduler."""
+        self.batcher = MicroBatcher(self.scheduler, max_batch=1)
+        self.assertFalse(self.batcher.enabled)
+        outcomes = self.run_behind_blocker([lambda i=i: self.batcher.submit(abs, -i) for i in range(3)])
+        self.assertEqual(outcomes, [0, 1, 2])
+        self.assertEqual(_batches(self.scheduler.name), 0)
+
+    def test_invalid_settings(self):
+        """Test that a batch size below 1 is refused."""
+        with self.assertRaises(ValueError):
+            MicroBatcher(self.scheduler, max_batch=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -9,7 +9,14 @@ import os
 # Add the parent directory to the path so we can import the tools
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from tools.optimize import optimize_prompt, score_prompt
+from prompt_optimizer_client.delta import apply_edits
+from tools.optimize import (
+    optimize_prompt,
+    optimize_prompt_edits,
+    record_stages,
+    score_components,
+    score_prompt,
+)
 
 
 class TestOptimizePrompt(unittest.TestCase):
@@ -138,6 +145,14 @@ class TestScorePrompt(unittest.TestCase):
         # Use a more lenient assertion since the scoring algorithm might give similar scores
         self.assertGreaterEqual(score1, score2)
 
+    def test_components(self):
+        """Test that the score is the weighted sum of its components, which empty prompts leave unset."""
+        components = score_components("Please write a very short poem", "Write a short poem")
+        self.assertEqual(components.score, score_prompt("Please write a very short poem", "Write a short poem"))
+        self.assertEqual(components.score, round(0.4 * components.length + 0.3 * components.keywords
+                                                 + 0.3 * components.clarity, 3))
+        self.assertEqual(score_components("", "x"), (0.0, None, None, None))
+
 
 class TestIntegration(unittest.TestCase):
     """Integration tests combining optimize and score functions."""
@@ -168,5 +183,108 @@ class TestIntegration(unittest.TestCase):
         self.assertEqual(score1, score2)
 
 
+class TestStageTiming(unittest.TestCase):
+    """Test cases for the stage-timer facility."""
+
+    def test_optimize_stages(self):
+        """Test that optimize_prompt records validation, split and builder stages."""
+        with record_stages() as timings:
+            result = optimize_prompt("Write a story. About a cat!", 'precise')
+
+        self.assertEqual(result, optimize_prompt("Write a story. About a cat!", 'precise'))
+        self.assertEqual([stage for stage, _ in timings], ['validate', 'split', 'build_precise'])
+        self.assertTrue(all(seconds >= 0 for _, seconds in timings))
+
+    def test_score_stages(self):
+        """Test that score_prompt records each scoring component."""
+        with record_stages() as timings:
+            score_prompt("Please write a very long story", "Write a story")
+
+        self.assertEqual([stage for stage, _ in timings],
+                         ['score_validate', 'score_length', 'score_keywords', 'score_clarity'])
+
+    def test_disabled_by_default(self):
+        """Test that nothing is recorded outside record_stages."""
+        with record_stages() as timings:
+            pass
+        optimize_prompt("Write a story", 'fast')
+        self.assertEqual(timings, [])
+
+
+class TestVariantSelection(unittest.TestCase):
+    """Test cases for building a subset of the variants."""
+
+    PROMPT = "Please write a very detailed story. It should be comprehensive!"
+
+    def test_matches_full_output(self):
+        """Test that selected variants equal the same entries of the full output, in requested order."""
+        for style in ('creative', 'precise', 'fast'):
+            full = optimize_prompt(self.PROMPT, style)
+            self.assertEqual(optimize_prompt(self.PROMPT, style, variants=[0]), full[:1])
+            self.assertEqual(optimize_prompt(self.PROMPT, style, variants=[2, 0]), [full[2], full[0]])
+            self.assertEqual(optimize_prompt(self.PROMPT, style, variants=[]), [])
+            self.assertEqual([apply_edits(self.PROMPT, script)
+                              for script in optimize_prompt_edits(self.PROMPT, style, [1])], full[1:2])
+
+    def test_sentence_split_is_lazy(self):
+        """Test that only the bullet variant splits the prompt into sentences."""
+        with record_stages() as timings:
+            optimize_prompt(self.PROMPT, 'precise', variants=[0, 2])
+            optimize_prompt(self.PROMPT, 'creative')
+        self.assertNotIn('split', [stage for stage, _ in timings])
+
+        with record_stages() as timings:
+            optimize_prompt(self.PROMPT, 'precise', variants=[1])
+        self.assertIn('split', [stage for stage, _ in timings])
+
+    def test_unchanged_without_sentences(self):
+        """Test that punctuation-only prompts are returned unchanged for any selection."""
+        self.assertEqual(optimize_prompt(" ?!. ", 'fast', variants=[2]), ["?!."])
+
+    def test_invalid_indices(self):
+        """Test that out-of-range or non-integer indices are rejected."""
+        with self.assertRaises(ValueError):
+            optimize_prompt(self.PROMPT, 'fast', variants=[3])
+        with self.assertRaises(ValueError):
+            optimize_prompt(self.PROMPT, 'fast', variants=[-1])
+        with self.assertRaises(TypeError):
+            optimize_prompt(self.PROMPT, 'fast', variants=["0"])
+
+
+class TestEditScripts(unittest.TestCase):
+    """Test cases for delta-encoded variants."""
+
+    PROMPTS = [
+        "Write a story about a cat",
+        "  Please write a very detailed explanation. It should cover basics!  ",
+        "Can you analyze the data? Make it good. I think that would be nice.",
+        "Explain quantum computing\n\nUse simple words; avoid jargon.",
+    ]
+
+    def test_round_trip(self):
+        """Test that applying the edits reproduces optimize_prompt exactly."""
+        for prompt in self.PROMPTS:
+            for style in ('creative', 'precise', 'fast'):
+                edits = optimize_prompt_edits(prompt, style)
+                self.assertEqual([apply_edits(prompt, script) for script in edits],
+                                 optimize_prompt(prompt, style))
+
+    def test_edits_reference_input(self):
+        """Test that untouched text is copied rather than resent."""
+        prompt = "Describe the history of the Roman Empire in great detail " * 20
+        for script in optimize_prompt_edits(prompt, 'creative'):
+            inserted = sum(len(arg) for op, arg in script if op == 'i')
+            self.assertLess(inserted, len(prompt) // 2)
+
+    def test_invalid_script(self):
+        """Test that scripts which do not fit the prompt are rejected."""
+        with self.assertRaises(ValueError):
+            apply_edits("abc", [['c', 5]])
+        with self.assertRaises(ValueError):
+            apply_edits("abc", [['c', 1]])
+        with self.assertRaises(ValueError):
+            apply_edits("abc", [['x', 3]])
+
+
 if __name__ == '__main__':
     unittest.main() 
\ No newline at end of file
@@ -0,0 +1,90 @@
+"""
+Unit tests for the sampling profiler.
+"""
+
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tools import profiler
+from tools.optimize import optimize_prompt
+
+
+def _busy_optimize(stop: threading.Event) -> None:
+    while not stop.is_set():
+        optimize_prompt("Please write a very detailed explanation about machine learning. " * 20, "precise")
+
+
+class TestSampleStacks(unittest.TestCase):
+    """Test cases for sample_stacks and format_collapsed."""
+
+    def test_samples_other_threads(self):
+        """Test that a busy worker thread shows up in the collapsed stacks."""
+        stop = threading.Event()
+        worker = threading.Thread(target=_busy_optimize, args=(stop,), name="busy-worker")
+        worker.start()
+        try:
+            counts = profiler.sample_stacks(0.2, interval=0.002)
+        finally:
+            stop.set()
+            worker.join()
+
+        worker_stacks = [stack for stack in counts if stack.startswith("busy-worker;")]
+        self.assertTrue(worker_stacks)
+        self.assertTrue(any("optimize_prompt (optimize.py:" in stack for stack in worker_stacks))
+
+        text = profiler.format_collapsed(counts)
+        stack, count = text.splitlines()[0].rsplit(" ", 1)
+        self.assertEqual(int(count), max(counts.values()))
+
+    def test_invalid_arguments(self):
+        """Test handling of out-of-range durations."""
+        with self.assertRaises(ValueError):
+            profiler.sample_stacks(0)
+        with self.assertRaises(ValueError):
+            profiler.sample_stacks(profiler.MAX_SECONDS + 1)
+
+    def test_one_profile_at_a_time(self):
+        """Test that overlapping profiles are refused."""
+        thread = threading.Thread(target=profiler.sample_stacks, args=(0.2,))
+        thread.start()
+        time.sleep(0.05)
+        try:
+            with self.assertRaises(profiler.ProfilerBusyError):
+                profiler.sample_stacks(0.1)
+        finally:
+            thread.join()
+
+
+@unittest.skipUnless(hasattr(signal, "SIGUSR1"), "SIGUSR1 is not available")
+class TestSignalHandler(unittest.TestCase):
+    """Test cases for the stdio server's signal trigger."""
+
+    def test_signal_writes_profile(self):
+        """Test that SIGUSR1 writes a collapsed-stack file."""
+        previous = signal.getsignal(signal.SIGUSR1)
+        with tempfile.TemporaryDirectory() as tmp:
+            try:
+                self.assertTrue(profiler.install_signal_handler(seconds=0.1, directory=tmp))
+                os.kill(os.getpid(), signal.SIGUSR1)
+                deadline = time.time() + 5
+                while not os.listdir(tmp) and time.time() < deadline:
+                    time.sleep(0.05)
+                time.sleep(0.05)
+            finally:
+                signal.signal(signal.SIGUSR1, previous)
+
+            files = os.listdir(tmp)
+            self.assertEqual(len(files), 1)
+            self.assertTrue(files[0].endswith(".folded"))
+
+
+if __name__ == '__main__':
+    unittest.main()
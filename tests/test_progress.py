@@ -0,0 +1,143 @@
+"""
+Unit tests for progress reporting and MCP progress notifications.
+"""
+
+import asyncio
+import unittest
+from unittest.mock import patch
+import sys
+import os
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from mcp.shared.memory import create_connected_server_and_client_session
+
+import server
+from tools.metrics import REGISTRY
+from tools.optimize import optimize_prompt, score_prompt
+from tools.progress import progress_scope, report_progress
+
+
+class TestReportProgress(unittest.TestCase):
+    """Test cases for progress scopes."""
+
+    def test_reports_variants_and_components(self):
+        """Test that optimize and score report each finished item with its result."""
+        updates = []
+        with progress_scope(lambda done, total, partial: updates.append((done, total, partial))):
+            variants = optimize_prompt("Please write a very short poem about the sea.", "precise")
+            score = score_prompt("Please write a very short poem.", "Write a short poem.")
+        self.assertEqual(updates[:3], [(1, 3, variants[0]), (2, 3, variants[1]), (3, 3, variants[2])])
+        self.assertEqual([(done, name) for done, _, (name, _) in updates[3:]],
+                         [(1, 'length'), (2, 'keywords'), (3, 'clarity')])
+        self.assertGreater(score, 0)
+
+    def test_prompt_without_sentences(self):
+        """Test that a prompt returned unchanged still reports each variant."""
+        updates = []
+        with progress_scope(lambda done, total, partial: updates.append((done, total, partial))):
+            variants = optimize_prompt("...", "creative", [0, 2])
+        self.assertEqual(updates, [(1, 2, variants[0]), (2, 2, variants[1])])
+
+    def test_noop_outside_scope(self):
+        """Test that partial results are not built without a listener."""
+        def partial():
+            raise AssertionError("partial result built without a listener")
+
+        report_progress(1, 1, partial)
+
+
+class TestProgressNotifications(unittest.TestCase):
+    """Test cases for MCP progress notifications of tool calls."""
+
+    def call_tool(self, name, arguments):
+        updates = []
+
+        async def on_progress(progress, total, message):
+            updates.append((progress, total, message))
+
+        async def scenario():
+            async with create_connected_server_and_client_session(server.server) as client:
+                return await client.call_tool(name, arguments, progress_callback=on_progress)
+
+        result = asyncio.run(scenario())
+        self.assertFalse(result.isError, result.content)
+        return result, updates
+
+    def tearDown(self):
+        server.scheduler.shutdown()
+
+    def test_optimize_variants_streamed(self):
+        """Test that each variant arrives as a progress notification before the result."""
+        result, updates = self.call_tool("optimize_prompt_tool", {
+            "raw_prompt": "Could you kind of explain how tides work, in detail?", "style": "fast",
+            "variants": [2, 0]})
+        self.assertEqual([(progress, total) for progress, total, _ in updates], [(0, 2), (1, 2), (2, 2)])
+        self.assertTrue(updates[0][2].startswith("0/2 done in "))
+        self.assertIn("\nVariant 3: ", updates[1][2])
+        self.assertIn("\nVariant 1: ", updates[2][2])
+        # The streamed variant is the one in the final result
+        streamed = updates[1][2].split("\nVariant 3: ", 1)[1]
+        self.assertIn(f"Variant 3: {streamed}", result.content[0].text)
+
+    def test_long_results_are_chunked(self):
+        """Test that a long partial result is split with increasing fractional progress."""
+        prompt = "Explain the water cycle to a child. " * 40
+        with patch("server.PROGRESS_CHUNK_CHARS", 500):
+            result, updates = self.call_tool("optimize_prompt_tool", {
+                "raw_prompt": prompt, "style": "creative", "variants": [0]})
+        progress = [value for value, _, _ in updates]
+        self.assertEqual(progress, sorted(set(progress)))
+        self.assertEqual(progress[-1], 1)
+        self.assertGreater(len(updates), 3)
+        self.assertIn("(part 1/", updates[1][2])
+        streamed = "".join(message.split("\n", 1)[1] for _, _, message in updates[1:])
+        self.assertEqual(streamed, result.content[0].text.split("\n\n", 1)[1])
+
+    def test_score_components_streamed(self):
+        """Test that score components are sent as they are computed."""
+        _, updates = self.call_tool("score_prompt_tool", {
+            "raw_prompt": "Please kind of write a poem", "improved_prompt": "Write a poem"})
+        self.assertEqual([progress for progress, _, _ in updates], [0, 1, 2, 3])
+        self.assertIn("length score: ", updates[1][2])
+        self.assertIn("clarity score: ", updates[3][2])
+
+    def test_coalesced_calls_all_streamed(self):
+        """Test that identical concurrent calls sharing one computation each get every notification."""
+        arguments = {"raw_prompt": "Please explain how tides work. Keep it short.", "style": "precise"}
+        updates = [[], []]
+
+        async def call(index):
+            async def on_progress(progress, total, message):
+                updates[index].append(progress)
+
+            async with create_connected_server_and_client_session(server.server) as client:
+                return await client.call_tool("optimize_prompt_tool", arguments, progress_callback=on_progress)
+
+        submit = server.batcher.submit
+
+        async def slow_submit(*args, **kwargs):
+            # Long enough for the second call to join the first one's computation
+            await asyncio.sleep(0.2)
+            return await submit(*args, **kwargs)
+
+        async def scenario():
+            return await asyncio.gather(call(0), call(1))
+
+        before = REGISTRY.counter("singleflight_coalesced_total", "").value(group="mcp_optimize")
+        with patch.object(server.batcher, "submit", slow_submit):
+            results = asyncio.run(scenario())
+        self.assertEqual(REGISTRY.counter("singleflight_coalesced_total", "").value(group="mcp_optimize") - before, 1)
+        self.assertEqual(results[0].content, results[1].content)
+        self.assertEqual(updates, [[0, 1, 2, 3], [0, 1, 2, 3]])
+
+    def test_without_progress_token(self):
+        """Test that calls without a progress token still work."""
+        result = asyncio.run(server.handle_call_tool("score_prompt_tool", {
+            "raw_prompt": "Please write a poem", "improved_prompt": "Write a poem"}))
+        self.assertIn("Effectiveness score", result[0].text)
+
+
+if __name__ == '__main__':
+    unittest.main()
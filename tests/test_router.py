@@ -0,0 +1,259 @@
+"""
+Tests for consistent-hash routing and the router in front of local backend processes.
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+import unittest
+from collections import Counter
+from unittest.mock import patch
+
+# Add the parent directory to the path so we can import the router
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import httpx
+from fastapi.testclient import TestClient
+
+import router
+from tools.httpcache import content_hash
+from tools.routing import BackendPool, HashRing
+
+REPO_ROOT = os.path.join(os.path.dirname(__file__), '..')
+KEYS = [f"key-{i}" for i in range(3000)]
+
+
+class TestHashRing(unittest.TestCase):
+    """Test cases for the HashRing class."""
+
+    def test_balanced(self):
+        """Test that keys spread about evenly over the nodes."""
+        ring = HashRing(["a", "b", "c", "d"])
+        counts = Counter(ring.node_for(key) for key in KEYS)
+        self.assertEqual(set(counts), {"a", "b", "c", "d"})
+        for count in counts.values():
+            self.assertLess(abs(count - len(KEYS) / 4), len(KEYS) / 4 * 0.3)
+
+    def test_minimal_movement(self):
+        """Test that adding or removing a node only moves keys to or from that node."""
+        ring = HashRing(["a", "b", "c"])
+        before = {key: ring.node_for(key) for key in KEYS}
+        ring.add("d")
+        after = {key: ring.node_for(key) for key in KEYS}
+        moved = [key for key in KEYS if before[key] != after[key]]
+        self.assertTrue(all(after[key] == "d" for key in moved))
+        self.assertLess(abs(len(moved) - len(KEYS) / 4), len(KEYS) / 4 * 0.3)
+
+        ring.remove("b")
+        removed = {key: ring.node_for(key) for key in KEYS}
+        self.assertTrue(all(removed[key] == after[key] for key in KEYS if after[key] != "b"))
+
+    def test_preference(self):
+        """Test that the preference list holds every node once, starting with the owner."""
+        ring = HashRing(["a", "b", "c"])
+        for key in KEYS[:50]:
+            preference = list(ring.preference(key))
+            self.assertEqual(sorted(preference), ["a", "b", "c"])
+            self.assertEqual(preference[0], ring.node_for(key))
+        self.assertIsNone(HashRing().node_for("x"))
+
+    def test_pool_skips_unhealthy(self):
+        """Test that a backend that is down is skipped without moving other keys."""
+        pool = BackendPool(["http://a/", "http://b", "http://c"])
+        self.assertEqual(pool.route("x"), [])
+        for url in pool.ring.nodes:
+            pool.mark(url, True)
+        owners = {key: pool.route(key)[0] for key in KEYS[:300]}
+        self.assertFalse(pool.mark("http://b", False, "refused"))
+        for key, owner in owners.items():
+            self.assertNotEqual(pool.route(key)[0], "http://b")
+            if owner != "http://b":
+                self.assertEqual(pool.route(key)[0], owner)
+        self.assertTrue(pool.mark("http://b", True))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Backend:
+    """http_server.py under uvicorn in a subprocess."""
+
+    def __init__(self):
+        self.url = f"http://127.0.0.1:{_free_port()}"
+        self.process = None
+
+    def start(self) -> None:
+        self.process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "http_server:app", "--host", "127.0.0.1",
+             "--port", self.url.rsplit(":", 1)[1], "--log-level", "warning"],
+            cwd=REPO_ROOT, env=dict(os.environ, WORKER_THREADS="1"),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+
+    def wait_ready(self) -> None:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if httpx.get(self.url + "/ready").status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            if self.process.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("backend failed to start")
+            time.sleep(0.1)
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+
+class TestRouter(unittest.TestCase):
+    """The router in front of three local backend processes."""
+
+    PROMPTS = [f"Please could you explain topic {i} in a very detailed way" for i in range(40)]
+
+    @classmethod
+    def setUpClass(cls):
+        cls.backends = [Backend() for _ in range(3)]
+        for backend in cls.backends:
+            backend.start()
+        try:
+            for backend in cls.backends:
+                backend.wait_ready()
+        except RuntimeError:
+            cls.tearDownClass()
+            raise
+
+    @classmethod
+    def tearDownClass(cls):
+        for backend in cls.backends:
+            backend.stop()
+
+    def setUp(self):
+        self.pool = BackendPool([backend.url for backend in self.backends])
+        patcher = patch("router.pool", self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def owner(self, prompt):
+        return self.pool.ring.node_for(content_hash(prompt))
+
+    def test_routes_by_prompt(self):
+        """Test that each prompt always reaches the backend owning it, whatever the endpoint."""
+        with TestClient(router.app) as client:
+            used = set()
+            for prompt in self.PROMPTS:
+                optimized = client.post("/optimize", json={"raw_prompt": prompt, "style": "precise"})
+                self.assertEqual(optimized.status_code, 200)
+                self.assertEqual(optimized.headers["x-backend"], self.owner(prompt))
+                scored = client.post("/score", json={"raw_prompt": prompt, "improved_prompt": "Explain it"})
+                self.assertEqual(scored.headers["x-backend"], self.owner(prompt))
+                used.add(optimized.headers["x-backend"])
+            self.assertEqual(used, {backend.url for backend in self.backends})
+
+            # A stored prompt lives on one backend only; GETs by its hash must find it there
+            for prompt in self.PROMPTS[:10]:
+                text_hash = client.post("/prompts", json={"text": prompt}).json()["hash"]
+                response = client.get("/optimize", params={"raw_prompt_hash": text_hash, "style": "fast"},
+                                      headers={"Accept-Encoding": "gzip"})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.headers["x-backend"], self.owner(prompt))
+                self.assertIn("etag", response.headers)
+
+    def test_score_by_hashes_on_different_shards(self):
+        """Test that GET /score finds an improved prompt stored on another backend than the raw one."""
+        pairs = [(raw, improved) for raw, improved in zip(self.PROMPTS[10:30], self.PROMPTS[11:31])
+                 if self.owner(raw) != self.owner(improved)]
+        self.assertTrue(pairs)
+        with TestClient(router.app) as client:
+            for raw, improved in pairs:
+                raw_hash = client.post("/prompts", json={"text": raw}).json()["hash"]
+                improved_hash = client.post("/prompts", json={"text": improved}).json()["hash"]
+                response = client.get("/score", params={"raw_prompt_hash": raw_hash,
+                                                        "improved_prompt_hash": improved_hash})
+                self.assertEqual(response.status_code, 200, response.text)
+                self.assertEqual(response.headers["x-backend"], self.owner(raw))
+                expected = client.post("/score", json={"raw_prompt": raw, "improved_prompt": improved}).json()
+                self.assertEqual(response.json(), expected)
+            self.assertEqual(client.get(f"/prompts/{improved_hash}").json(), {"text": improved})
+            # An unknown hash is still reported by the backend
+            response = client.get("/score", params={"raw_prompt_hash": raw_hash, "improved_prompt_hash": "0" * 64})
+            self.assertEqual(response.status_code, 404)
+
+    def test_batch_split_across_shards(self):
+        """Test that a batch is split by owner and merged back in request order."""
+        requests = [{"raw_prompt": prompt, "style": "fast"} for prompt in self.PROMPTS]
+        requests.insert(5, {"raw_prompt": "x", "style": "unknown"})
+        before = {backend.url: router.routed.value(backend=backend.url, endpoint="/optimize/batch")
+                  for backend in self.backends}
+        with TestClient(router.app) as client:
+            response = client.post("/optimize/batch", json={"requests": requests})
+            self.assertEqual(response.status_code, 200)
+            results = response.json()["results"]
+            self.assertEqual(len(results), len(requests))
+            self.assertEqual(results[5]["status"], 422)
+            for request, result in zip(requests[6:], results[6:]):
+                expected = client.post("/optimize", json=request).json()
+                self.assertEqual(result["result"], expected)
+            # One sub-batch per backend
+            for backend in self.backends:
+                self.assertEqual(router.routed.value(backend=backend.url, endpoint="/optimize/batch"),
+                                 before[backend.url] + 1)
+            self.assertEqual(client.post("/optimize/batch", json={"requests": []}).status_code, 422)
+
+    def test_styles_reach_every_shard(self):
+        """Test that a custom style registered through the router works for prompts on every backend."""
+        tenant = {"X-Tenant-ID": "router-tenant"}
+        spec = {"variants": [[{"op": "prefix", "text": "Routed: "}], [{"op": "bullets"}], [{"op": "suffix", "text": "!"}]]}
+        with TestClient(router.app) as client:
+            self.addCleanup(client.delete, "/styles/routed", headers=tenant)
+            self.assertEqual(client.put("/styles/routed", json=spec, headers=tenant).status_code, 200)
+            for prompt in self.PROMPTS[:15]:
+                response = client.post("/optimize", json={"raw_prompt": prompt, "style": "routed"}, headers=tenant)
+                self.assertEqual(response.json()["variants"][0], "Routed: " + prompt)
+            self.assertEqual(client.get("/styles", headers=tenant).json()["custom"], ["routed"])
+
+    def test_failover_and_membership(self):
+        """Test that keys of a dead backend fail over, other keys stay put, and a removed backend's keys return."""
+        victim = self.backends[0]
+        with patch("router.ADMIN_TOKEN", "secret"), TestClient(router.app) as client:
+            admin = {"X-Admin-Token": "secret"}
+            self.assertEqual(client.delete("/router/backends", params={"url": victim.url}, headers=admin).status_code, 200)
+            for prompt in self.PROMPTS:
+                response = client.post("/optimize", json={"raw_prompt": prompt, "style": "fast"})
+                self.assertNotEqual(response.headers["x-backend"], victim.url)
+            self.assertEqual(client.post("/router/backends", json={"url": victim.url}).status_code, 403)
+            added = client.post("/router/backends", json={"url": victim.url}, headers=admin)
+            self.assertTrue(next(b for b in added.json()["backends"] if b["url"] == victim.url)["healthy"])
+            for prompt in self.PROMPTS:
+                response = client.post("/optimize", json={"raw_prompt": prompt, "style": "fast"})
+                self.assertEqual(response.headers["x-backend"], self.owner(prompt))
+
+            victim.stop()
+            try:
+                for prompt in self.PROMPTS:
+                    response = client.post("/optimize", json={"raw_prompt": prompt, "style": "fast"})
+                    self.assertEqual(response.status_code, 200)
+                    if self.owner(prompt) != victim.url:
+                        self.assertEqual(response.headers["x-backend"], self.owner(prompt))
+                self.assertFalse(self.pool.healthy(victim.url))
+                backends = client.get("/router/backends").json()["backends"]
+                self.assertFalse(next(b for b in backends if b["url"] == victim.url)["healthy"])
+            finally:
+                victim.start()
+                victim.wait_ready()
+            router_ready = client.get("/ready")
+            self.assertEqual(router_ready.status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()
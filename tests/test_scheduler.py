@@ -0,0 +1,130 @@
+"""
+Unit tests for the weighted fair queuing scheduler.
+"""
+
+import asyncio
+import threading
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tools.metrics import REGISTRY
+from tools.scheduler import BATCH, INTERACTIVE, FairScheduler, SchedulerRejectedError, parse_weights
+
+
+class TestFairScheduler(unittest.TestCase):
+    """Test cases for the FairScheduler class."""
+
+    def run_blocked(self, scheduler, submissions):
+        """Occupy every worker, queue ``submissions`` as (lane, label, tenant), release and return run order."""
+        gate = threading.Event()
+        order = []
+
+        async def scenario():
+            blockers = [asyncio.ensure_future(scheduler.submit(gate.wait, lane=BATCH))
+                        for _ in range(scheduler.workers)]
+            await asyncio.sleep(0.01)
+            jobs = [asyncio.ensure_future(scheduler.submit(order.append, label, lane=lane, tenant=tenant))
+                    for lane, label, tenant in submissions]
+            await asyncio.sleep(0.01)
+            gate.set()
+            await asyncio.gather(*blockers, *jobs)
+
+        asyncio.run(scenario())
+        return order
+
+    def tearDown(self):
+        if hasattr(self, "scheduler"):
+            self.scheduler.shutdown()
+
+    def test_interactive_overtakes_batch_backlog(self):
+        """Test that interactive jobs queued behind a batch backlog run first."""
+        self.scheduler = FairScheduler("test_wfq", workers=1)
+        submissions = [(BATCH, f"b{i}", "t") for i in range(4)] + [(INTERACTIVE, f"i{i}", "t") for i in range(2)]
+        self.assertEqual(self.run_blocked(self.scheduler, submissions), ["i0", "i1", "b0", "b1", "b2", "b3"])
+
+    def test_weighted_share(self):
+        """Test that backlogged lanes are served in proportion to their weights."""
+        self.scheduler = FairScheduler("test_share", workers=1, weights={INTERACTIVE: 3, BATCH: 1})
+        submissions = [(lane, lane[0], "t") for _ in range(8) for lane in (INTERACTIVE, BATCH)]
+        order = self.run_blocked(self.scheduler, submissions)
+        self.assertEqual(order[:8].count("i"), 6)
+        self.assertEqual(order[:8].count("b"), 2)
+
+    def test_tenant_limit(self):
+        """Test that a tenant over its cap is rejected while other tenants are admitted."""
+        self.scheduler = FairScheduler("test_tenant", workers=1, tenant_limit=2)
+        gate = threading.Event()
+
+        async def scenario():
+            held = [asyncio.ensure_future(self.scheduler.submit(gate.wait, tenant="a")) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            with self.assertRaises(SchedulerRejectedError) as raised:
+                await self.scheduler.submit(len, "x", tenant="a")
+            other = asyncio.ensure_future(self.scheduler.submit(len, "xy", tenant="b"))
+            gate.set()
+            await asyncio.gather(*held)
+            return raised.exception.reason, await other
+
+        self.assertEqual(asyncio.run(scenario()), ("tenant", 2))
+        self.assertEqual(self.scheduler.tenant_jobs("a"), 0)
+        self.assertGreater(REGISTRY.counter("scheduler_rejected_total", "").value(
+            pool="test_tenant", lane=INTERACTIVE, reason="tenant"), 0)
+
+    def test_queue_bound_and_cancellation(self):
+        """Test that full lanes reject new jobs and cancelled waiters leave the queue."""
+        self.scheduler = FairScheduler("test_queue", workers=1, max_queue=1)
+        gate = threading.Event()
+
+        async def scenario():
+            blocker = asyncio.ensure_future(self.scheduler.submit(gate.wait))
+            await asyncio.sleep(0.01)
+            queued = asyncio.ensure_future(self.scheduler.submit(len, "x", tenant="c"))
+            await asyncio.sleep(0)
+            with self.assertRaises(SchedulerRejectedError):
+                await self.scheduler.submit(len, "y")
+            queued.cancel()
+            await asyncio.sleep(0)
+            depth = self.scheduler.queued(INTERACTIVE), self.scheduler.tenant_jobs("c")
+            gate.set()
+            await blocker
+            return depth
+
+        self.assertEqual(asyncio.run(scenario()), (0, 0))
+
+    def test_errors_and_context(self):
+        """Test that exceptions propagate and unknown lanes are refused."""
+        self.scheduler = FairScheduler("test_errors", workers=2)
+
+        def fail():
+            raise TypeError("bad input")
+
+        async def scenario():
+            with self.assertRaises(TypeError):
+                await self.scheduler.submit(fail)
+            with self.assertRaises(ValueError):
+                await self.scheduler.submit(len, "x", lane="bulk")
+            return await self.scheduler.submit(len, "abc")
+
+        self.assertEqual(asyncio.run(scenario()), 3)
+
+    def test_start_creates_every_worker(self):
+        """Test that start() spawns all worker threads up front."""
+        self.scheduler = FairScheduler("test-start", workers=3)
+        self.scheduler.start()
+        names = [thread.name for thread in threading.enumerate() if thread.name.startswith("test-start-worker")]
+        self.assertEqual(len(names), 3)
+
+    def test_parse_weights(self):
+        """Test parsing of LANE_WEIGHTS values."""
+        self.assertEqual(parse_weights("interactive=4, batch=0.5"), {INTERACTIVE: 4.0, BATCH: 0.5})
+        self.assertEqual(parse_weights(""), {INTERACTIVE: 8.0, BATCH: 1.0})
+        with self.assertRaises(ValueError):
+            parse_weights("batch=0")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""
+Unit tests for the MinHash/LSH similarity index.
+"""
+
+import unittest
+import sys
+import os
+import tempfile
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tools.similarity import MinHashIndex, load_or_create
+
+
+class TestMinHashIndex(unittest.TestCase):
+    """Test cases for the MinHashIndex class."""
+
+    def setUp(self):
+        self.index = MinHashIndex()
+        self.index.insert("Write a story about a cat", {"variants": ["Craft a compelling story about a cat"]})
+        self.index.insert("Explain quantum computing to a beginner", {"variants": ["Explain quantum computing simply"]})
+        self.index.insert("Summarize the quarterly sales report", None)
+
+    def test_exact_match_ranks_first(self):
+        """Test that an identical prompt is returned with similarity 1.0."""
+        matches = self.index.query("Write a story about a cat")
+        self.assertEqual(matches[0]["prompt"], "Write a story about a cat")
+        self.assertEqual(matches[0]["similarity"], 1.0)
+        self.assertEqual(matches[0]["payload"], {"variants": ["Craft a compelling story about a cat"]})
+
+    def test_near_match(self):
+        """Test that a prompt sharing most tokens is found."""
+        matches = self.index.query("write a short story about a cat", k=1)
+        self.assertEqual(len(matches), 1)
+        self.assertEqual(matches[0]["prompt"], "Write a story about a cat")
+        self.assertGreater(matches[0]["similarity"], 0.5)
+
+    def test_unrelated_prompt(self):
+        """Test that unrelated prompts do not match above a threshold."""
+        matches = self.index.query("Translate this recipe into French", min_similarity=0.5)
+        self.assertEqual(matches, [])
+
+    def test_empty_prompt(self):
+        """Test that a prompt without tokens matches nothing."""
+        self.assertEqual(self.index.query("   "), [])
+
+    def test_reinsert_replaces_entry(self):
+        """Test that inserting the same prompt twice keeps one entry."""
+        self.index.insert("Write a story about a cat", "updated")
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(self.index.query("Write a story about a cat", k=1)[0]["payload"], "updated")
+
+    def test_remove(self):
+        """Test removing a prompt from the index."""
+        self.assertTrue(self.index.remove("Write a story about a cat"))
+        self.assertFalse(self.index.remove("Write a story about a cat"))
+        self.assertNotIn("Write a story about a cat", self.index)
+        self.assertEqual(self.index.query("Write a story about a cat", min_similarity=0.9), [])
+
+    def test_save_and_load(self):
+        """Test that an index survives a round trip to disk."""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.json")
+            self.index.save(path)
+            loaded = load_or_create(path)
+
+        self.assertEqual(len(loaded), 3)
+        self.assertEqual(loaded.query("Write a story about a cat", k=1), self.index.query("Write a story about a cat", k=1))
+
+    def test_invalid_parameters(self):
+        """Test handling of invalid arguments."""
+        with self.assertRaises(ValueError):
+            MinHashIndex(num_perm=100, bands=32)
+        with self.assertRaises(TypeError):
+            self.index.insert(123)
+        with self.assertRaises(TypeError):
+            self.index.query(None)
+
+
+if __name__ == '__main__':
+    unittest.main()
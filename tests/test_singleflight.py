@@ -0,0 +1,139 @@
+"""
+Unit tests for single-flight coalescing.
+"""
+
+import asyncio
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import server
+from tools.metrics import REGISTRY
+from tools.progress import progress_scope, report_progress
+from tools.singleflight import SingleFlight, content_key
+
+
+class TestSingleFlight(unittest.TestCase):
+    """Test cases for the SingleFlight class."""
+
+    def test_concurrent_calls_share_one_computation(self):
+        """Test that identical concurrent calls run the computation once."""
+        flight = SingleFlight("test_share")
+        runs = []
+
+        async def compute():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        async def scenario():
+            return await asyncio.gather(*(flight.do("key", compute) for _ in range(5)))
+
+        results = asyncio.run(scenario())
+        self.assertEqual(results, ["result"] * 5)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(len(flight), 0)
+        self.assertEqual(REGISTRY.gauge("singleflight_coalesce_ratio", "").value(group="test_share"), 0.8)
+
+    def test_errors_reach_every_waiter(self):
+        """Test that a failing computation raises in every caller."""
+        flight = SingleFlight("test_error")
+
+        async def compute():
+            await asyncio.sleep(0.01)
+            raise TypeError("bad input")
+
+        async def scenario():
+            return await asyncio.gather(*(flight.do("key", compute) for _ in range(3)), return_exceptions=True)
+
+        results = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(result, TypeError) for result in results))
+
+    def test_distinct_keys_are_not_coalesced(self):
+        """Test that different keys compute separately, and sequential calls recompute."""
+        flight = SingleFlight("test_distinct")
+        runs = []
+
+        async def compute():
+            runs.append(1)
+            await asyncio.sleep(0)
+            return len(runs)
+
+        async def scenario():
+            await asyncio.gather(flight.do("a", compute), flight.do("b", compute))
+            await flight.do("a", compute)
+
+        asyncio.run(scenario())
+        self.assertEqual(len(runs), 3)
+
+    def test_cancelled_caller_does_not_cancel_others(self):
+        """Test that cancelling the first caller leaves the shared result intact."""
+        flight = SingleFlight("test_cancel")
+
+        async def compute():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        async def scenario():
+            first = asyncio.ensure_future(flight.do("key", compute))
+            second = asyncio.ensure_future(flight.do("key", compute))
+            await asyncio.sleep(0.005)
+            first.cancel()
+            return await second
+
+        self.assertEqual(asyncio.run(scenario()), "done")
+
+    def test_progress_reaches_every_caller(self):
+        """Test that each caller receives every progress report, including those sent before it joined."""
+        flight = SingleFlight("test_progress")
+        reports = {"first": [], "second": [], "silent": []}
+
+        async def compute():
+            for done in (1, 2, 3):
+                report_progress(done, 3, lambda: f"item {done}")
+                await asyncio.sleep(0.01)
+            return "done"
+
+        async def caller(label, delay):
+            await asyncio.sleep(delay)
+            if label == "silent":
+                return await flight.do("key", compute)
+            with progress_scope(lambda done, total, partial: reports[label].append(partial)):
+                return await flight.do("key", compute)
+
+        async def scenario():
+            return await asyncio.gather(caller("first", 0), caller("second", 0.015), caller("silent", 0))
+
+        self.assertEqual(asyncio.run(scenario()), ["done"] * 3)
+        self.assertEqual(reports["first"], ["item 1", "item 2", "item 3"])
+        self.assertEqual(reports["second"], reports["first"])
+        self.assertEqual(reports["silent"], [])
+
+    def test_content_key(self):
+        """Test that keys depend on every part and on type."""
+        self.assertEqual(content_key("a", "fast"), content_key("a", "fast"))
+        self.assertNotEqual(content_key("a", "fast"), content_key("a", "precise"))
+        self.assertNotEqual(content_key("123"), content_key(123))
+
+
+class TestMCPCoalescing(unittest.TestCase):
+    """Test that the MCP tool handler coalesces identical calls."""
+
+    def test_handle_call_tool(self):
+        """Test that concurrent identical MCP calls return the same text."""
+        arguments = {"raw_prompt": "Write a story about a cat", "style": "creative"}
+        before = REGISTRY.counter("singleflight_calls_total", "").value(group="mcp_optimize")
+
+        async def scenario():
+            return await asyncio.gather(*(server.handle_call_tool("optimize_prompt_tool", arguments) for _ in range(4)))
+
+        results = asyncio.run(scenario())
+        self.assertTrue(all(result == results[0] for result in results))
+        self.assertEqual(REGISTRY.counter("singleflight_calls_total", "").value(group="mcp_optimize") - before, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
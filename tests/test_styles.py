@@ -0,0 +1,163 @@
+"""
+Unit tests for runtime-registered custom styles.
+"""
+
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from prompt_optimizer_client.delta import apply_edits
+from tools.optimize import optimize_prompt
+from tools.styles import StyleRegistry, compile_style, validate_spec
+
+FAST_SPEC = {"variants": [
+    [{"op": "replace", "words": {
+        "utilize": "use", "implement": "use", "demonstrate": "show", "illustrate": "show",
+        "elaborate": "explain", "comprehensive": "complete", "subsequently": "then",
+        "furthermore": "also", "additionally": "also", "nevertheless": "but"}}],
+    [{"op": "remove", "words": ["please", "could you", "would you"]}],
+    [{"op": "prefix", "text": "Quick response: "}],
+]}
+
+PRECISE_SPEC = {"variants": [
+    [{"op": "remove", "words": ["very", "quite", "really", "actually", "just", "simply", "kind of", "sort of"]}],
+    [{"op": "bullets"}],
+    [{"op": "suffix", "text": " Be specific and concise."}],
+]}
+
+PROMPTS = [
+    "Please utilize a comprehensive plan. Could you elaborate? Furthermore, IMPLEMENT it.",
+    "  Write a very, really detailed story. It is kind of   long!  ",
+    "...",
+    "",
+]
+
+
+class TestCompiledStyles(unittest.TestCase):
+    """Test cases for compiling style specs."""
+
+    def test_matches_builtin_styles(self):
+        """Test that specs mirroring built-in styles produce identical variants and edits."""
+        for name, spec in (('fast', FAST_SPEC), ('precise', PRECISE_SPEC)):
+            style = compile_style("custom", spec)
+            for prompt in PROMPTS:
+                self.assertEqual(style.optimize(prompt), optimize_prompt(prompt, name))
+                self.assertEqual([apply_edits(prompt, script) for script in style.optimize_edits(prompt)],
+                                 optimize_prompt(prompt, name))
+                self.assertEqual(style.optimize(prompt, [2, 0]), optimize_prompt(prompt, name, [2, 0]))
+
+    def test_fused_substitutions_are_single_pass(self):
+        """Test that a replacement is not rewritten by a later operation of the same run."""
+        style = compile_style("chain", {"variants": [
+            [{"op": "replace", "words": {"use": "utilize"}}, {"op": "replace", "words": {"utilize": "employ"}}],
+            [{"op": "bullets"}, {"op": "prefix", "text": "Steps:\n"}],
+            [],
+        ]})
+        self.assertEqual(style.optimize("Use tools. Utilize people"), [
+            "utilize tools. employ people",
+            "Steps:\n• Use tools\n• Utilize people",
+            "Use tools. Utilize people",
+        ])
+
+    def test_case_folded_matches(self):
+        """Test that words matched only by case folding are replaced instead of failing."""
+        style = compile_style("sunny", {"variants": [[{"op": "replace", "words": {"sun": "star", "Kelvin": "K"}}], [], []]})
+        self.assertEqual(style.optimize("the \u017fun rises. SUN and \u212aelvin", [0]), ["the star rises. star and K"])
+
+    def test_invalid_specs(self):
+        """Test that malformed specs are rejected."""
+        invalid = [
+            None,
+            {"variants": [[], []]},
+            {"variants": [[{"op": "shout"}], [], []]},
+            {"variants": [[{"op": "prefix", "text": ""}], [], []]},
+            {"variants": [[{"op": "prefix", "text": "a"}, {"op": "bullets"}], [], []]},
+            {"variants": [[{"op": "replace", "words": ["a"]}], [], []]},
+            {"variants": [[{"op": "remove", "words": []}], [], []]},
+        ]
+        for spec in invalid:
+            with self.assertRaises(ValueError):
+                validate_spec(spec)
+
+
+class TestStyleRegistry(unittest.TestCase):
+    """Test cases for per-tenant registration and the compiled-style cache."""
+
+    def setUp(self):
+        self.registry = StyleRegistry(cache_size=2, max_styles=3)
+
+    def test_builtins_and_unknown(self):
+        """Test that built-in names resolve and cannot be registered, and unknown names raise KeyError."""
+        self.assertEqual(self.registry.resolve("fast").optimize("Please help"), optimize_prompt("Please help", "fast"))
+        with self.assertRaises(ValueError):
+            self.registry.register("fast", FAST_SPEC)
+        with self.assertRaises(KeyError):
+            self.registry.resolve("missing")
+
+    def test_tenant_isolation(self):
+        """Test that tenants only see their own styles."""
+        self.registry.register("house", FAST_SPEC, tenant="a")
+        self.assertEqual(self.registry.names("a"), ["house"])
+        self.assertEqual(self.registry.names("b"), [])
+        with self.assertRaises(KeyError):
+            self.registry.resolve("house", tenant="b")
+
+    def test_unknown_lookups_leave_no_cache(self):
+        """Test that resolving unknown styles for new tenants does not grow the compiled cache."""
+        for tenant in ("x", "y", "z"):
+            with self.assertRaises(KeyError):
+                self.registry.resolve("missing", tenant=tenant)
+        self.assertEqual(self.registry._compiled, {})
+
+    def test_tenant_cap(self):
+        """Test that the number of tenants holding styles is bounded and freed by deletes."""
+        registry = StyleRegistry(max_tenants=2)
+        registry.register("house", FAST_SPEC, tenant="a")
+        registry.register("house", FAST_SPEC, tenant="b")
+        registry.register("other", FAST_SPEC, tenant="b")
+        with self.assertRaises(ValueError):
+            registry.register("house", FAST_SPEC, tenant="c")
+        self.assertEqual(registry.names("c"), [])
+
+        registry.resolve("house", tenant="a")
+        self.assertTrue(registry.remove("house", tenant="a"))
+        self.assertNotIn("a", registry._compiled)
+        registry.register("house", FAST_SPEC, tenant="c")
+        self.assertEqual(registry.resolve("house", tenant="c").optimize("Hello"), optimize_prompt("Hello", "fast"))
+
+    def test_update_invalidates_cache(self):
+        """Test that re-registering a style replaces its compiled pipeline."""
+        first = self.registry.register("house", FAST_SPEC)
+        old = self.registry.resolve("house")
+        self.assertIs(self.registry.resolve("house"), old)
+
+        second = self.registry.register("house", PRECISE_SPEC)
+        self.assertGreater(second, first)
+        new = self.registry.resolve("house")
+        self.assertIsNot(new, old)
+        self.assertEqual(new.optimize("A very good day. Yes"), optimize_prompt("A very good day. Yes", "precise"))
+
+        self.assertTrue(self.registry.remove("house"))
+        with self.assertRaises(KeyError):
+            self.registry.resolve("house")
+
+    def test_lru_bound(self):
+        """Test that compiled styles are evicted least recently used first and recompiled on demand."""
+        for name in ("a", "b", "c"):
+            self.registry.register(name, FAST_SPEC)
+        self.registry.resolve("a")
+        self.registry.resolve("b")
+        self.registry.resolve("a")
+        self.registry.resolve("c")
+        self.assertEqual(self.registry.cached(), ["a", "c"])
+        self.assertEqual(self.registry.resolve("b").optimize("Please go"), ["Please go", "go", "Quick response: Please go"])
+
+        with self.assertRaises(ValueError):
+            self.registry.register("d", FAST_SPEC)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Unit tests for startup warmup and readiness.
+"""
+
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tools.warmup import Warmup, warm_rules, warm_scorer
+
+
+class TestWarmup(unittest.TestCase):
+    """Test cases for the Warmup class."""
+
+    def test_ready_after_run(self):
+        """Test that readiness is reported only once every step has run."""
+        calls = []
+        warmup = Warmup()
+        warmup.add("first", lambda: calls.append("first"))
+        warmup.add("second", lambda: calls.append("second"))
+
+        status = warmup.status()
+        self.assertFalse(status["ready"])
+        self.assertIsNone(status["warmup_seconds"])
+        self.assertFalse(status["components"]["first"]["ready"])
+
+        self.assertTrue(warmup.run())
+        self.assertEqual(calls, ["first", "second"])
+        status = warmup.status()
+        self.assertTrue(status["ready"])
+        self.assertGreaterEqual(status["warmup_seconds"], 0)
+        self.assertTrue(all(c["ready"] and c["seconds"] is not None for c in status["components"].values()))
+
+    def test_failed_step(self):
+        """Test that a failing step leaves its component, and the server, not ready."""
+        def fail():
+            raise RuntimeError("broken rules")
+
+        warmup = Warmup()
+        warmup.add("rules", fail)
+        warmup.add("workers", lambda: None)
+
+        self.assertFalse(warmup.run())
+        status = warmup.status()
+        self.assertFalse(status["ready"])
+        self.assertEqual(status["components"]["rules"]["error"], "broken rules")
+        self.assertTrue(status["components"]["workers"]["ready"])
+
+    def test_corpus_steps(self):
+        """Test that the built-in warmup steps run cleanly."""
+        warm_rules()
+        warm_scorer()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+Unit tests for wire-format negotiation and compression.
+"""
+
+import unittest
+import sys
+import os
+
+# Add the parent directory to the path so we can import the tools
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from tools import wire
+
+
+class TestNegotiation(unittest.TestCase):
+    """Test cases for Accept and Accept-Encoding handling."""
+
+    def test_is_msgpack(self):
+        """Test Content-Type detection."""
+        self.assertTrue(wire.is_msgpack("application/msgpack"))
+        self.assertTrue(wire.is_msgpack("application/x-msgpack; charset=binary"))
+        self.assertFalse(wire.is_msgpack("application/json"))
+        self.assertFalse(wire.is_msgpack(None))
+
+    def test_wants_msgpack(self):
+        """Test that msgpack is chosen only when preferred over JSON."""
+        self.assertTrue(wire.wants_msgpack("application/msgpack"))
+        self.assertTrue(wire.wants_msgpack("application/json;q=0.5, application/msgpack"))
+        self.assertFalse(wire.wants_msgpack("application/json, application/msgpack;q=0.5"))
+        self.assertFalse(wire.wants_msgpack("*/*"))
+        self.assertFalse(wire.wants_msgpack(None))
+
+    def test_choose_encoding(self):
+        """Test content-coding selection with q-values."""
+        self.assertEqual(wire.choose_encoding("gzip, deflate"), "gzip")
+        self.assertIsNone(wire.choose_encoding("identity"))
+        self.assertIsNone(wire.choose_encoding("gzip;q=0"))
+        self.assertIsNone(wire.choose_encoding(None))
+        if "zstd" in wire.available_encodings():
+            self.assertEqual(wire.choose_encoding("gzip, zstd"), "zstd")
+            self.assertEqual(wire.choose_encoding("gzip, zstd;q=0.5"), "gzip")
+            self.assertEqual(wire.choose_encoding("*"), "zstd")
+
+    def test_compress_round_trip(self):
+        """Test that every available coding round-trips."""
+        data = b"Write a story about a cat. " * 100
+        for encoding in wire.available_encodings():
+            compressed = wire.compress(data, encoding)
+            self.assertLess(len(compressed), len(data))
+            self.assertEqual(wire.decompress(compressed, encoding), data)
+
+        with self.assertRaises(ValueError):
+            wire.compress(data, "br")
+
+
+@unittest.skipUnless(wire.MSGPACK_AVAILABLE, "msgpack is not installed")
+class TestMsgpack(unittest.TestCase):
+    """Test cases for MessagePack encoding."""
+
+    def test_round_trip(self):
+        """Test that packed objects decode to the same value."""
+        payload = {"variants": ["a", "b", "ü"], "score": 0.85}
+        self.assertEqual(wire.unpackb(wire.packb(payload)), payload)
+
+    def test_invalid_body(self):
+        """Test that garbage input raises ValueError."""
+        with self.assertRaises(ValueError):
+            wire.unpackb(b"\xc1")
+
+
+if __name__ == '__main__':
+    unittest.main()
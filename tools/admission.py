@@ -0,0 +1,108 @@
+"""
+Admission control for the HTTP transport.
+
+This module decides, before any work is queued, whether a request can be served:
+a cap on concurrent in-flight requests plus an optional token-bucket rate limit.
+Rejected requests get a Retry-After hint instead of waiting in a queue.
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+
+class TokenBucket:
+    """Token-bucket rate limiter refilled continuously at ``rate`` tokens per second."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            rate: Tokens added per second; must be positive
+            burst: Bucket capacity (defaults to ``rate``, at least 1)
+            clock: Monotonic time source, overridable for tests
+
+        Raises:
+            ValueError: If rate or burst is not positive
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(burst) if burst is not None else max(1.0, self.rate)
+        if self.capacity <= 0:
+            raise ValueError("burst must be positive")
+
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def try_take(self) -> float:
+        """
+        Take one token if available.
+
+        Returns:
+            float: 0.0 if a token was taken, otherwise seconds until one is available
+        """
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return 0.0
+            return (1.0 - self._tokens) / self.rate
+
+
+class AdmissionController:
+    """Concurrency limit plus optional rate limit, checked without blocking."""
+
+    def __init__(self, max_in_flight: int, rate: float = 0.0, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            max_in_flight: Maximum number of admitted requests running at once (0 disables the cap)
+            rate: Sustained requests per second (0 disables rate limiting)
+            burst: Token-bucket capacity when rate limiting is enabled
+            clock: Monotonic time source, overridable for tests
+
+        Raises:
+            ValueError: If max_in_flight or rate is negative
+        """
+        if max_in_flight < 0:
+            raise ValueError("max_in_flight must be non-negative")
+        if rate < 0:
+            raise ValueError("rate must be non-negative")
+
+        self.max_in_flight = max_in_flight
+        self.bucket = TokenBucket(rate, burst, clock) if rate > 0 else None
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> Optional[float]:
+        """
+        Try to admit one request.
+
+        Returns:
+            Optional[float]: None if admitted (call :meth:`release` when done),
+            otherwise a suggested retry delay in seconds
+        """
+        with self._lock:
+            if self.max_in_flight and self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                return 1.0
+            if self.bucket is not None:
+                wait = self.bucket.try_take()
+                if wait > 0:
+                    self.rejected += 1
+                    return wait
+            self.in_flight += 1
+            self.admitted += 1
+            return None
+
+    def release(self) -> None:
+        """Mark an admitted request as finished."""
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
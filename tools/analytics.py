@@ -0,0 +1,286 @@
+"""
+One-pass aggregates over a scored corpus, in bounded memory.
+
+A report over a corpus of prompt pairs needs a handful of numbers, not one
+score per pair. :class:`CorpusAnalysis` scores each raw/improved pair as it
+streams past and folds the result into fixed-size summaries: running moments
+and a :class:`QuantileSketch` of the score, of each score component and of
+the length ratio, per-phrase filler counts, and the best and worst pairs
+seen. Its memory does not grow with the number of pairs, so a corpus of any
+size can be analyzed in a single request.
+"""
+
+import heapq
+import math
+import random
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from tools.deadline import checkpoint
+from tools.metrics import REGISTRY
+from tools.optimize import _FILLER_PATTERNS, score_components
+
+DEFAULT_QUANTILES = (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99)
+COMPONENTS = ("length", "keywords", "clarity")
+
+# Readable name of each filler pattern, e.g. "kind of" for r'\bkind of\s+'
+FILLER_PHRASES = [re.sub(r'\\b|\\s\+', '', pattern) for pattern in _FILLER_PATTERNS]
+
+# Every filler pattern as one group of a single regex; the group that matched names the phrase
+_FILLER_GROUPS = re.compile('|'.join(f'({pattern})' for pattern in _FILLER_PATTERNS), re.IGNORECASE)
+
+_analyzed = REGISTRY.counter("analyze_items_total", "Prompt pairs folded into corpus analyses")
+
+
+class Breakdown(NamedTuple):
+    """Score of one pair with the parts it is made of."""
+    score: float
+    # None where ``score_prompt`` decides without computing the components (an empty prompt)
+    length: Optional[float]
+    keywords: Optional[float]
+    clarity: Optional[float]
+    # Word count of the improved prompt over that of the raw one; None when the raw prompt has no words
+    length_ratio: Optional[float]
+    # Matches of each filler pattern, in the order of FILLER_PHRASES
+    raw_fillers: List[int]
+    improved_fillers: List[int]
+
+
+def _filler_counts(text: str) -> List[int]:
+    counts = [0] * len(_FILLER_PATTERNS)
+    for match in _FILLER_GROUPS.finditer(text):
+        counts[match.lastindex - 1] += 1
+    return counts
+
+
+def score_breakdown(raw_prompt: str, improved_prompt: str) -> Breakdown:
+    """
+    Score a pair with ``score_components``, the formula behind ``score_prompt``, keeping the parts.
+
+    Engines only return the score and are verified against the reference, so
+    the breakdown always comes from the reference formula.
+
+    Raises:
+        TypeError: If either prompt is not a string
+    """
+    if not isinstance(raw_prompt, str) or not isinstance(improved_prompt, str):
+        raise TypeError("Both raw_prompt and improved_prompt must be strings")
+    raw_prompt = raw_prompt.strip()
+    improved_prompt = improved_prompt.strip()
+    raw_fillers = _filler_counts(raw_prompt)
+    improved_fillers = _filler_counts(improved_prompt)
+    raw_length = len(raw_prompt.split())
+    length_ratio = len(improved_prompt.split()) / raw_length if raw_length else None
+    components = score_components(raw_prompt, improved_prompt, (sum(raw_fillers), sum(improved_fillers)))
+    return Breakdown(*components, length_ratio, raw_fillers, improved_fillers)
+
+
+class QuantileSketch:
+    """
+    KLL sketch of a stream of numbers.
+
+    Values are kept in levels of sorted compactors; when a level fills up,
+    every other value of it is promoted to the next level with twice the
+    weight and the rest are dropped. A sketch holds about ``3 * k`` values
+    however many it has seen, and answers a quantile query to within about
+    ``1.7 / k`` of the true rank. Until the first compaction it is exact.
+    """
+
+    def __init__(self, k: int = 200, seed: Optional[int] = None):
+        """
+        Args:
+            k: Capacity of the top level; larger is more accurate and uses more memory
+            seed: Seed of the random choice of which half of a level is promoted
+
+        Raises:
+            ValueError: If k is below 2
+        """
+        if k < 2:
+            raise ValueError("k must be at least 2")
+        self.k = k
+        self.count = 0
+        self._levels: List[List[float]] = [[]]
+        self._rng = random.Random(seed)
+
+    def __len__(self) -> int:
+        """Number of values retained."""
+        return sum(len(level) for level in self._levels)
+
+    def _capacity(self, level: int) -> int:
+        # Lower levels shrink geometrically, so the total stays below 3k
+        return max(2, math.ceil(self.k * (2 / 3) ** (len(self._levels) - level - 1)))
+
+    def add(self, value: float) -> None:
+        self._levels[0].append(value)
+        self.count += 1
+        if len(self._levels[0]) >= self._capacity(0):
+            self._compress()
+
+    def _compress(self) -> None:
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if len(items) < self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self._levels):
+                self._levels.append([])
+            items.sort()
+            # An odd value out stays behind, so no weight is lost
+            kept = [items.pop()] if len(items) % 2 else []
+            self._levels[level + 1].extend(items[self._rng.randrange(2)::2])
+            self._levels[level] = kept
+            # Adding a level lowers every capacity, so check again from the bottom
+            level = 0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The value at rank ``q`` (0-1) of the stream; None for an empty sketch."""
+        return self.quantiles([q])[0]
+
+    def quantiles(self, qs: Sequence[float]) -> List[Optional[float]]:
+        if not self.count:
+            return [None] * len(qs)
+        weighted = sorted((value, 1 << level) for level, items in enumerate(self._levels) for value in items)
+        total = sum(weight for _, weight in weighted)
+        results = []
+        for q in qs:
+            target = q * total
+            seen = 0
+            value = weighted[-1][0]
+            for candidate, weight in weighted:
+                seen += weight
+                if seen >= target:
+                    value = candidate
+                    break
+            results.append(value)
+        return results
+
+
+class Distribution:
+    """Running count, mean, spread and extremes (Welford's method) plus a quantile sketch of a stream."""
+
+    def __init__(self, k: int = 200, seed: Optional[int] = None):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+        self.sketch = QuantileSketch(k, seed)
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.sketch.add(value)
+
+    def summary(self, quantiles: Sequence[float] = DEFAULT_QUANTILES) -> Dict[str, Any]:
+        empty = not self.count
+        return {
+            "count": self.count,
+            "mean": None if empty else self.mean,
+            "stddev": None if empty else math.sqrt(self._m2 / self.count),
+            "min": self.min,
+            "max": self.max,
+            "quantiles": {str(q): value for q, value in zip(quantiles, self.sketch.quantiles(quantiles))},
+        }
+
+
+class CorpusAnalysis:
+    """
+    Aggregates of a corpus of raw/improved pairs, fed one pair at a time.
+
+    Not thread-safe: feed it from one thread at a time, for instance one
+    scheduler job per chunk of the corpus.
+    """
+
+    def __init__(self, examples: int = 5, example_chars: int = 200, k: int = 200, seed: Optional[int] = 0):
+        """
+        Args:
+            examples: Number of best and of worst pairs to keep
+            example_chars: Longest prompt text kept for an example; longer ones are cut
+            k: Accuracy parameter of the quantile sketches
+            seed: Seed of the sketches, so the same corpus gives the same report
+
+        Raises:
+            ValueError: If examples or example_chars is negative
+        """
+        if examples < 0 or example_chars < 0:
+            raise ValueError("examples and example_chars must not be negative")
+        self.examples = examples
+        self.example_chars = example_chars
+        self.count = 0
+        self.score = Distribution(k, seed)
+        self.components = {name: Distribution(k, seed) for name in COMPONENTS}
+        self.length_ratio = Distribution(k, seed)
+        self.raw_fillers = [0] * len(FILLER_PHRASES)
+        self.improved_fillers = [0] * len(FILLER_PHRASES)
+        # Min-heaps holding the best pairs by (score, -index) and the worst by (-score, -index),
+        # so on equal scores the earlier pair is kept
+        self._best: List[Tuple[float, int, str, str]] = []
+        self._worst: List[Tuple[float, int, str, str]] = []
+
+    def add(self, raw_prompt: str, improved_prompt: str) -> Breakdown:
+        """Score one pair and fold it into the aggregates; the pair's index is the number added before it."""
+        breakdown = score_breakdown(raw_prompt, improved_prompt)
+        index = self.count
+        self.count += 1
+        self.score.add(breakdown.score)
+        for name in COMPONENTS:
+            value = getattr(breakdown, name)
+            if value is not None:
+                self.components[name].add(value)
+        if breakdown.length_ratio is not None:
+            self.length_ratio.add(breakdown.length_ratio)
+        for i, (raw, improved) in enumerate(zip(breakdown.raw_fillers, breakdown.improved_fillers)):
+            self.raw_fillers[i] += raw
+            self.improved_fillers[i] += improved
+        if self.examples:
+            self._keep(self._best, breakdown.score, index, raw_prompt, improved_prompt)
+            self._keep(self._worst, -breakdown.score, index, raw_prompt, improved_prompt)
+        return breakdown
+
+    def add_all(self, pairs: Iterable[Dict[str, str]]) -> int:
+        """
+        Fold every ``{"raw_prompt", "improved_prompt"}`` pair into the aggregates, stopping if cancelled.
+
+        Returns:
+            int: Number of pairs added
+        """
+        added = 0
+        for pair in pairs:
+            checkpoint()
+            self.add(pair["raw_prompt"], pair["improved_prompt"])
+            added += 1
+        _analyzed.inc(added)
+        return added
+
+    def _keep(self, heap: List[Tuple[float, int, str, str]], key: float, index: int, raw: str, improved: str) -> None:
+        entry = (key, -index)
+        if len(heap) == self.examples and entry <= heap[0][:2]:
+            return
+        # Texts are cut only for pairs that make it in
+        item = (key, -index, raw[:self.example_chars], improved[:self.example_chars])
+        if len(heap) < self.examples:
+            heapq.heappush(heap, item)
+        else:
+            heapq.heapreplace(heap, item)
+
+    def summary(self, quantiles: Sequence[float] = DEFAULT_QUANTILES) -> Dict[str, Any]:
+        """The report: distributions, filler counts and examples, best first and worst first."""
+        def examples(heap: List[Tuple[float, int, str, str]], sign: int) -> List[Dict[str, Any]]:
+            return [{"index": -index, "score": sign * key, "raw_prompt": raw, "improved_prompt": improved}
+                    for key, index, raw, improved in sorted(heap, reverse=True)]
+
+        return {
+            "count": self.count,
+            "score": self.score.summary(quantiles),
+            "components": {name: dist.summary(quantiles) for name, dist in self.components.items()},
+            "length_ratio": self.length_ratio.summary(quantiles),
+            "fillers": {phrase: {"raw": raw, "improved": improved}
+                        for phrase, raw, improved in zip(FILLER_PHRASES, self.raw_fillers, self.improved_fillers)},
+            "best": examples(self._best, 1),
+            "worst": examples(self._worst, -1),
+        }
@@ -0,0 +1,208 @@
+"""
+Approximate scoring for very long prompts.
+
+``score_prompt`` scans each prompt once per filler pattern, which dominates
+its cost on large inputs. The approximate scorer computes the same three
+components with bounded extra work:
+
+- Length: exact word counts.
+- Keywords: Jaccard similarity estimated from fixed-size bottom-k MinHash
+  signatures of the token sets.
+- Clarity: filler counts estimated from a stratified sample of text windows,
+  scanned with all filler patterns fused into one regex.
+
+The estimate comes with an error bound (two standard errors, about 95%
+confidence). The window sample doubles until that bound meets the target or
+the whole text has been scanned, at which point the filler counts are exact.
+"""
+
+import heapq
+import math
+import random
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+from tools.deadline import checkpoint
+from tools.engines import SCORE, run
+from tools.optimize import _FILLERS, _clarity_score, _length_score, _stage, score_prompt
+from tools.progress import report_progress
+from tools.similarity import _token_hash
+
+# Inputs (both prompts together) at least this long are scored approximately by default
+APPROXIMATE_MIN_CHARS = 100_000
+TARGET_ERROR = 0.02
+SIGNATURE_SIZE = 1024
+WINDOW_CHARS = 256
+INITIAL_WINDOWS = 64
+
+# Longest filler match that can start inside a window and end after it
+_WINDOW_OVERLAP = 16
+_WORD = re.compile(r'\w+')
+
+
+class ScoreEstimate(NamedTuple):
+    """A score with its error bound; ``error`` is 0.0 for exact scores."""
+    score: float
+    error: float
+    approximate: bool
+
+
+def signature(text: str, size: int = SIGNATURE_SIZE) -> List[int]:
+    """
+    Bottom-k MinHash signature of the word tokens ``score_prompt`` compares.
+
+    Returns:
+        List[int]: The ``size`` smallest token hashes in ascending order (all of them for shorter texts)
+    """
+    tokens = set(_WORD.findall(text.lower()))
+    checkpoint()
+    return heapq.nsmallest(size, {_token_hash(token) for token in tokens})
+
+
+def jaccard_estimate(first: List[int], second: List[int], size: int = SIGNATURE_SIZE) -> Tuple[float, float]:
+    """
+    Estimate the Jaccard similarity of two token sets from their signatures.
+
+    Returns:
+        Tuple[float, float]: (estimate, standard error); the error is 0.0 when both
+        signatures hold their whole set, as the estimate is then exact
+    """
+    a, b = set(first), set(second)
+    if len(a) < size and len(b) < size:
+        union = a | b
+        return (len(a & b) / len(union) if union else 1.0), 0.0
+    # The k smallest hashes of the union are a uniform sample of it
+    sample = heapq.nsmallest(size, a | b)
+    shared = sum(1 for h in sample if h in a and h in b)
+    estimate = shared / len(sample)
+    # Smoothed so an all-or-nothing sample still reports some uncertainty
+    p = (shared + 0.5) / (len(sample) + 1)
+    return estimate, math.sqrt(p * (1 - p) / len(sample))
+
+
+def _filler_count(text: str, windows: int) -> Tuple[float, float, bool]:
+    """
+    Estimate the number of filler matches in ``text`` from ``windows`` sampled windows.
+
+    Returns:
+        Tuple[float, float, bool]: (estimate, variance, whether the count is exact)
+    """
+    length = len(text)
+    if windows * WINDOW_CHARS >= length:
+        return float(len(_FILLERS.findall(text))), 0.0, True
+
+    # One window at a random offset in each of ``windows`` equal strata; seeded by
+    # the length so the same input always gives the same estimate
+    rng = random.Random(length)
+    stratum = length / windows
+    counts = []
+    for i in range(windows):
+        if i % 256 == 255:
+            checkpoint()
+        start = int(i * stratum + rng.random() * (stratum - WINDOW_CHARS))
+        end = start + WINDOW_CHARS
+        counts.append(sum(1 for match in _FILLERS.finditer(text, start, min(length, end + _WINDOW_OVERLAP))
+                          if match.start() < end))
+
+    fraction = windows * WINDOW_CHARS / length
+    hits = sum(counts)
+    mean = hits / windows
+    spread = sum((count - mean) ** 2 for count in counts) / (windows - 1)
+    # Sampling variance of the scaled-up total, floored at a Poisson count of hits + 1
+    # so that a sample without any hit does not claim to be certain
+    variance = max((length / WINDOW_CHARS) ** 2 * spread / windows, (hits + 1) / fraction ** 2) * (1 - fraction)
+    return hits / fraction, variance, False
+
+
+def _clarity_error(raw: Tuple[float, float, bool], improved: Tuple[float, float, bool]) -> float:
+    """Standard error of the clarity component, by the delta method."""
+    (r, r_var, _), (i, i_var, _) = raw, improved
+    return 0.5 * math.sqrt(i_var / r ** 2 + i ** 2 * r_var / r ** 4)
+
+
+def estimate_score(raw_prompt: str, improved_prompt: str, target_error: float = TARGET_ERROR,
+                   signature_size: int = SIGNATURE_SIZE) -> ScoreEstimate:
+    """
+    Approximate ``score_prompt`` with an error bound.
+
+    Args:
+        raw_prompt: The original prompt
+        improved_prompt: The optimized version to evaluate
+        target_error: Error bound to reach before the window sample stops growing
+        signature_size: Hashes per MinHash signature; the keyword error shrinks
+            with its square root
+
+    Returns:
+        ScoreEstimate: Score, its error bound (two standard errors), and approximate=True
+
+    Raises:
+        TypeError: If inputs are not strings
+        OperationCancelledError: If the current deadline passes or the work is cancelled
+    """
+    if not isinstance(raw_prompt, str) or not isinstance(improved_prompt, str):
+        raise TypeError("Both raw_prompt and improved_prompt must be strings")
+    raw_prompt = raw_prompt.strip()
+    improved_prompt = improved_prompt.strip()
+    if not raw_prompt or not improved_prompt:
+        # The exact edge cases are constant time
+        return ScoreEstimate(score_prompt(raw_prompt, improved_prompt), 0.0, True)
+
+    with _stage('score_length'):
+        checkpoint()
+        length_score = _length_score(len(raw_prompt.split()), len(improved_prompt.split()))
+        report_progress(1, 3, lambda: ('length', length_score))
+
+    with _stage('score_keywords'):
+        keyword_score, keyword_error = jaccard_estimate(
+            signature(raw_prompt, signature_size), signature(improved_prompt, signature_size), signature_size)
+        report_progress(2, 3, lambda: ('keywords', keyword_score))
+
+    with _stage('score_clarity'):
+        windows = INITIAL_WINDOWS
+        while True:
+            checkpoint()
+            raw = _filler_count(raw_prompt, windows)
+            improved = _filler_count(improved_prompt, windows)
+            exact = raw[2] and improved[2]
+            if raw[0] == 0:
+                # Without a filler in the raw sample the clarity rule cannot be estimated
+                clarity_error = 0.0 if exact else math.inf
+            else:
+                clarity_error = _clarity_error(raw, improved)
+            error = 2 * math.hypot(0.3 * keyword_error, 0.3 * clarity_error)
+            if exact or error <= target_error:
+                break
+            windows *= 2
+        clarity_score = _clarity_score(raw[0], improved[0])
+        report_progress(3, 3, lambda: ('clarity', clarity_score))
+
+    score = length_score * 0.4 + keyword_score * 0.3 + clarity_score * 0.3
+    return ScoreEstimate(round(score, 3), math.ceil(error * 1000) / 1000, True)
+
+
+def score_with_error(raw_prompt: str, improved_prompt: str, approximate: Optional[bool] = None,
+                     min_chars: int = APPROXIMATE_MIN_CHARS, target_error: float = TARGET_ERROR) -> ScoreEstimate:
+    """
+    Score exactly or approximately.
+
+    Args:
+        raw_prompt: The original prompt
+        improved_prompt: The optimized version to evaluate
+        approximate: True or False to force a mode; None picks approximate
+            scoring when both prompts together have at least ``min_chars`` characters
+        min_chars: Input size at which scoring turns approximate by default
+        target_error: Error bound for approximate scores
+
+    Returns:
+        ScoreEstimate: The score, its error bound, and whether it is approximate
+
+    Raises:
+        TypeError: If inputs are not strings
+        OperationCancelledError: If the current deadline passes or the work is cancelled
+    """
+    if approximate is None:
+        approximate = (isinstance(raw_prompt, str) and isinstance(improved_prompt, str)
+                       and len(raw_prompt) + len(improved_prompt) >= min_chars)
+    if approximate:
+        return estimate_score(raw_prompt, improved_prompt, target_error)
+    return ScoreEstimate(run(SCORE, raw_prompt, improved_prompt), 0.0, False)
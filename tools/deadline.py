@@ -0,0 +1,118 @@
+"""
+Deadlines and cooperative cancellation for long-running work.
+
+A request carries a :class:`CancelToken` with its deadline. The token is set
+in a context variable, so it follows the work onto worker threads, and long
+operations call :func:`checkpoint` between chunks and rewrite rules to stop
+early once the deadline has passed or the caller has gone away. Python
+threads cannot be interrupted from outside; a running job only stops at its
+next checkpoint.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+DEADLINE = "deadline"
+CANCELLED = "cancelled"
+
+
+class OperationCancelledError(RuntimeError):
+    """Raised at a checkpoint when the work's deadline passed or its caller cancelled it."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+class CancelToken:
+    """Deadline plus cancellation flag shared by a request and the work it started."""
+
+    __slots__ = ('deadline', '_reason')
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Args:
+            timeout: Seconds from now until the deadline; None for no deadline
+        """
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self._reason: Optional[str] = None
+
+    def cancel(self, reason: str = CANCELLED) -> None:
+        """Ask the work to stop at its next checkpoint; an earlier reason, or an expired deadline, wins."""
+        if self.reason is None:
+            self._reason = reason
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left until the deadline (never negative), or None without a deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    @property
+    def reason(self) -> Optional[str]:
+        """Why the work should stop, or None if it may continue."""
+        if self._reason is None and self.deadline is not None and time.monotonic() >= self.deadline:
+            self._reason = DEADLINE
+        return self._reason
+
+    def check(self) -> None:
+        """
+        Raises:
+            OperationCancelledError: If the deadline passed or the token was cancelled
+        """
+        reason = self.reason
+        if reason is not None:
+            raise OperationCancelledError("deadline exceeded" if reason == DEADLINE else "operation cancelled", reason)
+
+
+# Token of the work running in this context; None (the default) never cancels
+_current_token: ContextVar[Optional[CancelToken]] = ContextVar('_current_token', default=None)
+
+
+def current_token() -> Optional[CancelToken]:
+    """The token of the current context, if any."""
+    return _current_token.get()
+
+
+@contextmanager
+def cancel_scope(token: CancelToken) -> Iterator[CancelToken]:
+    """Make ``token`` govern checkpoints in this context and in tasks or jobs started from it."""
+    reset = _current_token.set(token)
+    try:
+        yield token
+    finally:
+        _current_token.reset(reset)
+
+
+def checkpoint() -> None:
+    """
+    Stop here if the current work was cancelled; a no-op outside a cancel scope.
+
+    Raises:
+        OperationCancelledError: If the deadline passed or the token was cancelled
+    """
+    token = _current_token.get()
+    if token is not None:
+        token.check()
+
+
+async def run_with_deadline(timeout: float, fn: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Await ``fn()`` in a new cancel scope with a deadline of ``timeout`` seconds.
+
+    When the deadline passes, or the awaiting task is cancelled, ``fn()`` is
+    cancelled with it: work still queued on a scheduler is dropped and running
+    work stops at its next checkpoint.
+
+    Raises:
+        OperationCancelledError: If the deadline passed
+    """
+    with cancel_scope(CancelToken(timeout)):
+        # wait_for runs fn() in a task that copies this context, token included
+        try:
+            return await asyncio.wait_for(fn(), timeout)
+        except asyncio.TimeoutError:
+            raise OperationCancelledError("deadline exceeded", DEADLINE)
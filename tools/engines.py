@@ -0,0 +1,286 @@
+"""
+Switchable implementations of the optimize and score operations.
+
+An :class:`Engine` bundles one implementation of ``optimize``,
+``optimize_edits`` and ``score``. The functions of :mod:`tools.optimize` are
+the ``reference`` engine; every other engine must return byte-identical output
+for the same input, only faster. The engine is chosen per process or per
+request with :func:`engine_scope`, which like the cancel scope follows the work
+onto worker threads, and :func:`run` calls the operation of the current engine.
+
+A faster engine is trusted only once it has been shown to agree with the
+reference on real traffic. In shadow mode a :class:`ShadowVerifier` takes a
+sampled fraction of the calls served by another engine and, on a background
+thread, runs the reference on the same input, compares the two outputs byte
+for byte, and records mismatches and the relative latency of the two engines
+in metrics.
+"""
+
+import hashlib
+import json
+import logging
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from tools.deadline import checkpoint
+from tools.metrics import REGISTRY
+from tools.optimize import (
+    _FILLERS,
+    _clarity_score,
+    _length_score,
+    _stage,
+    optimize_prompt,
+    optimize_prompt_edits,
+    score_prompt,
+)
+from tools.progress import report_progress
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZE = "optimize"
+OPTIMIZE_EDITS = "optimize_edits"
+SCORE = "score"
+OPERATIONS = (OPTIMIZE, OPTIMIZE_EDITS, SCORE)
+
+MATCH = "match"
+MISMATCH = "mismatch"
+DROPPED = "dropped"
+
+_seconds = REGISTRY.histogram("engine_seconds", "Time an engine spent on an operation")
+_shadowed = REGISTRY.counter(
+    "engine_shadow_total", "Calls compared against the reference engine, by outcome (match, mismatch, dropped)")
+_ratio = REGISTRY.histogram(
+    "engine_shadow_latency_ratio", "Engine latency divided by reference latency on the same input",
+    buckets=(0.1, 0.25, 0.5, 0.75, 0.9, 1.0, 1.1, 1.25, 1.5, 2.0, 4.0))
+
+
+class Engine:
+    """One implementation of each operation, called with the arguments of the reference function."""
+
+    __slots__ = ('name', 'optimize', 'optimize_edits', 'score')
+
+    def __init__(self, name: str, optimize: Callable[..., List[str]], optimize_edits: Callable[..., List[Any]],
+                 score: Callable[[str, str], float]):
+        self.name = name
+        self.optimize = optimize
+        self.optimize_edits = optimize_edits
+        self.score = score
+
+    def __repr__(self) -> str:
+        return f"Engine({self.name!r})"
+
+
+_WORDS = re.compile(r'\b\w+\b')
+
+
+def fused_score_prompt(raw_prompt: str, improved_prompt: str) -> float:
+    """
+    ``score_prompt`` with every filler pattern fused into one regex pass per prompt.
+
+    The reference scans each prompt once per filler pattern; the fused pattern
+    finds the same matches in a single scan.
+    """
+    with _stage('score_validate'):
+        checkpoint()
+        if not isinstance(raw_prompt, str) or not isinstance(improved_prompt, str):
+            raise TypeError("Both raw_prompt and improved_prompt must be strings")
+        raw_prompt = raw_prompt.strip()
+        improved_prompt = improved_prompt.strip()
+        if not raw_prompt:
+            return 0.0 if improved_prompt else 1.0
+        if not improved_prompt:
+            return 0.0
+
+    with _stage('score_length'):
+        checkpoint()
+        length_score = _length_score(len(raw_prompt.split()), len(improved_prompt.split()))
+        report_progress(1, 3, lambda: ('length', length_score))
+
+    with _stage('score_keywords'):
+        checkpoint()
+        raw_words = set(_WORDS.findall(raw_prompt.lower()))
+        improved_words = set(_WORDS.findall(improved_prompt.lower()))
+        if not raw_words:
+            keyword_score = 1.0
+        else:
+            union = raw_words | improved_words
+            keyword_score = len(raw_words & improved_words) / len(union) if union else 0.0
+        report_progress(2, 3, lambda: ('keywords', keyword_score))
+
+    with _stage('score_clarity'):
+        checkpoint()
+        clarity_score = _clarity_score(len(_FILLERS.findall(raw_prompt)), len(_FILLERS.findall(improved_prompt)))
+        report_progress(3, 3, lambda: ('clarity', clarity_score))
+
+    return round(length_score * 0.4 + keyword_score * 0.3 + clarity_score * 0.3, 3)
+
+
+REFERENCE = Engine("reference", optimize_prompt, optimize_prompt_edits, score_prompt)
+FUSED = Engine("fused", optimize_prompt, optimize_prompt_edits, fused_score_prompt)
+ENGINES: Dict[str, Engine] = {engine.name: engine for engine in (REFERENCE, FUSED)}
+
+
+def get_engine(name: str) -> Engine:
+    """
+    Raises:
+        ValueError: If no engine has that name
+    """
+    try:
+        return ENGINES[name]
+    except KeyError:
+        raise ValueError(f"Unknown engine: {name}; expected one of {', '.join(ENGINES)}") from None
+
+
+def _canonical(output: Any) -> bytes:
+    """Byte form of an operation's output; floats keep their exact repr."""
+    return json.dumps(output, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _digest(value: bytes) -> str:
+    return hashlib.sha256(value).hexdigest()[:16]
+
+
+class ShadowVerifier:
+    """
+    Compares a sample of another engine's calls with the reference engine in the background.
+
+    Comparisons queue for a single daemon thread; when ``max_pending`` are
+    already waiting, new ones are dropped rather than letting verification
+    pile up behind traffic. The reference runs outside the caller's context,
+    so the request's deadline and progress callback do not apply to it.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, max_pending: int = 64, reference: Engine = REFERENCE,
+                 history: int = 32, seed: Optional[int] = None):
+        """
+        Args:
+            sample_rate: Fraction (0-1) of eligible calls to compare
+            max_pending: Comparisons that may wait for the background thread
+            reference: Engine whose output is taken as correct
+            history: Recent mismatches kept for inspection
+            seed: Seed of the sampling random generator
+
+        Raises:
+            ValueError: If sample_rate is outside 0-1 or max_pending is below 1
+        """
+        if not 0.0 <= sample_rate <= 1.0 or max_pending < 1:
+            raise ValueError("sample_rate must be between 0 and 1 and max_pending at least 1")
+        self.sample_rate = sample_rate
+        self.reference = reference
+        self._queue: "queue.Queue[Tuple[Engine, str, tuple, bytes, float]]" = queue.Queue(max_pending)
+        self._rng = random.Random(seed)
+        self._mismatches: Deque[Dict[str, Any]] = deque(maxlen=history)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def offer(self, engine: Engine, operation: str, args: tuple, output: Any, seconds: float) -> bool:
+        """
+        Queue a comparison of ``output``, which ``engine`` produced in ``seconds``, if it is sampled.
+
+        Returns:
+            bool: Whether the call was queued for comparison
+        """
+        if engine is self.reference or getattr(engine, operation) is getattr(self.reference, operation):
+            # Nothing to verify: the engine runs the reference code for this operation
+            return False
+        if self.sample_rate <= 0.0 or self._rng.random() >= self.sample_rate:
+            return False
+        try:
+            self._queue.put_nowait((engine, operation, args, _canonical(output), seconds))
+        except queue.Full:
+            _shadowed.inc(engine=engine.name, operation=operation, outcome=DROPPED)
+            return False
+        self._ensure_thread()
+        return True
+
+    def drain(self) -> None:
+        """Block until every queued comparison has finished."""
+        self._queue.join()
+
+    def mismatches(self) -> List[Dict[str, Any]]:
+        """Recent mismatches, oldest first; inputs and outputs appear only as digests."""
+        return list(self._mismatches)
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._worker, name="engine-shadow", daemon=True)
+                self._thread.start()
+
+    def _worker(self) -> None:
+        while True:
+            engine, operation, args, candidate, seconds = self._queue.get()
+            try:
+                self._compare(engine, operation, args, candidate, seconds)
+            except Exception as e:
+                logger.error(f"Shadow comparison of engine {engine.name} failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _compare(self, engine: Engine, operation: str, args: tuple, candidate: bytes, seconds: float) -> None:
+        start = time.perf_counter()
+        try:
+            expected = _canonical(getattr(self.reference, operation)(*args))
+        except Exception as e:
+            # The engine answered where the reference fails: that is a mismatch too
+            expected = f"{type(e).__name__}: {e}".encode('utf-8')
+        reference_seconds = time.perf_counter() - start
+        if reference_seconds > 0:
+            _ratio.observe(seconds / reference_seconds, engine=engine.name, operation=operation)
+
+        if candidate == expected:
+            _shadowed.inc(engine=engine.name, operation=operation, outcome=MATCH)
+            return
+        _shadowed.inc(engine=engine.name, operation=operation, outcome=MISMATCH)
+        offset = next((i for i, (a, b) in enumerate(zip(candidate, expected)) if a != b),
+                      min(len(candidate), len(expected)))
+        mismatch = {
+            "engine": engine.name,
+            "operation": operation,
+            "input": _digest(_canonical(list(args))),
+            "output": _digest(candidate),
+            "reference_output": _digest(expected),
+            "first_difference": offset,
+            "time": time.time(),
+        }
+        self._mismatches.append(mismatch)
+        logger.warning(f"Engine {engine.name} {operation} differs from {self.reference.name} "
+                       f"at byte {offset} for input {mismatch['input']}")
+
+
+# Engine of the work running in this context, and the verifier sampling its calls
+_selection: ContextVar[Tuple[Engine, Optional[ShadowVerifier]]] = ContextVar('_selection', default=(REFERENCE, None))
+
+
+@contextmanager
+def engine_scope(engine: Engine, shadow: Optional[ShadowVerifier] = None) -> Iterator[Engine]:
+    """Run operations in this context, and in tasks or jobs started from it, on ``engine``."""
+    reset = _selection.set((engine, shadow))
+    try:
+        yield engine
+    finally:
+        _selection.reset(reset)
+
+
+def current_engine() -> Engine:
+    """The engine of the current context; the reference engine outside an engine scope."""
+    return _selection.get()[0]
+
+
+def run(operation: str, *args: Any) -> Any:
+    """Call ``operation`` on the current engine, timing it and offering it for shadow verification."""
+    engine, shadow = _selection.get()
+    start = time.perf_counter()
+    output = getattr(engine, operation)(*args)
+    seconds = time.perf_counter() - start
+    _seconds.observe(seconds, engine=engine.name, operation=operation)
+    if shadow is not None:
+        shadow.offer(engine, operation, args, output, seconds)
+    return output
@@ -0,0 +1,137 @@
+"""
+HTTP caching support for deterministic results.
+
+Optimize and score results depend only on their inputs and on the rules that
+produced them, so GET responses can carry a strong ETag derived from both and
+be cached by CDNs and reverse proxies. :data:`RULES_VERSION` is a digest of
+the modules holding the rules, so every rule change invalidates old ETags.
+Long prompts do not fit in a URL; clients store them once in a
+:class:`ContentStore` and refer to them by their SHA-256 hash.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional
+
+from tools import approximate, optimize, styles
+from tools.metrics import REGISTRY
+
+
+def content_hash(text: str) -> str:
+    """SHA-256 hex digest of ``text`` as UTF-8; the key prompts are stored under."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _rules_digest() -> str:
+    digest = hashlib.sha256()
+    for module in (optimize, approximate, styles):
+        with open(module.__file__, 'rb') as source:
+            digest.update(source.read())
+    return digest.hexdigest()[:16]
+
+
+# Identifies the rule pack results are computed with; RULES_VERSION in the environment overrides it
+RULES_VERSION = os.getenv("RULES_VERSION") or _rules_digest()
+
+
+def make_etag(*parts: Any) -> str:
+    """Strong entity tag over the given values (inputs, options, rule version)."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(hashlib.sha256(repr(part).encode('utf-8')).digest())
+    return f'"{digest.hexdigest()[:32]}"'
+
+
+def representation_etag(etag: str, *transforms: str) -> str:
+    """
+    Tag of an encoded representation (msgpack, gzip, ...) of the entity tagged ``etag``.
+
+    Strong tags must differ between representations that are not byte-identical.
+    """
+    if not transforms:
+        return etag
+    return etag[:-1] + "".join(f"+{transform}" for transform in transforms) + '"'
+
+
+def _parse_etags(header: str) -> List[str]:
+    return [tag.strip() for tag in header.split(",") if tag.strip()]
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """
+    Weak comparison of an If-None-Match header against ``etag`` or any representation of it.
+
+    Returns:
+        Optional[str]: The matching tag from the header (``etag`` for ``*``), or None
+    """
+    if not if_none_match:
+        return None
+    base = etag.strip('"')
+    for tag in _parse_etags(if_none_match):
+        if tag == "*":
+            return etag
+        opaque = tag[2:] if tag.startswith("W/") else tag
+        if opaque.strip('"').split("+", 1)[0] == base:
+            return opaque
+    return None
+
+
+_stored = REGISTRY.gauge("content_store_bytes", "Bytes of prompt text held for hash references")
+_evicted = REGISTRY.counter("content_store_evictions_total", "Stored prompts evicted to stay within the size bound")
+
+
+class ContentStore:
+    """Prompts by SHA-256 hash, least recently used evicted first once ``max_bytes`` is exceeded."""
+
+    def __init__(self, max_bytes: int):
+        """
+        Args:
+            max_bytes: Total UTF-8 size of the stored texts
+
+        Raises:
+            ValueError: If max_bytes is not positive
+        """
+        if max_bytes < 1:
+            raise ValueError("max_bytes must be at least 1")
+        self.max_bytes = max_bytes
+        self._texts: OrderedDict = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def put(self, text: str) -> str:
+        """
+        Store ``text`` and return its hash.
+
+        Raises:
+            ValueError: If the text alone is larger than the store
+        """
+        size = len(text.encode('utf-8'))
+        if size > self.max_bytes:
+            raise ValueError(f"text is larger than the content store ({self.max_bytes} bytes)")
+        key = content_hash(text)
+        with self._lock:
+            if key in self._texts:
+                self._texts.move_to_end(key)
+                return key
+            self._texts[key] = (text, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._texts.popitem(last=False)
+                self._bytes -= evicted
+                _evicted.inc()
+            _stored.set(self._bytes)
+        return key
+
+    def get(self, key: str) -> Optional[str]:
+        """The text stored under ``key``, or None if it was never stored or has been evicted."""
+        with self._lock:
+            entry = self._texts.get(key)
+            if entry is None:
+                return None
+            self._texts.move_to_end(key)
+            return entry[0]
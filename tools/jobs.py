@@ -0,0 +1,399 @@
+"""
+Asynchronous jobs over large prompt corpora.
+
+A corpus of millions of prompts cannot be optimized or scored in one request.
+:class:`JobStore` keeps jobs and their items in SQLite: a corpus is written
+item by item as it is read, and every result is written back as soon as its
+chunk finishes. :class:`JobRunner` works through the stored jobs in the
+background, a few chunks at a time, so a job that was interrupted by a
+restart resumes with the items that have no result yet. Finished jobs are
+deleted once their retention period has passed.
+"""
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from tools.limits import SizeLimits
+from tools.metrics import REGISTRY
+from tools.scheduler import SchedulerRejectedError
+
+logger = logging.getLogger(__name__)
+
+OPTIMIZE = "optimize"
+SCORE = "score"
+OPERATIONS = (OPTIMIZE, SCORE)
+
+# Job states; "uploading" jobs are still being written and are never run
+UPLOADING = "uploading"
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Items inserted per transaction while a corpus is stored
+_INSERT_BATCH = 1000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    operation TEXT NOT NULL,
+    options TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    resumed REAL,
+    done_at_resume INTEGER NOT NULL DEFAULT 0,
+    finished REAL,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    input TEXT NOT NULL,
+    finished INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS items_pending ON items (job_id, finished, seq);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created);
+"""
+
+_items = REGISTRY.counter("job_items_total", "Corpus items processed by background jobs, by operation and outcome")
+_jobs = REGISTRY.counter("jobs_total", "Background jobs by final status")
+
+# (result, None) for an item that succeeded, (None, error message) for one that failed
+Outcome = Tuple[Optional[Any], Optional[str]]
+
+
+def read_corpus(lines: Iterable[Union[str, bytes]], operation: str, start: int = 1,
+                limits: Optional[SizeLimits] = None) -> Iterator[Dict[str, str]]:
+    """
+    Parse a JSON Lines corpus into job items, one line at a time.
+
+    Each line is a JSON object with ``raw_prompt`` (and ``improved_prompt`` for
+    score jobs); optimize jobs also accept a bare JSON string. Blank lines are skipped.
+    ``start`` is the line number of the first line, for reading a corpus in pieces.
+
+    Raises:
+        ValueError: On the first malformed line, with its line number
+        RequestTooLargeError: On the first prompt over the prompt limit of ``limits``
+    """
+    fields = ("raw_prompt",) if operation == OPTIMIZE else ("raw_prompt", "improved_prompt")
+    for number, line in enumerate(lines, start):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            value = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"line {number}: invalid JSON ({e.msg})")
+        if isinstance(value, str) and operation == OPTIMIZE:
+            value = {"raw_prompt": value}
+        if not isinstance(value, dict) or not all(isinstance(value.get(field), str) for field in fields):
+            raise ValueError(f"line {number}: expected an object with string {' and '.join(fields)}")
+        if limits is not None:
+            for field in fields:
+                limits.check_prompt(value[field], f"line {number}: {field}")
+        yield {field: value[field] for field in fields}
+
+
+class JobStore:
+    """
+    Jobs and their items in a SQLite database.
+
+    One connection is shared by all threads and serialized by a lock; every
+    call is a short transaction, so readers polling a job are never blocked
+    for long by a corpus being stored or results being written.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        """
+        Args:
+            path: Database file; ``":memory:"`` keeps jobs only for the life of the process
+        """
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock:
+            if path != ":memory:":
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+            # Jobs whose upload was cut short by a restart can never complete
+            self._delete_where("status = ?", (UPLOADING,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _delete_where(self, condition: str, params: tuple) -> int:
+        ids = [row[0] for row in self._db.execute(f"SELECT id FROM jobs WHERE {condition}", params)]
+        if ids:
+            self._db.execute("BEGIN")
+            self._db.executemany("DELETE FROM items WHERE job_id = ?", [(job_id,) for job_id in ids])
+            self._db.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in ids])
+            self._db.execute("COMMIT")
+        return len(ids)
+
+    def create(self, tenant: str, operation: str, options: Dict[str, Any], items: Iterable[Dict[str, str]]) -> str:
+        """
+        Store a job and its items and queue it.
+
+        Items are consumed lazily and inserted in batches, so ``items`` can
+        stream a corpus far larger than memory.
+
+        Returns:
+            str: The job ID
+
+        Raises:
+            ValueError: If the operation is unknown or reading ``items`` fails;
+                nothing of the job is kept
+        """
+        if operation not in OPERATIONS:
+            raise ValueError(f"unknown operation: {operation}")
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, tenant, operation, options, status, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, tenant, operation, json.dumps(options), UPLOADING, time.time()))
+        total = 0
+        try:
+            batch = []
+            for item in items:
+                batch.append((job_id, total, json.dumps(item)))
+                total += 1
+                if len(batch) == _INSERT_BATCH:
+                    self._insert(batch)
+                    batch = []
+            if batch:
+                self._insert(batch)
+        except BaseException:
+            with self._lock:
+                self._delete_where("id = ?", (job_id,))
+            raise
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, total = ? WHERE id = ?", (QUEUED, total, job_id))
+        return job_id
+
+    def _insert(self, batch: List[Tuple[str, int, str]]) -> None:
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany("INSERT INTO items (job_id, seq, input) VALUES (?, ?, ?)", batch)
+            self._db.execute("COMMIT")
+
+    def get(self, job_id: str, tenant: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        The job with progress and throughput, or None if it does not exist (or belongs to another tenant).
+
+        ``throughput`` is items per second since the job last started or resumed,
+        and ``eta_seconds`` the time left at that rate.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or (tenant is not None and row["tenant"] != tenant) or row["status"] == UPLOADING:
+            return None
+        job = dict(row)
+        job["options"] = json.loads(job["options"])
+        job["throughput"] = job["eta_seconds"] = None
+        if job["resumed"] is not None:
+            elapsed = (job["finished"] or time.time()) - job["resumed"]
+            processed = job["done"] - job["done_at_resume"]
+            if elapsed > 0 and processed > 0:
+                job["throughput"] = round(processed / elapsed, 3)
+                if job["status"] == RUNNING:
+                    job["eta_seconds"] = round((job["total"] - job["done"]) / job["throughput"], 3)
+        return job
+
+    def next_job(self) -> Optional[Dict[str, Any]]:
+        """The oldest job that is queued or was running when the server stopped."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id FROM jobs WHERE status IN (?, ?) ORDER BY created LIMIT 1", (RUNNING, QUEUED)).fetchone()
+        return self.get(row["id"]) if row is not None else None
+
+    def start(self, job_id: str) -> None:
+        """Mark a job running; throughput is measured from now."""
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, started = COALESCE(started, ?), resumed = ?, done_at_resume = done"
+                " WHERE id = ?", (RUNNING, now, now, job_id))
+
+    def pending(self, job_id: str, limit: int) -> List[Tuple[int, Dict[str, str]]]:
+        """Up to ``limit`` items without a result, in corpus order."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, input FROM items WHERE job_id = ? AND finished = 0 ORDER BY seq LIMIT ?",
+                (job_id, limit)).fetchall()
+        return [(row["seq"], json.loads(row["input"])) for row in rows]
+
+    def record(self, job_id: str, outcomes: List[Tuple[int, Outcome]]) -> None:
+        """Store the outcomes of finished items and advance the job's progress."""
+        rows = [(json.dumps(result) if error is None else None, error, job_id, seq)
+                for seq, (result, error) in outcomes]
+        failed = sum(1 for _, (_, error) in outcomes if error is not None)
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "UPDATE items SET finished = 1, result = ?, error = ? WHERE job_id = ? AND seq = ?", rows)
+            self._db.execute("UPDATE jobs SET done = done + ?, failed = failed + ? WHERE id = ?",
+                             (len(rows), failed, job_id))
+            self._db.execute("COMMIT")
+
+    def finish(self, job_id: str, error: Optional[str] = None) -> None:
+        """Mark a job done, or failed with ``error``."""
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = ?, finished = ?, error = ? WHERE id = ?",
+                             (FAILED if error else DONE, time.time(), error, job_id))
+
+    def results(self, job_id: str, start: int = 0, limit: int = 100) -> Tuple[List[Dict[str, Any]], bool]:
+        """
+        A page of results in corpus order, from position ``start`` on.
+
+        Items finish out of order when chunks run in parallel; while a job runs
+        a page stops at the first item still pending, so paging on from the
+        position after the last one returned never skips a result.
+
+        Returns:
+            Tuple[List[Dict[str, Any]], bool]: The results (``index`` plus
+            ``result`` or ``error``) and whether a later page may hold more
+        """
+        with self._lock:
+            status = self._db.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            running = status is not None and status[0] not in (DONE, FAILED)
+            end = None
+            if running:
+                end = self._db.execute(
+                    "SELECT MIN(seq) FROM items WHERE job_id = ? AND finished = 0", (job_id,)).fetchone()[0]
+            rows = self._db.execute(
+                "SELECT seq, result, error FROM items WHERE job_id = ? AND finished = 1 AND seq >= ? AND seq < ?"
+                " ORDER BY seq LIMIT ?", (job_id, start, end if end is not None else 1 << 62, limit + 1)).fetchall()
+        page = []
+        for row in rows[:limit]:
+            entry = {"index": row["seq"]}
+            if row["error"] is not None:
+                entry["error"] = row["error"]
+            else:
+                entry["result"] = json.loads(row["result"])
+            page.append(entry)
+        return page, running or len(rows) > limit
+
+    def purge(self, retention: float) -> int:
+        """Delete jobs that finished more than ``retention`` seconds ago; returns how many."""
+        with self._lock:
+            return self._delete_where("finished IS NOT NULL AND finished < ?", (time.time() - retention,))
+
+
+class JobRunner:
+    """
+    Run stored jobs one after another in the background.
+
+    Each job is processed in chunks of ``chunk_size`` items, ``parallel``
+    chunks at a time, by ``process``, which gets the job and a chunk of
+    items and returns one :data:`Outcome` per item. Outcomes are stored
+    as soon as a round of chunks finishes.
+    """
+
+    def __init__(self, store: JobStore,
+                 process: Callable[[Dict[str, Any], List[Dict[str, str]]], Awaitable[List[Outcome]]],
+                 chunk_size: int = 64, parallel: int = 2, retention: float = 7 * 86400,
+                 poll_interval: float = 1.0, retry_interval: float = 1.0):
+        """
+        Args:
+            store: Where jobs are read from and results written to
+            process: Coroutine function computing the outcomes of a chunk
+            chunk_size: Items handed to ``process`` at once
+            parallel: Chunks processed at the same time
+            retention: Seconds finished jobs are kept
+            poll_interval: Seconds between checks for new jobs while idle
+            retry_interval: Seconds to wait before retrying chunks the scheduler rejected
+
+        Raises:
+            ValueError: If a size or interval is out of range
+        """
+        if chunk_size < 1 or parallel < 1 or retention < 0 or poll_interval <= 0 or retry_interval <= 0:
+            raise ValueError("chunk_size and parallel must be at least 1 and intervals positive")
+        self.store = store
+        self.process = process
+        self.chunk_size = chunk_size
+        self.parallel = parallel
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._wakeup: Optional[asyncio.Event] = None
+        self._purged = 0.0
+
+    def wake(self) -> None:
+        """Start a newly queued job now instead of at the next poll."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self) -> None:
+        """Process jobs until cancelled; an interrupted job resumes on the next run."""
+        # Created here because an event is bound to the loop it is first used on
+        self._wakeup = asyncio.Event()
+        while True:
+            if time.monotonic() - self._purged >= 60:
+                purged = await asyncio.to_thread(self.store.purge, self.retention)
+                if purged:
+                    logger.info(f"Deleted {purged} expired jobs")
+                self._purged = time.monotonic()
+            job = await asyncio.to_thread(self.store.next_job)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_job(job)
+
+    async def run_job(self, job: Dict[str, Any]) -> None:
+        """Process the pending items of ``job`` and mark it finished."""
+        if job["status"] == RUNNING:
+            logger.info(f"Resuming job {job['id']} at {job['done']}/{job['total']} items")
+        await asyncio.to_thread(self.store.start, job["id"])
+        while True:
+            pending = await asyncio.to_thread(self.store.pending, job["id"], self.chunk_size * self.parallel)
+            if not pending:
+                break
+            chunks = [pending[i:i + self.chunk_size] for i in range(0, len(pending), self.chunk_size)]
+            returned = await asyncio.gather(
+                *(self.process(job, [item for _, item in chunk]) for chunk in chunks), return_exceptions=True)
+            outcomes = []
+            error = None
+            for chunk, result in zip(chunks, returned):
+                if isinstance(result, BaseException):
+                    error = error or result
+                else:
+                    outcomes.extend((seq, outcome) for (seq, _), outcome in zip(chunk, result))
+            if outcomes:
+                await asyncio.to_thread(self.store.record, job["id"], outcomes)
+                for _, (_, item_error) in outcomes:
+                    _items.inc(operation=job["operation"], outcome="error" if item_error else "ok")
+            if isinstance(error, SchedulerRejectedError):
+                # The batch lane is full; its chunks stay pending and are retried
+                await asyncio.sleep(self.retry_interval)
+            elif isinstance(error, asyncio.CancelledError):
+                raise error
+            elif error is not None:
+                logger.error(f"Job {job['id']} failed: {error}")
+                await asyncio.to_thread(self.store.finish, job["id"], str(error))
+                _jobs.inc(status=FAILED)
+                return
+        await asyncio.to_thread(self.store.finish, job["id"])
+        _jobs.inc(status=DONE)
+        logger.info(f"Job {job['id']} finished")
@@ -0,0 +1,157 @@
+"""
+Input size limits, per tenant.
+
+A prompt is only useful up to some size, but nothing stops a client from
+sending far more. These limits are checked as early as the transport allows:
+the HTTP server refuses a body whose declared length is too large before
+reading any of it, and stops reading one that grows too large while it
+streams in, so an oversized request costs at most the limit in memory. Each
+prompt is then checked before any work is queued, and the MCP server applies
+the same limits to tool arguments.
+
+A tenant's overrides apply only to callers that present one of the tenant's
+API keys; naming a tenant in the unauthenticated X-Tenant-ID header is not
+enough. A caller can always leave its key out, so an override may only
+loosen a limit: the defaults are the limits every caller is held to.
+"""
+
+from typing import Any, Dict, Iterator, Mapping, NamedTuple, Optional
+
+_FIELDS = {"body": "max_body_bytes", "prompt": "max_prompt_chars", "corpus": "max_corpus_bytes"}
+
+
+class RequestTooLargeError(ValueError):
+    """Input over a size limit; ``kind`` names the limit (body, corpus, line or prompt)."""
+
+    def __init__(self, message: str, kind: str, limit: int):
+        super().__init__(message)
+        self.kind = kind
+        self.limit = limit
+
+
+class SizeLimits(NamedTuple):
+    """Size limits of one tenant; 0 turns a limit off."""
+    # Request body, or the serialized arguments of an MCP tool call
+    max_body_bytes: int
+    # Each prompt, in characters
+    max_prompt_chars: int
+    # Body of a corpus upload (/jobs, /analyze), which is streamed rather than held in memory
+    max_corpus_bytes: int
+
+    def check_body(self, size: int, corpus: bool = False) -> None:
+        """
+        Raises:
+            RequestTooLargeError: If a body of ``size`` bytes is over the limit
+        """
+        limit = self.max_corpus_bytes if corpus else self.max_body_bytes
+        if limit and size > limit:
+            raise RequestTooLargeError(f"Request is larger than {limit} bytes", "corpus" if corpus else "body", limit)
+
+    def check_line(self, size: int) -> None:
+        """
+        Hold a corpus line, which carries one item, to the body limit of a single request.
+
+        Raises:
+            RequestTooLargeError: If a line of ``size`` bytes is over the body limit
+        """
+        if self.max_body_bytes and size > self.max_body_bytes:
+            raise RequestTooLargeError(
+                f"Corpus line is larger than {self.max_body_bytes} bytes", "line", self.max_body_bytes)
+
+    def check_prompt(self, text: str, field: str = "prompt") -> None:
+        """
+        Raises:
+            RequestTooLargeError: If ``text`` is longer than the prompt limit
+        """
+        if self.max_prompt_chars and len(text) > self.max_prompt_chars:
+            raise RequestTooLargeError(
+                f"{field} is {len(text)} characters; the limit is {self.max_prompt_chars}", "prompt",
+                self.max_prompt_chars)
+
+
+def parse_tenant_limits(spec: Optional[str], default: SizeLimits) -> Dict[str, SizeLimits]:
+    """
+    Parse per-tenant overrides written as ``"acme.body=4194304,acme.prompt=200000,free.prompt=2000"``.
+
+    Limits a tenant does not override keep their value from ``default``. An
+    override may only raise a limit or turn it off (0): a caller escapes a
+    tighter one simply by not presenting the tenant's API key.
+
+    Raises:
+        ValueError: If an entry is malformed, names an unknown limit, is negative or tightens the default
+    """
+    limits: Dict[str, SizeLimits] = {}
+    if not spec:
+        return limits
+    for item in spec.split(","):
+        key, _, value = item.partition("=")
+        tenant, _, name = key.strip().rpartition(".")
+        if not tenant or name not in _FIELDS or not value.strip().isdigit():
+            raise ValueError(f"invalid tenant limit: {item!r}")
+        current = getattr(default, _FIELDS[name])
+        if int(value) and (not current or int(value) < current):
+            raise ValueError(f"tenant limit {item.strip()!r} is tighter than the default of {current}; "
+                             f"overrides may only raise a limit or turn it off")
+        limits[tenant] = limits.get(tenant, default)._replace(**{_FIELDS[name]: int(value)})
+    return limits
+
+
+def parse_api_keys(spec: Optional[str]) -> Dict[str, str]:
+    """
+    Parse the tenant of each API key, written as ``"key1=acme,key2=acme,key3=beta"``.
+
+    Raises:
+        ValueError: If an entry is not a non-empty key and tenant
+    """
+    tenants: Dict[str, str] = {}
+    if not spec:
+        return tenants
+    for item in spec.split(","):
+        key, _, tenant = item.partition("=")
+        if not key.strip() or not tenant.strip():
+            raise ValueError("invalid tenant API key entry; expected key=tenant")
+        tenants[key.strip()] = tenant.strip()
+    return tenants
+
+
+class LimitPolicy:
+    """The default limits, the tenants that override them, and the API keys that authenticate those tenants."""
+
+    def __init__(self, default: SizeLimits, tenants: Optional[Dict[str, SizeLimits]] = None,
+                 api_keys: Optional[Dict[str, str]] = None):
+        self.default = default
+        self.tenants = dict(tenants or {})
+        self.api_keys = dict(api_keys or {})
+
+    def for_tenant(self, tenant: str) -> SizeLimits:
+        return self.tenants.get(tenant, self.default)
+
+    def for_api_key(self, api_key: Optional[str]) -> SizeLimits:
+        """Limits of the tenant ``api_key`` belongs to; the defaults for a missing or unknown key."""
+        tenant = self.api_keys.get(api_key) if api_key else None
+        return self.default if tenant is None else self.for_tenant(tenant)
+
+
+def _strings(value: Any, path: str) -> Iterator[tuple]:
+    if isinstance(value, str):
+        yield path, value
+    elif isinstance(value, Mapping):
+        for key, item in value.items():
+            yield from _strings(item, f"{path}.{key}" if path else str(key))
+    elif isinstance(value, (list, tuple)):
+        for i, item in enumerate(value):
+            yield from _strings(item, f"{path}[{i}]")
+
+
+def check_arguments(arguments: Mapping[str, Any], limits: SizeLimits) -> None:
+    """
+    Apply the prompt limit to every string of a tool call's arguments and the body limit to their total.
+
+    Raises:
+        RequestTooLargeError: If an argument or the arguments together are over a limit
+    """
+    total = 0
+    for path, text in _strings(arguments, ""):
+        limits.check_prompt(text, path)
+        total += len(text.encode('utf-8'))
+        limits.check_body(total)
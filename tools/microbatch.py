@@ -0,0 +1,191 @@
+"""
+Adaptive micro-batching of small scheduler jobs.
+
+Every job on :class:`~tools.scheduler.FairScheduler` pays a queue entry, a
+hand-off to a worker thread and a wake-up of the event loop, which under
+high concurrency costs as much as optimizing a short prompt. A
+:class:`MicroBatcher` sits in front of the scheduler and runs concurrent
+calls of the same lane and tenant as one job.
+
+The window adapts to load: while fewer batches are running than the
+scheduler has workers, a call is sent at once, so an idle server answers
+exactly as fast as without batching. Only while every worker is busy do
+calls wait, and they are sent together as soon as a batch finishes, the
+batch is full or ``max_wait`` has passed.
+"""
+
+import asyncio
+import contextvars
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from tools.deadline import CancelToken, OperationCancelledError, cancel_scope, current_token
+from tools.metrics import REGISTRY
+from tools.scheduler import FairScheduler, _cancelled
+
+_batch_size = REGISTRY.histogram(
+    "microbatch_size", "Calls run together as one scheduler job", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+
+
+class _Call:
+    __slots__ = ('fn', 'args', 'cost', 'context', 'token', 'future', 'result', 'error')
+
+    def __init__(self, fn: Callable[..., Any], args: tuple, cost: float, future: asyncio.Future):
+        self.fn = fn
+        self.args = args
+        self.cost = cost
+        # Each call runs in its caller's context, with its own deadline and progress callback
+        self.context = contextvars.copy_context()
+        # The caller's token, or a fresh one so a call can still be told to stop
+        self.token = current_token() or CancelToken()
+        self.future = future
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+def _invoke(call: _Call, pool: str, lane: str) -> None:
+    with cancel_scope(call.token):
+        # A call whose deadline passed while its batch waited is dropped, as the scheduler drops expired jobs
+        reason = call.token.reason
+        if reason is not None:
+            _cancelled.inc(pool=pool, lane=lane, state="queued", reason=reason)
+            call.error = OperationCancelledError("deadline passed while queued", reason)
+            return
+        try:
+            call.result = call.fn(*call.args)
+        except OperationCancelledError as e:
+            _cancelled.inc(pool=pool, lane=lane, state="running", reason=e.reason)
+            call.error = e
+        except Exception as e:
+            call.error = e
+
+
+def _run_calls(calls: List[_Call], pool: str, lane: str) -> List[_Call]:
+    """Run the calls of a batch one after another on a worker; one call failing does not fail the others."""
+    for call in calls:
+        call.context.run(_invoke, call, pool, lane)
+    return calls
+
+
+class MicroBatcher:
+    """
+    Drop-in front end for :meth:`FairScheduler.submit` that batches concurrent calls.
+
+    Calls are batched per lane and tenant, so fair queuing and tenant caps
+    still apply; a batch counts as one job against them. Its cost is the sum
+    of the costs of its calls.
+    """
+
+    def __init__(self, scheduler: FairScheduler, max_batch: int = 16, max_wait: float = 0.002):
+        """
+        Args:
+            scheduler: Scheduler the batches run on
+            max_batch: Most calls in one batch; 1 turns batching off
+            max_wait: Longest time a call waits for a busy worker before its batch is sent anyway
+
+        Raises:
+            ValueError: If max_batch is below 1 or max_wait is negative
+        """
+        if max_batch < 1 or max_wait < 0:
+            raise ValueError("max_batch must be at least 1 and max_wait non-negative")
+        self.scheduler = scheduler
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._pending: Dict[Tuple[str, str], List[_Call]] = {}
+        self._timers: Dict[Tuple[str, str], asyncio.TimerHandle] = {}
+        self._in_flight = 0
+        # The loop only keeps weak references to tasks
+        self._batches: Set[asyncio.Future] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch > 1
+
+    async def submit(self, fn: Callable[..., Any], *args: Any, lane: Optional[str] = None,
+                     tenant: str = "default", cost: float = 1.0) -> Any:
+        """
+        Run ``fn(*args)`` on the scheduler, batched with concurrent calls of the same lane and tenant.
+
+        Raises:
+            SchedulerRejectedError: If the scheduler refused the batch
+            OperationCancelledError: If the call's deadline passed or it was cancelled
+        """
+        if not self.enabled:
+            return await self.scheduler.submit(fn, *args, lane=lane, tenant=tenant, cost=cost)
+
+        key = (lane or self.scheduler.default_lane, tenant)
+        if self._in_flight < self.scheduler.workers and key not in self._pending:
+            # A worker is free: send the call as it is, without the cost of batching it
+            self._in_flight += 1
+            _batch_size.observe(1, pool=self.scheduler.name)
+            try:
+                return await self.scheduler.submit(fn, *args, lane=key[0], tenant=tenant, cost=cost)
+            finally:
+                self._done()
+
+        loop = asyncio.get_running_loop()
+        call = _Call(fn, args, cost, loop.create_future())
+        pending = self._pending.setdefault(key, [])
+        pending.append(call)
+        if self._in_flight < self.scheduler.workers or len(pending) >= self.max_batch:
+            self._flush(key)
+        elif key not in self._timers:
+            self._timers[key] = loop.call_later(self.max_wait, self._flush, key)
+
+        try:
+            return await call.future
+        except asyncio.CancelledError:
+            pending = self._pending.get(key, [])
+            call.token.cancel()
+            if call in pending:
+                pending.remove(call)
+                _cancelled.inc(pool=self.scheduler.name, lane=key[0], state="queued", reason=call.token.reason)
+                if not pending:
+                    # Nothing left to send: drop the key so idle calls take the direct path again
+                    del self._pending[key]
+                    timer = self._timers.pop(key, None)
+                    if timer is not None:
+                        timer.cancel()
+            # Once sent, the worker skips the call, or the call stops at its next checkpoint
+            raise
+
+    def _flush(self, key: Tuple[str, str]) -> None:
+        """Send the waiting calls of ``key`` as one batch."""
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        calls = self._pending.pop(key, [])
+        if not calls:
+            return
+        self._in_flight += 1
+        _batch_size.observe(len(calls), pool=self.scheduler.name)
+        # Started in an empty context: the batch must not inherit the deadline of whichever
+        # caller flushed it, or that caller's cancellation would drop everyone's calls
+        batch = contextvars.Context().run(asyncio.ensure_future, self._run_batch(key, calls))
+        self._batches.add(batch)
+        batch.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, key: Tuple[str, str], calls: List[_Call]) -> None:
+        lane, tenant = key
+        try:
+            await self.scheduler.submit(_run_calls, calls, self.scheduler.name, lane,
+                                        lane=lane, tenant=tenant, cost=sum(call.cost for call in calls))
+        except Exception as e:
+            for call in calls:
+                if not call.future.done():
+                    call.future.set_exception(e)
+        else:
+            for call in calls:
+                if call.future.done():
+                    continue
+                if call.error is not None:
+                    call.future.set_exception(call.error)
+                else:
+                    call.future.set_result(call.result)
+        finally:
+            self._done()
+
+    def _done(self) -> None:
+        self._in_flight -= 1
+        # A worker is free: send the calls that queued up while all of them were busy
+        while self._pending and self._in_flight < self.scheduler.workers:
+            self._flush(next(iter(self._pending)))
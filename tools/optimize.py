@@ -5,52 +5,402 @@ This module provides stateless, deterministic functions for optimizing and scori
 """
 
 import re
-from typing import List, Literal
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Literal, NamedTuple, Optional, Sequence, Set, Tuple, Union
 
+from tools.deadline import checkpoint
+from tools.progress import report_progress
 
-def optimize_prompt(raw_prompt: str, style: Literal['creative', 'precise', 'fast']) -> List[str]:
+# Stage timings for the current request; None (the default) disables timing
+_stage_timings: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar('_stage_timings', default=None)
+
+
+class _StageTimer:
+    """Context manager that appends (stage, seconds) to the active timing list."""
+
+    __slots__ = ('name', 'timings', 'start')
+
+    def __init__(self, name: str, timings: List[Tuple[str, float]]):
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.timings.append((self.name, time.perf_counter() - self.start))
+
+
+class _NoopTimer:
+    """Shared do-nothing timer used while stage timing is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NOOP_TIMER = _NoopTimer()
+
+
+def _stage(name: str):
+    """Time a named stage if stage timing is enabled for the current context."""
+    timings = _stage_timings.get()
+    return _NOOP_TIMER if timings is None else _StageTimer(name, timings)
+
+
+@contextmanager
+def record_stages() -> Iterator[List[Tuple[str, float]]]:
+    """
+    Enable stage timing for calls made in this context.
+
+    Yields:
+        List[Tuple[str, float]]: (stage name, seconds) pairs, appended as stages finish
+    """
+    timings: List[Tuple[str, float]] = []
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
+
+
+# An edit script rebuilds a variant from the raw prompt, reading it left to right:
+# ["c", n] copies the next n characters, ["d", n] skips them, ["i", text] inserts text.
+EditScript = List[list]
+
+
+class _Variant:
+    """
+    One variant under construction, kept either as a plain string or as edits.
+
+    In text mode the operations are ordinary string operations. In edit mode the
+    variant is a piece table over the raw prompt: ``(start, end)`` ranges of
+    the source and inserted literals, always in source order, so it can be
+    emitted as an edit script without building the full string.
+    """
+
+    __slots__ = ('source', 'pieces', '_text')
+
+    def __init__(self, source: str, start: int, end: int, track_edits: bool = False):
+        self.source = source
+        if track_edits:
+            self.pieces: Optional[List[Union[Tuple[int, int], str]]] = [(start, end)] if end > start else []
+            self._text = None
+        else:
+            self.pieces = None
+            self._text = source[start:end]
+
+    def prepend(self, text: str) -> None:
+        if self.pieces is None:
+            self._text = text + self._text
+        else:
+            self.pieces.insert(0, text)
+
+    def append(self, text: str) -> None:
+        if self.pieces is None:
+            self._text = self._text + text
+        else:
+            self.pieces.append(text)
+
+    def sub(self, pattern: Union[str, re.Pattern], replacement: Union[str, Callable[[re.Match], str]],
+            flags: int = 0) -> None:
+        """
+        Apply ``re.sub(pattern, replacement, text, flags=flags)`` to the variant.
+
+        A string ``replacement`` is inserted literally; a callable one is called
+        with each match. In edit mode an untouched variant is matched against
+        the source in place; otherwise the current text is built once so
+        matches see the result of earlier substitutions, exactly as chained
+        ``re.sub`` calls would.
+        
+        Each substitution is one rewrite rule, so it is also a cancellation checkpoint.
+        """
+        checkpoint()
+        if self.pieces is None:
+            if isinstance(pattern, str):
+                self._text = re.sub(pattern, replacement, self._text, flags=flags)
+            else:
+                self._text = pattern.sub(replacement, self._text)
+            return
+
+        compiled = re.compile(pattern, flags) if isinstance(pattern, str) else pattern
+        pieces = self.pieces
+        if len(pieces) == 1 and isinstance(pieces[0], tuple):
+            start, end = pieces[0]
+            matches = compiled.finditer(self.source, start, end)
+        else:
+            start = 0
+            matches = compiled.finditer(self.text())
+        spans = [(m.start() - start, m.end() - start, replacement if isinstance(replacement, str) else replacement(m))
+                 for m in matches]
+        if not spans:
+            return
+
+        new_pieces: List[Union[Tuple[int, int], str]] = []
+        index, offset = 0, 0
+
+        def take(a: int, b: int) -> None:
+            # Copy the pieces covering current-text offsets [a, b)
+            nonlocal index, offset
+            while index < len(pieces) and offset + _piece_length(pieces[index]) <= a:
+                offset += _piece_length(pieces[index])
+                index += 1
+            i, o = index, offset
+            while i < len(pieces) and o < b:
+                piece = pieces[i]
+                length = _piece_length(piece)
+                lo, hi = max(a, o) - o, min(b, o + length) - o
+                if hi > lo:
+                    _push(new_pieces, (piece[0] + lo, piece[0] + hi) if isinstance(piece, tuple) else piece[lo:hi])
+                o += length
+                i += 1
+
+        position = 0
+        for match_start, match_end, inserted in spans:
+            take(position, match_start)
+            if inserted:
+                _push(new_pieces, inserted)
+            position = match_end
+        take(position, sum(_piece_length(piece) for piece in pieces))
+        self.pieces = new_pieces
+
+    def text(self) -> str:
+        """Build the variant string."""
+        if self.pieces is None:
+            return self._text
+        source = self.source
+        return ''.join(source[p[0]:p[1]] if isinstance(p, tuple) else p for p in self.pieces)
+
+    def edits(self) -> EditScript:
+        """Express the variant as an edit script against the full source string."""
+        ops: EditScript = []
+        cursor = 0
+        for piece in self.pieces:
+            if isinstance(piece, tuple):
+                start, end = piece
+                if start > cursor:
+                    ops.append(['d', start - cursor])
+                ops.append(['c', end - start])
+                cursor = end
+            else:
+                ops.append(['i', piece])
+        if cursor < len(self.source):
+            ops.append(['d', len(self.source) - cursor])
+        return ops
+
+
+def _piece_length(piece: Union[Tuple[int, int], str]) -> int:
+    return piece[1] - piece[0] if isinstance(piece, tuple) else len(piece)
+
+
+def _push(pieces: List[Union[Tuple[int, int], str]], piece: Union[Tuple[int, int], str]) -> None:
+    """Append a piece, merging it with the previous one when they are contiguous."""
+    if pieces:
+        last = pieces[-1]
+        if isinstance(piece, tuple) and isinstance(last, tuple) and last[1] == piece[0]:
+            pieces[-1] = (last[0], piece[1])
+            return
+        if isinstance(piece, str) and isinstance(last, str):
+            pieces[-1] = last + piece
+            return
+    pieces.append(piece)
+
+
+_SENTENCE_END = re.compile(r'[.!?]+')
+
+# Sentences split between cancellation checkpoints
+_CHECKPOINT_EVERY = 4096
+
+
+def _sentence_spans(source: str, start: int, end: int) -> List[Tuple[int, int]]:
+    """Spans of the non-empty, stripped sentences of ``source[start:end]`` split on ``[.!?]+``."""
+    spans = []
+
+    def add(a: int, b: int) -> None:
+        while a < b and source[a].isspace():
+            a += 1
+        while b > a and source[b - 1].isspace():
+            b -= 1
+        if b > a:
+            spans.append((a, b))
+
+    segment_start = start
+    for count, match in enumerate(_SENTENCE_END.finditer(source, start, end), 1):
+        if count % _CHECKPOINT_EVERY == 0:
+            checkpoint()
+        add(segment_start, match.start())
+        segment_start = match.end()
+    add(segment_start, end)
+    return spans
+
+
+def _bullets(source: str, start: int, end: int, sentences: list, track_edits: bool) -> _Variant:
+    """Variant listing each sentence as a bullet point (sentences are strings, or spans in edit mode)."""
+    variant = _Variant(source, start, start, track_edits)
+    if track_edits:
+        pieces: List[Union[Tuple[int, int], str]] = ["• "]
+        for i, sentence in enumerate(sentences):
+            if i:
+                pieces.append("\n• ")
+            pieces.append(sentence)
+        variant.pieces = pieces
+    else:
+        variant._text = "• " + "\n• ".join(sentences)
+    return variant
+
+
+# Any character that survives sentence splitting and stripping
+_SENTENCE_CONTENT = re.compile(r'[^.!?\s]')
+
+
+class _Analysis:
+    """
+    The stripped prompt plus the analyses the variant builders depend on.
+    
+    Each analysis runs on first use, so a request only pays for what its
+    variants need: the sentence split, for instance, only runs for the
+    precise style's bullet variant.
+    """
+
+    __slots__ = ('source', 'start', 'end', 'track_edits', '_sentences')
+
+    def __init__(self, source: str, start: int, end: int, track_edits: bool):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.track_edits = track_edits
+        self._sentences = None
+
+    def variant(self) -> _Variant:
+        """A new variant holding the stripped prompt."""
+        return _Variant(self.source, self.start, self.end, self.track_edits)
+
+    def has_sentences(self) -> bool:
+        """Whether splitting on ``[.!?]+`` leaves any non-blank sentence, without splitting."""
+        if self._sentences is not None:
+            return bool(self._sentences)
+        return _SENTENCE_CONTENT.search(self.source, self.start, self.end) is not None
+
+    def sentences(self) -> list:
+        """Non-empty stripped sentences (strings, or spans in edit mode)."""
+        if self._sentences is None:
+            # Split into sentences for better processing
+            with _stage('split'):
+                if self.track_edits:
+                    self._sentences = _sentence_spans(self.source, self.start, self.end)
+                else:
+                    sentences = re.split(r'[.!?]+', self.source[self.start:self.end])
+                    self._sentences = [s.strip() for s in sentences if s.strip()]
+        return self._sentences
+
+
+VARIANT_COUNT = 3
+
+
+def _build_variants(raw_prompt: str, style: str, track_edits: bool = False,
+                    variants: Optional[Sequence[int]] = None,
+                    builders: Optional[Sequence[Callable[[_Analysis], _Variant]]] = None) -> List[_Variant]:
+    """
+    Validate the input and build the requested variants of ``style`` over ``raw_prompt``.
+    
+    ``builders`` replaces the built-in builders of ``style``; compiled custom
+    styles use it to run through the same pipeline. The build stops with
+    ``OperationCancelledError`` at the next checkpoint once the deadline of the
+    current cancel scope passes.
+    """
+    # Input validation
+    with _stage('validate'):
+        checkpoint()
+        if not isinstance(raw_prompt, str):
+            raise TypeError("raw_prompt must be a string")
+        if builders is None and (not isinstance(style, str) or style not in ['creative', 'precise', 'fast']):
+            raise TypeError("style must be one of: 'creative', 'precise', 'fast'")
+        if variants is None:
+            indices: Sequence[int] = range(VARIANT_COUNT)
+        else:
+            indices = list(variants)
+            if not all(isinstance(i, int) and not isinstance(i, bool) for i in indices):
+                raise TypeError("variants must be a list of variant indices")
+            if not all(0 <= i < VARIANT_COUNT for i in indices):
+                raise ValueError(f"variant indices must be between 0 and {VARIANT_COUNT - 1}")
+        
+        # Clean and normalize the input prompt; edits stay relative to the unstripped input
+        start = len(raw_prompt) - len(raw_prompt.lstrip())
+        end = len(raw_prompt.rstrip())
+        analysis = _Analysis(raw_prompt, start, max(start, end), track_edits)
+    
+    # Custom style names are tenant-defined, so they share one stage label
+    with _stage(f'build_{style}' if builders is None else 'build_custom'):
+        # Prompts without any sentence content are returned unchanged, still reporting each variant
+        if end <= start or not analysis.has_sentences():
+            builders = (_Analysis.variant,) * VARIANT_COUNT
+        elif builders is None:
+            builders = _STYLE_BUILDERS[style]
+        built = []
+        for i in indices:
+            checkpoint()
+            built.append(builders[i](analysis))
+            report_progress(len(built), len(indices), built[-1].text)
+        return built
+
+
+def optimize_prompt(raw_prompt: str, style: Literal['creative', 'precise', 'fast'],
+                    variants: Optional[Sequence[int]] = None) -> List[str]:
     """
     Generate 3 optimized variants of the raw LLM prompt in the specified style.
     
     Args:
         raw_prompt: The original prompt to optimize
         style: The optimization style - 'creative', 'precise', or 'fast'
+        variants: Indices (0-2) of the variants to build, in the order to return
+            them; defaults to all three. Unrequested variants are never computed.
     
     Returns:
-        List[str]: 3 optimized prompt variants
+        List[str]: The optimized prompt variants
     
     Raises:
         TypeError: If inputs are not strings or style is invalid
+        ValueError: If a variant index is out of range
+        OperationCancelledError: If the current deadline passes or the work is cancelled
     """
-    # Input validation
-    if not isinstance(raw_prompt, str):
-        raise TypeError("raw_prompt must be a string")
-    if not isinstance(style, str) or style not in ['creative', 'precise', 'fast']:
-        raise TypeError("style must be one of: 'creative', 'precise', 'fast'")
+    return [variant.text() for variant in _build_variants(raw_prompt, style, variants=variants)]
+
+
+def optimize_prompt_edits(raw_prompt: str, style: Literal['creative', 'precise', 'fast'],
+                          variants: Optional[Sequence[int]] = None) -> List[EditScript]:
+    """
+    Generate the same variants as ``optimize_prompt`` as edit scripts against ``raw_prompt``.
     
-    # Clean and normalize the input prompt
-    raw_prompt = raw_prompt.strip()
-    if not raw_prompt:
-        return ["", "", ""]
+    Most variants are the prompt with a prefix, a suffix or a few words changed,
+    so the scripts are much smaller than the full strings for long prompts.
+    Apply one with ``prompt_optimizer_client.delta.apply_edits(raw_prompt, script)``.
     
-    # Split into sentences for better processing
-    sentences = re.split(r'[.!?]+', raw_prompt)
-    sentences = [s.strip() for s in sentences if s.strip()]
+    Args:
+        raw_prompt: The original prompt to optimize
+        style: The optimization style - 'creative', 'precise', or 'fast'
+        variants: Indices (0-2) of the variants to build; defaults to all three
     
-    if style == 'creative':
-        return _create_creative_variants(raw_prompt, sentences)
-    elif style == 'precise':
-        return _create_precise_variants(raw_prompt, sentences)
-    else:  # fast
-        return _create_fast_variants(raw_prompt, sentences)
-
-
-def _create_creative_variants(raw_prompt: str, sentences: List[str]) -> List[str]:
-    """Create creative variants with enhanced adjectives and imaginative language."""
-    if not sentences:
-        return [raw_prompt, raw_prompt, raw_prompt]
+    Returns:
+        List[EditScript]: Edit scripts of ``["c", n]``, ``["d", n]`` and ``["i", text]`` operations
     
-    # Variant 1: Add descriptive adjectives
+    Raises:
+        TypeError: If inputs are not strings or style is invalid
+        ValueError: If a variant index is out of range
+        OperationCancelledError: If the current deadline passes or the work is cancelled
+    """
+    return [variant.edits() for variant in _build_variants(raw_prompt, style, True, variants)]
+
+
+# Creative variants: enhanced adjectives and imaginative language
+
+def _creative_adjectives(analysis: _Analysis) -> _Variant:
+    """Variant 1: Add descriptive adjectives."""
     enhanced_words = {
         'write': 'craft a compelling',
         'create': 'design an innovative',
@@ -62,39 +412,45 @@ def _create_creative_variants(raw_prompt: str, sentences: List[str]) -> List[str
         'tell': 'share the captivating'
     }
     
-    variant1 = raw_prompt
+    variant = analysis.variant()
+    lowered = analysis.source[analysis.start:analysis.end].lower()
     for word, replacement in enhanced_words.items():
-        if word in variant1.lower():
-            variant1 = re.sub(rf'\b{word}\b', replacement, variant1, flags=re.IGNORECASE)
+        if word in lowered:
+            variant.sub(rf'\b{word}\b', replacement, flags=re.IGNORECASE)
             break
-    
-    # Variant 2: Add engaging opening phrases
+    return variant
+
+
+def _creative_opening(analysis: _Analysis) -> _Variant:
+    """Variant 2: Add engaging opening phrases."""
     engaging_starts = [
         "Imagine you're an expert in this field. ",
         "Picture yourself as a master of this subject. ",
         "As a seasoned professional, ",
         "With your deep expertise, "
     ]
-    variant2 = engaging_starts[0] + raw_prompt
-    
-    # Variant 3: Add creative modifiers
+    variant = analysis.variant()
+    variant.prepend(engaging_starts[0])
+    return variant
+
+
+def _creative_modifier(analysis: _Analysis) -> _Variant:
+    """Variant 3: Add creative modifiers."""
     creative_modifiers = [
         "in a way that captivates and inspires",
         "with creativity and originality",
         "in an engaging and memorable manner",
         "with flair and imagination"
     ]
-    variant3 = raw_prompt + ". " + creative_modifiers[0]
-    
-    return [variant1, variant2, variant3]
+    variant = analysis.variant()
+    variant.append(". " + creative_modifiers[0])
+    return variant
 
 
-def _create_precise_variants(raw_prompt: str, sentences: List[str]) -> List[str]:
-    """Create precise variants with concise, focused language."""
-    if not sentences:
-        return [raw_prompt, raw_prompt, raw_prompt]
-    
-    # Variant 1: Remove redundant words
+# Precise variants: concise, focused language
+
+def _precise_without_fillers(analysis: _Analysis) -> _Variant:
+    """Variant 1: Remove redundant words."""
     redundant_patterns = [
         (r'\bvery\s+', ''),
         (r'\bquite\s+', ''),
@@ -106,33 +462,36 @@ def _create_precise_variants(raw_prompt: str, sentences: List[str]) -> List[str]
         (r'\bsort of\s+', '')
     ]
     
-    variant1 = raw_prompt
+    variant = analysis.variant()
     for pattern, replacement in redundant_patterns:
-        variant1 = re.sub(pattern, replacement, variant1, flags=re.IGNORECASE)
-    
-    # Variant 2: Use bullet points for clarity
+        variant.sub(pattern, replacement, flags=re.IGNORECASE)
+    return variant
+
+
+def _precise_bullets(analysis: _Analysis) -> _Variant:
+    """Variant 2: Use bullet points for clarity."""
+    sentences = analysis.sentences()
     if len(sentences) > 1:
-        variant2 = "• " + "\n• ".join(sentences)
-    else:
-        variant2 = raw_prompt
-    
-    # Variant 3: Add specific constraints
+        return _bullets(analysis.source, analysis.start, analysis.end, sentences, analysis.track_edits)
+    return analysis.variant()
+
+
+def _precise_constraint(analysis: _Analysis) -> _Variant:
+    """Variant 3: Add specific constraints."""
     constraint_phrases = [
         "Be specific and concise.",
         "Provide clear, actionable guidance.",
         "Focus on the most important aspects."
     ]
-    variant3 = raw_prompt + " " + constraint_phrases[0]
-    
-    return [variant1, variant2, variant3]
+    variant = analysis.variant()
+    variant.append(" " + constraint_phrases[0])
+    return variant
 
 
-def _create_fast_variants(raw_prompt: str, sentences: List[str]) -> List[str]:
-    """Create fast variants optimized for quick processing."""
-    if not sentences:
-        return [raw_prompt, raw_prompt, raw_prompt]
-    
-    # Variant 1: Use shorter synonyms
+# Fast variants: optimized for quick processing
+
+def _fast_synonyms(analysis: _Analysis) -> _Variant:
+    """Variant 1: Use shorter synonyms."""
     short_synonyms = {
         'utilize': 'use',
         'implement': 'use',
@@ -146,28 +505,67 @@ def _create_fast_variants(raw_prompt: str, sentences: List[str]) -> List[str]:
         'nevertheless': 'but'
     }
     
-    variant1 = raw_prompt
+    variant = analysis.variant()
     for long_word, short_word in short_synonyms.items():
-        variant1 = re.sub(rf'\b{long_word}\b', short_word, variant1, flags=re.IGNORECASE)
-    
-    # Variant 2: Use imperative form
-    variant2 = raw_prompt
+        variant.sub(rf'\b{long_word}\b', short_word, flags=re.IGNORECASE)
+    return variant
+
+
+def _fast_imperative(analysis: _Analysis) -> _Variant:
+    """Variant 2: Use imperative form."""
+    variant = analysis.variant()
     # Convert "Please write..." to "Write..."
-    variant2 = re.sub(r'\bplease\s+', '', variant2, flags=re.IGNORECASE)
+    variant.sub(r'\bplease\s+', '', flags=re.IGNORECASE)
     # Convert "Could you..." to direct commands
-    variant2 = re.sub(r'\bcould you\s+', '', variant2, flags=re.IGNORECASE)
-    variant2 = re.sub(r'\bwould you\s+', '', variant2, flags=re.IGNORECASE)
-    
-    # Variant 3: Add speed indicators
+    variant.sub(r'\bcould you\s+', '', flags=re.IGNORECASE)
+    variant.sub(r'\bwould you\s+', '', flags=re.IGNORECASE)
+    return variant
+
+
+def _fast_speed_indicator(analysis: _Analysis) -> _Variant:
+    """Variant 3: Add speed indicators."""
     speed_indicators = [
         "Quick response: ",
         "Fast answer: ",
         "Brief: ",
         "Short: "
     ]
-    variant3 = speed_indicators[0] + raw_prompt
-    
-    return [variant1, variant2, variant3]
+    variant = analysis.variant()
+    variant.prepend(speed_indicators[0])
+    return variant
+
+
+# Variant builders of each style, in output order
+_STYLE_BUILDERS: Dict[str, Tuple[Callable[[_Analysis], _Variant], ...]] = {
+    'creative': (_creative_adjectives, _creative_opening, _creative_modifier),
+    'precise': (_precise_without_fillers, _precise_bullets, _precise_constraint),
+    'fast': (_fast_synonyms, _fast_imperative, _fast_speed_indicator),
+}
+
+
+# Redundant phrases and filler words counted by the clarity component of the score
+_FILLER_PATTERNS = [
+    r'\bvery\s+',
+    r'\bquite\s+',
+    r'\breally\s+',
+    r'\bactually\s+',
+    r'\bjust\s+',
+    r'\bsimply\s+',
+    r'\bkind of\s+',
+    r'\bsort of\s+',
+    r'\bplease\s+',
+    r'\bcould you\s+',
+    r'\bwould you\s+'
+]
+
+# One pass finds every filler; the patterns never match at the same position, so the
+# fused count equals the sum of the per-pattern counts
+_FILLERS = re.compile('|'.join(_FILLER_PATTERNS), re.IGNORECASE)
+
+
+def _tokenize(text: str) -> Set[str]:
+    """Return the set of lowercase word tokens used for keyword comparison."""
+    return set(re.findall(r'\b\w+\b', text.lower()))
 
 
 def score_prompt(raw_prompt: str, improved_prompt: str) -> float:
@@ -188,81 +586,119 @@ def score_prompt(raw_prompt: str, improved_prompt: str) -> float:
     
     Raises:
         TypeError: If inputs are not strings
+        OperationCancelledError: If the current deadline passes or the work is cancelled
+    """
+    return score_components(raw_prompt, improved_prompt).score
+
+
+class ScoreComponents(NamedTuple):
+    """Score of a pair with the components it is weighted from."""
+    score: float
+    # None where an empty prompt decides the score without computing the components
+    length: Optional[float]
+    keywords: Optional[float]
+    clarity: Optional[float]
+
+
+def score_components(raw_prompt: str, improved_prompt: str,
+                     fillers: Optional[Tuple[int, int]] = None) -> ScoreComponents:
+    """
+    Compute the score of ``score_prompt`` together with its length, keyword and clarity components.
+
+    Args:
+        raw_prompt: The original prompt
+        improved_prompt: The optimized version to evaluate
+        fillers: Filler counts of the stripped raw and improved prompts, when the caller has counted them already
+
+    Returns:
+        ScoreComponents: The score and its components
+
+    Raises:
+        TypeError: If inputs are not strings
+        OperationCancelledError: If the current deadline passes or the work is cancelled
     """
     # Input validation
-    if not isinstance(raw_prompt, str) or not isinstance(improved_prompt, str):
-        raise TypeError("Both raw_prompt and improved_prompt must be strings")
+    with _stage('score_validate'):
+        checkpoint()
+        if not isinstance(raw_prompt, str) or not isinstance(improved_prompt, str):
+            raise TypeError("Both raw_prompt and improved_prompt must be strings")
     
-    # Handle edge cases
-    if not raw_prompt.strip():
-        return 0.0 if improved_prompt.strip() else 1.0
+        # Handle edge cases
+        if not raw_prompt.strip():
+            return ScoreComponents(0.0 if improved_prompt.strip() else 1.0, None, None, None)
     
-    if not improved_prompt.strip():
-        return 0.0
+        if not improved_prompt.strip():
+            return ScoreComponents(0.0, None, None, None)
     
-    # Normalize prompts
-    raw_prompt = raw_prompt.strip()
-    improved_prompt = improved_prompt.strip()
+        # Normalize prompts
+        raw_prompt = raw_prompt.strip()
+        improved_prompt = improved_prompt.strip()
     
     # Calculate length score (40% weight)
-    raw_length = len(raw_prompt.split())
-    improved_length = len(improved_prompt.split())
+    with _stage('score_length'):
+        checkpoint()
+        raw_length = len(raw_prompt.split())
+        improved_length = len(improved_prompt.split())
     
-    if raw_length == 0:
-        length_score = 1.0
-    else:
-        # Prefer shorter prompts, but not too short (maintain at least 50% of original length)
-        length_ratio = improved_length / raw_length
-        if length_ratio <= 0.5:
-            length_score = 0.3  # Penalty for being too short
-        elif length_ratio <= 0.8:
-            length_score = 1.0  # Optimal range
-        elif length_ratio <= 1.2:
-            length_score = 0.8  # Slightly longer is acceptable
-        else:
-            length_score = 0.4  # Too long gets penalized
+        length_score = _length_score(raw_length, improved_length)
+        report_progress(1, 3, lambda: ('length', length_score))
     
     # Calculate keyword preservation score (30% weight)
-    raw_words = set(re.findall(r'\b\w+\b', raw_prompt.lower()))
-    improved_words = set(re.findall(r'\b\w+\b', improved_prompt.lower()))
+    with _stage('score_keywords'):
+        checkpoint()
+        raw_words = _tokenize(raw_prompt)
+        improved_words = _tokenize(improved_prompt)
     
-    if not raw_words:
-        keyword_score = 1.0
-    else:
-        # Calculate Jaccard similarity
-        intersection = raw_words.intersection(improved_words)
-        union = raw_words.union(improved_words)
-        keyword_score = len(intersection) / len(union) if union else 0.0
+        if not raw_words:
+            keyword_score = 1.0
+        else:
+            # Calculate Jaccard similarity
+            intersection = raw_words.intersection(improved_words)
+            union = raw_words.union(improved_words)
+            keyword_score = len(intersection) / len(union) if union else 0.0
+        report_progress(2, 3, lambda: ('keywords', keyword_score))
     
     # Calculate clarity score (30% weight)
-    # Count redundant phrases and filler words
-    redundant_patterns = [
-        r'\bvery\s+',
-        r'\bquite\s+',
-        r'\breally\s+',
-        r'\bactually\s+',
-        r'\bjust\s+',
-        r'\bsimply\s+',
-        r'\bkind of\s+',
-        r'\bsort of\s+',
-        r'\bplease\s+',
-        r'\bcould you\s+',
-        r'\bwould you\s+'
-    ]
-    
-    raw_redundant = sum(len(re.findall(pattern, raw_prompt, re.IGNORECASE)) 
-                       for pattern in redundant_patterns)
-    improved_redundant = sum(len(re.findall(pattern, improved_prompt, re.IGNORECASE)) 
-                            for pattern in redundant_patterns)
+    with _stage('score_clarity'):
+        checkpoint()
+        # Count redundant phrases and filler words
+        if fillers is not None:
+            raw_redundant, improved_redundant = fillers
+        else:
+            raw_redundant = sum(len(re.findall(pattern, raw_prompt, re.IGNORECASE))
+                               for pattern in _FILLER_PATTERNS)
+            improved_redundant = sum(len(re.findall(pattern, improved_prompt, re.IGNORECASE))
+                                    for pattern in _FILLER_PATTERNS)
     
-    # Fewer redundant words = better clarity
-    if raw_redundant == 0:
-        clarity_score = 1.0 if improved_redundant == 0 else 0.7
-    else:
-        improvement_ratio = (raw_redundant - improved_redundant) / raw_redundant
-        clarity_score = max(0.0, min(1.0, 0.5 + improvement_ratio * 0.5))
+        clarity_score = _clarity_score(raw_redundant, improved_redundant)
+        report_progress(3, 3, lambda: ('clarity', clarity_score))
     
     # Calculate weighted final score
     final_score = (length_score * 0.4 + keyword_score * 0.3 + clarity_score * 0.3)
     
-    return round(final_score, 3) 
\ No newline at end of file
+    return ScoreComponents(round(final_score, 3), length_score, keyword_score, clarity_score)
+
+
+def _length_score(raw_length: int, improved_length: int) -> float:
+    """Length component of the score, from the word counts of both prompts."""
+    if raw_length == 0:
+        return 1.0
+    # Prefer shorter prompts, but not too short (maintain at least 50% of original length)
+    length_ratio = improved_length / raw_length
+    if length_ratio <= 0.5:
+        return 0.3  # Penalty for being too short
+    elif length_ratio <= 0.8:
+        return 1.0  # Optimal range
+    elif length_ratio <= 1.2:
+        return 0.8  # Slightly longer is acceptable
+    else:
+        return 0.4  # Too long gets penalized
+
+
+def _clarity_score(raw_redundant: float, improved_redundant: float) -> float:
+    """Clarity component of the score, from the filler counts of both prompts."""
+    # Fewer redundant words = better clarity
+    if raw_redundant == 0:
+        return 1.0 if improved_redundant == 0 else 0.7
+    improvement_ratio = (raw_redundant - improved_redundant) / raw_redundant
+    return max(0.0, min(1.0, 0.5 + improvement_ratio * 0.5)) 
\ No newline at end of file
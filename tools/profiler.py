@@ -0,0 +1,133 @@
+"""
+On-demand sampling profiler for production diagnosis.
+
+This module samples the Python stacks of every thread at a fixed interval and
+aggregates them as collapsed stacks (``frame;frame;frame count`` lines), the
+input format of flame-graph tools. Nothing runs until a profile is requested,
+so an idle server pays no cost.
+"""
+
+import logging
+import os
+import signal
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 0.005
+MAX_SECONDS = 60.0
+
+# Only one profile runs at a time; overlapping samplers would skew each other
+_profile_lock = threading.Lock()
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when a profile is requested while another one is running."""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval: float = DEFAULT_INTERVAL) -> Dict[str, int]:
+    """
+    Sample the stacks of all threads for ``seconds``.
+
+    Runs in the calling thread, which is excluded from the samples.
+
+    Args:
+        seconds: Sampling duration, at most ``MAX_SECONDS``
+        interval: Delay between samples in seconds
+
+    Returns:
+        Dict[str, int]: Sample counts keyed by collapsed stack, root frame first
+
+    Raises:
+        ValueError: If seconds or interval is out of range
+        ProfilerBusyError: If another profile is already running
+    """
+    if not 0 < seconds <= MAX_SECONDS:
+        raise ValueError(f"seconds must be in (0, {MAX_SECONDS:g}]")
+    if interval <= 0:
+        raise ValueError("interval must be positive")
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusyError("a profile is already running")
+
+    try:
+        own_id = threading.get_ident()
+        counts: Dict[str, int] = {}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                key = ";".join(reversed(stack))
+                counts[key] = counts.get(key, 0) + 1
+            time.sleep(interval)
+        return counts
+    finally:
+        _profile_lock.release()
+
+
+def format_collapsed(counts: Dict[str, int]) -> str:
+    """Render sample counts as collapsed-stack text, most frequent first."""
+    lines = [f"{stack} {count}" for stack, count in sorted(counts.items(), key=lambda item: -item[1])]
+    return "\n".join(lines) + ("\n" if lines else "")
+
+
+def profile_to_file(seconds: float, directory: Optional[str] = None,
+                    interval: float = DEFAULT_INTERVAL) -> str:
+    """
+    Profile for ``seconds`` and write collapsed stacks to a new file.
+
+    Returns:
+        str: Path of the written ``.folded`` file
+    """
+    counts = sample_stacks(seconds, interval)
+    directory = directory or tempfile.gettempdir()
+    path = os.path.join(directory, f"profile-{os.getpid()}-{int(time.time())}.folded")
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(format_collapsed(counts))
+    return path
+
+
+def install_signal_handler(signum: int = getattr(signal, "SIGUSR1", 0), seconds: float = 10.0,
+                           directory: Optional[str] = None) -> bool:
+    """
+    Start a background profile whenever the process receives ``signum``.
+
+    The signal handler only spawns a thread; the collapsed stacks are written
+    by :func:`profile_to_file` and the path is logged.
+
+    Returns:
+        bool: False if the platform has no such signal or this is not the main thread
+    """
+    if not signum or threading.current_thread() is not threading.main_thread():
+        return False
+
+    def run_profile():
+        try:
+            path = profile_to_file(seconds, directory)
+            logger.info(f"Wrote {seconds:g}s profile to {path}")
+        except ProfilerBusyError:
+            logger.warning("Profile requested while another one is running; ignoring")
+        except Exception as e:
+            logger.error(f"Profiling failed: {e}")
+
+    def handler(signum, frame):
+        threading.Thread(target=run_profile, name="profiler", daemon=True).start()
+
+    signal.signal(signum, handler)
+    return True
@@ -0,0 +1,80 @@
+"""
+Progress reporting for long-running work.
+
+Like the cancel token of :mod:`tools.deadline`, the progress callback of the
+current work is kept in a context variable, so it follows the work onto
+worker threads. Long operations call :func:`report_progress` as each item
+(a variant, a score component) finishes; outside a :func:`progress_scope`
+that is a no-op, and a partial result is only built when someone listens.
+"""
+
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+# Called with (items done, total items, result of the item just finished or None)
+ProgressCallback = Callable[[int, int, Any], None]
+
+_current_callback: ContextVar[Optional[ProgressCallback]] = ContextVar('_current_callback', default=None)
+
+
+def current_progress() -> Optional[ProgressCallback]:
+    """The progress callback of the current context, if any."""
+    return _current_callback.get()
+
+
+@contextmanager
+def progress_scope(callback: ProgressCallback) -> Iterator[None]:
+    """Send progress of work in this context, and in tasks or jobs started from it, to ``callback``."""
+    reset = _current_callback.set(callback)
+    try:
+        yield
+    finally:
+        _current_callback.reset(reset)
+
+
+def report_progress(done: int, total: int, partial: Optional[Callable[[], Any]] = None) -> None:
+    """
+    Report that ``done`` of ``total`` items have finished; a no-op outside a progress scope.
+
+    Args:
+        done: Items finished so far
+        total: Items in the whole operation
+        partial: Returns the result of the item just finished; called only if
+            a callback is listening, so building it costs nothing otherwise
+    """
+    callback = _current_callback.get()
+    if callback is not None:
+        callback(done, total, partial() if partial is not None else None)
+
+
+class ProgressFanout:
+    """
+    Progress callback that forwards every report to several listeners, for work shared by several callers.
+
+    A listener added after the work started is first sent the reports it
+    missed, so every listener sees the whole sequence. Safe to call from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._listeners: List[ProgressCallback] = []
+        self._reports: List[Tuple[int, int, Any]] = []
+
+    def __call__(self, done: int, total: int, partial: Any) -> None:
+        with self._lock:
+            self._reports.append((done, total, partial))
+            for listener in self._listeners:
+                listener(done, total, partial)
+
+    def add(self, listener: ProgressCallback) -> None:
+        with self._lock:
+            for report in self._reports:
+                listener(*report)
+            self._listeners.append(listener)
+
+    def remove(self, listener: ProgressCallback) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
@@ -0,0 +1,194 @@
+"""
+Consistent-hash routing of requests to backend instances.
+
+Behind a round-robin load balancer every replica sees a random slice of the
+traffic, so each one warms its caches (coalesced calls, stored prompts,
+compiled styles) for keys the others also hold. :class:`HashRing` maps each
+request key to one backend instead, so each backend serves a stable partition
+of the keys; adding or removing a backend only moves the keys of the ring
+segments it gains or loses. :class:`BackendPool` tracks backend health and
+routes around backends that are down.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import logging
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import httpx
+
+from tools.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+_healthy = REGISTRY.gauge("router_backend_healthy", "1 while a backend passes health checks, 0 while it is down")
+
+
+def _position(value: str) -> int:
+    """Position on the ring: a 64-bit hash that is stable across processes."""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hashing with virtual nodes.
+
+    Each node is placed on the ring at ``replicas`` pseudo-random points; a
+    key belongs to the node of the first point at or after the key's own
+    position. With many points per node the keys spread evenly, and a node
+    that joins or leaves takes or gives up only about ``1/len(nodes)`` of them.
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), replicas: int = 128):
+        """
+        Args:
+            nodes: Initial nodes
+            replicas: Points per node on the ring
+
+        Raises:
+            ValueError: If replicas is not positive
+        """
+        if replicas < 1:
+            raise ValueError("replicas must be at least 1")
+        self.replicas = replicas
+        self._points: List[Tuple[int, str]] = []
+        self._nodes: List[str] = []
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, node: str) -> bool:
+        return node in self._nodes
+
+    @property
+    def nodes(self) -> List[str]:
+        return list(self._nodes)
+
+    def add(self, node: str) -> bool:
+        """Place ``node`` on the ring; returns False if it was already there."""
+        if node in self._nodes:
+            return False
+        self._nodes.append(node)
+        for replica in range(self.replicas):
+            bisect.insort(self._points, (_position(f"{node}#{replica}"), node))
+        return True
+
+    def remove(self, node: str) -> bool:
+        """Take ``node`` off the ring; returns False if it was not there."""
+        if node not in self._nodes:
+            return False
+        self._nodes.remove(node)
+        self._points = [point for point in self._points if point[1] != node]
+        return True
+
+    def preference(self, key: str) -> Iterator[str]:
+        """Every node once, starting with the owner of ``key`` and going clockwise from there."""
+        if not self._points:
+            return
+        start = bisect.bisect_left(self._points, (_position(key), ""))
+        seen = set()
+        for i in range(len(self._points)):
+            node = self._points[(start + i) % len(self._points)][1]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == len(self._nodes):
+                    return
+
+    def node_for(self, key: str) -> Optional[str]:
+        """The node that owns ``key``, or None for an empty ring."""
+        return next(self.preference(key), None)
+
+
+class BackendPool:
+    """
+    Backends on a hash ring with their health.
+
+    A backend that fails a health check or refuses a connection is skipped:
+    its keys go to the next backend on the ring until it passes a check
+    again, while every other key stays where it was. Used from one event
+    loop, so it needs no locking.
+    """
+
+    def __init__(self, urls: Iterable[str] = (), replicas: int = 128):
+        self.ring = HashRing(replicas=replicas)
+        self._health: Dict[str, Dict[str, Any]] = {}
+        for url in urls:
+            self.add(url)
+
+    @staticmethod
+    def normalize(url: str) -> str:
+        return url.strip().rstrip("/")
+
+    def add(self, url: str) -> bool:
+        """Add a backend; it receives traffic once it passes a health check."""
+        url = self.normalize(url)
+        if not self.ring.add(url):
+            return False
+        self._health[url] = {"healthy": False, "error": "not checked yet", "checked": None}
+        _healthy.set(0, backend=url)
+        logger.info(f"Added backend {url}")
+        return True
+
+    def remove(self, url: str) -> bool:
+        url = self.normalize(url)
+        if not self.ring.remove(url):
+            return False
+        del self._health[url]
+        _healthy.set(0, backend=url)
+        logger.info(f"Removed backend {url}")
+        return True
+
+    def mark(self, url: str, healthy: bool, error: Optional[str] = None) -> bool:
+        """
+        Record the outcome of a check or request.
+
+        Returns:
+            bool: Whether the backend just came back up
+        """
+        health = self._health.get(url)
+        if health is None:
+            return False
+        recovered = healthy and not health["healthy"]
+        if health["healthy"] and not healthy:
+            logger.warning(f"Backend {url} is down: {error}")
+        elif recovered:
+            logger.info(f"Backend {url} is back up")
+        health.update(healthy=healthy, error=error, checked=time.time())
+        _healthy.set(1 if healthy else 0, backend=url)
+        return recovered
+
+    def healthy(self, url: str) -> bool:
+        health = self._health.get(url)
+        return health is not None and health["healthy"]
+
+    def route(self, key: str) -> List[str]:
+        """Healthy backends for ``key``: its owner first, then the ones to fail over to."""
+        return [url for url in self.ring.preference(key) if self.healthy(url)]
+
+    def status(self) -> List[Dict[str, Any]]:
+        return [{"url": url, **health} for url, health in self._health.items()]
+
+    async def check(self, client: httpx.AsyncClient, path: str = "/ready", timeout: float = 1.0) -> List[str]:
+        """
+        Probe every backend once, all at the same time.
+
+        Returns:
+            List[str]: Backends that came back up with this check
+        """
+        async def probe(url: str) -> Tuple[bool, Optional[str]]:
+            try:
+                response = await client.get(url + path, timeout=timeout)
+            except httpx.HTTPError as e:
+                return False, f"{type(e).__name__}: {e}"
+            if response.status_code != 200:
+                return False, f"{path} answered {response.status_code}"
+            return True, None
+
+        urls = self.ring.nodes
+        outcomes = await asyncio.gather(*(probe(url) for url in urls))
+        return [url for url, (healthy, error) in zip(urls, outcomes) if self.mark(url, healthy, error)]
@@ -0,0 +1,315 @@
+"""
+Priority lanes with weighted fair queuing on a worker pool.
+
+Interactive calls and bulk jobs share the same CPU. Instead of handing every
+request to a large thread pool in arrival order, the HTTP server queues
+compute per lane and lets a small pool of workers pick the next job by
+weighted fair queuing (self-clocked variant): each job gets a virtual finish
+tag ``max(V, last tag of its lane) + cost / weight`` and the smallest tag runs
+next. A lane with weight 8 thus gets eight times the service of a weight-1 lane
+while both are backlogged, and an idle lane never saves up credit. Per-tenant
+caps bound how many jobs one tenant may have queued or running.
+
+Jobs carry the :class:`~tools.deadline.CancelToken` of the caller's context. A
+job whose caller stopped waiting, or whose deadline passed while it was
+queued, never runs; a running one has its token cancelled so it stops at its
+next checkpoint.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Optional
+
+from tools.deadline import CancelToken, OperationCancelledError, cancel_scope, current_token
+from tools.metrics import REGISTRY
+
+INTERACTIVE = "interactive"
+BATCH = "batch"
+DEFAULT_WEIGHTS = {INTERACTIVE: 8.0, BATCH: 1.0}
+
+_queue_depth = REGISTRY.gauge("scheduler_queue_depth", "Jobs waiting for a worker")
+_running = REGISTRY.gauge("scheduler_running", "Jobs running on a worker")
+_queue_wait = REGISTRY.histogram("scheduler_queue_wait_seconds", "Time jobs wait for a worker")
+_completed = REGISTRY.counter("scheduler_completed_total", "Jobs run to completion")
+_rejected = REGISTRY.counter("scheduler_rejected_total", "Jobs rejected because a queue or tenant cap was full")
+_cancelled = REGISTRY.counter(
+    "scheduler_cancelled_total", "Jobs dropped while queued or stopped while running by a deadline or cancellation")
+
+
+class SchedulerRejectedError(RuntimeError):
+    """Raised when a job is refused because its lane queue or its tenant is at capacity."""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def parse_weights(spec: Optional[str]) -> Dict[str, float]:
+    """
+    Parse lane weights written as ``"interactive=8,batch=1"``.
+
+    Raises:
+        ValueError: If an entry is malformed or a weight is not positive
+    """
+    if not spec:
+        return dict(DEFAULT_WEIGHTS)
+    weights = {}
+    for item in spec.split(","):
+        lane, _, value = item.partition("=")
+        if not lane.strip() or float(value) <= 0:
+            raise ValueError(f"invalid lane weight: {item!r}")
+        weights[lane.strip()] = float(value)
+    return weights
+
+
+class _Job:
+    __slots__ = ('tag', 'lane', 'tenant', 'fn', 'args', 'context', 'token', 'future', 'loop', 'enqueued', 'started')
+
+    def __init__(self, tag: float, lane: str, tenant: str, fn: Callable[..., Any], args: tuple,
+                 future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        self.tag = tag
+        self.lane = lane
+        self.tenant = tenant
+        self.fn = fn
+        self.args = args
+        # Run in the caller's context, as run_in_threadpool does, so context variables carry over
+        self.context = contextvars.copy_context()
+        # The caller's token, or a fresh one so a running job can still be told to stop
+        self.token = current_token() or CancelToken()
+        self.future = future
+        self.loop = loop
+        self.enqueued = time.perf_counter()
+        self.started = False
+
+
+def _run(job: _Job) -> Any:
+    with cancel_scope(job.token):
+        return job.fn(*job.args)
+
+
+def _deliver(future: asyncio.Future, result: Future) -> None:
+    if future.done():
+        return
+    error = result.exception()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result.result())
+
+
+def _fail(future: asyncio.Future, error: BaseException) -> None:
+    if not future.done():
+        future.set_exception(error)
+
+
+class FairScheduler:
+    """
+    Run blocking calls on a fixed worker pool, picking queued jobs by weighted fair queuing.
+
+    ``submit`` is awaited from an event loop; the job runs on a worker thread
+    once it is the next in fair order and a worker is free.
+    """
+
+    def __init__(self, name: str, workers: int = 4, weights: Optional[Dict[str, float]] = None,
+                 max_queue: int = 1000, tenant_limit: int = 0):
+        """
+        Args:
+            name: Pool label used in metrics
+            workers: Worker threads, i.e. jobs running at once
+            weights: Relative share of each lane; the first lane is the default
+            max_queue: Jobs each lane may hold waiting before new ones are rejected
+            tenant_limit: Jobs one tenant may have queued or running (0 = unlimited)
+
+        Raises:
+            ValueError: If a bound or weight is out of range
+        """
+        weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        if workers < 1 or max_queue < 1 or tenant_limit < 0:
+            raise ValueError("workers and max_queue must be at least 1 and tenant_limit non-negative")
+        if not weights or any(weight <= 0 for weight in weights.values()):
+            raise ValueError("lane weights must be positive")
+
+        self.name = name
+        self.workers = workers
+        self.weights = weights
+        self.max_queue = max_queue
+        self.tenant_limit = tenant_limit
+        self.default_lane = next(iter(weights))
+
+        self._queues: Dict[str, Deque[_Job]] = {lane: deque() for lane in weights}
+        self._last_tag = {lane: 0.0 for lane in weights}
+        self._virtual_time = 0.0
+        self._running = 0
+        self._tenants: Dict[str, int] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def queued(self, lane: str) -> int:
+        return len(self._queues[lane])
+
+    def tenant_jobs(self, tenant: str) -> int:
+        return self._tenants.get(tenant, 0)
+
+    def _pool(self) -> ThreadPoolExecutor:
+        # Created on first use so the scheduler can be restarted after shutdown
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=f"{self.name}-worker")
+        return self._executor
+
+    def start(self, timeout: float = 1.0) -> None:
+        """Create the worker pool and all its threads now instead of on the first jobs."""
+        with self._lock:
+            pool = self._pool()
+        # Each call blocks until all of them run, so the pool cannot reuse an idle thread
+        # and creates every worker; with jobs already running the barrier times out, but
+        # by then each submit has created its thread anyway
+        barrier = threading.Barrier(self.workers)
+        futures = [pool.submit(barrier.wait, timeout) for _ in range(self.workers)]
+        for future in futures:
+            try:
+                future.result()
+            except threading.BrokenBarrierError:
+                pass
+
+    def shutdown(self) -> None:
+        """Stop the worker threads after running jobs finish; the pool is recreated on the next submit."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    async def submit(self, fn: Callable[..., Any], *args: Any, lane: Optional[str] = None,
+                     tenant: str = "default", cost: float = 1.0) -> Any:
+        """
+        Queue ``fn(*args)`` and wait for its result.
+
+        Args:
+            fn: Blocking function to run on a worker
+            lane: Lane name; defaults to the first configured lane
+            tenant: Tenant charged against ``tenant_limit``
+            cost: Work estimate; a lane's share is measured in cost units
+
+        Raises:
+            ValueError: If the lane is unknown
+            SchedulerRejectedError: If the lane queue or the tenant is at capacity
+            OperationCancelledError: If the deadline passed before the job started,
+                or ``fn`` stopped at a checkpoint
+        """
+        lane = lane or self.default_lane
+        if lane not in self._queues:
+            raise ValueError(f"unknown lane: {lane}")
+
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self.tenant_limit and self._tenants.get(tenant, 0) >= self.tenant_limit:
+                _rejected.inc(pool=self.name, lane=lane, reason="tenant")
+                raise SchedulerRejectedError(f"tenant {tenant} has too many requests in flight", "tenant")
+            queue = self._queues[lane]
+            if len(queue) >= self.max_queue:
+                _rejected.inc(pool=self.name, lane=lane, reason="queue")
+                raise SchedulerRejectedError(f"{lane} queue is full", "queue")
+
+            tag = max(self._virtual_time, self._last_tag[lane]) + cost / self.weights[lane]
+            self._last_tag[lane] = tag
+            job = _Job(tag, lane, tenant, fn, args, loop.create_future(), loop)
+            queue.append(job)
+            self._tenants[tenant] = self._tenants.get(tenant, 0) + 1
+        _queue_depth.inc(pool=self.name, lane=lane)
+
+        self._dispatch()
+        try:
+            return await job.future
+        except asyncio.CancelledError:
+            self._abandon(job)
+            raise
+
+    def _next_job(self) -> Optional[_Job]:
+        best = None
+        for queue in self._queues.values():
+            if queue and (best is None or queue[0].tag < best[0].tag):
+                best = queue
+        return best.popleft() if best is not None else None
+
+    def _dispatch(self) -> None:
+        """Start queued jobs while workers are free; called on submit and on every completion."""
+        # A job that finishes before its callback is attached completes inside this loop;
+        # the loop itself picks up the freed worker, so do not recurse
+        if getattr(self._local, 'dispatching', False):
+            return
+        self._local.dispatching = True
+        try:
+            while True:
+                with self._lock:
+                    if self._running >= self.workers:
+                        return
+                    job = self._next_job()
+                    if job is None:
+                        return
+                    reason = job.token.reason
+                    if reason is None:
+                        job.started = True
+                        self._running += 1
+                        self._virtual_time = job.tag
+                        pool = self._pool()
+                    else:
+                        self._release_tenant(job.tenant)
+                _queue_depth.dec(pool=self.name, lane=job.lane)
+                if reason is not None:
+                    # Expired while queued: fail it without spending a worker on it
+                    _cancelled.inc(pool=self.name, lane=job.lane, state="queued", reason=reason)
+                    self._notify(job, _fail, OperationCancelledError("deadline passed while queued", reason))
+                    continue
+                _running.inc(pool=self.name, lane=job.lane)
+                _queue_wait.observe(time.perf_counter() - job.enqueued, pool=self.name, lane=job.lane)
+                result = pool.submit(job.context.run, _run, job)
+                result.add_done_callback(lambda result, job=job: self._complete(job, result))
+        finally:
+            self._local.dispatching = False
+
+    def _complete(self, job: _Job, result: Future) -> None:
+        with self._lock:
+            self._running -= 1
+            self._release_tenant(job.tenant)
+        _running.dec(pool=self.name, lane=job.lane)
+        error = result.exception()
+        if isinstance(error, OperationCancelledError):
+            _cancelled.inc(pool=self.name, lane=job.lane, state="running", reason=error.reason)
+        else:
+            _completed.inc(pool=self.name, lane=job.lane)
+        self._notify(job, _deliver, result)
+        self._dispatch()
+
+    @staticmethod
+    def _notify(job: _Job, callback: Callable[[asyncio.Future, Any], None], outcome: Any) -> None:
+        try:
+            job.loop.call_soon_threadsafe(callback, job.future, outcome)
+        except RuntimeError:
+            # The caller's event loop is gone; nobody is waiting for the result
+            pass
+
+    def _abandon(self, job: _Job) -> None:
+        """Drop a job whose caller stopped waiting, or ask it to stop if it is running."""
+        with self._lock:
+            if job.started:
+                job.token.cancel()
+                return
+            try:
+                self._queues[job.lane].remove(job)
+            except ValueError:
+                return
+            self._release_tenant(job.tenant)
+        _queue_depth.dec(pool=self.name, lane=job.lane)
+        job.token.cancel()
+        _cancelled.inc(pool=self.name, lane=job.lane, state="queued", reason=job.token.reason)
+
+    def _release_tenant(self, tenant: str) -> None:
+        count = self._tenants.get(tenant, 0) - 1
+        if count > 0:
+            self._tenants[tenant] = count
+        else:
+            self._tenants.pop(tenant, None)
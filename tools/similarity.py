@@ -0,0 +1,231 @@
+"""
+Near-duplicate prompt lookup for the MCP server.
+
+This module provides a MinHash signature index with LSH banding so that a new
+prompt can be matched against a large history of previously optimized prompts
+without comparing it to every stored entry.
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from tools.optimize import _tokenize
+
+# Mersenne prime used as the modulus of the universal hash family
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = _MERSENNE_PRIME
+
+
+def _token_hash(token: str) -> int:
+    """Hash a token to a 64-bit integer that is stable across processes."""
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+class MinHashIndex:
+    """
+    In-process MinHash/LSH index of prompts.
+
+    Each prompt is reduced to a fixed-size MinHash signature over the same
+    word tokens that ``score_prompt`` uses for keyword Jaccard similarity. The
+    signature is cut into ``bands`` bands; prompts that agree on every row of
+    at least one band share a bucket and become candidates for a query, so
+    insert and query cost depend on the bucket sizes rather than the number of
+    stored prompts.
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 32, seed: int = 1):
+        """
+        Args:
+            num_perm: Number of hash permutations in each signature
+            bands: Number of LSH bands; must divide ``num_perm`` evenly
+            seed: Seed for the permutation coefficients
+
+        Raises:
+            ValueError: If the band layout does not fit the signature size
+        """
+        if num_perm <= 0 or bands <= 0 or num_perm % bands:
+            raise ValueError("num_perm must be a positive multiple of bands")
+
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.seed = seed
+
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+        self._entries: Dict[str, Tuple[str, List[int], Any]] = {}
+        self._buckets: List[Dict[Tuple[int, ...], set]] = [{} for _ in range(bands)]
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, prompt: str) -> bool:
+        return self._key(prompt) in self._entries
+
+    @staticmethod
+    def _key(prompt: str) -> str:
+        return hashlib.sha256(prompt.strip().encode('utf-8')).hexdigest()
+
+    def signature(self, prompt: str) -> List[int]:
+        """
+        Compute the MinHash signature of a prompt.
+
+        Args:
+            prompt: The prompt text
+
+        Returns:
+            List[int]: ``num_perm`` minimum hash values (all ``_MAX_HASH`` for a prompt without tokens)
+        """
+        hashes = [_token_hash(token) for token in _tokenize(prompt)]
+        if not hashes:
+            return [_MAX_HASH] * self.num_perm
+        return [min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._perms]
+
+    def _band_keys(self, signature: List[int]) -> Iterable[Tuple[int, Tuple[int, ...]]]:
+        for band in range(self.bands):
+            start = band * self.rows
+            yield band, tuple(signature[start:start + self.rows])
+
+    def _add(self, key: str, prompt: str, signature: List[int], payload: Any) -> None:
+        if key in self._entries:
+            self._discard(key)
+        self._entries[key] = (prompt, signature, payload)
+        for band, band_key in self._band_keys(signature):
+            self._buckets[band].setdefault(band_key, set()).add(key)
+
+    def _discard(self, key: str) -> None:
+        _, signature, _ = self._entries.pop(key)
+        for band, band_key in self._band_keys(signature):
+            bucket = self._buckets[band].get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
+
+    def insert(self, prompt: str, payload: Any = None) -> str:
+        """
+        Add a prompt to the index, replacing any earlier entry for the same text.
+
+        Args:
+            prompt: The prompt text
+            payload: JSON-serializable data stored with the prompt (e.g. curated variants)
+
+        Returns:
+            str: The content key of the stored entry
+
+        Raises:
+            TypeError: If prompt is not a string
+        """
+        if not isinstance(prompt, str):
+            raise TypeError("prompt must be a string")
+
+        prompt = prompt.strip()
+        key = self._key(prompt)
+        signature = self.signature(prompt)
+        with self._lock:
+            self._add(key, prompt, signature, payload)
+        return key
+
+    def remove(self, prompt: str) -> bool:
+        """Remove a prompt from the index. Returns True if it was present."""
+        key = self._key(prompt)
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._discard(key)
+        return True
+
+    def query(self, prompt: str, k: int = 5, min_similarity: float = 0.0) -> List[Dict[str, Any]]:
+        """
+        Find the stored prompts most similar to ``prompt``.
+
+        Args:
+            prompt: The prompt to look up
+            k: Maximum number of matches to return
+            min_similarity: Drop matches whose estimated Jaccard similarity is lower
+
+        Returns:
+            List[Dict[str, Any]]: Matches with ``prompt``, ``similarity`` and ``payload``, best first
+
+        Raises:
+            TypeError: If prompt is not a string
+        """
+        if not isinstance(prompt, str):
+            raise TypeError("prompt must be a string")
+        if k <= 0:
+            return []
+
+        signature = self.signature(prompt.strip())
+        if signature[0] == _MAX_HASH:
+            return []
+
+        matches = []
+        with self._lock:
+            candidates = set()
+            for band, band_key in self._band_keys(signature):
+                candidates.update(self._buckets[band].get(band_key, ()))
+
+            for key in candidates:
+                stored_prompt, stored_signature, payload = self._entries[key]
+                agree = sum(1 for x, y in zip(signature, stored_signature) if x == y)
+                similarity = agree / self.num_perm
+                if similarity >= min_similarity:
+                    matches.append((similarity, stored_prompt, payload))
+
+        matches.sort(key=lambda match: (-match[0], match[1]))
+        return [
+            {"prompt": stored_prompt, "similarity": round(similarity, 3), "payload": payload}
+            for similarity, stored_prompt, payload in matches[:k]
+        ]
+
+    def save(self, path: str) -> None:
+        """Write the index to ``path`` as JSON, replacing the file atomically."""
+        with self._lock:
+            data = {
+                "num_perm": self.num_perm,
+                "bands": self.bands,
+                "seed": self.seed,
+                "entries": [
+                    {"prompt": prompt, "signature": signature, "payload": payload}
+                    for prompt, signature, payload in self._entries.values()
+                ],
+            }
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(data, fh)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "MinHashIndex":
+        """
+        Read an index previously written by :meth:`save`.
+
+        Raises:
+            ValueError: If a stored signature does not match the saved parameters
+        """
+        with open(path, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+
+        index = cls(num_perm=data["num_perm"], bands=data["bands"], seed=data["seed"])
+        for entry in data["entries"]:
+            signature = entry["signature"]
+            if len(signature) != index.num_perm:
+                raise ValueError("stored signature length does not match num_perm")
+            index._add(cls._key(entry["prompt"]), entry["prompt"], signature, entry.get("payload"))
+        return index
+
+
+def load_or_create(path: Optional[str], **kwargs) -> MinHashIndex:
+    """Load the index at ``path`` if it exists, otherwise return an empty one."""
+    if path and os.path.exists(path):
+        return MinHashIndex.load(path)
+    return MinHashIndex(**kwargs)
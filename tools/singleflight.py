@@ -0,0 +1,126 @@
+"""
+Single-flight coalescing of identical concurrent calls.
+
+``optimize_prompt`` and ``score_prompt`` are deterministic, so when several
+callers ask for the same result at the same time only the first one computes
+it; the others await the same future and receive the same result or error.
+The shared computation has a deadline of its own, the latest of its callers',
+so a caller with a short deadline does not cut it short for the others, and
+its progress reports reach every caller.
+"""
+
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from tools.deadline import CancelToken, cancel_scope, current_token
+from tools.metrics import REGISTRY
+from tools.progress import ProgressFanout, current_progress, progress_scope
+
+_calls = REGISTRY.counter(
+    "singleflight_calls_total", "Calls submitted to a single-flight group")
+_coalesced = REGISTRY.counter(
+    "singleflight_coalesced_total", "Calls that joined an identical in-flight computation")
+
+
+def _coalesce_ratios():
+    coalesced = _coalesced.items()
+    return {key: coalesced.get(key, 0.0) / total for key, total in _calls.items().items() if total}
+
+
+REGISTRY.gauge(
+    "singleflight_coalesce_ratio", "Fraction of calls served by another caller's computation",
+    callback=_coalesce_ratios)
+
+
+def content_key(*parts: Any) -> str:
+    """Build a coalescing key from the SHA-256 hashes of the given values."""
+    return ":".join(hashlib.sha256(repr(part).encode('utf-8')).hexdigest() for part in parts)
+
+
+class SingleFlight:
+    """Group of keyed computations where concurrent callers with the same key share one result."""
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name: Group name used as the ``group`` label in metrics
+        """
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+        # Token and progress fan-out of each running computation
+        self._shared: Dict[asyncio.Future, Tuple[CancelToken, ProgressFanout]] = {}
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run ``fn`` for ``key`` unless an identical call is already running.
+
+        The computation runs in its own task, so a caller that is cancelled
+        does not cancel the result for the callers still waiting on it; once
+        the last caller is gone, the computation is cancelled too. It runs in
+        the context of the caller that started it, but under a token of its
+        own whose deadline is the latest of its callers' (none if any caller
+        has none); each caller still stops waiting at its own deadline. Its
+        progress reports go to every caller with a progress callback, those
+        that join late first receiving the reports they missed.
+
+        Args:
+            key: Identity of the computation (e.g. prompt hash and style)
+            fn: Zero-argument coroutine factory that computes the result
+
+        Returns:
+            Any: The result of the shared computation
+
+        Raises:
+            Exception: Whatever the shared computation raised
+        """
+        _calls.inc(group=self.name)
+        caller = current_token()
+        deadline = caller.deadline if caller is not None else None
+        future = self._inflight.get(key)
+        if future is not None:
+            _coalesced.inc(group=self.name)
+            token, progress = self._shared[future]
+            if token.deadline is not None and (deadline is None or deadline > token.deadline):
+                token.deadline = deadline
+        else:
+            token = CancelToken()
+            token.deadline = deadline
+            progress = ProgressFanout()
+            future = asyncio.ensure_future(self._run(token, progress, fn))
+            self._inflight[key] = future
+            self._shared[future] = token, progress
+            future.add_done_callback(lambda done: self._forget(key, done))
+        listener = current_progress()
+        if listener is not None:
+            progress.add(listener)
+        self._waiters[future] = self._waiters.get(future, 0) + 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if listener is not None:
+                progress.remove(listener)
+            remaining = self._waiters.pop(future) - 1
+            if remaining:
+                self._waiters[future] = remaining
+            elif not future.done():
+                # Nobody wants the result any more
+                token.cancel()
+                future.cancel()
+
+    @staticmethod
+    async def _run(token: CancelToken, progress: ProgressFanout, fn: Callable[[], Awaitable[Any]]) -> Any:
+        with cancel_scope(token), progress_scope(progress):
+            return await fn()
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        self._shared.pop(future, None)
+        if not future.cancelled():
+            # Mark the exception as retrieved even if every waiter went away
+            future.exception()
@@ -0,0 +1,341 @@
+"""
+Runtime-registered optimization styles.
+
+A custom style is declared as data: one list of rewrite operations per
+variant. Registering a style validates it; the first call that uses it
+compiles it into variant builders for the same pipeline the built-in styles
+run on, with all word substitutions of a variant fused into a single regex
+pass. Compiled styles are cached per tenant under an LRU bound and dropped
+whenever the style is updated or removed.
+
+A style spec looks like::
+
+    {"variants": [
+        [{"op": "remove", "words": ["very", "kind of"]},
+         {"op": "replace", "words": {"utilize": "use"}}],
+        [{"op": "bullets"}],
+        [{"op": "prefix", "text": "Brief: "}, {"op": "suffix", "text": " Cite sources."}]
+    ]}
+
+``replace`` swaps whole words (case-insensitive); ``remove`` deletes words with
+the whitespace that follows them, like the built-in filler removal; ``prefix``
+and ``suffix`` add text; ``bullets`` lists each sentence as a bullet point and
+must come first. Adjacent ``replace``/``remove`` operations run as one
+left-to-right pass, so a replacement is never rewritten again.
+"""
+
+import copy
+import hashlib
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from tools.engines import OPTIMIZE, OPTIMIZE_EDITS, run
+from tools.metrics import REGISTRY
+from tools.optimize import (
+    VARIANT_COUNT,
+    EditScript,
+    _Analysis,
+    _build_variants,
+    _precise_bullets,
+    _STYLE_BUILDERS,
+    _Variant,
+)
+
+DEFAULT_TENANT = "default"
+BUILTIN_STYLES = tuple(_STYLE_BUILDERS)
+
+OPERATIONS = ('replace', 'remove', 'prefix', 'suffix', 'bullets')
+MAX_WORDS = 2000
+MAX_TEXT_LENGTH = 2000
+_NAME = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+_compilations = REGISTRY.counter("style_compilations_total", "Custom styles compiled into pipelines")
+_evictions = REGISTRY.counter("style_cache_evictions_total", "Compiled custom styles evicted from the LRU cache")
+
+
+def validate_spec(spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Check a style spec and return a normalized copy.
+
+    Raises:
+        ValueError: If the spec is malformed
+    """
+    if not isinstance(spec, dict) or not isinstance(spec.get('variants'), list):
+        raise ValueError("style spec must be an object with a 'variants' list")
+    if len(spec['variants']) != VARIANT_COUNT:
+        raise ValueError(f"a style defines exactly {VARIANT_COUNT} variants")
+
+    variants = []
+    words = 0
+    for number, operations in enumerate(spec['variants'], 1):
+        if not isinstance(operations, list):
+            raise ValueError(f"variant {number} must be a list of operations")
+        normalized = []
+        for position, operation in enumerate(operations):
+            if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+                raise ValueError(f"variant {number}: each operation needs an 'op' of {', '.join(OPERATIONS)}")
+            op = operation['op']
+            if op == 'bullets':
+                if position:
+                    raise ValueError(f"variant {number}: 'bullets' must be the first operation")
+                normalized.append({'op': op})
+            elif op in ('prefix', 'suffix'):
+                text = operation.get('text')
+                if not isinstance(text, str) or not text or len(text) > MAX_TEXT_LENGTH:
+                    raise ValueError(f"variant {number}: '{op}' needs a 'text' of 1-{MAX_TEXT_LENGTH} characters")
+                normalized.append({'op': op, 'text': text})
+            elif op == 'replace':
+                table = operation.get('words')
+                if not isinstance(table, dict) or not table or not all(
+                        isinstance(k, str) and k.strip() and isinstance(v, str) for k, v in table.items()):
+                    raise ValueError(f"variant {number}: 'replace' needs a non-empty 'words' object of strings")
+                words += len(table)
+                normalized.append({'op': op, 'words': dict(table)})
+            else:  # remove
+                listed = operation.get('words')
+                if not isinstance(listed, list) or not listed or not all(
+                        isinstance(word, str) and word.strip() for word in listed):
+                    raise ValueError(f"variant {number}: 'remove' needs a non-empty 'words' list of strings")
+                words += len(listed)
+                normalized.append({'op': op, 'words': list(listed)})
+        variants.append(normalized)
+    if words > MAX_WORDS:
+        raise ValueError(f"a style may list at most {MAX_WORDS} words")
+    return {'variants': variants}
+
+
+def _word_alternation(words: Sequence[str]) -> str:
+    # Longest first, so "kind of" wins over "kind" at the same position
+    return '|'.join(re.escape(word) for word in sorted(set(words), key=len, reverse=True))
+
+
+def _fuse(operations: List[Dict[str, Any]]) -> Tuple[re.Pattern, Callable[[re.Match], str]]:
+    """Compile a run of replace/remove operations into one pattern and replacement function."""
+    table: Dict[str, str] = {}
+    removed: List[str] = []
+    for operation in operations:
+        if operation['op'] == 'replace':
+            for word, replacement in operation['words'].items():
+                table.setdefault(word.strip().lower(), replacement)
+        else:
+            removed.extend(word.strip().lower() for word in operation['words'])
+
+    alternatives = []
+    if removed:
+        alternatives.append(rf'(?P<remove>{_word_alternation(removed)})\s+')
+    if table:
+        alternatives.append(rf'(?P<replace>{_word_alternation(table)})\b')
+    pattern = re.compile(r'\b(?:' + '|'.join(alternatives) + ')', re.IGNORECASE)
+    # IGNORECASE matches by case folding (e.g. "ſun" matches "sun"), so look matches up the same way
+    folded: Dict[str, str] = {}
+    for word, replacement in table.items():
+        folded.setdefault(word.casefold(), replacement)
+
+    def replace(match: re.Match) -> str:
+        word = match.group('replace') if table else None
+        return '' if word is None else folded.get(word.casefold(), word)
+
+    return pattern, replace
+
+
+def _compile_variant(operations: List[Dict[str, Any]]) -> Callable[[_Analysis], _Variant]:
+    """Turn one variant's operations into a builder for ``_build_variants``."""
+    bullets = bool(operations) and operations[0]['op'] == 'bullets'
+    steps: List[Tuple[str, Any, Any]] = []
+    run: List[Dict[str, Any]] = []
+    for operation in operations[1 if bullets else 0:] + [None]:
+        if operation is not None and operation['op'] in ('replace', 'remove'):
+            run.append(operation)
+            continue
+        if run:
+            steps.append(('sub',) + _fuse(run))
+            run = []
+        if operation is not None:
+            steps.append((operation['op'], operation['text'], None))
+
+    def build(analysis: _Analysis) -> _Variant:
+        variant = _precise_bullets(analysis) if bullets else analysis.variant()
+        for kind, first, second in steps:
+            if kind == 'sub':
+                variant.sub(first, second)
+            elif kind == 'prefix':
+                variant.prepend(first)
+            else:
+                variant.append(first)
+        return variant
+
+    return build
+
+
+class CompiledStyle:
+    """A style ready to run: built-in, or a custom spec compiled to variant builders."""
+
+    __slots__ = ('name', 'builders', 'key', 'digest')
+
+    def __init__(self, name: str, builders: Optional[Tuple[Callable[[_Analysis], _Variant], ...]], key: Any,
+                 digest: str):
+        self.name = name
+        # None runs the built-in style of that name
+        self.builders = builders
+        # Identifies this exact definition, e.g. for caching or coalescing results
+        self.key = key
+        # Derived from the definition alone, so it is stable across restarts and replicas
+        self.digest = digest
+
+    def optimize(self, raw_prompt: str, variants: Optional[Sequence[int]] = None) -> List[str]:
+        """Same as ``optimize_prompt`` for this style; built-in styles run on the current engine."""
+        if self.builders is None:
+            return run(OPTIMIZE, raw_prompt, self.name, variants)
+        return [v.text() for v in _build_variants(raw_prompt, self.name, False, variants, self.builders)]
+
+    def optimize_edits(self, raw_prompt: str, variants: Optional[Sequence[int]] = None) -> List[EditScript]:
+        """Same as ``optimize_prompt_edits`` for this style; built-in styles run on the current engine."""
+        if self.builders is None:
+            return run(OPTIMIZE_EDITS, raw_prompt, self.name, variants)
+        return [v.edits() for v in _build_variants(raw_prompt, self.name, True, variants, self.builders)]
+
+
+def compile_style(name: str, spec: Dict[str, Any], key: Any = None) -> CompiledStyle:
+    """
+    Compile a style spec.
+
+    Raises:
+        ValueError: If the spec is malformed
+    """
+    spec = validate_spec(spec)
+    digest = hashlib.sha256(json.dumps(spec, sort_keys=True).encode('utf-8')).hexdigest()
+    return CompiledStyle(name, tuple(_compile_variant(operations) for operations in spec['variants']), key, digest)
+
+
+_BUILTINS = {name: CompiledStyle(name, None, name, name) for name in BUILTIN_STYLES}
+
+
+class StyleRegistry:
+    """
+    Per-tenant custom styles with an LRU cache of compiled pipelines.
+
+    Specs are kept for every registered style; at most ``cache_size``
+    compiled styles per tenant are kept, and an evicted one is recompiled on
+    its next use. Tenants are unauthenticated names, so at most
+    ``max_tenants`` of them may hold styles at once.
+    """
+
+    def __init__(self, cache_size: int = 32, max_styles: int = 100, max_tenants: int = 1000):
+        """
+        Args:
+            cache_size: Compiled styles kept per tenant
+            max_styles: Styles a tenant may register
+            max_tenants: Tenants that may hold styles at the same time
+
+        Raises:
+            ValueError: If a bound is not positive
+        """
+        if cache_size < 1 or max_styles < 1 or max_tenants < 1:
+            raise ValueError("cache_size, max_styles and max_tenants must be at least 1")
+        self.cache_size = cache_size
+        self.max_styles = max_styles
+        self.max_tenants = max_tenants
+        self._specs: Dict[str, Dict[str, Tuple[int, Dict[str, Any]]]] = {}
+        self._compiled: Dict[str, OrderedDict] = {}
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def register(self, name: str, spec: Dict[str, Any], tenant: str = DEFAULT_TENANT) -> int:
+        """
+        Add or replace a tenant's style.
+
+        Returns:
+            int: Version of the stored definition
+
+        Raises:
+            ValueError: If the name or spec is invalid, the tenant has too many styles,
+                or a new tenant would exceed ``max_tenants``
+        """
+        if not isinstance(name, str) or not _NAME.fullmatch(name):
+            raise ValueError("style names are 1-64 letters, digits, '_' or '-'")
+        if name in _BUILTINS:
+            raise ValueError(f"'{name}' is a built-in style")
+        spec = validate_spec(spec)
+
+        with self._lock:
+            if tenant not in self._specs and len(self._specs) >= self.max_tenants:
+                raise ValueError(f"at most {self.max_tenants} tenants may register styles")
+            specs = self._specs.setdefault(tenant, {})
+            if name not in specs and len(specs) >= self.max_styles:
+                raise ValueError(f"a tenant may register at most {self.max_styles} styles")
+            self._version += 1
+            specs[name] = (self._version, spec)
+            self._compiled.get(tenant, {}).pop(name, None)
+            return self._version
+
+    def remove(self, name: str, tenant: str = DEFAULT_TENANT) -> bool:
+        """Delete a tenant's style; returns False if it did not exist."""
+        with self._lock:
+            self._compiled.get(tenant, {}).pop(name, None)
+            specs = self._specs.get(tenant, {})
+            removed = specs.pop(name, None) is not None
+            if removed and not specs:
+                # A tenant without styles no longer counts against max_tenants
+                del self._specs[tenant]
+                self._compiled.pop(tenant, None)
+            return removed
+
+    def names(self, tenant: str = DEFAULT_TENANT) -> List[str]:
+        """Names of a tenant's custom styles."""
+        with self._lock:
+            return sorted(self._specs.get(tenant, {}))
+
+    def spec(self, name: str, tenant: str = DEFAULT_TENANT) -> Tuple[int, Dict[str, Any]]:
+        """
+        Return (version, spec) of a tenant's custom style.
+
+        Raises:
+            KeyError: If the tenant has no such style
+        """
+        with self._lock:
+            version, spec = self._specs.get(tenant, {})[name]
+            return version, copy.deepcopy(spec)
+
+    def resolve(self, name: str, tenant: str = DEFAULT_TENANT) -> CompiledStyle:
+        """
+        Return the style to run for ``name``: a built-in or the tenant's own.
+
+        Raises:
+            KeyError: If the style does not exist for this tenant
+        """
+        builtin = _BUILTINS.get(name)
+        if builtin is not None:
+            return builtin
+
+        with self._lock:
+            # Looked up without creating the tenant's cache, so unknown tenants and names leave nothing behind
+            cache = self._compiled.get(tenant, {})
+            compiled = cache.get(name)
+            if compiled is not None:
+                cache.move_to_end(name)
+                return compiled
+            version, spec = self._specs.get(tenant, {}).get(name, (None, None))
+        if spec is None:
+            raise KeyError(name)
+
+        # Compile outside the lock; a racing caller at worst compiles the same spec twice
+        compiled = compile_style(name, spec, key=(tenant, name, version))
+        _compilations.inc()
+        with self._lock:
+            current = self._specs.get(tenant, {}).get(name)
+            if current is not None and current[0] == version:
+                cache = self._compiled.setdefault(tenant, OrderedDict())
+                cache[name] = compiled
+                if len(cache) > self.cache_size:
+                    cache.popitem(last=False)
+                    _evictions.inc()
+        return compiled
+
+    def cached(self, tenant: str = DEFAULT_TENANT) -> List[str]:
+        """Names of a tenant's compiled styles, least recently used first."""
+        with self._lock:
+            return list(self._compiled.get(tenant, {}))
+
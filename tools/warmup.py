@@ -0,0 +1,111 @@
+"""
+Startup warmup and readiness.
+
+A freshly started server compiles rewrite-rule regexes on the first request
+that uses them and creates worker threads on the first jobs it runs, so its
+first requests are slow. :class:`Warmup` runs named steps once at startup
+(compiling the rules, running a representative corpus through every style
+and the scorer, starting the worker pools) and reports per-component
+readiness, so a readiness probe only routes traffic to a warm server.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tools.approximate import estimate_score
+from tools.metrics import REGISTRY
+from tools.optimize import _STYLE_BUILDERS, optimize_prompt, optimize_prompt_edits, score_prompt
+
+logger = logging.getLogger(__name__)
+
+_ready = REGISTRY.gauge("warmup_ready", "1 once a warmup component has finished, 0 before or on failure")
+_duration = REGISTRY.gauge("warmup_duration_seconds", "Time each warmup component took")
+
+# Short and long prompts touching every rule: fillers, polite openings, long words,
+# several sentences, questions and a prompt long enough to be split in chunks
+CORPUS = [
+    "Write about AI",
+    "Please could you explain how photosynthesis works?",
+    "I would kind of like you to utilize a very detailed approach to demonstrate the concept. "
+    "Basically, it is really important. Actually, make it sort of quick!",
+    "Would you summarize this article. It covers climate policy. Then list three key facts?",
+    "Explain quantum computing in simple terms for a beginner. " * 200,
+]
+
+
+def warm_rules() -> None:
+    """Run every built-in style over the corpus, compiling and caching its rule regexes."""
+    for style in _STYLE_BUILDERS:
+        for prompt in CORPUS:
+            optimize_prompt(prompt, style)
+            optimize_prompt_edits(prompt, style)
+
+
+def warm_scorer() -> None:
+    """Score the corpus exactly and approximately."""
+    for prompt in CORPUS:
+        for improved in optimize_prompt(prompt, 'precise'):
+            score_prompt(prompt, improved)
+            estimate_score(prompt, improved)
+
+
+class Warmup:
+    """Named warmup steps run once, with the readiness and duration of each."""
+
+    def __init__(self):
+        self._steps: List[Tuple[str, Callable[[], Any]]] = []
+        self._components: Dict[str, Dict[str, Any]] = {}
+        self._seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add(self, name: str, step: Callable[[], Any]) -> None:
+        """Register a step; steps run in the order they were added."""
+        self._steps.append((name, step))
+        with self._lock:
+            self._components[name] = {"ready": False, "seconds": None, "error": None}
+        _ready.set(0, component=name)
+
+    def run(self) -> bool:
+        """
+        Run every step in turn; a failed step is logged and leaves its component not ready.
+
+        Returns:
+            bool: Whether every component is ready
+        """
+        start = time.perf_counter()
+        for name, step in self._steps:
+            step_start = time.perf_counter()
+            error = None
+            try:
+                step()
+            except Exception as e:
+                logger.error(f"Warmup of {name} failed: {e}")
+                error = str(e)
+            seconds = time.perf_counter() - step_start
+            with self._lock:
+                self._components[name] = {"ready": error is None, "seconds": round(seconds, 4), "error": error}
+            _ready.set(0 if error else 1, component=name)
+            _duration.set(seconds, component=name)
+        with self._lock:
+            self._seconds = round(time.perf_counter() - start, 4)
+        logger.info(f"Warmup finished in {self._seconds}s")
+        return self.ready
+
+    @property
+    def ready(self) -> bool:
+        """Whether warmup has finished and every component is ready."""
+        with self._lock:
+            return self._seconds is not None and all(c["ready"] for c in self._components.values())
+
+    def status(self) -> Dict[str, Any]:
+        """Overall readiness, total warmup time (None while running) and per-component details."""
+        with self._lock:
+            components = {name: dict(component) for name, component in self._components.items()}
+            seconds = self._seconds
+        return {
+            "ready": seconds is not None and all(c["ready"] for c in components.values()),
+            "warmup_seconds": seconds,
+            "components": components,
+        }
@@ -0,0 +1,142 @@
+"""
+Wire formats for the HTTP transport.
+
+This module handles content negotiation: MessagePack bodies as a compact
+alternative to JSON, and zstd or gzip compression of large responses. Both
+codecs are optional dependencies; without them the server speaks plain JSON.
+"""
+
+import gzip
+from typing import Any, Dict, List, Optional
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+MSGPACK_TYPE = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK_TYPE, "application/x-msgpack")
+JSON_TYPE = "application/json"
+
+MSGPACK_AVAILABLE = msgpack is not None
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+
+def _parse_header(value: Optional[str]) -> Dict[str, float]:
+    """Parse a header like ``Accept`` or ``Accept-Encoding`` into {token: q}."""
+    parsed = {}
+    for item in (value or "").split(","):
+        token, *params = [part.strip() for part in item.split(";")]
+        if not token:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, val = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(val)
+                except ValueError:
+                    q = 0.0
+        parsed[token.lower()] = q
+    return parsed
+
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    """Return True if a Content-Type header names MessagePack."""
+    if not content_type:
+        return False
+    return content_type.split(";")[0].strip().lower() in MSGPACK_TYPES
+
+
+def wants_msgpack(accept: Optional[str]) -> bool:
+    """Return True if an Accept header prefers MessagePack over JSON."""
+    accepted = _parse_header(accept)
+    msgpack_q = max(accepted.get(media_type, 0.0) for media_type in MSGPACK_TYPES)
+    return msgpack_q > 0 and msgpack_q >= accepted.get(JSON_TYPE, 0.0)
+
+
+def packb(obj: Any) -> bytes:
+    """
+    Encode an object as MessagePack.
+
+    Raises:
+        RuntimeError: If the msgpack package is not installed
+    """
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed")
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpackb(data: bytes) -> Any:
+    """
+    Decode a MessagePack document.
+
+    Raises:
+        RuntimeError: If the msgpack package is not installed
+        ValueError: If the data is not valid MessagePack
+    """
+    if msgpack is None:
+        raise RuntimeError("msgpack is not installed")
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except Exception as e:
+        raise ValueError(f"invalid msgpack body: {e}") from e
+
+
+def available_encodings() -> List[str]:
+    """Content codings this process can produce, most preferred first."""
+    return (["zstd"] if zstandard is not None else []) + ["gzip"]
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick the response content coding from an ``Accept-Encoding`` header.
+
+    Returns:
+        Optional[str]: ``"zstd"`` or ``"gzip"``, or None for identity
+    """
+    accepted = _parse_header(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = accepted.get(encoding, wildcard)
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """
+    Compress data with the given content coding.
+
+    Raises:
+        ValueError: If the coding is not available
+    """
+    if encoding == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError(f"unsupported content coding: {encoding}")
+
+
+def decompress(data: bytes, encoding: Optional[str]) -> bytes:
+    """
+    Undo a content coding produced by :func:`compress`.
+
+    Raises:
+        ValueError: If the coding is not available
+    """
+    if not encoding or encoding == "identity":
+        return data
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "zstd" and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"unsupported content coding: {encoding}")